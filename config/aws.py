@@ -0,0 +1,97 @@
+# config/aws.py
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+# ====================================================================
+# CLIENTES AWS COMPARTILHADOS (Um por processo, conexões reaproveitadas)
+# ====================================================================
+# Criar um boto3.client custa dezenas de milissegundos (carrega os modelos do
+# botocore) e cada cliente novo abre conexões TLS novas. Aqui cada processo
+# cria UMA vez o cliente de cada serviço/região e todo mundo reaproveita o
+# pool de conexões dele. Os clientes do boto3 são thread-safe (gunicorn com
+# threads/gevent); a criação fica atrás de um lock porque a Session não é.
+# O PID entra na chave: depois do fork (Celery prefork, gunicorn --preload)
+# o filho nunca herda sockets abertos pelo pai.
+
+_clientes = {}
+_lock = threading.Lock()
+
+
+def _tentativas_do_servico(servico):
+    if servico == 'rekognition':
+        # Quem recua no throttling do Rekognition é o com_backoff + balde de tokens (galeria/indexacao_faces.py):
+        # aqui só uma repetição rápida para erro transitório, sem o limitador do modo 'adaptive'
+        return {'total_max_attempts': getattr(settings, 'AWS_REKOGNITION_TENTATIVAS', 2), 'mode': 'standard'}
+    return {
+        'max_attempts': getattr(settings, 'AWS_MAX_TENTATIVAS', 5),
+        'mode': 'adaptive', # Recua sozinho quando a AWS devolve throttling
+    }
+
+
+def _config_do_servico(servico):
+    opcoes = {
+        'max_pool_connections': getattr(settings, 'AWS_MAX_POOL_CONNECTIONS', 32),
+        'retries': _tentativas_do_servico(servico),
+        'tcp_keepalive': True,
+        'connect_timeout': getattr(settings, 'AWS_CONNECT_TIMEOUT', 5),
+        'read_timeout': getattr(settings, 'AWS_READ_TIMEOUT', 60),
+    }
+    if servico == 's3':
+        opcoes['signature_version'] = 's3v4'
+    return Config(**opcoes)
+
+
+def _regiao_padrao(servico):
+    if servico == 'rekognition':
+        return settings.AWS_REKOGNITION_REGION_NAME
+    return settings.AWS_S3_REGION_NAME
+
+
+def cliente_aws(servico, regiao=None):
+    """Cliente boto3 compartilhado do processo para o serviço/região."""
+    regiao = regiao or _regiao_padrao(servico)
+    chave = (servico, regiao, os.getpid())
+
+    cliente = _clientes.get(chave)
+    if cliente is not None:
+        return cliente
+
+    with _lock:
+        cliente = _clientes.get(chave)
+        if cliente is None:
+            sessao = boto3.session.Session(
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            )
+            cliente = sessao.client(servico, region_name=regiao, config=_config_do_servico(servico))
+            _clientes[chave] = cliente
+    return cliente
+
+
+def cliente_s3():
+    return cliente_aws('s3')
+
+
+def cliente_rekognition():
+    return cliente_aws('rekognition')
+
+
+def limpar_clientes():
+    """Descarta os clientes (testes, troca de credenciais ou logo após um fork)."""
+    with _lock:
+        _clientes.clear()
+
+
+def _apos_fork():
+    # O filho começa sem clientes e com um lock novo (o do pai pode ter sido copiado travado)
+    global _lock
+    _lock = threading.Lock()
+    _clientes.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork)
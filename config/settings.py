@@ -162,6 +162,28 @@ AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
 AWS_LOCATION = 'media'
 AWS_REKOGNITION_COLLECTION_ID = os.getenv('AWS_REKOGNITION_COLLECTION_ID')
 AWS_REKOGNITION_REGION_NAME = os.getenv('AWS_REKOGNITION_REGION_NAME')
+# Busca facial (galeria/busca_facial.py): 'rekognition' (AWS) ou 'local' (vetores + NumPy;
+# instale requirements-busca-facial.txt)
+BUSCA_FACIAL_BACKEND = os.getenv('BUSCA_FACIAL_BACKEND', 'rekognition')
+BUSCA_FACIAL_LIMIAR = 95 # FaceMatchThreshold do Rekognition (%)
+BUSCA_FACIAL_LIMIAR_LOCAL = 90 # Similaridade de cosseno mínima do backend local (%)
+BUSCA_FACIAL_INDICE_TTL = 300 # Segundos até o índice local de um álbum ser remontado mesmo sem mudanças
+BUSCA_FACIAL_INDICES_MAX = 16 # Partições (álbuns + global) com índice local na memória de cada processo (LRU)
+BUSCA_FACIAL_INDICES_MAX_FACES = 500_000 # Faces somadas nesses índices antes de descartar os menos usados
+BUSCA_FACIAL_CACHE_TTL = 600 # Segundos que o resultado de uma selfie (pelo hash perceptual) fica no cache
+# Rekognition: cada álbum ganha uma coleção própria (além da global). Custa um segundo IndexFaces por
+# foto, que também consome o REKOGNITION_TPS (a indexação cai pela metade): ligue só se a busca dentro
+# dos álbuns precisar da expansão. A coleção é apagada quando o álbum é arquivado ou apagado.
+BUSCA_FACIAL_COLECAO_POR_ALBUM = os.getenv('BUSCA_FACIAL_COLECAO_POR_ALBUM', 'False') == 'True'
+BUSCA_FACIAL_MAX_FACES = 100 # Faces devolvidas por consulta (MaxFaces)
+BUSCA_FACIAL_EXPANSAO_MAX = 3 # Melhores faces do álbum que viram novas consultas (SearchFaces)
+# Clientes boto3 compartilhados por processo (config/aws.py)
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '32'))
+AWS_MAX_TENTATIVAS = int(os.getenv('AWS_MAX_TENTATIVAS', '5'))
+# Rekognition: chamadas no total (1ª + repetições) no botocore; o backoff de throttling é do FACES_TENTATIVAS
+AWS_REKOGNITION_TENTATIVAS = int(os.getenv('AWS_REKOGNITION_TENTATIVAS', '2'))
+AWS_CONNECT_TIMEOUT = int(os.getenv('AWS_CONNECT_TIMEOUT', '5'))
+AWS_READ_TIMEOUT = int(os.getenv('AWS_READ_TIMEOUT', '60'))
 MP_ACCESS_TOKEN = os.getenv('MP_ACCESS_TOKEN')
 MP_WEBHOOK_SECRET = os.getenv('MP_WEBHOOK_SECRET')
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
@@ -220,6 +242,8 @@ CELERY_ACKS_LATE = True
 # 4. TIMEOUTS E LIMPEZA
 # Se uma foto demorar mais de 15 minutos a processar, algo correu mal.
 # Ele aborta e devolve à fila.
+# Atenção: sem o prefixo CELERY_ esta linha não é lida (config/celery.py usa namespace='CELERY').
+# O visibility_timeout que vale de fato é o padrão do Redis no Kombu: 3600 s.
 broker_transport_options = {'visibility_timeout': 900}
 
 # Formato padrão de envio de mensagens
@@ -227,4 +251,113 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
-X_FRAME_OPTIONS = 'SAMEORIGIN'
\ No newline at end of file
+# 5. FILA PRÓPRIA PARA A INDEXAÇÃO FACIAL (galeria/indexacao_faces.py)
+# O throttling do Rekognition não segura a fila das marcas d'água. Rode um worker só para ela:
+# celery -A config worker -Q faces --concurrency=1
+CELERY_TASK_ROUTES = {
+    'galeria.tasks.indexar_faces_pendentes_task': {'queue': 'faces'},
+    'galeria.tasks.remover_faces_task': {'queue': 'faces'},
+    'galeria.tasks.apagar_colecao_album_task': {'queue': 'faces'},
+}
+REKOGNITION_TPS = float(os.getenv('REKOGNITION_TPS', '5')) # Limite de IndexFaces/s da conta AWS
+FACES_LOTE = 50 # Fotos reservadas por lote
+FACES_THREADS = 8 # Chamadas simultâneas (o balde de tokens segura o TPS)
+FACES_TENTATIVAS = 6 # Tentativas em caso de throttling (espera exponencial com jitter)
+FACES_RESERVA_MINUTOS = 15 # Reserva de lote abandonada (worker morto) volta para a fila
+
+# 6. DISTRIBUIÇÃO FTP PARA JORNAIS PARCEIROS (galeria/distribuicao_ftp.py)
+FTP_MAX_THREADS = int(os.getenv('FTP_MAX_THREADS', '8')) # Jornais atendidos em paralelo por foto
+FTP_CONEXOES_POR_PARCEIRO = 2 # Conexões logadas que cada worker guarda por jornal
+FTP_TIMEOUT = 30 # Segundos
+FTP_VERIFICAR_APOS = 15 # Conexão parada há mais que isso leva um NOOP antes de ser reaproveitada
+FTP_OCIOSA_MAX = 120 # Acima disso é descartada (servidores costumam derrubar antes)
+FTP_BLOCO = 256 * 1024 # Bytes por leitura no STOR: a memória de um envio não passa disso
+FTP_PASTA_TEMPORARIA = os.getenv('FTP_PASTA_TEMPORARIA') or None # Onde um arquivo para vários jornais espera (None = /tmp)
+FTP_ENTREGA_TENTATIVAS = 6 # Depois disso a entrega fica FALHOU no painel (galeria/entregas_ftp.py)
+FTP_ESPERA_BASE = 30 # Segundos até a 1ª nova tentativa; dobra a cada falha
+# Teto da espera. Fica abaixo do visibility_timeout que vale de fato (3600 s, ver acima): um countdown
+# maior faria o Redis reentregar a mensagem antes da hora. Reentregas que escapem não reenviam nada,
+# porque reservar_entregas (galeria/entregas_ftp.py) é idempotente.
+FTP_ESPERA_MAX = 1800
+FTP_DISJUNTOR_FALHAS = 5 # Falhas seguidas que tiram o jornal do ar por um tempo
+FTP_DISJUNTOR_SEGUNDOS = 300
+FTP_RESERVA_MINUTOS = 30 # Entrega presa em ENVIANDO (worker morto) volta para a fila
+FTP_CARIMBO_TTL = 60 * 60 * 24 * 7 # Cabeçalho JPEG já carimbado com IPTC/XMP (galeria/metadados.py)
+
+# --- UPLOAD DIRETO PARA O S3 (galeria/uploads_diretos.py) ---
+# O bucket precisa de CORS liberando POST/PUT do domínio do painel e expondo o cabeçalho ETag.
+UPLOAD_SESSAO_HORAS = 24 # Validade dos POSTs assinados e da sessão
+UPLOAD_MAX_ARQUIVOS = 1000 # Arquivos por sessão
+UPLOAD_FOTO_MAX_MB = 80
+UPLOAD_VIDEO_MAX_MB = 10 * 1024
+UPLOAD_PARTE_MB = 16 # Tamanho das partes do multipart dos vídeos (o S3 aceita até 10.000 partes)
+
+# --- UPLOAD EM LOTE (galeria/processamento_em_lote.py) ---
+PROCESSAMENTO_PEDACO = 25 # Fotos por mensagem do Celery (um pedaço precisa caber no visibility_timeout de 3600 s)
+PROCESSAMENTO_LOTE_TTL = 60 * 60 * 24 # Contador de pedaços pendentes no cache
+
+X_FRAME_OPTIONS = 'SAMEORIGIN'
+
+# ==============================================================================
+# --- CACHE (Redis em produção, memória local no desenvolvimento) ---
+# ==============================================================================
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Tempo (segundos) que o preço calculado de um carrinho fica no cache (loja/precificacao.py)
+CARRINHO_CACHE_TTL = int(os.getenv('CARRINHO_CACHE_TTL', '3600'))
+
+# ==============================================================================
+# --- VERSÕES DAS FOTOS (galeria/versoes.py) ---
+# ==============================================================================
+# Cada foto é decodificada UMA vez e gera todas as versões abaixo de uma só vez.
+# Esta é a única tabela de versões (galeria/versoes.py só lê daqui). Cada versão define:
+# - tamanho: caixa máxima (largura, altura) em pixels
+# - modo: 'ajustar' mantém a proporção dentro da caixa / 'cortar' preenche a caixa (cartão social)
+# - qualidade: qualidade JPEG da saída
+# - marca_dagua: se aplica a marca d'água em grade
+# - campo: campo do modelo Foto onde a versão é gravada (None = só uso interno)
+FOTO_VERSOES = {
+    'rekognition': {'tamanho': (1920, 1080), 'modo': 'ajustar', 'qualidade': 90, 'marca_dagua': False, 'campo': 'imagem_rekognition'},
+    'social': {'tamanho': (1200, 630), 'modo': 'cortar', 'qualidade': 85, 'marca_dagua': True, 'campo': 'imagem_social'},
+    'lightbox': {'tamanho': (600, 600), 'modo': 'ajustar', 'qualidade': 90, 'marca_dagua': True, 'campo': 'miniatura_marca_dagua'},
+    'grade': {'tamanho': (300, 300), 'modo': 'ajustar', 'qualidade': 80, 'marca_dagua': True, 'campo': 'miniatura_grade'},
+}
+# Acima disso a foto é rejeitada no worker (bomba de descompressão); o request só lê o cabeçalho (galeria/validacao_imagem.py)
+FOTO_MAX_PIXELS = int(os.getenv('FOTO_MAX_PIXELS', '120000000'))
+# --- CACHE DA MARCA D'ÁGUA (galeria/marca_dagua.py) ---
+# Memória (MB) de grades de marca d'água prontas em cada processo; as que não cabem vêm do disco
+MARCA_DAGUA_CACHE_MB = int(os.getenv('MARCA_DAGUA_CACHE_MB', '48'))
+# Pasta local onde as grades ficam salvas entre reinícios (vazio = pasta temporária do sistema)
+MARCA_DAGUA_CACHE_DIR = os.getenv('MARCA_DAGUA_CACHE_DIR', '')
+# Quantas grades ficam nessa pasta; acima disso as menos usadas são apagadas
+MARCA_DAGUA_CACHE_DISCO_MAX = int(os.getenv('MARCA_DAGUA_CACHE_DISCO_MAX', '256'))
+# --- PROCESSAMENTO DOS VÍDEOS (galeria/processamento_video.py) ---
+# Janela do original que o ffmpeg lê do S3 para o preview com marca d'água (a miniatura sai dela)
+VIDEO_PREVIEW_INICIO = int(os.getenv('VIDEO_PREVIEW_INICIO', '0'))
+VIDEO_PREVIEW_SEGUNDOS = int(os.getenv('VIDEO_PREVIEW_SEGUNDOS', '10'))
+# Validade (segundos) da URL assinada que o ffmpeg usa para ler o original
+VIDEO_URL_VALIDADE = int(os.getenv('VIDEO_URL_VALIDADE', '3600'))
+# --- DOWNLOAD EM ZIP (loja/pacotes.py) ---
+# Quantos arquivos do S3 ficam abertos em paralelo enquanto o ZIP é transmitido
+ZIP_DOWNLOAD_PREFETCH = int(os.getenv('ZIP_DOWNLOAD_PREFETCH', '4'))
+# Pacote PENDENTE/PROCESSANDO parado há mais que isso (minutos) é remontado no próximo pedido
+PACOTE_ZIP_TIMEOUT_MINUTOS = int(os.getenv('PACOTE_ZIP_TIMEOUT_MINUTOS', '30'))
+# --- EXPORTAÇÃO DE RELATÓRIOS (loja/exportacao.py) ---
+# Acima desse número de linhas o relatório é gerado pelo Celery e o link vai por e-mail
+EXPORTACAO_LIMITE_LINHAS = int(os.getenv('EXPORTACAO_LIMITE_LINHAS', '50000'))
+# Quantas linhas o cursor do banco traz por vez
+EXPORTACAO_CHUNK = int(os.getenv('EXPORTACAO_CHUNK', '2000'))
+# Validade (segundos) do link do relatório enviado por e-mail
+EXPORTACAO_LINK_VALIDADE = int(os.getenv('EXPORTACAO_LINK_VALIDADE', str(3 * 24 * 3600)))
@@ -11,6 +11,7 @@ from rest_framework import status
 from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from contas.permissions import IsFotografoOrAdmin
+from galeria.marca_dagua import aplicar_marca_dagua, caminho_marca_dagua
 
 class ContactFormView(APIView):
     permission_classes = [AllowAny]
@@ -69,35 +70,18 @@ class WatermarkToolView(APIView):
             # 1. ALTERAÇÃO AQUI: Diminuímos de 1920 para 800x800. 
             # É o tamanho ideal para capas e pré-visualizações do WhatsApp.
             original_image.thumbnail((800, 800), Image.Resampling.LANCZOS)
-            img_width, img_height = original_image.size
 
-            watermark_path = settings.BASE_DIR / 'assets' / 'watermark.PNG'
-
-            if not os.path.exists(watermark_path):
+            if not os.path.exists(caminho_marca_dagua()):
                 return Response({'error': 'Imagem de marca d\'água não encontrada no servidor.'}, status=500)
 
-            watermark = Image.open(watermark_path).convert("RGBA")
-            
-            new_wm_width = int(img_width * 0.20)
-            new_wm_height = int(watermark.size[1] * (new_wm_width / watermark.size[0]))
-            watermark = watermark.resize((new_wm_width, new_wm_height), Image.Resampling.LANCZOS)
-            wm_width, wm_height = watermark.size
-            
-            alpha = watermark.getchannel('A').point(lambda i: i * 0.3)
-            watermark.putalpha(alpha)
-
-            final_image = Image.new('RGBA', original_image.size, (0, 0, 0, 0))
-            final_image.paste(original_image, (0, 0))
-            
-            for y in range(0, img_height, wm_height + int(img_height * 0.1)):
-                for x in range(0, img_width, wm_width + int(img_width * 0.1)):
-                    final_image.paste(watermark, (x, y), mask=watermark)
+            # Grade de marcas vinda do cache compartilhado (um único alpha_composite)
+            final_image = aplicar_marca_dagua(original_image)
 
             buffer = BytesIO()
             
             # 2. ALTERAÇÃO AQUI: Baixamos a qualidade para 75 e ativamos o optimize.
             # A imagem continua bonita, mas o peso despenca.
-            final_image.convert("RGB").save(buffer, format='JPEG', quality=75, optimize=True)
+            final_image.save(buffer, format='JPEG', quality=75, optimize=True)
             buffer.seek(0)
 
             original_filename = os.path.splitext(imagem_original_file.name)[0]
@@ -22,6 +22,12 @@ def limpar_fotos_nao_vendidas(modeladmin, request, queryset):
                 # 2. Deleta a miniatura com marca d'água do S3
                 if foto.miniatura_marca_dagua:
                     foto.miniatura_marca_dagua.delete(save=False)
+                if foto.miniatura_grade:
+                    foto.miniatura_grade.delete(save=False)
+                if foto.imagem_social:
+                    foto.imagem_social.delete(save=False)
+                if foto.imagem_rekognition:
+                    foto.imagem_rekognition.delete(save=False)
                 
                 # 3. Elimina o registro correspondente no banco de dados
                 foto.delete()
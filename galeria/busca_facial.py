@@ -0,0 +1,442 @@
+# galeria/busca_facial.py
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.module_loading import import_string
+
+from config.aws import cliente_rekognition
+
+# ====================================================================
+# BUSCA FACIAL PLUGÁVEL (Rekognition ou índice vetorial local)
+# ====================================================================
+# O backend é escolhido em settings.BUSCA_FACIAL_BACKEND:
+# - 'rekognition': index_faces / search_faces_by_image na AWS, na coleção global
+#   do site e, com BUSCA_FACIAL_COLECAO_POR_ALBUM, também numa coleção por álbum
+#   (custo: dois IndexFaces por foto, metade da vazão do REKOGNITION_TPS).
+#   Arquivar ou apagar o álbum apaga a coleção dele (apagar_colecao_do_album).
+# - 'local': cada FaceIndexada guarda o vetor da face (float32) e a busca é um
+#   produto de matrizes do NumPy, partido por álbum, dentro do próprio processo.
+# Também aceita o caminho de uma classe própria (ex: 'app.modulo.MeuBackend').
+#
+# Os dois falam a mesma língua:
+# - indexar(foto, imagem_bytes, chamar=None) -> lista de FaceIndexada (ainda não salvas);
+#   'chamar' embrulha CADA chamada à API externa (balde de tokens e backoff da indexação)
+# - buscar(imagem_bytes, album_id=None) -> [(foto_id, similaridade 0-100)], da maior para a menor
+# - particao(album_id) -> em que índice a busca do álbum roda (None = coleção global)
+#
+# Dentro de um álbum a busca é "expandida": as melhores faces encontradas
+# (no máximo BUSCA_FACIAL_EXPANSAO_MAX) viram novas consultas, trazendo as
+# fotos da pessoa em que a selfie sozinha não bateu (perfil, óculos, boné...).
+
+
+def _max_faces():
+    return getattr(settings, 'BUSCA_FACIAL_MAX_FACES', 100)
+
+
+def _max_expansao():
+    return getattr(settings, 'BUSCA_FACIAL_EXPANSAO_MAX', 3)
+
+
+def _direto(funcao):
+    return funcao()
+
+
+# O álbum tem coleção própria? (particao() do Rekognition, sem consulta ao banco a cada busca)
+CHAVE_COLECAO_ALBUM = 'busca_facial:colecao_album'
+
+
+def _chave_colecao_album(album_id):
+    return f"{CHAVE_COLECAO_ALBUM}:{album_id}"
+
+
+class BackendRekognition:
+    nome = 'rekognition'
+
+    # Coleções que este processo já garantiu que existem
+    _colecoes_criadas = set()
+
+    def __init__(self):
+        self.colecao = settings.AWS_REKOGNITION_COLLECTION_ID
+        self.limiar = getattr(settings, 'BUSCA_FACIAL_LIMIAR', 95)
+        self.por_album = getattr(settings, 'BUSCA_FACIAL_COLECAO_POR_ALBUM', True)
+
+    def colecao_do_album(self, album_id):
+        return f"{self.colecao}-album-{album_id}"
+
+    def _garantir_colecao(self, colecao, chamar=_direto):
+        if colecao in self._colecoes_criadas:
+            return
+        rekognition = cliente_rekognition()
+        try:
+            chamar(lambda: rekognition.create_collection(CollectionId=colecao))
+        except rekognition.exceptions.ResourceAlreadyExistsException:
+            pass
+        self._colecoes_criadas.add(colecao)
+
+    def _indexar_na_colecao(self, foto, imagem_bytes, colecao, chamar=_direto):
+        from .models import FaceIndexada
+
+        response = chamar(lambda: cliente_rekognition().index_faces(
+            CollectionId=colecao,
+            Image={'Bytes': imagem_bytes},
+            ExternalImageId=str(foto.id),
+            DetectionAttributes=['DEFAULT']
+        ))
+        return [
+            FaceIndexada(
+                foto=foto,
+                rekognition_face_id=registro['Face']['FaceId'],
+                colecao='' if colecao == self.colecao else colecao
+            )
+            for registro in response.get('FaceRecords', [])
+        ]
+
+    def indexar(self, foto, imagem_bytes, chamar=_direto):
+        # Coleção global (busca no site todo) + a do álbum (busca sem concorrer com a plataforma).
+        # Cada IndexFaces tem a sua repetição: um throttling na do álbum não reindexa na global.
+        faces = self._indexar_na_colecao(foto, imagem_bytes, self.colecao, chamar)
+        if self.por_album and faces:
+            colecao_album = self.colecao_do_album(foto.album_id)
+            self._garantir_colecao(colecao_album, chamar)
+            try:
+                faces += self._indexar_na_colecao(foto, imagem_bytes, colecao_album, chamar)
+            except cliente_rekognition().exceptions.ResourceNotFoundException:
+                # Apagada (álbum arquivado e desarquivado) depois que este processo a criou
+                self._colecoes_criadas.discard(colecao_album)
+                self._garantir_colecao(colecao_album, chamar)
+                faces += self._indexar_na_colecao(foto, imagem_bytes, colecao_album, chamar)
+            cache.set(_chave_colecao_album(foto.album_id), True, None)
+        return faces
+
+    def particao(self, album_id):
+        """O álbum tem coleção própria? Álbuns indexados antes dela continuam na global."""
+        from .models import FaceIndexada
+
+        if not (album_id and self.por_album):
+            return None
+        chave = _chave_colecao_album(album_id)
+        tem_colecao = cache.get(chave)
+        if tem_colecao is None:
+            tem_colecao = FaceIndexada.objects.filter(colecao=self.colecao_do_album(album_id)).exists()
+            # "Sim" só muda quando a coleção é apagada (que limpa a chave); "não" pode mudar na próxima indexação
+            cache.set(chave, tem_colecao, None if tem_colecao else getattr(settings, 'BUSCA_FACIAL_CACHE_TTL', 600))
+        return album_id if tem_colecao else None
+
+    def esquecer_colecao_do_album(self, album_id):
+        """A coleção do álbum foi apagada na AWS: as buscas voltam para a global e a próxima indexação a recria."""
+        self._colecoes_criadas.discard(self.colecao_do_album(album_id))
+        cache.delete(_chave_colecao_album(album_id))
+
+    def buscar(self, imagem_bytes, album_id=None):
+        from .models import FaceIndexada
+
+        rekognition = cliente_rekognition()
+        particao = self.particao(album_id)
+        colecao = self.colecao_do_album(particao) if particao else self.colecao
+
+        def procurar(colecao):
+            return rekognition.search_faces_by_image(
+                CollectionId=colecao,
+                Image={'Bytes': imagem_bytes},
+                MaxFaces=_max_faces(), FaceMatchThreshold=self.limiar
+            )
+
+        try:
+            response = procurar(colecao)
+        except rekognition.exceptions.ResourceNotFoundException:
+            if not particao:
+                raise
+            # Coleção do álbum apagada no meio do caminho: a busca cai na global, filtrada pelo álbum
+            self.esquecer_colecao_do_album(particao)
+            particao, colecao = None, self.colecao
+            response = procurar(colecao)
+        similaridade_por_face = {match['Face']['FaceId']: match['Similarity'] for match in response.get('FaceMatches', [])}
+
+        if particao:
+            # Expansão limitada: as melhores faces buscam as outras fotos da mesma pessoa
+            sementes = sorted(similaridade_por_face.items(), key=lambda par: par[1], reverse=True)[:_max_expansao()]
+            for face_id, similaridade_semente in sementes:
+                expansao = rekognition.search_faces(
+                    CollectionId=colecao, FaceId=face_id,
+                    MaxFaces=_max_faces(), FaceMatchThreshold=self.limiar
+                )
+                for match in expansao.get('FaceMatches', []):
+                    estimada = match['Similarity'] * similaridade_semente / 100
+                    similaridade_por_face[match['Face']['FaceId']] = max(similaridade_por_face.get(match['Face']['FaceId'], 0), estimada)
+
+        if not similaridade_por_face:
+            return []
+
+        faces = FaceIndexada.objects.filter(rekognition_face_id__in=similaridade_por_face.keys())
+        if album_id:
+            faces = faces.filter(foto__album_id=album_id)
+
+        melhores = {}
+        for face_id, foto_id in faces.values_list('rekognition_face_id', 'foto_id'):
+            melhores[foto_id] = max(melhores.get(foto_id, 0), similaridade_por_face[face_id])
+        return sorted(melhores.items(), key=lambda par: (-par[1], par[0]))
+
+
+# --------------------------------------------------------------------
+# BACKEND LOCAL (NumPy)
+# --------------------------------------------------------------------
+
+def extrair_embeddings_face_recognition(imagem_bytes):
+    """
+    Extrator padrão do backend local: vetores de 128 dimensões da biblioteca
+    face_recognition (dlib). Devolve uma lista, da MAIOR face para a menor.
+    """
+    import face_recognition
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(imagem_bytes)) as imagem:
+        pixels = np.asarray(ImageOps.exif_transpose(imagem).convert('RGB'))
+
+    locais = face_recognition.face_locations(pixels)
+    # (topo, direita, baixo, esquerda): ordena pela área da face
+    locais.sort(key=lambda l: (l[2] - l[0]) * (l[1] - l[3]), reverse=True)
+    return face_recognition.face_encodings(pixels, known_face_locations=locais)
+
+
+class BackendLocal:
+    nome = 'local'
+
+    # Índices montados por processo: {album_id ou None: (assinatura, criado_em, foto_ids, matriz)}.
+    # LRU limitado em partições e em faces somadas (BUSCA_FACIAL_INDICES_MAX/_MAX_FACES):
+    # sem isso cada álbum já buscado ficava na memória do worker para sempre.
+    _indices = OrderedDict()
+    _trava = threading.Lock()
+
+    def __init__(self):
+        import numpy as np
+
+        self.np = np
+        self.extrator = import_string(getattr(
+            settings, 'BUSCA_FACIAL_EXTRATOR', 'galeria.busca_facial.extrair_embeddings_face_recognition'
+        ))
+        self.limiar = getattr(settings, 'BUSCA_FACIAL_LIMIAR_LOCAL', 90)
+        self.validade_indice = getattr(settings, 'BUSCA_FACIAL_INDICE_TTL', 300)
+
+    def _vetor(self, embedding):
+        vetor = self.np.asarray(embedding, dtype=self.np.float32).ravel()
+        norma = self.np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def indexar(self, foto, imagem_bytes, chamar=_direto):
+        from .models import FaceIndexada
+
+        # Nada de API externa: 'chamar' (balde de tokens) não entra aqui
+        return [
+            FaceIndexada(
+                foto=foto,
+                rekognition_face_id=f"local-{uuid.uuid4().hex}",
+                embedding=self._vetor(embedding).tobytes()
+            )
+            for embedding in self.extrator(imagem_bytes)
+        ]
+
+    def _faces_da_particao(self, album_id):
+        from .models import FaceIndexada
+
+        faces = FaceIndexada.objects.filter(embedding__isnull=False, foto__is_arquivado=False)
+        if album_id:
+            return faces.filter(foto__album_id=album_id)
+        return faces.filter(foto__album__is_arquivado=False, foto__album__is_publico=True)
+
+    def _indice(self, album_id):
+        """Matriz (faces x dimensões) da partição; só é remontada quando as faces mudam."""
+        faces = self._faces_da_particao(album_id)
+        resumo = faces.aggregate(total=Count('id'), ultimo=Max('id'))
+        assinatura = (resumo['total'], resumo['ultimo'])
+
+        with self._trava:
+            guardado = self._indices.get(album_id)
+            if guardado and guardado[0] == assinatura and time.monotonic() - guardado[1] < self.validade_indice:
+                self._indices.move_to_end(album_id)
+                return guardado[2], guardado[3]
+
+        foto_ids = []
+        vetores = []
+        for foto_id, embedding in faces.values_list('foto_id', 'embedding').iterator(chunk_size=2000):
+            foto_ids.append(foto_id)
+            vetores.append(self.np.frombuffer(bytes(embedding), dtype=self.np.float32))
+
+        foto_ids = self.np.asarray(foto_ids, dtype=self.np.int64)
+        matriz = self.np.vstack(vetores) if vetores else self.np.empty((0, 0), dtype=self.np.float32)
+        self._guardar_indice(album_id, (assinatura, time.monotonic(), foto_ids, matriz))
+        return foto_ids, matriz
+
+    def _guardar_indice(self, album_id, indice):
+        maximo = getattr(settings, 'BUSCA_FACIAL_INDICES_MAX', 16)
+        maximo_faces = getattr(settings, 'BUSCA_FACIAL_INDICES_MAX_FACES', 500_000)
+        with self._trava:
+            self._indices[album_id] = indice
+            self._indices.move_to_end(album_id)
+            # O recém-montado sempre fica, mesmo que sozinho passe do limite de faces
+            while len(self._indices) > 1 and (
+                len(self._indices) > maximo or sum(len(ids) for _, _, ids, _ in self._indices.values()) > maximo_faces
+            ):
+                self._indices.popitem(last=False)
+
+    def particao(self, album_id):
+        return album_id or None
+
+    def buscar(self, imagem_bytes, album_id=None):
+        embeddings = self.extrator(imagem_bytes)
+        if len(embeddings) == 0:
+            return []
+
+        particao = self.particao(album_id)
+        foto_ids, matriz = self._indice(particao)
+        return self.buscar_no_indice(foto_ids, matriz, self._vetor(embeddings[0]), expandir=particao is not None)
+
+    def buscar_no_indice(self, foto_ids, matriz, vetor, expandir=False):
+        np = self.np
+        if not len(foto_ids):
+            return []
+
+        # Vetores normalizados: similaridade de cosseno = um único produto matriz x vetor
+        similaridades = matriz @ vetor * 100
+
+        if expandir:
+            # As melhores faces (limitadas) também viram consulta: (faces x sementes) numa multiplicação só
+            acima = np.flatnonzero(similaridades >= self.limiar)
+            sementes = acima[np.argsort(-similaridades[acima])][:_max_expansao()]
+            if len(sementes):
+                expandidas = (matriz @ matriz[sementes].T) * similaridades[sementes]
+                similaridades = np.maximum(similaridades, expandidas.max(axis=1))
+
+        candidatas = np.flatnonzero(similaridades >= self.limiar)
+        if not len(candidatas):
+            return []
+        candidatas = candidatas[np.argsort(-similaridades[candidatas], kind='stable')]
+
+        # Uma foto pode ter várias faces parecidas: fica a melhor de cada foto
+        melhores = {}
+        for posicao in candidatas:
+            foto_id = int(foto_ids[posicao])
+            if foto_id not in melhores:
+                melhores[foto_id] = float(similaridades[posicao])
+                if len(melhores) >= _max_faces():
+                    break
+        return sorted(melhores.items(), key=lambda par: (-par[1], par[0]))
+
+
+BACKENDS = {
+    'rekognition': BackendRekognition,
+    'local': BackendLocal,
+}
+
+
+def backend_busca_facial():
+    nome = getattr(settings, 'BUSCA_FACIAL_BACKEND', 'rekognition')
+    classe = BACKENDS.get(nome) or import_string(nome)
+    return classe()
+
+
+# ====================================================================
+# CACHE DE RESULTADOS POR HASH PERCEPTUAL DA SELFIE
+# ====================================================================
+# A mesma selfie (reenviada, recomprimida ou usada nos vários álbuns de um
+# evento) tem o mesmo dHash. O resultado global fica no cache com a chave
+# hash + versão da coleção; indexar faces novas sobe a versão.
+
+CHAVE_VERSAO_COLECAO = 'busca_facial:versao'
+
+
+def hash_perceptual(imagem_bytes):
+    """dHash de 64 bits da imagem normalizada (cinza, 9x8). None se não for uma imagem."""
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(BytesIO(imagem_bytes)) as imagem:
+            imagem.draft('L', (64, 64)) # JPEG: decodifica já reduzido
+            pequena = ImageOps.exif_transpose(imagem).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    except Exception:
+        return None
+
+    pixels = list(pequena.getdata())
+    bits = 0
+    for linha in range(8):
+        for coluna in range(8):
+            bits = (bits << 1) | (pixels[linha * 9 + coluna] > pixels[linha * 9 + coluna + 1])
+    return f"{bits:016x}"
+
+
+def versao_colecao():
+    return cache.get_or_set(CHAVE_VERSAO_COLECAO, 0, None)
+
+
+def incrementar_versao_colecao():
+    """Chamado sempre que faces entram (ou saem) da coleção: invalida os resultados guardados."""
+    cache.add(CHAVE_VERSAO_COLECAO, 0, None)
+    try:
+        return cache.incr(CHAVE_VERSAO_COLECAO)
+    except ValueError: # A chave expirou/foi despejada entre o add e o incr
+        cache.set(CHAVE_VERSAO_COLECAO, 1, None)
+        return 1
+
+
+def buscar_selfie(imagem_bytes, album_id=None):
+    """Busca facial com cache: devolve [(foto_id, similaridade)], da mais parecida para a menos."""
+    from .models import Foto
+
+    backend = backend_busca_facial()
+    album_id = album_id or None
+    particao = backend.particao(album_id)
+
+    impressao = hash_perceptual(imagem_bytes)
+    chave = None
+    if impressao:
+        chave = f"busca_facial:{backend.nome}:v{versao_colecao()}:{particao or 'global'}:{impressao}"
+        resultados = cache.get(chave)
+    else:
+        resultados = None
+
+    if resultados is None:
+        resultados = backend.buscar(imagem_bytes, album_id=particao)
+        if chave:
+            cache.set(chave, resultados, getattr(settings, 'BUSCA_FACIAL_CACHE_TTL', 600))
+
+    if album_id and particao is None:
+        # Álbum sem índice próprio: o resultado global guardado é só filtrado no banco, sem nova chamada à AWS
+        do_album = set(Foto.objects.filter(id__in=[foto_id for foto_id, _ in resultados], album_id=album_id).values_list('id', flat=True))
+        resultados = [(foto_id, similaridade) for foto_id, similaridade in resultados if foto_id in do_album]
+    return resultados
+
+
+# --- Paginação por cursor sobre uma "foto" do resultado (não muda entre as páginas) ---
+
+def paginar_resultados(resultados=None, cursor=None, limite=30):
+    """
+    Sem cursor: guarda o resultado completo no cache e devolve a primeira página.
+    Com cursor: lê a página seguinte do resultado guardado (sem reenviar a selfie).
+    Devolve (pagina, proximo_cursor). Cursor inválido ou expirado: ValueError.
+    """
+    if cursor:
+        try:
+            token, posicao = urlsafe_base64_decode(cursor).decode().split('|')
+            posicao = int(posicao)
+        except (ValueError, TypeError):
+            raise ValueError("Cursor inválido.")
+        resultados = cache.get(f"busca_facial:pagina:{token}")
+        if resultados is None:
+            raise ValueError("A busca expirou. Envie a selfie novamente.")
+    else:
+        token, posicao = uuid.uuid4().hex, 0
+        if len(resultados) > limite:
+            cache.set(f"busca_facial:pagina:{token}", resultados, getattr(settings, 'BUSCA_FACIAL_CACHE_TTL', 600))
+
+    pagina = resultados[posicao:posicao + limite]
+    fim = posicao + limite
+    proximo_cursor = urlsafe_base64_encode(f"{token}|{fim}".encode()) if fim < len(resultados) else None
+    return pagina, proximo_cursor
+
@@ -0,0 +1,346 @@
+# galeria/distribuicao_ftp.py
+
+import ftplib
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from django.conf import settings
+
+# ====================================================================
+# MOTOR DE DISTRIBUIÇÃO FTP (Jornais parceiros em paralelo)
+# ====================================================================
+# Uma foto sai para todos os jornais ao mesmo tempo (pool de threads
+# limitado a FTP_MAX_THREADS). Cada processo do worker mantém conexões já
+# logadas por parceiro, lembrando a pasta em que estão: a segunda foto para
+# o mesmo jornal pula o connect/login/cwd e vai direto ao STOR.
+# Conexão parada há algum tempo passa por um NOOP antes de ser reaproveitada.
+
+PASTA_PADRAO = 'Acesso_Imagens' # Nome da pasta se o parceiro não definir nenhuma
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def endereco_do_parceiro(parceiro):
+    if ':' in parceiro.ftp_host:
+        host, porta = parceiro.ftp_host.rsplit(':', 1)
+        return host, int(porta)
+    return parceiro.ftp_host, 21
+
+
+def pasta_do_parceiro(parceiro):
+    pasta = (parceiro.ftp_pasta or '').strip()
+    if not pasta or pasta == '/':
+        return PASTA_PADRAO
+    return pasta
+
+
+class ConexaoFTP:
+    """Uma sessão FTP logada num parceiro, com a pasta atual em cache."""
+
+    def __init__(self, parceiro):
+        self.chave = chave_do_parceiro(parceiro)
+        self.ftp = ftplib.FTP(timeout=_config('FTP_TIMEOUT', 30))
+        host, porta = endereco_do_parceiro(parceiro)
+        try:
+            self.ftp.connect(host, porta)
+            self.ftp.login(user=parceiro.ftp_user, passwd=parceiro.ftp_password)
+        except BaseException:
+            self.ftp.close() # Senha errada não pode deixar o socket aberto
+            raise
+        self.pasta = None
+        self.criada_em = self.usada_em = time.monotonic()
+        self.reaproveitada = False
+
+    def saudavel(self):
+        """Conexão parada há pouco tempo é confiável; depois disso, um NOOP confirma."""
+        ociosa = time.monotonic() - self.usada_em
+        if ociosa > _config('FTP_OCIOSA_MAX', 120):
+            return False
+        if ociosa > _config('FTP_VERIFICAR_APOS', 15):
+            try:
+                self.ftp.voidcmd('NOOP')
+            except Exception:
+                return False
+        return True
+
+    def entrar_na_pasta(self, pasta_alvo):
+        """A lógica de pasta inteligente: entra, cria se não existir ou cai para a raiz. Só roda uma vez por conexão."""
+        if self.pasta == pasta_alvo:
+            return
+        try:
+            self.ftp.cwd(pasta_alvo) # Tenta entrar na pasta
+        except ftplib.error_perm:
+            # Se não existe, tenta criar
+            try:
+                self.ftp.mkd(pasta_alvo)
+                self.ftp.cwd(pasta_alvo)
+            except ftplib.error_perm:
+                # FALLBACK SEGURANÇA: Se não tiver permissão para criar, usa a raiz
+                try:
+                    self.ftp.cwd('/')
+                except ftplib.all_errors:
+                    pass # Fica no diretório padrão de login
+        self.pasta = pasta_alvo
+
+    def enviar(self, nome_arquivo, arquivo):
+        """Envia bytes ou um arquivo aberto; o arquivo é lido em blocos, nunca inteiro."""
+        if isinstance(arquivo, (bytes, bytearray)):
+            arquivo = BytesIO(arquivo)
+        self.ftp.storbinary(f'STOR {nome_arquivo}', arquivo, blocksize=_config('FTP_BLOCO', 256 * 1024))
+        self.usada_em = time.monotonic()
+
+    def fechar(self):
+        try:
+            self.ftp.quit()
+        except Exception:
+            self.ftp.close()
+
+
+def chave_do_parceiro(parceiro):
+    # O cwd da pasta é relativo: a pasta entra na chave para uma sessão de um jornal (mesmas
+    # credenciais de outro, ou pasta trocada no cadastro) não ser reaproveitada dentro da pasta errada
+    host, porta = endereco_do_parceiro(parceiro)
+    return (host, porta, parceiro.ftp_user, parceiro.ftp_password, pasta_do_parceiro(parceiro))
+
+
+class PoolFTP:
+    """Conexões ociosas por parceiro, deste processo. Thread-safe."""
+
+    def __init__(self):
+        self._ociosas = {}
+        self._lock = threading.Lock()
+
+    def _retirar(self, chave):
+        with self._lock:
+            fila = self._ociosas.get(chave)
+            return fila.pop() if fila else None
+
+    def devolver(self, conexao):
+        with self._lock:
+            fila = self._ociosas.setdefault(conexao.chave, [])
+            if len(fila) < _config('FTP_CONEXOES_POR_PARCEIRO', 2):
+                fila.append(conexao)
+                return
+        conexao.fechar()
+
+    @contextmanager
+    def conexao(self, parceiro, nova=False):
+        """Empresta uma conexão logada; se der erro ela é descartada em vez de voltar ao pool."""
+        while True:
+            conexao = None if nova else self._retirar(chave_do_parceiro(parceiro))
+            if conexao is None:
+                conexao = ConexaoFTP(parceiro)
+                break
+            if conexao.saudavel():
+                conexao.reaproveitada = True
+                break
+            conexao.fechar()
+
+        try:
+            yield conexao
+        except Exception:
+            conexao.fechar()
+            raise
+        else:
+            self.devolver(conexao)
+
+    def limpar(self):
+        with self._lock:
+            conexoes = [conexao for fila in self._ociosas.values() for conexao in fila]
+            self._ociosas.clear()
+        for conexao in conexoes:
+            conexao.fechar()
+
+
+pool = PoolFTP()
+
+
+def _apos_fork():
+    # Sockets do pai não podem ser usados pelo filho (Celery prefork)
+    global pool
+    pool = PoolFTP()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork)
+
+
+# ====================================================================
+# ENTREGA EM LOTE (Álbum inteiro numa sessão por jornal)
+# ====================================================================
+# Cada jornal ganha uma thread que abre UMA sessão e passa todos os arquivos
+# por ela; os jornais andam em paralelo, cada um no seu ritmo. Nada de
+# arquivo inteiro na memória: o STOR lê blocos de FTP_BLOCO direto da origem
+# (stream do S3) quando só um jornal recebe o arquivo; com vários, a origem
+# é baixada uma vez para um temporário local que todos leem e que é apagado
+# quando o último jornal termina.
+
+# Resultado de um arquivo para um jornal (tamanho em bytes e duração do STOR em segundos)
+Aviso = namedtuple('Aviso', ['parceiro', 'chave', 'erro', 'tamanho', 'duracao'])
+
+
+class LeituraContada:
+    """Conta os bytes que o STOR leu (o stream do S3 não diz o tamanho antes do fim)."""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.lidos = 0
+
+    def read(self, tamanho=-1):
+        bloco = self.arquivo.read(tamanho)
+        self.lidos += len(bloco)
+        return bloco
+
+
+class ArquivosCompartilhados:
+    """
+    Abre o arquivo de cada chave para os jornais. consumidores: {chave: quantos jornais vão enviá-la}.
+    Chave de um jornal só sai direto da origem; as demais passam por um temporário local.
+    """
+
+    def __init__(self, abrir, consumidores):
+        self._abrir = abrir
+        self._consumidores = consumidores
+        self._caminhos = {}
+        self._restantes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        """Devolve um arquivo binário aberto (quem pede fecha)."""
+        if self._consumidores[chave] == 1:
+            return self._abrir(chave)
+        with self._lock:
+            lock = self._locks.setdefault(chave, threading.Lock())
+        with lock: # Dois jornais pedindo a mesma foto ao mesmo tempo: só um baixa
+            if chave not in self._caminhos:
+                self._caminhos[chave] = self._baixar(chave)
+            return open(self._caminhos[chave], 'rb')
+
+    def _baixar(self, chave):
+        origem = self._abrir(chave)
+        try:
+            with tempfile.NamedTemporaryFile(prefix='ftp_', dir=_config('FTP_PASTA_TEMPORARIA', None), delete=False) as destino:
+                try:
+                    shutil.copyfileobj(origem, destino, _config('FTP_BLOCO', 256 * 1024))
+                except BaseException:
+                    os.remove(destino.name)
+                    raise
+                return destino.name
+        finally:
+            origem.close()
+
+    def liberar(self, chave):
+        with self._lock:
+            restantes = self._restantes.get(chave, self._consumidores[chave]) - 1
+            if restantes > 0:
+                self._restantes[chave] = restantes
+                return
+            self._restantes.pop(chave, None)
+            self._locks.pop(chave, None)
+            caminho = self._caminhos.pop(chave, None)
+        if caminho:
+            os.remove(caminho)
+
+    def limpar(self):
+        """Apaga os temporários que sobraram (lote interrompido no meio)."""
+        with self._lock:
+            caminhos = list(self._caminhos.values())
+            self._caminhos.clear()
+        for caminho in caminhos:
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+
+def _entregar_para_parceiro(parceiro, arquivos, compartilhados, avisar):
+    """
+    Envia a lista toda por uma sessão. Se a sessão cair no meio, o arquivo da vez falha e o resto segue numa nova.
+    Sessão do pool que já estava morta (caiu antes do primeiro arquivo) ganha UMA nova tentativa com conexão nova.
+    """
+    pendentes = list(arquivos)
+    nova = False
+    while pendentes:
+        enviados_na_sessao = 0
+        reaproveitada = False
+        try:
+            with pool.conexao(parceiro, nova=nova) as conexao:
+                reaproveitada = conexao.reaproveitada
+                conexao.entrar_na_pasta(pasta_do_parceiro(parceiro))
+                while pendentes:
+                    chave, nome_arquivo = pendentes[0]
+                    try:
+                        arquivo = compartilhados.obter(chave)
+                    except Exception as e:
+                        # Falha ao ler do storage não é culpa da sessão FTP
+                        pendentes.pop(0)
+                        compartilhados.liberar(chave)
+                        avisar(Aviso(parceiro, chave, e, 0, 0))
+                        continue
+                    leitura = LeituraContada(arquivo)
+                    inicio = time.monotonic()
+                    try:
+                        conexao.enviar(nome_arquivo, leitura)
+                        erro = None
+                    except ftplib.error_perm as e:
+                        erro = e # Recusado pelo servidor (nome, cota...): a sessão continua boa
+                    finally:
+                        arquivo.close()
+                    pendentes.pop(0)
+                    compartilhados.liberar(chave)
+                    avisar(Aviso(parceiro, chave, erro, leitura.lidos, time.monotonic() - inicio))
+                    enviados_na_sessao += 1
+        except Exception as e:
+            if enviados_na_sessao == 0 and reaproveitada and not nova:
+                # O servidor derrubou a sessão ociosa: sem isso a lista toda falharia (e abriria o disjuntor)
+                nova = True
+                continue
+            if enviados_na_sessao == 0:
+                # Nem conectou (ou a primeira foto derrubou a sessão): desiste do jornal em vez de insistir
+                for chave, _ in pendentes:
+                    compartilhados.liberar(chave)
+                    avisar(Aviso(parceiro, chave, e, 0, 0))
+                return
+            chave, _ = pendentes.pop(0)
+            compartilhados.liberar(chave)
+            avisar(Aviso(parceiro, chave, e, 0, 0))
+
+
+def entregar_em_lote(envios, abrir):
+    """
+    envios: [(parceiro, [(chave, nome_arquivo), ...]), ...]; abrir(chave) devolve um arquivo binário
+    aberto (ex.: o Body do get_object do S3), lido em blocos.
+    Gera um Aviso(parceiro, chave, erro ou None, tamanho, duracao) conforme cada arquivo termina,
+    para quem chama registrar o progresso.
+    """
+    envios = [(parceiro, arquivos) for parceiro, arquivos in envios if arquivos]
+    if not envios:
+        return
+
+    consumidores = Counter(chave for _, arquivos in envios for chave, _ in arquivos)
+    compartilhados = ArquivosCompartilhados(abrir, consumidores)
+    avisos = queue.Queue()
+    threads = min(_config('FTP_MAX_THREADS', 8), len(envios))
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futuros = [
+                executor.submit(_entregar_para_parceiro, parceiro, arquivos, compartilhados, avisos.put)
+                for parceiro, arquivos in envios
+            ]
+            faltam = sum(consumidores.values())
+            while faltam:
+                yield avisos.get()
+                faltam -= 1
+            for futuro in futuros:
+                futuro.result()
+    finally:
+        compartilhados.limpar()
@@ -0,0 +1,279 @@
+# galeria/entregas_ftp.py
+
+import os
+import random
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from config.aws import cliente_s3
+from .distribuicao_ftp import entregar_em_lote
+from .metadados import abrir_carimbado
+from .models import LoteEntrega, EntregaFTP
+
+# ====================================================================
+# REGISTRO DURÁVEL DAS ENTREGAS FTP (Novas tentativas e disjuntor)
+# ====================================================================
+# Toda entrega (arquivo x jornal) é uma linha de EntregaFTP: nada de lista de
+# strings que o Celery joga fora. Falha volta a PENDENTE com espera exponencial
+# e a task do lote se reagenda para a próxima tentativa; esgotadas as
+# tentativas, fica FALHOU no painel para reenfileirar na mão.
+#
+# Disjuntor por jornal: depois de FTP_DISJUNTOR_FALHAS falhas seguidas o
+# jornal fica FTP_DISJUNTOR_SEGUNDOS sem receber tentativas (as entregas só
+# são adiadas, sem gastar tentativa). Passado o tempo, uma falha já reabre.
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+# --- DISJUNTOR POR JORNAL (no cache: vale para todos os workers) ---
+
+def _chave_disjuntor(parceiro_id, campo):
+    return f'ftp:disjuntor:{parceiro_id}:{campo}'
+
+
+def disjuntor_aberto_ate(parceiro_id):
+    """Momento em que o disjuntor do jornal fecha, ou None se está fechado."""
+    aberto_ate = cache.get(_chave_disjuntor(parceiro_id, 'aberto_ate'))
+    if aberto_ate and aberto_ate > time.time():
+        return timezone.now() + timedelta(seconds=aberto_ate - time.time())
+    return None
+
+
+def registrar_sucesso(parceiro_id):
+    cache.delete_many([_chave_disjuntor(parceiro_id, campo) for campo in ('falhas', 'aberto_ate', 'em_teste')])
+
+
+def fechar_disjuntor(parceiro_id):
+    registrar_sucesso(parceiro_id)
+
+
+def registrar_falha(parceiro_id):
+    """Conta a falha; devolve True se o disjuntor abriu agora."""
+    segundos = _config('FTP_DISJUNTOR_SEGUNDOS', 300)
+    chave_falhas = _chave_disjuntor(parceiro_id, 'falhas')
+    cache.add(chave_falhas, 0, segundos * 10)
+    falhas = cache.incr(chave_falhas)
+
+    # Depois de um período aberto o jornal está "em teste": uma falha já basta
+    em_teste = cache.get(_chave_disjuntor(parceiro_id, 'em_teste'))
+    if falhas < _config('FTP_DISJUNTOR_FALHAS', 5) and not em_teste:
+        return False
+
+    cache.set(_chave_disjuntor(parceiro_id, 'aberto_ate'), time.time() + segundos, segundos)
+    cache.set(_chave_disjuntor(parceiro_id, 'em_teste'), 1, segundos * 10)
+    cache.delete(chave_falhas)
+    print(f"🔌 [FTP] Disjuntor aberto para o jornal {parceiro_id} por {segundos}s")
+    return True
+
+
+def espera_para(tentativas):
+    """Segundos até a próxima tentativa: exponencial, com teto e jitter."""
+    base = _config('FTP_ESPERA_BASE', 30)
+    espera = min(_config('FTP_ESPERA_MAX', 1800), base * (2 ** (tentativas - 1)))
+    return espera * random.uniform(0.5, 1.0)
+
+
+# --- CRIAÇÃO E AGENDAMENTO DOS LOTES ---
+
+def criar_lote(solicitante, parceiros, fotos=(), chave_temporaria='', nome_arquivo='', album=None, metadados=None, temporarios=()):
+    """
+    Um lote com uma EntregaFTP por arquivo e jornal. Fotos do site OU arquivos temporários do S3
+    (um em chave_temporaria/nome_arquivo, ou vários em temporarios=[(chave, nome), ...]).
+    """
+    lote = LoteEntrega.objects.create(solicitante=solicitante, album=album, metadados=metadados or {})
+    if chave_temporaria:
+        temporarios = [(chave_temporaria, nome_arquivo)]
+    if temporarios:
+        arquivos = [{'chave_temporaria': chave, 'nome_arquivo': nome} for chave, nome in temporarios]
+    else:
+        arquivos = [{'foto': foto, 'nome_arquivo': os.path.basename(foto.imagem.name)} for foto in fotos]
+    EntregaFTP.objects.bulk_create([
+        EntregaFTP(lote=lote, parceiro=parceiro, **arquivo)
+        for parceiro in parceiros
+        for arquivo in arquivos
+    ])
+    return lote
+
+
+def agendar_lote(lote_id, espera=0):
+    """Dispara a task do lote depois do commit (o worker precisa enxergar as entregas)."""
+    from .tasks import entregar_lote_ftp_task
+
+    transaction.on_commit(lambda: entregar_lote_ftp_task.apply_async((lote_id,), countdown=max(0, int(espera))))
+
+
+def reserva_vencida():
+    """ENVIANDO mais antigo que isso é de um worker que morreu no meio do lote."""
+    return timezone.now() - timedelta(minutes=_config('FTP_RESERVA_MINUTOS', 30))
+
+
+def abandonadas():
+    return Q(status=EntregaFTP.Status.ENVIANDO, atualizado_em__lt=reserva_vencida())
+
+
+def reenfileirar(entregas):
+    """
+    Volta entregas para PENDENTE com as tentativas zeradas e agenda os lotes. Devolve quantas voltaram.
+    ENVIANDO só volta se a reserva venceu (a que está saindo agora não é mexida).
+    """
+    entregas = entregas.exclude(Q(status=EntregaFTP.Status.ENVIANDO) & ~abandonadas())
+    lotes = set(entregas.values_list('lote_id', flat=True))
+    parceiros = set(entregas.values_list('parceiro_id', flat=True))
+    total = entregas.update(status=EntregaFTP.Status.PENDENTE, tentativas=0, proxima_tentativa_em=None, atualizado_em=timezone.now())
+
+    # Quem reenfileira na mão já sabe que o jornal voltou
+    for parceiro_id in parceiros:
+        fechar_disjuntor(parceiro_id)
+    LoteEntrega.objects.filter(id__in=lotes).update(status=LoteEntrega.Status.PENDENTE, concluido_em=None)
+    for lote_id in lotes:
+        agendar_lote(lote_id)
+    return total
+
+
+def retomar_entregas_abandonadas():
+    """
+    Reagenda os lotes com entregas presas em ENVIANDO (worker morto no meio do lote): sem o
+    beat, a task do lote não volta sozinha. Devolve quantos lotes foram reagendados.
+    """
+    lotes = set(EntregaFTP.objects.filter(abandonadas()).values_list('lote_id', flat=True))
+    for lote_id in lotes:
+        agendar_lote(lote_id)
+    return len(lotes)
+
+
+# --- ENVIO ---
+
+def reservar_entregas(lote_id):
+    """Marca como ENVIANDO as entregas do lote que já podem sair (SKIP LOCKED: mensagem duplicada não reenvia)."""
+    agora = timezone.now()
+    prontas = Q(status=EntregaFTP.Status.PENDENTE) & (Q(proxima_tentativa_em__isnull=True) | Q(proxima_tentativa_em__lte=agora))
+
+    with transaction.atomic():
+        ids = list(
+            EntregaFTP.objects.select_for_update(skip_locked=True, of=('self',))
+            # Reserva antiga (worker morto no meio do lote) volta a valer
+            .filter(lote_id=lote_id).filter(prontas | abandonadas())
+            .values_list('id', flat=True)
+        )
+        if ids:
+            EntregaFTP.objects.filter(id__in=ids).update(status=EntregaFTP.Status.ENVIANDO, atualizado_em=agora)
+
+    return list(EntregaFTP.objects.filter(id__in=ids).select_related('lote', 'foto', 'parceiro').order_by('parceiro_id', 'id'))
+
+
+def chave_no_bucket(campo):
+    """Chave S3 de um FileField (o storage guarda com o prefixo 'location': media_private/fotos/...)."""
+    return f"{campo.storage.location}/{campo.name}".replace('//', '/')
+
+
+def _chave_do_arquivo(entrega):
+    if entrega.foto_id:
+        return ('foto', entrega.foto_id)
+    return ('temporario', entrega.chave_temporaria)
+
+
+def processar_entregas(entregas):
+    """Envia as entregas reservadas e grava o resultado de cada uma. Devolve (enviadas, falhas)."""
+    agora = timezone.now()
+    fotos = {}
+    envios = {}
+    por_arquivo = {}
+
+    for entrega in entregas:
+        parceiro = entrega.parceiro
+        aberto_ate = disjuntor_aberto_ate(parceiro.id) if parceiro.ativo else None
+        if not parceiro.ativo or aberto_ate:
+            # Jornal suspenso ou com disjuntor aberto: adia sem gastar tentativa
+            entrega.status = EntregaFTP.Status.PENDENTE
+            entrega.proxima_tentativa_em = aberto_ate
+            entrega.save(update_fields=['status', 'proxima_tentativa_em', 'atualizado_em'])
+            continue
+
+        chave = _chave_do_arquivo(entrega)
+        if entrega.foto_id:
+            fotos[entrega.foto_id] = entrega.foto
+        nome_arquivo = entrega.nome_arquivo or os.path.basename(entrega.foto.imagem.name)
+        envios.setdefault(parceiro.id, (parceiro, []))[1].append((chave, nome_arquivo))
+        por_arquivo[(parceiro.id, chave)] = entrega
+
+    # Título, legenda e créditos do formulário vão para o IPTC/XMP do JPEG (galeria/metadados.py)
+    metadados = entregas[0].lote.metadados if entregas else {}
+
+    def abrir(chave):
+        tipo, valor = chave
+        chave_s3 = chave_no_bucket(fotos[valor].imagem) if tipo == 'foto' else valor
+
+        def abrir_no_s3(inicio):
+            # Stream do S3 (lido em blocos pelo STOR), nunca o arquivo inteiro na memória
+            parametros = {'Range': f'bytes={inicio}-'} if inicio else {}
+            return cliente_s3().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=chave_s3, **parametros)['Body']
+
+        return abrir_carimbado(chave_s3, metadados, abrir_no_s3)
+
+    enviadas = falhas = 0
+    maximo = _config('FTP_ENTREGA_TENTATIVAS', 6)
+    for aviso in entregar_em_lote(envios.values(), abrir):
+        # Cada arquivo concluído já aparece no painel
+        entrega = por_arquivo[(aviso.parceiro.id, aviso.chave)]
+        entrega.tentativas += 1
+        if aviso.erro is None:
+            enviadas += 1
+            registrar_sucesso(aviso.parceiro.id)
+            entrega.status = EntregaFTP.Status.ENVIADA
+            entrega.erro = ''
+            entrega.bytes_enviados = aviso.tamanho
+            entrega.duracao_ms = int(aviso.duracao * 1000)
+            entrega.enviado_em = timezone.now()
+            entrega.proxima_tentativa_em = None
+        else:
+            falhas += 1
+            registrar_falha(aviso.parceiro.id)
+            entrega.erro = str(aviso.erro) or aviso.erro.__class__.__name__
+            if entrega.tentativas >= maximo:
+                entrega.status = EntregaFTP.Status.FALHOU
+                entrega.proxima_tentativa_em = None
+            else:
+                entrega.status = EntregaFTP.Status.PENDENTE
+                entrega.proxima_tentativa_em = agora + timedelta(seconds=espera_para(entrega.tentativas))
+        entrega.save(update_fields=[
+            'status', 'tentativas', 'erro', 'bytes_enviados', 'duracao_ms', 'enviado_em', 'proxima_tentativa_em', 'atualizado_em'
+        ])
+
+    return enviadas, falhas
+
+
+def atualizar_lote(lote_id):
+    """Recalcula o status do lote. Devolve em quantos segundos a task deve voltar (ou None se acabou)."""
+    entregas = EntregaFTP.objects.filter(lote_id=lote_id)
+    em_aberto = entregas.filter(status__in=[EntregaFTP.Status.PENDENTE, EntregaFTP.Status.ENVIANDO])
+
+    if em_aberto.exists():
+        LoteEntrega.objects.filter(id=lote_id).update(status=LoteEntrega.Status.AGUARDANDO)
+        # Entrega de jornal suspenso (sem data) não reagenda: volta quando for reenfileirada
+        proxima = em_aberto.filter(status=EntregaFTP.Status.PENDENTE).aggregate(proxima=Min('proxima_tentativa_em'))['proxima']
+        if proxima is None:
+            return None
+        return max(0, (proxima - timezone.now()).total_seconds())
+
+    falhou = entregas.filter(status=EntregaFTP.Status.FALHOU).exists()
+    LoteEntrega.objects.filter(id=lote_id).update(
+        status=LoteEntrega.Status.CONCLUIDO_COM_FALHAS if falhou else LoteEntrega.Status.CONCLUIDO,
+        concluido_em=timezone.now(),
+    )
+
+    # Arquivo temporário (upload só para FTP) sai do S3 quando todos os jornais o receberam.
+    # Com falha ele fica para o reenfileiramento (a regra de ciclo de vida de tmp_ftp/ no bucket limpa o resto).
+    if not falhou:
+        for chave in entregas.exclude(chave_temporaria='').values_list('chave_temporaria', flat=True).distinct():
+            try:
+                cliente_s3().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=chave)
+            except Exception as e:
+                print(f"⚠️ [FTP] Não foi possível apagar o temporário {chave}: {e}")
+    return None
@@ -0,0 +1,424 @@
+# galeria/indexacao_faces.py
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .busca_facial import backend_busca_facial, incrementar_versao_colecao
+from .versoes import gerar_versoes, VERSAO_REKOGNITION
+
+# ====================================================================
+# INDEXAÇÃO FACIAL EM LOTES (Fila 'faces', vazão controlada)
+# ====================================================================
+# A indexação saiu do processamento das fotos: marca d'água é CPU, o
+# Rekognition é espera de rede e throttling. Uma task própria (fila 'faces')
+# reserva um lote de fotos PENDENTES, indexa em paralelo num pool de threads
+# limitado por um balde de tokens (REKOGNITION_TPS) e grava tudo com um
+# bulk_create. Enquanto houver pendentes a task se reagenda.
+#
+# O balde é do processo (balde_do_processo, compartilhado por todos os lotes
+# e pelas remoções): rode a fila 'faces' num worker só, com 1 processo
+# (celery -A config worker -Q faces --concurrency=1), para o TPS valer para a conta.
+
+CHAVE_AGENDAMENTO = 'faces:lote_agendado'
+
+# Códigos da AWS que significam "vá mais devagar"
+ERROS_DE_LIMITE = {'ThrottlingException', 'ProvisionedThroughputExceededException', 'LimitExceededException', 'TooManyRequestsException'}
+
+
+class BaldeDeTokens:
+    """Libera no máximo 'taxa' chamadas por segundo (com rajadas de até 'capacidade')."""
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade or taxa)
+        self.tokens = self.capacidade
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self, quantidade=1):
+        if self.taxa <= 0 or quantidade <= 0:
+            return
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.tokens >= quantidade:
+                    self.tokens -= quantidade
+                    return
+                espera = (quantidade - self.tokens) / self.taxa
+            time.sleep(espera)
+
+
+_balde = None
+_balde_lock = threading.Lock()
+
+
+def balde_do_processo():
+    """O mesmo balde para todos os lotes: um lote novo não começa com a rajada cheia."""
+    global _balde
+    with _balde_lock:
+        if _balde is None:
+            _balde = BaldeDeTokens(getattr(settings, 'REKOGNITION_TPS', 5))
+        return _balde
+
+
+def erro_de_limite(erro):
+    codigo = getattr(erro, 'response', {}).get('Error', {}).get('Code')
+    return codigo in ERROS_DE_LIMITE
+
+
+def com_backoff(funcao, tentativas=None, base=None):
+    """Repete 'funcao' quando a AWS pede calma, com espera exponencial e jitter."""
+    tentativas = tentativas or getattr(settings, 'FACES_TENTATIVAS', 6)
+    base = base if base is not None else getattr(settings, 'FACES_BACKOFF_BASE', 0.5)
+    for tentativa in range(tentativas):
+        try:
+            return funcao()
+        except Exception as erro:
+            if not erro_de_limite(erro) or tentativa == tentativas - 1:
+                raise
+            espera = min(30, base * (2 ** tentativa)) * random.uniform(0.5, 1.5)
+            print(f"⏳ [FACES] Throttling da AWS, nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+
+def agendar_indexacao_faces():
+    """Agenda UMA task de lote, mesmo que 5.000 fotos cheguem ao mesmo tempo."""
+    from .tasks import indexar_faces_pendentes_task
+
+    if cache.add(CHAVE_AGENDAMENTO, 1, getattr(settings, 'FACES_AGENDAMENTO_TTL', 60)):
+        indexar_faces_pendentes_task.delay()
+
+
+def reservar_lote(tamanho=None):
+    """Marca até 'tamanho' fotos pendentes como PROCESSANDO (SKIP LOCKED: workers não disputam a mesma foto)."""
+    from .models import Foto
+
+    tamanho = tamanho or getattr(settings, 'FACES_LOTE', 50)
+    # Reservas antigas (worker morto no meio do lote) voltam para a fila
+    reserva_vencida = timezone.now() - timedelta(minutes=getattr(settings, 'FACES_RESERVA_MINUTOS', 15))
+
+    with transaction.atomic():
+        ids = list(
+            Foto.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(Q(status_faces=Foto.StatusFaces.PENDENTE) | Q(status_faces=Foto.StatusFaces.PROCESSANDO, faces_atualizado_em__lt=reserva_vencida))
+            .exclude(imagem='')
+            .exclude(album__is_arquivado=True)
+            # Só depois do processamento: a versão 'rekognition' já está gravada (processar_foto_task agenda o lote)
+            .filter(status_processamento=Foto.StatusProcessamento.PROCESSADA)
+            .order_by('id')
+            .values_list('id', flat=True)[:tamanho]
+        )
+        if ids:
+            Foto.objects.filter(id__in=ids).update(status_faces=Foto.StatusFaces.PROCESSANDO, faces_atualizado_em=timezone.now())
+
+    return list(Foto.objects.filter(id__in=ids).only('id', 'album_id', 'imagem', 'imagem_rekognition').order_by('id'))
+
+
+def imagem_para_indexar(foto):
+    """
+    Bytes da versão 'rekognition' gravada pelo processar_foto_task (poucas centenas de KB).
+    Foto processada antes dessa versão existir: gera do original uma vez e grava, para a próxima indexação.
+    """
+    from .models import Foto
+
+    if foto.imagem_rekognition:
+        with foto.imagem_rekognition.open('rb') as arquivo:
+            return arquivo.read()
+
+    with foto.imagem.open('rb') as arquivo:
+        conteudo = gerar_versoes(arquivo, [VERSAO_REKOGNITION])[VERSAO_REKOGNITION]
+    foto.imagem_rekognition.save(os.path.basename(foto.imagem.name), ContentFile(conteudo), save=False)
+    Foto.objects.filter(id=foto.id).update(imagem_rekognition=foto.imagem_rekognition.name)
+    return conteudo
+
+
+def _indexar_foto(foto, backend, balde):
+    imagem_bytes = imagem_para_indexar(foto)
+
+    def chamar(funcao):
+        # Um token e um backoff por chamada à API: repetir o IndexFaces do álbum não repete o da global
+        def tentativa():
+            balde.adquirir()
+            return funcao()
+        return com_backoff(tentativa)
+
+    return backend.indexar(foto, imagem_bytes, chamar=chamar)
+
+
+def indexar_lote(fotos, backend=None, balde=None):
+    """Indexa as fotos em paralelo e grava as faces. Devolve (ids_indexados, ids_com_falha)."""
+    from .models import Foto, FaceIndexada
+
+    if not fotos:
+        return [], []
+
+    backend = backend or backend_busca_facial()
+    balde = balde or balde_do_processo()
+    threads = min(getattr(settings, 'FACES_THREADS', 8), len(fotos))
+
+    novas_faces, indexadas, falhas = [], [], []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futuros = [(foto, executor.submit(_indexar_foto, foto, backend, balde)) for foto in fotos]
+        for foto, futuro in futuros:
+            try:
+                novas_faces.extend(futuro.result())
+                indexadas.append(foto.id)
+            except Exception as e:
+                print(f"❌ [FACES] Foto ID {foto.id} não foi indexada: {e}")
+                falhas.append(foto.id)
+
+    agora = timezone.now()
+    with transaction.atomic():
+        # Só grava o que continua reservado: foto apagada ou álbum arquivado (REMOVIDA) no meio
+        # do lote não ganha faces de volta, e as faces que já foram para a AWS entram na fila de remoção
+        vigentes = set(
+            Foto.objects.select_for_update()
+            .filter(id__in=indexadas + falhas, status_faces=Foto.StatusFaces.PROCESSANDO)
+            .values_list('id', flat=True)
+        )
+        descartadas = [face for face in novas_faces if face.foto_id not in vigentes]
+        novas_faces = [face for face in novas_faces if face.foto_id in vigentes]
+        indexadas = [foto_id for foto_id in indexadas if foto_id in vigentes]
+        falhas = [foto_id for foto_id in falhas if foto_id in vigentes]
+
+        if novas_faces:
+            FaceIndexada.objects.bulk_create(novas_faces, ignore_conflicts=True, batch_size=500)
+        Foto.objects.filter(id__in=indexadas).update(status_faces=Foto.StatusFaces.INDEXADA, faces_atualizado_em=agora)
+        Foto.objects.filter(id__in=falhas).update(status_faces=Foto.StatusFaces.FALHOU, faces_atualizado_em=agora)
+        if enfileirar_remocao((face.rekognition_face_id, face.colecao) for face in descartadas):
+            transaction.on_commit(agendar_remocao_faces)
+
+    if novas_faces:
+        incrementar_versao_colecao()
+    return indexadas, falhas
+
+
+# ====================================================================
+# COLETA DE LIXO DO ÍNDICE FACIAL (Fotos apagadas, álbuns arquivados)
+# ====================================================================
+# Apagar uma FaceIndexada (direto ou em cascata da Foto) coloca a face na
+# fila FaceParaRemover, na mesma transação. Uma task da fila 'faces' tira as
+# faces da coleção com DeleteFaces em lotes de até 4096. Arquivar um álbum
+# tira as faces dele do índice; desarquivar devolve as fotos para a indexação.
+
+CHAVE_AGENDAMENTO_REMOCAO = 'faces:remocao_agendada'
+
+# Limite da API DeleteFaces
+MAX_FACES_POR_REMOCAO = 4096
+
+# Remoções em massa já enfileiram tudo de uma vez: o signal de cada face fica quieto
+_remocao_em_lote = threading.local()
+
+
+def remocao_em_lote_ativa():
+    return getattr(_remocao_em_lote, 'ativa', False)
+
+
+def enfileirar_remocao(faces):
+    """Recebe pares (rekognition_face_id, colecao). Faces do backend local não existem na AWS."""
+    from .models import FaceParaRemover
+
+    fila = [
+        FaceParaRemover(rekognition_face_id=face_id, colecao=colecao)
+        for face_id, colecao in faces
+        if not face_id.startswith('local-')
+    ]
+    if fila:
+        FaceParaRemover.objects.bulk_create(fila, ignore_conflicts=True, batch_size=1000)
+    return len(fila)
+
+
+def agendar_remocao_faces():
+    from .tasks import remover_faces_task
+
+    if cache.add(CHAVE_AGENDAMENTO_REMOCAO, 1, getattr(settings, 'FACES_AGENDAMENTO_TTL', 60)):
+        remover_faces_task.delay()
+
+
+def remover_faces_enfileiradas(rekognition=None, balde=None):
+    """Esvazia a fila: DeleteFaces por coleção, em lotes de até 4096. Devolve o total removido."""
+    from config.aws import cliente_rekognition
+    from .models import FaceParaRemover
+
+    rekognition = rekognition or cliente_rekognition()
+    balde = balde or balde_do_processo()
+    colecao_global = settings.AWS_REKOGNITION_COLLECTION_ID
+    total = 0
+
+    while True:
+        primeira = FaceParaRemover.objects.order_by('id').first()
+        if primeira is None:
+            break
+
+        lote = list(
+            FaceParaRemover.objects.filter(colecao=primeira.colecao)
+            .order_by('id').values_list('id', 'rekognition_face_id')[:MAX_FACES_POR_REMOCAO]
+        )
+        face_ids = [face_id for _, face_id in lote]
+
+        def apagar():
+            balde.adquirir()
+            return rekognition.delete_faces(CollectionId=primeira.colecao or colecao_global, FaceIds=face_ids)
+
+        try:
+            com_backoff(apagar)
+        except rekognition.exceptions.ResourceNotFoundException:
+            pass # A coleção já não existe: as faces foram junto
+
+        # Faces que a AWS não achou também saem da fila (já não estão na coleção)
+        FaceParaRemover.objects.filter(id__in=[id_fila for id_fila, _ in lote]).delete()
+        total += len(lote)
+        print(f"🧹 [FACES] {len(lote)} faces removidas da coleção {primeira.colecao or colecao_global}")
+
+    if total:
+        incrementar_versao_colecao()
+    return total
+
+
+def apagar_colecao_do_album(album_id, rekognition=None, balde=None):
+    """Álbum arquivado ou apagado: a coleção própria sai inteira (DeleteCollection), sem DeleteFaces face a face."""
+    from config.aws import cliente_rekognition
+    from .busca_facial import BackendRekognition
+    from .models import FaceParaRemover
+
+    rekognition = rekognition or cliente_rekognition()
+    balde = balde or balde_do_processo()
+    backend = BackendRekognition()
+    colecao = backend.colecao_do_album(album_id)
+
+    def apagar():
+        balde.adquirir()
+        return rekognition.delete_collection(CollectionId=colecao)
+
+    try:
+        com_backoff(apagar)
+        print(f"🗑️ [FACES] Coleção {colecao} apagada")
+    except rekognition.exceptions.ResourceNotFoundException:
+        pass # O álbum nunca teve coleção própria
+    # As faces dela que ainda estavam na fila foram junto com a coleção
+    FaceParaRemover.objects.filter(colecao=colecao).delete()
+    backend.esquecer_colecao_do_album(album_id)
+
+
+def agendar_remocao_colecao(album_id):
+    """Depois do commit, apaga a coleção do álbum na fila 'faces' (só existe no backend Rekognition)."""
+    from .busca_facial import BackendRekognition
+    from .tasks import apagar_colecao_album_task
+
+    if isinstance(backend_busca_facial(), BackendRekognition):
+        transaction.on_commit(lambda: apagar_colecao_album_task.delay(album_id))
+
+
+def retirar_album_do_indice(album_id):
+    """Álbum arquivado: as faces saem do banco (e entram na fila de remoção) e as fotos ficam REMOVIDA."""
+    from .models import Foto, FaceIndexada
+
+    faces = FaceIndexada.objects.filter(foto__album_id=album_id)
+    with transaction.atomic():
+        # Só as da coleção global vão face a face: a coleção do álbum é apagada inteira
+        enfileirar_remocao(faces.filter(colecao='').values_list('rekognition_face_id', 'colecao'))
+        agendar_remocao_colecao(album_id)
+        _remocao_em_lote.ativa = True
+        try:
+            faces.delete()
+        finally:
+            _remocao_em_lote.ativa = False
+        Foto.objects.filter(album_id=album_id).update(status_faces=Foto.StatusFaces.REMOVIDA, faces_atualizado_em=timezone.now())
+        transaction.on_commit(agendar_remocao_faces)
+    incrementar_versao_colecao()
+
+
+def devolver_album_ao_indice(album_id):
+    """Álbum desarquivado: as fotos voltam para a fila de indexação."""
+    from .models import Foto
+
+    atualizadas = Foto.objects.filter(album_id=album_id, status_faces=Foto.StatusFaces.REMOVIDA).update(
+        status_faces=Foto.StatusFaces.PENDENTE, faces_atualizado_em=timezone.now()
+    )
+    # Mesmo sem REMOVIDAs: fotos enviadas enquanto o álbum estava arquivado ficaram PENDENTES
+    transaction.on_commit(agendar_indexacao_faces)
+    return atualizadas
+
+
+# --- Reconciliação: o que está na AWS x o que está no banco ---
+
+def faces_da_colecao(rekognition, nome_colecao):
+    """Todas as faces da coleção na AWS: {FaceId: ExternalImageId}. Coleção inexistente = vazia."""
+    faces = {}
+    parametros = {'CollectionId': nome_colecao, 'MaxResults': MAX_FACES_POR_REMOCAO}
+    try:
+        while True:
+            resposta = com_backoff(lambda: rekognition.list_faces(**parametros))
+            for face in resposta.get('Faces', []):
+                faces[face['FaceId']] = face.get('ExternalImageId')
+            if not resposta.get('NextToken'):
+                return faces
+            parametros['NextToken'] = resposta['NextToken']
+    except rekognition.exceptions.ResourceNotFoundException:
+        return faces
+
+
+def devolver_fotos_para_indexacao(foto_ids):
+    """Tira todas as faces das fotos (banco e fila de remoção) e marca as fotos como PENDENTES."""
+    from .models import Foto, FaceIndexada
+
+    faces = FaceIndexada.objects.filter(foto_id__in=foto_ids)
+    with transaction.atomic():
+        enfileirar_remocao(faces.values_list('rekognition_face_id', 'colecao'))
+        _remocao_em_lote.ativa = True
+        try:
+            faces.delete()
+        finally:
+            _remocao_em_lote.ativa = False
+        Foto.objects.filter(id__in=foto_ids).exclude(status_faces=Foto.StatusFaces.REMOVIDA).update(
+            status_faces=Foto.StatusFaces.PENDENTE, faces_atualizado_em=timezone.now()
+        )
+
+
+def reconciliar_colecao(rekognition, colecao, aplicar=False):
+    """
+    Compara ListFaces com FaceIndexada de uma coleção ('' = global).
+    - órfãs: estão na AWS e não no banco -> fila de remoção
+    - perdidas: estão no banco e não na AWS -> a foto volta para a indexação
+    Devolve (orfas, perdidas).
+    """
+    from .models import Foto, FaceIndexada
+
+    inicio = timezone.now()
+    remotas = faces_da_colecao(rekognition, colecao or settings.AWS_REKOGNITION_COLLECTION_ID)
+
+    # Só faces gravadas antes da listagem (uma indexação em andamento não é "perda")
+    locais = dict(
+        FaceIndexada.objects.filter(colecao=colecao, data_indexacao__lt=inicio)
+        .exclude(rekognition_face_id__startswith='local-')
+        .values_list('rekognition_face_id', 'foto_id')
+    )
+    todas_locais = set(FaceIndexada.objects.filter(colecao=colecao).values_list('rekognition_face_id', flat=True))
+
+    # Lote em andamento: a face já está na AWS, mas o bulk_create só vem no fim do lote
+    em_processamento = {
+        str(foto_id) for foto_id in Foto.objects.filter(status_faces=Foto.StatusFaces.PROCESSANDO).values_list('id', flat=True)
+    }
+    orfas = [
+        face_id for face_id, externo in remotas.items()
+        if face_id not in todas_locais and externo not in em_processamento
+    ]
+    perdidas = [face_id for face_id in locais if face_id not in remotas]
+
+    if aplicar:
+        enfileirar_remocao((face_id, colecao) for face_id in orfas)
+        if perdidas:
+            devolver_fotos_para_indexacao({locais[face_id] for face_id in perdidas})
+    return orfas, perdidas
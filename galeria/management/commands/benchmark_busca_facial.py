@@ -0,0 +1,40 @@
+# galeria/management/commands/benchmark_busca_facial.py
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from galeria.busca_facial import BackendLocal
+
+
+class Command(BaseCommand):
+    help = "Mede a busca do backend facial local (NumPy) num álbum sintético, sem rede e sem banco."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faces', type=int, default=20000, help="Faces indexadas no álbum.")
+        parser.add_argument('--dimensoes', type=int, default=128)
+        parser.add_argument('--consultas', type=int, default=200)
+
+    def handle(self, *args, **options):
+        backend = BackendLocal()
+        np = backend.np
+        gerador = np.random.default_rng(42)
+
+        faces = options['faces']
+        matriz = gerador.standard_normal((faces, options['dimensoes']), dtype=np.float32)
+        matriz /= np.linalg.norm(matriz, axis=1, keepdims=True)
+        foto_ids = np.arange(faces, dtype=np.int64) // 3 # ~3 faces por foto
+
+        tempos = []
+        for _ in range(options['consultas']):
+            # Selfie = uma face do álbum com ruído (sempre tem resultado acima do limiar)
+            alvo = matriz[gerador.integers(faces)] + gerador.standard_normal(options['dimensoes'], dtype=np.float32) * 0.02
+            inicio = time.perf_counter()
+            backend.buscar_no_indice(foto_ids, matriz, backend._vetor(alvo))
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+        self.stdout.write(f"Álbum sintético: {faces} faces x {options['dimensoes']} dimensões ({matriz.nbytes / 1024 / 1024:.1f} MB)")
+        self.stdout.write(
+            f"  busca local: média {statistics.mean(tempos):.2f} ms | mediana {statistics.median(tempos):.2f} ms | "
+            f"p95 {sorted(tempos)[min(len(tempos) - 1, int(len(tempos) * 0.95))]:.2f} ms"
+        )
@@ -0,0 +1,66 @@
+# galeria/management/commands/benchmark_clientes_aws.py
+import statistics
+import time
+
+import boto3
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.aws import cliente_s3, limpar_clientes
+
+
+def cliente_s3_antigo():
+    """Cópia fiel do padrão antigo: um boto3.client novo a cada requisição."""
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        config=boto3.session.Config(signature_version='s3v4')
+    )
+
+
+class Command(BaseCommand):
+    help = "Compara a latência por requisição do boto3.client novo a cada vez com o cliente compartilhado (config/aws.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=30)
+        parser.add_argument(
+            '--chave', default=None,
+            help="Chave de um objeto do bucket: mede também um HEAD real (conexão TLS nova x reaproveitada)."
+        )
+
+    def medir(self, obter_cliente, repeticoes, chave):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            s3 = obter_cliente()
+            if chave:
+                s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=chave)
+            else:
+                # Assinar uma URL exercita o cliente sem sair para a rede
+                s3.generate_presigned_url('get_object', Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME or 'bucket', 'Key': 'benchmark.jpg'}, ExpiresIn=60)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
+
+    def handle(self, *args, **options):
+        repeticoes = options['repeticoes']
+        chave = options['chave']
+        cenario = f"HEAD em {chave}" if chave else "URL pré-assinada (sem rede)"
+        self.stdout.write(f"Cenário: {cenario} | {repeticoes} requisições por modo")
+
+        antigo = self.medir(cliente_s3_antigo, repeticoes, chave)
+
+        limpar_clientes()
+        inicio = time.perf_counter()
+        cliente_s3()
+        primeira = (time.perf_counter() - inicio) * 1000
+        novo = self.medir(cliente_s3, repeticoes, chave)
+
+        for nome, tempos in [('boto3.client a cada requisição', antigo), ('cliente compartilhado', novo)]:
+            self.stdout.write(
+                f"  {nome:<32} média {statistics.mean(tempos):8.2f} ms | "
+                f"mediana {statistics.median(tempos):8.2f} ms | p95 {sorted(tempos)[min(len(tempos) - 1, int(len(tempos) * 0.95))]:8.2f} ms"
+            )
+        self.stdout.write(f"  (criação única do cliente compartilhado: {primeira:.2f} ms)")
+        self.stdout.write(self.style.SUCCESS(f"Ganho por requisição: {statistics.mean(antigo) / max(statistics.mean(novo), 0.001):.1f}x"))
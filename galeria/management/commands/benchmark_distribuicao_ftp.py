@@ -0,0 +1,88 @@
+# galeria/management/commands/benchmark_distribuicao_ftp.py
+import ftplib
+import os
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from contas.models import JornalParceiro
+from galeria import distribuicao_ftp
+
+
+def distribuir_antigo(parceiros, nome_arquivo, dados):
+    """Cópia fiel do laço antigo das tasks: um jornal depois do outro, conexão nova a cada foto."""
+    for parceiro in parceiros:
+        ftp = ftplib.FTP()
+        host, porta = parceiro.ftp_host.split(':')
+        ftp.connect(host, int(porta))
+        ftp.login(user=parceiro.ftp_user, passwd=parceiro.ftp_password)
+        pasta_alvo = parceiro.ftp_pasta.strip()
+        if not pasta_alvo or pasta_alvo == '/':
+            pasta_alvo = 'Acesso_Imagens'
+        try:
+            ftp.cwd(pasta_alvo)
+        except ftplib.error_perm:
+            ftp.mkd(pasta_alvo)
+            ftp.cwd(pasta_alvo)
+        ftp.storbinary(f'STOR {nome_arquivo}', BytesIO(dados))
+        ftp.quit()
+
+
+class Command(BaseCommand):
+    help = "Compara o envio FTP sequencial antigo com o motor em paralelo (galeria/distribuicao_ftp.py) usando o servidor_ftp.py local."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parceiros', type=int, default=5)
+        parser.add_argument('--fotos', type=int, default=10)
+        parser.add_argument('--tamanho-kb', type=int, default=500)
+        parser.add_argument('--latencia-ms', type=int, default=20, help="Atraso simulado por comando FTP.")
+        parser.add_argument('--porta', type=int, default=2121)
+
+    def handle(self, *args, **options):
+        try:
+            from servidor_ftp import criar_servidor, ligar_em_segundo_plano
+        except ImportError as e:
+            raise CommandError(f"pyftpdlib é necessário para o servidor de teste: {e}")
+
+        pasta = tempfile.mkdtemp(prefix='benchmark_ftp_')
+        servidor, usuarios = criar_servidor(
+            ('127.0.0.1', options['porta']), pasta_base=pasta,
+            parceiros=options['parceiros'], latencia_ms=options['latencia_ms'], threaded=True, log=False, # Um log por comando FTP distorce a medição
+        )
+        desligar_servidor = ligar_em_segundo_plano(servidor)
+
+        # Instâncias em memória: o benchmark não toca no banco
+        parceiros = [
+            JornalParceiro(nome_jornal=usuario, ftp_host=f"127.0.0.1:{options['porta']}", ftp_user=usuario, ftp_password='senha123', ftp_pasta='/')
+            for usuario, _ in usuarios
+        ]
+        dados = os.urandom(options['tamanho_kb'] * 1024)
+        fotos = options['fotos']
+
+        self.stdout.write(
+            f"Cenário: {len(parceiros)} jornais | {fotos} fotos de {options['tamanho_kb']} KB | "
+            f"latência {options['latencia_ms']} ms por comando"
+        )
+
+        try:
+            inicio = time.perf_counter()
+            for i in range(fotos):
+                distribuir_antigo(parceiros, f'antigo_{i}.jpg', dados)
+            antigo = time.perf_counter() - inicio
+
+            distribuicao_ftp.pool.limpar()
+            inicio = time.perf_counter()
+            envios = [(parceiro, [(i, f'novo_{i}.jpg') for i in range(fotos)]) for parceiro in parceiros]
+            for aviso in distribuicao_ftp.entregar_em_lote(envios, lambda chave: BytesIO(dados)):
+                if aviso.erro is not None:
+                    raise CommandError(f"Falha ao enviar para {aviso.parceiro.nome_jornal}: {aviso.erro}")
+            novo = time.perf_counter() - inicio
+        finally:
+            distribuicao_ftp.pool.limpar()
+            desligar_servidor()
+
+        for nome, total in [('sequencial, conexão nova', antigo), ('lote, uma sessão por jornal', novo)]:
+            self.stdout.write(f"  {nome:<28} {total:7.2f} s | {total / fotos * 1000:8.1f} ms por foto")
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {antigo / max(novo, 0.001):.1f}x"))
@@ -0,0 +1,64 @@
+# galeria/management/commands/benchmark_marca_dagua.py
+import time
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from galeria.marca_dagua import aplicar_marca_dagua, caminho_marca_dagua, limpar_cache
+
+
+def marca_dagua_antiga(original_image):
+    """Cópia fiel do laço antigo (abre o PNG, redimensiona e cola a marca a cada chamada)."""
+    img_width, img_height = original_image.size
+    with Image.open(caminho_marca_dagua()).convert("RGBA") as watermark:
+        new_wm_width = int(img_width * 0.20)
+        wm_ratio = new_wm_width / watermark.size[0]
+        new_wm_height = int(wm_ratio * watermark.size[1])
+        watermark = watermark.resize((new_wm_width, new_wm_height), Image.Resampling.LANCZOS)
+        wm_width, wm_height = watermark.size
+
+        alpha = watermark.getchannel('A')
+        alpha = alpha.point(lambda i: i * 0.3)
+        watermark.putalpha(alpha)
+
+        final_image = Image.new('RGBA', original_image.size, (0, 0, 0, 0))
+        final_image.paste(original_image, (0, 0))
+        for y in range(0, img_height, wm_height + int(img_height * 0.1)):
+            for x in range(0, img_width, wm_width + int(img_width * 0.1)):
+                final_image.paste(watermark, (x, y), mask=watermark)
+        return final_image.convert("RGB")
+
+
+class Command(BaseCommand):
+    help = "Compara a marca d'água antiga (laço de paste) com o compositor em cache (galeria/marca_dagua.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=50)
+
+    def medir(self, funcao, imagem, repeticoes):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao(imagem)
+        return (time.perf_counter() - inicio) * 1000 / repeticoes
+
+    def handle(self, *args, **options):
+        repeticoes = options['repeticoes']
+        self.stdout.write(f"Marca d'água: {caminho_marca_dagua()} | {repeticoes} repetições por cenário")
+
+        # Tamanhos típicos: miniatura de 600px das fotos e 800px da ferramenta do painel
+        for tamanho in [(600, 400), (400, 600), (800, 533)]:
+            imagem = Image.new('RGBA', tamanho, (90, 120, 150, 255))
+
+            antiga = self.medir(marca_dagua_antiga, imagem, repeticoes)
+
+            limpar_cache()
+            inicio = time.perf_counter()
+            aplicar_marca_dagua(imagem)
+            primeira = (time.perf_counter() - inicio) * 1000
+
+            nova = self.medir(aplicar_marca_dagua, imagem, repeticoes)
+
+            self.stdout.write(
+                f"{tamanho[0]}x{tamanho[1]}: antiga {antiga:.2f} ms/img | "
+                f"nova {nova:.2f} ms/img (1ª chamada sem cache {primeira:.2f} ms) | "
+                f"{antiga / nova:.1f}x mais rápida"
+            )
@@ -0,0 +1,12 @@
+# galeria/management/commands/limpar_uploads_expirados.py
+from django.core.management.base import BaseCommand
+
+from galeria.uploads_diretos import limpar_sessoes_expiradas
+
+
+class Command(BaseCommand):
+    help = "Cancela as sessões de upload direto vencidas: aborta os multiparts e apaga o que não foi confirmado."
+
+    def handle(self, *args, **options):
+        total = limpar_sessoes_expiradas()
+        self.stdout.write(self.style.SUCCESS(f"{total} sessões de upload canceladas."))
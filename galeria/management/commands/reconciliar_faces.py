@@ -0,0 +1,72 @@
+# galeria/management/commands/reconciliar_faces.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from config.aws import cliente_rekognition
+from galeria.busca_facial import BackendRekognition, backend_busca_facial
+from galeria.indexacao_faces import reconciliar_colecao, remover_faces_enfileiradas, agendar_indexacao_faces
+from galeria.models import Album, FaceIndexada
+
+
+class Command(BaseCommand):
+    help = "Compara as coleções do Rekognition (ListFaces) com o FaceIndexada e corrige as diferenças."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aplicar', action='store_true', help="Corrige de fato (sem isso só mostra o que faria).")
+
+    def colecoes(self, rekognition, backend):
+        """Coleção global + as de álbum que existem na AWS ou no banco: {nome_na_aws: valor_do_campo_colecao}."""
+        prefixo = backend.colecao_do_album('')
+        colecoes = {settings.AWS_REKOGNITION_COLLECTION_ID: ''}
+
+        parametros = {}
+        while True:
+            resposta = rekognition.list_collections(**parametros)
+            for nome in resposta.get('CollectionIds', []):
+                if nome.startswith(prefixo):
+                    colecoes[nome] = nome
+            if not resposta.get('NextToken'):
+                break
+            parametros['NextToken'] = resposta['NextToken']
+
+        for nome in FaceIndexada.objects.exclude(colecao='').values_list('colecao', flat=True).distinct():
+            colecoes[nome] = nome
+        return colecoes
+
+    def handle(self, *args, **options):
+        backend = backend_busca_facial()
+        if not isinstance(backend, BackendRekognition):
+            raise CommandError("A reconciliação só existe para o backend 'rekognition'.")
+
+        aplicar = options['aplicar']
+        rekognition = cliente_rekognition()
+        prefixo = backend.colecao_do_album('')
+        albuns_existentes = set(Album.objects.values_list('id', flat=True))
+
+        total_orfas = total_perdidas = 0
+        for nome, colecao in self.colecoes(rekognition, backend).items():
+            # Coleção de um álbum que já foi apagado: sai inteira
+            album_id = nome[len(prefixo):] if colecao else None
+            if album_id and album_id.isdigit() and int(album_id) not in albuns_existentes:
+                self.stdout.write(f"🗑️ {nome}: álbum {album_id} não existe mais, coleção inteira removida")
+                if aplicar:
+                    rekognition.delete_collection(CollectionId=nome)
+                continue
+
+            orfas, perdidas = reconciliar_colecao(rekognition, colecao, aplicar=aplicar)
+            total_orfas += len(orfas)
+            total_perdidas += len(perdidas)
+            if orfas or perdidas:
+                self.stdout.write(f"🔎 {nome}: {len(orfas)} face(s) órfã(s) na AWS, {len(perdidas)} face(s) perdida(s) no banco")
+
+        if aplicar:
+            removidas = remover_faces_enfileiradas(rekognition)
+            if total_perdidas:
+                agendar_indexacao_faces()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {removidas} face(s) removida(s) da AWS; fotos com {total_perdidas} face(s) perdida(s) voltaram para a indexação."
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Simulação: {total_orfas} órfã(s) e {total_perdidas} perdida(s). Rode com --aplicar para corrigir."
+            ))
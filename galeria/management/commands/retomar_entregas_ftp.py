@@ -0,0 +1,12 @@
+# galeria/management/commands/retomar_entregas_ftp.py
+from django.core.management.base import BaseCommand
+
+from galeria.entregas_ftp import retomar_entregas_abandonadas
+
+
+class Command(BaseCommand):
+    help = "Reagenda os lotes FTP com entregas presas em ENVIANDO além de FTP_RESERVA_MINUTOS (worker morto no meio do lote)."
+
+    def handle(self, *args, **options):
+        total = retomar_entregas_abandonadas()
+        self.stdout.write(self.style.SUCCESS(f"{total} lotes FTP reagendados."))
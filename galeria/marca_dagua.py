@@ -0,0 +1,217 @@
+# galeria/marca_dagua.py
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from PIL import Image
+from django.conf import settings
+
+# ====================================================================
+# MARCA D'ÁGUA EM GRADE (Fotos, Vídeos e Ferramenta do Painel)
+# ====================================================================
+# A grade de marcas d'água é montada UMA vez por (largura, altura, opacidade, ...)
+# e guardada num cache LRU em memória (limitado em MB) e em disco. Cada imagem depois recebe
+# apenas um único Image.alpha_composite, em vez de abrir o PNG, redimensionar
+# e colar a marca dezenas de vezes a cada chamada.
+
+# Padrão das fotos: marca com 20% da largura e espaçamento de 10% da imagem
+PROPORCAO_MARCA = 0.20
+PROPORCAO_ESPACO = 0.10
+OPACIDADE_FOTO = 0.3
+
+# Padrão do preview de vídeo: "lençol" de 2000x2000 com marca fixa de 120px
+TAMANHO_LENCOL_VIDEO = 2000
+LARGURA_MARCA_VIDEO = 120
+OPACIDADE_VIDEO = 0.5
+ESPACO_VIDEO = (40, 60)
+
+_cache_memoria = OrderedDict()
+_bytes_em_memoria = 0
+_trava = threading.Lock()
+
+
+def caminho_marca_dagua():
+    caminho = os.path.join(settings.STATIC_ROOT, 'watermark.PNG')
+    if not os.path.exists(caminho):
+        # Ambiente sem collectstatic (desenvolvimento): usa o arquivo original
+        caminho = os.path.join(settings.BASE_DIR, 'assets', 'watermark.PNG')
+    return caminho
+
+
+def _limite_memoria():
+    return getattr(settings, 'MARCA_DAGUA_CACHE_MB', 48) * 1024 * 1024
+
+
+def _tamanho_em_bytes(overlay):
+    largura, altura = overlay.size
+    return largura * altura * 4 # RGBA
+
+
+def _limite_disco():
+    return getattr(settings, 'MARCA_DAGUA_CACHE_DISCO_MAX', 256)
+
+
+def _pasta_cache_disco():
+    pasta = getattr(settings, 'MARCA_DAGUA_CACHE_DIR', None) or os.path.join(tempfile.gettempdir(), 'acesso_imagens_marca_dagua')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def _montar_overlay(largura, altura, opacidade, largura_marca, espaco_x, espaco_y):
+    with Image.open(caminho_marca_dagua()) as original:
+        marca = original.convert('RGBA')
+
+    altura_marca = max(1, int(marca.size[1] * (largura_marca / marca.size[0])))
+    marca = marca.resize((largura_marca, altura_marca), Image.Resampling.LANCZOS)
+
+    # Opacidade por tabela (LUT) no canal alfa
+    tabela = [int(i * opacidade) for i in range(256)]
+    marca.putalpha(marca.getchannel('A').point(tabela))
+
+    # As marcas nunca se sobrepõem, então copiamos os pixels RGBA tal como estão
+    overlay = Image.new('RGBA', (largura, altura), (0, 0, 0, 0))
+    for y in range(0, altura, altura_marca + espaco_y):
+        for x in range(0, largura, largura_marca + espaco_x):
+            overlay.paste(marca, (x, y))
+    return overlay
+
+
+def _chave(largura, altura, opacidade, largura_marca, espaco_x, espaco_y):
+    # O mtime do PNG entra na chave: trocar a marca d'água invalida o cache em disco
+    try:
+        versao = int(os.path.getmtime(caminho_marca_dagua()))
+    except OSError:
+        versao = 0
+    return (largura, altura, round(opacidade, 3), largura_marca, espaco_x, espaco_y, versao)
+
+
+def _caminho_em_disco(chave):
+    nome = hashlib.sha1(repr(chave).encode()).hexdigest()
+    return os.path.join(_pasta_cache_disco(), f"overlay_{nome}.png")
+
+
+def _gravar_em_disco(caminho, overlay):
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        overlay.save(temporario, 'PNG')
+        os.replace(temporario, caminho) # Escrita atômica: outro worker nunca lê um PNG pela metade
+    except OSError:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        return
+    _podar_disco(os.path.dirname(caminho))
+
+
+def _podar_disco(pasta):
+    """
+    Cada tamanho de foto gera uma grade (PNGs de vários MB): sem limite a pasta cresce para sempre.
+    Apaga as menos usadas recentemente (o mtime é renovado a cada leitura) acima de MARCA_DAGUA_CACHE_DISCO_MAX.
+    """
+    try:
+        entradas = [entrada for entrada in os.scandir(pasta) if entrada.name.startswith('overlay_') and entrada.name.endswith('.png')]
+        excedente = len(entradas) - _limite_disco()
+        if excedente <= 0:
+            return
+        entradas.sort(key=lambda entrada: entrada.stat().st_mtime)
+    except OSError:
+        return
+    for entrada in entradas[:excedente]:
+        try:
+            os.remove(entrada.path)
+        except OSError:
+            pass # Outro worker já apagou
+
+
+def _guardar_em_memoria(chave, overlay):
+    """
+    LRU limitado pela soma dos pixels (MARCA_DAGUA_CACHE_MB por processo): cada worker guarda
+    poucas grades grandes. Grade maior que o limite inteiro fica só no disco.
+    """
+    global _bytes_em_memoria
+    tamanho = _tamanho_em_bytes(overlay)
+    limite = _limite_memoria()
+    if tamanho > limite:
+        return
+    with _trava:
+        anterior = _cache_memoria.pop(chave, None)
+        if anterior is not None:
+            _bytes_em_memoria -= _tamanho_em_bytes(anterior)
+        _cache_memoria[chave] = overlay
+        _bytes_em_memoria += tamanho
+        while _bytes_em_memoria > limite:
+            _, descartada = _cache_memoria.popitem(last=False)
+            _bytes_em_memoria -= _tamanho_em_bytes(descartada)
+
+
+def obter_overlay(largura, altura, opacidade=OPACIDADE_FOTO, largura_marca=None, espaco_x=None, espaco_y=None):
+    """
+    Devolve a grade RGBA (largura x altura) pronta para o alpha_composite.
+    Sem parâmetros extras segue o padrão das fotos (marca com 20% da largura).
+    """
+    if largura_marca is None:
+        largura_marca = max(1, int(largura * PROPORCAO_MARCA))
+    if espaco_x is None:
+        espaco_x = int(largura * PROPORCAO_ESPACO)
+    if espaco_y is None:
+        espaco_y = int(altura * PROPORCAO_ESPACO)
+
+    chave = _chave(largura, altura, opacidade, largura_marca, espaco_x, espaco_y)
+
+    # 1. Memória do processo
+    with _trava:
+        overlay = _cache_memoria.get(chave)
+        if overlay is not None:
+            _cache_memoria.move_to_end(chave)
+            return overlay
+
+    # 2. Disco local (sobrevive ao restart do worker)
+    caminho = _caminho_em_disco(chave)
+    try:
+        with Image.open(caminho) as img:
+            overlay = img.convert('RGBA')
+        os.utime(caminho) # Usado agora: fica de fora da poda
+    except OSError:
+        overlay = None
+
+    # 3. Monta do zero e grava nos dois níveis
+    if overlay is None:
+        overlay = _montar_overlay(largura, altura, opacidade, largura_marca, espaco_x, espaco_y)
+        _gravar_em_disco(caminho, overlay)
+
+    _guardar_em_memoria(chave, overlay)
+    return overlay
+
+
+def aplicar_marca_dagua(imagem, opacidade=OPACIDADE_FOTO):
+    """Aplica a grade de marcas d'água numa imagem e devolve o resultado em RGB."""
+    base = imagem if imagem.mode == 'RGBA' else imagem.convert('RGBA')
+    overlay = obter_overlay(base.size[0], base.size[1], opacidade)
+    return Image.alpha_composite(base, overlay).convert('RGB')
+
+
+def caminho_overlay_video():
+    """
+    Caminho do PNG do "lençol" de marcas usado pelo ffmpeg no preview dos vídeos.
+    O ffmpeg lê o arquivo: a grade (2000x2000, ~16 MB em RGBA) nunca fica na memória do processo.
+    """
+    espaco_x, espaco_y = ESPACO_VIDEO
+    chave = _chave(TAMANHO_LENCOL_VIDEO, TAMANHO_LENCOL_VIDEO, OPACIDADE_VIDEO, LARGURA_MARCA_VIDEO, espaco_x, espaco_y)
+    caminho = _caminho_em_disco(chave)
+    try:
+        os.utime(caminho) # Usado agora: fica de fora da poda
+    except OSError:
+        # Ainda não existe ou a poda já tirou o PNG do disco
+        overlay = _montar_overlay(
+            TAMANHO_LENCOL_VIDEO, TAMANHO_LENCOL_VIDEO, OPACIDADE_VIDEO, LARGURA_MARCA_VIDEO, espaco_x, espaco_y
+        )
+        _gravar_em_disco(caminho, overlay)
+    return caminho
+
+
+def limpar_cache():
+    global _bytes_em_memoria
+    with _trava:
+        _cache_memoria.clear()
+        _bytes_em_memoria = 0
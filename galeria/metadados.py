@@ -0,0 +1,417 @@
+# galeria/metadados.py
+
+import hashlib
+import json
+import re
+import struct
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.core.cache import cache
+
+# ====================================================================
+# CARIMBO IPTC/XMP NAS ENTREGAS FTP (Sem decodificar nem recomprimir)
+# ====================================================================
+# Os jornais leem título, legenda e créditos do IPTC (APP13) e do XMP (APP1).
+# Em vez de abrir a foto no Pillow e salvar de novo (decodifica e recomprime
+# megapixels), só o cabeçalho do JPEG é lido: os segmentos até o SOS. Os
+# nossos APP13/APP1 entram no lugar dos antigos e o resto do arquivo (os
+# dados comprimidos) passa como veio, em stream. Do que o fotógrafo já tinha
+# gravado (copyright, palavras-chave, os outros recursos 8BIM e o resto do
+# XMP) só saem os campos que o carimbo preenche.
+#
+# O cabeçalho carimbado fica no cache por (arquivo, hash dos metadados):
+# os outros jornais, e as novas tentativas, pedem ao S3 só os bytes a partir
+# do SOS (Range) e colam o cabeçalho pronto na frente.
+
+# (dataset IPTC IIM do registro 2, tamanho máximo da norma)
+CAMPOS_IPTC = {
+    'titulo': [(5, 64)], # Object Name
+    'legenda': [(120, 2000)], # Caption/Abstract
+    'creditos': [(80, 32), (110, 32)], # By-line e Credit
+    'local': [(90, 32)], # City
+}
+
+ASSINATURA_XMP = b'http://ns.adobe.com/xap/1.0/\x00'
+ASSINATURA_PHOTOSHOP = b'Photoshop 3.0\x00'
+
+# Recursos 8BIM: IPTC IIM e o MD5 dele (fica velho quando o IPTC muda)
+RECURSO_IPTC = 0x0404
+RECURSO_DIGEST_IPTC = 0x0425
+
+# Conteúdo máximo de um segmento JPEG (o campo de tamanho tem 2 bytes e conta a si mesmo)
+MAX_SEGMENTO = 0xFFFF - 2
+
+NS_RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+NS_DC = 'http://purl.org/dc/elements/1.1/'
+NS_PHOTOSHOP = 'http://ns.adobe.com/photoshop/1.0/'
+
+# Propriedades XMP que cada campo do carimbo substitui
+PROPRIEDADES_XMP = {
+    'titulo': [f'{{{NS_DC}}}title'],
+    'legenda': [f'{{{NS_DC}}}description'],
+    'creditos': [f'{{{NS_DC}}}creator', f'{{{NS_PHOTOSHOP}}}Credit'],
+    'local': [f'{{{NS_PHOTOSHOP}}}City'],
+    'data': [f'{{{NS_PHOTOSHOP}}}DateCreated'],
+}
+
+# Marcadores sem campo de tamanho (TEM e RSTn)
+MARCADORES_SEM_TAMANHO = {0x01} | set(range(0xD0, 0xD8))
+
+
+def normalizar_metadados(metadados):
+    """Só os campos conhecidos e preenchidos; a data vira AAAA-MM-DD (ou some se não der para entender)."""
+    limpos = {}
+    for campo in list(CAMPOS_IPTC) + ['data']:
+        valor = str((metadados or {}).get(campo) or '').strip()
+        if valor:
+            limpos[campo] = valor
+
+    if 'data' in limpos:
+        data = re.match(r'^(\d{4})-(\d{2})-(\d{2})', limpos['data']) or re.match(r'^(\d{2})/(\d{2})/(\d{4})$', limpos['data'])
+        if not data:
+            del limpos['data']
+        elif len(data.group(1)) == 4:
+            limpos['data'] = '-'.join(data.groups())
+        else:
+            dia, mes, ano = data.groups()
+            limpos['data'] = f'{ano}-{mes}-{dia}'
+    return limpos
+
+
+def hash_metadados(metadados):
+    texto = json.dumps(normalizar_metadados(metadados), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:16]
+
+
+def _dataset(numero, valor, registro=2):
+    if len(valor) > 0x7FFF:
+        # Dataset estendido: o tamanho vai em 4 bytes depois do campo
+        return struct.pack('>BBBHI', 0x1C, registro, numero, 0x8004, len(valor)) + valor
+    return struct.pack('>BBBH', 0x1C, registro, numero, len(valor)) + valor
+
+
+def _ler_datasets(iim):
+    """[(registro, numero, valor)] de um bloco IPTC IIM; para no primeiro byte que não é dataset."""
+    datasets, posicao = [], 0
+    while posicao + 5 <= len(iim) and iim[posicao] == 0x1C:
+        registro, numero, tamanho = struct.unpack('>BBH', iim[posicao + 1:posicao + 5])
+        posicao += 5
+        if tamanho & 0x8000:
+            bytes_do_tamanho = tamanho & 0x7FFF
+            tamanho = int.from_bytes(iim[posicao:posicao + bytes_do_tamanho], 'big')
+            posicao += bytes_do_tamanho
+        datasets.append((registro, numero, iim[posicao:posicao + tamanho]))
+        posicao += tamanho
+    return datasets
+
+
+def _em_utf8(valor):
+    """Texto de um IIM sem declaração de charset: UTF-8 se já for, senão Latin-1 convertido."""
+    try:
+        valor.decode('utf-8')
+        return valor
+    except UnicodeDecodeError:
+        return valor.decode('latin-1').encode('utf-8')
+
+
+def _cortar(texto, limite):
+    """Corta em bytes UTF-8 sem quebrar um caractere no meio."""
+    return texto.encode('utf-8')[:limite].decode('utf-8', 'ignore').encode('utf-8')
+
+
+def montar_iim(metadados, antigo=b''):
+    """
+    IPTC IIM em UTF-8 com os nossos campos. Do IIM antigo ficam os datasets que o carimbo
+    não preenche (copyright, palavras-chave...), convertidos para UTF-8 se preciso.
+    """
+    metadados = normalizar_metadados(metadados)
+    nossos = {numero for campo in metadados for numero, _ in CAMPOS_IPTC.get(campo, [])}
+    if 'data' in metadados:
+        nossos.add(55)
+
+    antigos = _ler_datasets(antigo)
+    ja_utf8 = (1, 90, b'\x1b%G') in antigos
+    registro_1 = [(r, n, v) for r, n, v in antigos if r == 1 and n != 90]
+    registro_2 = [(r, n, _em_utf8(v) if not ja_utf8 else v) for r, n, v in antigos if r == 2 and n != 0 and n not in nossos]
+    outros = [(r, n, v) for r, n, v in antigos if r > 2]
+
+    iim = _dataset(90, b'\x1b%G', registro=1) + b''.join(_dataset(n, v, registro=r) for r, n, v in registro_1)
+    iim += _dataset(0, b'\x00\x04') # Versão do registro 2
+    iim += b''.join(_dataset(n, v) for _, n, v in registro_2)
+    for campo, datasets in CAMPOS_IPTC.items():
+        if campo in metadados:
+            for numero, limite in datasets:
+                iim += _dataset(numero, _cortar(metadados[campo], limite))
+    if 'data' in metadados:
+        iim += _dataset(55, metadados['data'].replace('-', '').encode('ascii')) # Date Created
+    return iim + b''.join(_dataset(n, v, registro=r) for r, n, v in outros)
+
+
+def _recurso_8bim(identificador, dados, nome=b'\x00\x00'):
+    bloco = b'8BIM' + struct.pack('>H', identificador) + nome + struct.pack('>I', len(dados)) + dados
+    return bloco + b'\x00' if len(dados) % 2 else bloco # Recursos 8BIM têm tamanho par
+
+
+def _ler_recursos_8bim(dados):
+    """[(id, nome pascal com o preenchimento, dados)] dos recursos do Photoshop, ou None se estiver corrompido."""
+    recursos, posicao = [], 0
+    while posicao < len(dados):
+        if dados[posicao:posicao + 4] != b'8BIM' or posicao + 7 > len(dados):
+            return None
+        identificador = struct.unpack('>H', dados[posicao + 4:posicao + 6])[0]
+        tamanho_nome = dados[posicao + 6] + 1
+        tamanho_nome += tamanho_nome % 2 # Nome pascal com tamanho par
+        nome = dados[posicao + 6:posicao + 6 + tamanho_nome]
+        posicao += 6 + tamanho_nome
+        if posicao + 4 > len(dados):
+            return None
+        tamanho = struct.unpack('>I', dados[posicao:posicao + 4])[0]
+        posicao += 4
+        if posicao + tamanho > len(dados):
+            return None
+        recursos.append((identificador, nome, dados[posicao:posicao + tamanho]))
+        posicao += tamanho + tamanho % 2
+    return recursos
+
+
+def segmentos_photoshop(metadados, antigo=b''):
+    """
+    APP13 'Photoshop 3.0' com o nosso IPTC (8BIM 0x0404). Os outros recursos 8BIM do
+    arquivo (antigo = dados dos APP13 originais, sem a assinatura) passam como vieram.
+    Se não couber num segmento, continua nos seguintes, como o Photoshop faz.
+    """
+    recursos = _ler_recursos_8bim(antigo) or []
+    iim_antigo = next((dados for identificador, _, dados in recursos if identificador == RECURSO_IPTC), b'')
+    iptc = _recurso_8bim(RECURSO_IPTC, montar_iim(metadados, iim_antigo))
+
+    blocos, trocou = [], False
+    for identificador, nome, dados in recursos:
+        if identificador == RECURSO_IPTC:
+            if not trocou:
+                blocos.append(iptc)
+                trocou = True
+        elif identificador != RECURSO_DIGEST_IPTC:
+            blocos.append(_recurso_8bim(identificador, dados, nome))
+    if not trocou:
+        blocos.append(iptc)
+
+    irb = b''.join(blocos)
+    maximo = MAX_SEGMENTO - len(ASSINATURA_PHOTOSHOP)
+    return [
+        b'\xff\xed' + struct.pack('>H', len(ASSINATURA_PHOTOSHOP) + len(pedaco) + 2) + ASSINATURA_PHOTOSHOP + pedaco
+        for pedaco in (irb[inicio:inicio + maximo] for inicio in range(0, len(irb), maximo))
+    ]
+
+
+def segmento_iptc(metadados):
+    """APP13 'Photoshop 3.0' com um bloco 8BIM 0x0404 (IPTC IIM, em UTF-8)."""
+    return segmentos_photoshop(metadados)[0]
+
+
+def _propriedades_xmp(metadados):
+    # Os valores são cortados como no IPTC: uma legenda gigante não pode estourar o segmento de 64 KB
+    def valor(campo):
+        limite = max(limite for _, limite in CAMPOS_IPTC[campo])
+        return escape(_cortar(metadados[campo], limite).decode('utf-8'))
+
+    propriedades = []
+    if 'titulo' in metadados:
+        propriedades.append(f'<dc:title><rdf:Alt><rdf:li xml:lang="x-default">{valor("titulo")}</rdf:li></rdf:Alt></dc:title>')
+    if 'legenda' in metadados:
+        propriedades.append(f'<dc:description><rdf:Alt><rdf:li xml:lang="x-default">{valor("legenda")}</rdf:li></rdf:Alt></dc:description>')
+    if 'creditos' in metadados:
+        propriedades.append(f'<dc:creator><rdf:Seq><rdf:li>{valor("creditos")}</rdf:li></rdf:Seq></dc:creator>')
+        propriedades.append(f'<photoshop:Credit>{valor("creditos")}</photoshop:Credit>')
+    if 'local' in metadados:
+        propriedades.append(f'<photoshop:City>{valor("local")}</photoshop:City>')
+    if 'data' in metadados:
+        propriedades.append(f'<photoshop:DateCreated>{metadados["data"]}</photoshop:DateCreated>')
+    return (
+        f'<rdf:Description rdf:about="" xmlns:rdf="{NS_RDF}" xmlns:dc="{NS_DC}" xmlns:photoshop="{NS_PHOTOSHOP}">'
+        + ''.join(propriedades) + '</rdf:Description>'
+    )
+
+
+def _pacote_xmp(rdf):
+    return (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">' + rdf + '</x:xmpmeta><?xpacket end="w"?>'
+    ).encode('utf-8')
+
+
+def _xmp_mesclado(antigo, metadados):
+    """O XMP do fotógrafo sem as propriedades que o carimbo preenche, mais a nossa rdf:Description. None se não der para ler."""
+    try:
+        prefixos = [prefixo_uri for _, prefixo_uri in ET.iterparse(BytesIO(antigo.rstrip(b'\x00')), events=['start-ns'])]
+        raiz = ET.fromstring(antigo.rstrip(b'\x00'))
+    except ET.ParseError:
+        return None
+    rdf = raiz if raiz.tag == f'{{{NS_RDF}}}RDF' else raiz.find(f'.//{{{NS_RDF}}}RDF')
+    if rdf is None:
+        return None
+
+    for prefixo, uri in prefixos:
+        if prefixo:
+            try:
+                ET.register_namespace(prefixo, uri) # Mantém os prefixos do arquivo (senão viram ns0, ns1...)
+            except ValueError:
+                pass
+
+    trocadas = {propriedade for campo in metadados for propriedade in PROPRIEDADES_XMP.get(campo, [])}
+    for descricao in rdf.iter(f'{{{NS_RDF}}}Description'):
+        for filho in [filho for filho in descricao if filho.tag in trocadas]:
+            descricao.remove(filho)
+        for atributo in [atributo for atributo in descricao.attrib if atributo in trocadas]:
+            del descricao.attrib[atributo]
+    rdf.append(ET.fromstring(_propriedades_xmp(metadados)))
+    return ET.tostring(rdf, encoding='unicode')
+
+
+def segmento_xmp(metadados, antigo=None):
+    """
+    APP1 XMP com os mesmos campos (dc:title, dc:description, dc:creator, photoshop:City/DateCreated).
+    Com o XMP antigo (antigo = o pacote, sem a assinatura), o resto dele é mantido.
+    """
+    metadados = normalizar_metadados(metadados)
+    nosso = _pacote_xmp(f'<rdf:RDF xmlns:rdf="{NS_RDF}">{_propriedades_xmp(metadados)}</rdf:RDF>')
+    xmp = nosso
+    if antigo:
+        mesclado = _xmp_mesclado(antigo, metadados)
+        if mesclado is not None:
+            xmp = _pacote_xmp(mesclado)
+        if len(ASSINATURA_XMP) + len(xmp) > MAX_SEGMENTO:
+            xmp = nosso # O do fotógrafo já ocupava o segmento todo: fica só o nosso
+    conteudo = ASSINATURA_XMP + xmp
+    return b'\xff\xe1' + struct.pack('>H', len(conteudo) + 2) + conteudo
+
+
+def _ler_exato(origem, tamanho):
+    dados = b''
+    while len(dados) < tamanho:
+        bloco = origem.read(tamanho - len(dados))
+        if not bloco:
+            break
+        dados += bloco
+    return dados
+
+
+def ler_cabecalho(origem):
+    """
+    Lê os segmentos do JPEG até o SOS (exclusive). Devolve (segmentos, lidos):
+    segmentos = [(marcador, bytes do segmento)] ou None se não for JPEG; lidos = bytes consumidos da origem.
+    """
+    lidos = _ler_exato(origem, 2)
+    if lidos != b'\xff\xd8':
+        return None, lidos
+
+    segmentos = []
+    while True:
+        marcador = _ler_exato(origem, 2)
+        lidos += marcador
+        while marcador[:1] == b'\xff' and marcador[1:] == b'\xff':
+            # Bytes de preenchimento antes do marcador
+            proximo = _ler_exato(origem, 1)
+            lidos += proximo
+            marcador = b'\xff' + proximo
+        if len(marcador) < 2 or marcador[0] != 0xFF:
+            return None, lidos # Cabeçalho estranho: o arquivo segue intacto
+        codigo = marcador[1]
+        if codigo == 0xDA:
+            return segmentos, lidos
+        if codigo in MARCADORES_SEM_TAMANHO:
+            segmentos.append((codigo, marcador))
+            continue
+        tamanho = _ler_exato(origem, 2)
+        corpo = _ler_exato(origem, struct.unpack('>H', tamanho)[0] - 2) if len(tamanho) == 2 else b''
+        lidos += tamanho + corpo
+        segmentos.append((codigo, marcador + tamanho + corpo))
+
+
+def _eh_nosso_alvo(codigo, segmento):
+    """APP13 do Photoshop e APP1 XMP antigos saem; Exif (também APP1) fica."""
+    if codigo == 0xED:
+        return segmento[4:4 + len(ASSINATURA_PHOTOSHOP)] == ASSINATURA_PHOTOSHOP
+    if codigo == 0xE1:
+        return segmento[4:4 + len(ASSINATURA_XMP)] == ASSINATURA_XMP
+    return False
+
+
+def montar_cabecalho(segmentos, metadados):
+    """SOI + JFIF/Exif originais + nosso XMP e IPTC (mesclados aos antigos) + o resto do cabeçalho (tabelas, SOF...)."""
+    mantidos = [(codigo, segmento) for codigo, segmento in segmentos if not _eh_nosso_alvo(codigo, segmento)]
+    # Os APP13 do Photoshop são um bloco só partido em segmentos; do XMP vale o primeiro
+    photoshop = b''.join(
+        segmento[4 + len(ASSINATURA_PHOTOSHOP):] for codigo, segmento in segmentos
+        if codigo == 0xED and _eh_nosso_alvo(codigo, segmento)
+    )
+    xmp = next((
+        segmento[4 + len(ASSINATURA_XMP):] for codigo, segmento in segmentos
+        if codigo == 0xE1 and _eh_nosso_alvo(codigo, segmento)
+    ), None)
+    # Os nossos entram logo depois do APP0/APP1 iniciais, onde os leitores esperam
+    posicao = 0
+    while posicao < len(mantidos) and mantidos[posicao][0] in (0xE0, 0xE1):
+        posicao += 1
+    novos = [segmento_xmp(metadados, antigo=xmp)] + segmentos_photoshop(metadados, antigo=photoshop)
+    return b'\xff\xd8' + b''.join(s for _, s in mantidos[:posicao]) + b''.join(novos) + b''.join(s for _, s in mantidos[posicao:])
+
+
+class JpegCarimbado:
+    """Arquivo de leitura: o cabeçalho novo e, depois, o resto da origem em stream."""
+
+    def __init__(self, prefixo, origem):
+        self._prefixo = prefixo
+        self._origem = origem
+
+    def read(self, tamanho=-1):
+        if tamanho is None or tamanho < 0:
+            dados, self._prefixo = self._prefixo + self._origem.read(), b''
+            return dados
+        if self._prefixo:
+            dados, self._prefixo = self._prefixo[:tamanho], self._prefixo[tamanho:]
+            return dados
+        return self._origem.read(tamanho)
+
+    def close(self):
+        self._origem.close()
+
+
+def carimbar(origem, metadados):
+    """
+    Devolve (arquivo carimbado em stream, cabeçalho, início do resto) para um arquivo aberto.
+    Se não for JPEG (ou não houver metadados) o arquivo sai intacto e o cabeçalho vem None.
+    """
+    if not normalizar_metadados(metadados):
+        return origem, None, 0
+    segmentos, lidos = ler_cabecalho(origem)
+    if segmentos is None:
+        return JpegCarimbado(lidos, origem), None, 0
+    # O marcador SOS já foi consumido: entra no fim do cabeçalho
+    cabecalho = montar_cabecalho(segmentos, metadados) + b'\xff\xda'
+    return JpegCarimbado(cabecalho, origem), cabecalho, len(lidos)
+
+
+def _chave_cache(identificador, metadados):
+    return f"jpeg_carimbado:{hashlib.sha1(str(identificador).encode('utf-8')).hexdigest()[:16]}:{hash_metadados(metadados)}"
+
+
+def abrir_carimbado(identificador, metadados, abrir):
+    """
+    abrir(inicio) devolve a origem a partir do byte 'inicio' (ex.: get_object com Range).
+    Com o cabeçalho no cache, só o resto do arquivo é pedido à origem.
+    """
+    if not normalizar_metadados(metadados):
+        return abrir(0)
+
+    chave = _chave_cache(identificador, metadados)
+    pronto = cache.get(chave)
+    if pronto:
+        cabecalho, inicio = pronto
+        return JpegCarimbado(cabecalho, abrir(inicio))
+
+    arquivo, cabecalho, inicio = carimbar(abrir(0), metadados)
+    if cabecalho is not None:
+        cache.set(chave, (cabecalho, inicio), getattr(settings, 'FTP_CARIMBO_TTL', 60 * 60 * 24 * 7))
+    return arquivo
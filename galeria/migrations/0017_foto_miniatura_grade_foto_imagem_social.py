@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:28
+
+import config.storages
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0016_avaliacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='imagem_social',
+            field=models.ImageField(blank=True, help_text='Cartão 1200x630 para compartilhamento (Open Graph).', null=True, storage=config.storages.PublicMediaStorage(), upload_to='sociais/'),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='miniatura_grade',
+            field=models.ImageField(blank=True, help_text='Miniatura leve para a grade do álbum.', null=True, storage=config.storages.PublicMediaStorage(), upload_to='miniaturas_grade/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0017_foto_miniatura_grade_foto_imagem_social'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceindexada',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
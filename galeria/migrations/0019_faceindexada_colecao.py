@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0018_faceindexada_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceindexada',
+            name='colecao',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:48
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def marcar_fotos_ja_processadas(apps, schema_editor):
+    # Fotos que já passaram pelo processamento antigo tiveram as faces indexadas junto
+    Foto = apps.get_model('galeria', 'Foto')
+    ja_processadas = Q(faces_indexadas__isnull=False) | (Q(miniatura_marca_dagua__isnull=False) & ~Q(miniatura_marca_dagua=''))
+    Foto.objects.filter(ja_processadas).update(status_faces='INDEXADA')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0019_faceindexada_colecao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='faces_atualizado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='status_faces',
+            field=models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('INDEXADA', 'Indexada'), ('FALHOU', 'Falhou')], db_index=True, default='PENDENTE', max_length=20),
+        ),
+        migrations.RunPython(marcar_fotos_ja_processadas, migrations.RunPython.noop),
+    ]
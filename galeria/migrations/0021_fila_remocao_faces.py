@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0020_foto_status_faces'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='foto',
+            name='status_faces',
+            field=models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('INDEXADA', 'Indexada'), ('FALHOU', 'Falhou'), ('REMOVIDA', 'Removida (álbum arquivado)')], db_index=True, default='PENDENTE', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='FaceParaRemover',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rekognition_face_id', models.CharField(max_length=255)),
+                ('colecao', models.CharField(blank=True, default='', max_length=255)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('colecao', 'rekognition_face_id'), name='face_para_remover_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contas', '0007_usuario_mostrar_no_quem_somos'),
+        ('galeria', '0021_fila_remocao_faces'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteEntrega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metadados', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Na fila'), ('ENVIANDO', 'Enviando'), ('CONCLUIDO', 'Concluído'), ('CONCLUIDO_COM_FALHAS', 'Concluído com falhas')], default='PENDENTE', max_length=25)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('album', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lotes_entrega', to='galeria.album')),
+                ('solicitante', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lotes_entrega', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntregaFTP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('ENVIADA', 'Enviada'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=10)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+                ('foto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entregas_ftp', to='galeria.foto')),
+                ('parceiro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entregas_ftp', to='contas.jornalparceiro')),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entregas', to='galeria.loteentrega')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lote', 'foto', 'parceiro'), name='entrega_ftp_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0022_lote_entrega_ftp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entregaftp',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='entregaftp',
+            name='bytes_enviados',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='entregaftp',
+            name='chave_temporaria',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='entregaftp',
+            name='duracao_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='entregaftp',
+            name='nome_arquivo',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='entregaftp',
+            name='proxima_tentativa_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='entregaftp',
+            name='tentativas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='entregaftp',
+            name='foto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entregas_ftp', to='galeria.foto'),
+        ),
+        migrations.AlterField(
+            model_name='entregaftp',
+            name='status',
+            field=models.CharField(choices=[('PENDENTE', 'Pendente'), ('ENVIANDO', 'Enviando'), ('ENVIADA', 'Enviada'), ('FALHOU', 'Falhou')], db_index=True, default='PENDENTE', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='loteentrega',
+            name='status',
+            field=models.CharField(choices=[('PENDENTE', 'Na fila'), ('ENVIANDO', 'Enviando'), ('AGUARDANDO', 'Aguardando nova tentativa'), ('CONCLUIDO', 'Concluído'), ('CONCLUIDO_COM_FALHAS', 'Concluído com falhas')], default='PENDENTE', max_length=25),
+        ),
+    ]
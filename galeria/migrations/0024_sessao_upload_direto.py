@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:15
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0023_entregas_ftp_tentativas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessaoUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('FOTO', 'Fotos'), ('VIDEO', 'Vídeos')], default='FOTO', max_length=5)),
+                ('destino', models.CharField(choices=[('site', 'Site'), ('ftp', 'Apenas jornais (FTP)'), ('ambos', 'Site e jornais')], default='site', max_length=5)),
+                ('jornais', models.JSONField(blank=True, default=list)),
+                ('metadados', models.JSONField(blank=True, default=dict)),
+                ('preco', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('legenda', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('ABERTA', 'Aguardando arquivos'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada')], db_index=True, default='ABERTA', max_length=10)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('expira_em', models.DateTimeField()),
+                ('confirmada_em', models.DateTimeField(blank=True, null=True)),
+                ('album', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sessoes_upload', to='galeria.album')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessoes_upload', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArquivoUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome_original', models.CharField(max_length=255)),
+                ('chave', models.CharField(max_length=500)),
+                ('content_type', models.CharField(max_length=100)),
+                ('tamanho', models.PositiveBigIntegerField()),
+                ('upload_id', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('AGUARDANDO', 'Aguardando upload'), ('CONFIRMADO', 'Confirmado')], default='AGUARDANDO', max_length=10)),
+                ('foto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='galeria.foto')),
+                ('video', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='galeria.video')),
+                ('sessao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arquivos', to='galeria.sessaoupload')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
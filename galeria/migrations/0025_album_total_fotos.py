@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def contar_fotos_existentes(apps, schema_editor):
+    Album = apps.get_model('galeria', 'Album')
+    Foto = apps.get_model('galeria', 'Foto')
+    contagem = Foto.objects.filter(album=OuterRef('pk')).order_by().values('album').annotate(total=Count('id')).values('total')
+    Album.objects.update(total_fotos=Coalesce(Subquery(contagem), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0024_sessao_upload_direto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='total_fotos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(contar_fotos_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+def marcar_fotos_ja_processadas(apps, schema_editor):
+    # Fotos com miniatura já passaram pelo processamento (e pela validação do ImageField no upload)
+    Foto = apps.get_model('galeria', 'Foto')
+    Foto.objects.exclude(miniatura_marca_dagua='').exclude(miniatura_marca_dagua__isnull=True).update(status_processamento='PROCESSADA')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0025_album_total_fotos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='altura',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='largura',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='motivo_rejeicao',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='status_processamento',
+            field=models.CharField(choices=[('PENDENTE', 'Aguardando processamento'), ('PROCESSADA', 'Processada'), ('REJEITADA', 'Rejeitada (arquivo inválido)')], db_index=True, default='PENDENTE', max_length=10),
+        ),
+        migrations.RunPython(marcar_fotos_ja_processadas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0026_foto_status_processamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arquivoupload',
+            name='checksums',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
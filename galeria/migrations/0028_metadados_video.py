@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0027_checksum_partes_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='metadados',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:09
+
+import config.storages
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galeria', '0028_metadados_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='imagem_rekognition',
+            field=models.ImageField(blank=True, editable=False, help_text="Versão reduzida, sem marca d'água, lida pela indexação facial.", null=True, storage=config.storages.PrivateMediaStorage(), upload_to='rekognition/'),
+        ),
+    ]
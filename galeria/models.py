@@ -1,8 +1,9 @@
 # galeria/models.py
 
+import uuid
 from django.db import models
 from django.utils.text import slugify
-from contas.models import Usuario # Importamos nosso modelo de usuário
+from contas.models import Usuario, JornalParceiro # Importamos nosso modelo de usuário
 from config.storages import PublicMediaStorage, PrivateMediaStorage
 
 class Album(models.Model):
@@ -35,6 +36,8 @@ class Album(models.Model):
     slug = models.SlugField(unique=True, max_length=255, blank=True, help_text="Link personalizado. Deixe em branco para gerar automaticamente.")
     capa = models.ImageField(upload_to='album_capas/', null=True, blank=True, help_text="Imagem de capa do álbum.", storage=PublicMediaStorage())
     is_arquivado = models.BooleanField(default=False, help_text="Se marcado, o álbum não será visível no site público.")
+    # Contador (sinais da Foto e fim de cada lote de upload): a listagem não faz um COUNT por álbum
+    total_fotos = models.PositiveIntegerField(default=0, editable=False)
 
     # --- NOVOS CAMPOS: DESCONTO PROGRESSIVO POR QUANTIDADE ---
     qtd_desconto_1 = models.PositiveIntegerField(default=0, help_text="Quantidade de fotos para ativar o Desconto 1 (Ex: 5)")
@@ -69,6 +72,18 @@ class Album(models.Model):
         return self.titulo
 
 class Foto(models.Model):
+    class StatusFaces(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Pendente'
+        PROCESSANDO = 'PROCESSANDO', 'Processando'
+        INDEXADA = 'INDEXADA', 'Indexada'
+        FALHOU = 'FALHOU', 'Falhou'
+        REMOVIDA = 'REMOVIDA', 'Removida (álbum arquivado)'
+
+    class StatusProcessamento(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Aguardando processamento'
+        PROCESSADA = 'PROCESSADA', 'Processada'
+        REJEITADA = 'REJEITADA', 'Rejeitada (arquivo inválido)'
+
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='fotos')
     imagem = models.ImageField(upload_to='fotos/', storage=PrivateMediaStorage())
     legenda = models.CharField(max_length=255, blank=True, null=True)
@@ -76,7 +91,19 @@ class Foto(models.Model):
     preco = models.DecimalField(max_digits=10, decimal_places=2, default=10.00)
     rotacao = models.IntegerField(default=0)
     miniatura_marca_dagua = models.ImageField(upload_to='miniaturas/', blank=True, null=True, storage=PublicMediaStorage())
+    # --- VERSÕES GERADAS PELO PROCESSAMENTO (ver galeria/versoes.py) ---
+    miniatura_grade = models.ImageField(upload_to='miniaturas_grade/', blank=True, null=True, storage=PublicMediaStorage(), help_text="Miniatura leve para a grade do álbum.")
+    imagem_social = models.ImageField(upload_to='sociais/', blank=True, null=True, storage=PublicMediaStorage(), help_text="Cartão 1200x630 para compartilhamento (Open Graph).")
+    imagem_rekognition = models.ImageField(upload_to='rekognition/', blank=True, null=True, storage=PrivateMediaStorage(), editable=False, help_text="Versão reduzida, sem marca d'água, lida pela indexação facial.")
     is_arquivado = models.BooleanField(default=False, help_text="Se marcado, a foto não será visível no site público.")
+    # --- INDEXAÇÃO FACIAL (fila própria 'faces', ver galeria/indexacao_faces.py) ---
+    status_faces = models.CharField(max_length=20, choices=StatusFaces.choices, default=StatusFaces.PENDENTE, db_index=True)
+    faces_atualizado_em = models.DateTimeField(null=True, blank=True)
+    # --- VALIDAÇÃO NO WORKER (ver galeria/validacao_imagem.py) ---
+    status_processamento = models.CharField(max_length=10, choices=StatusProcessamento.choices, default=StatusProcessamento.PENDENTE, db_index=True)
+    motivo_rejeicao = models.CharField(max_length=255, blank=True, default='')
+    largura = models.PositiveIntegerField(null=True, blank=True) # Do cabeçalho, lido no upload
+    altura = models.PositiveIntegerField(null=True, blank=True)
 
     # Os campos duplicados 'legenda' e 'data_upload' foram removidos
     
@@ -90,6 +117,8 @@ class Video(models.Model):
     arquivo_video = models.FileField(upload_to='videos/', storage=PrivateMediaStorage())
     miniatura = models.ImageField(upload_to='videos_thumbnails/', help_text="Thumbnail de pré-visualização para o vídeo.", blank=True, null=True, storage=PublicMediaStorage())
     arquivo_preview = models.FileField(upload_to='videos_previews/', storage=PublicMediaStorage(), blank=True, null=True)
+    # Resumo do ffprobe (duração, resolução, codecs), gravado pelo processamento (galeria/processamento_video.py)
+    metadados = models.JSONField(default=dict, blank=True)
     preco = models.DecimalField(max_digits=10, decimal_places=2, default=25.00)
     data_upload = models.DateTimeField(auto_now_add=True)
 
@@ -99,11 +128,151 @@ class Video(models.Model):
 class FaceIndexada(models.Model):
     foto = models.ForeignKey(Foto, on_delete=models.CASCADE, related_name='faces_indexadas')
     rekognition_face_id = models.CharField(max_length=255, unique=True, db_index=True)
+    # Coleção do Rekognition onde a face vive ('' = coleção global do site)
+    colecao = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    # Vetor float32 da face (só no backend local de busca facial: galeria/busca_facial.py)
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
     data_indexacao = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Face {self.rekognition_face_id} em Foto {self.foto.id}"
 
+
+class FaceParaRemover(models.Model):
+    """Fila de faces que saíram do banco e ainda precisam sair da coleção do Rekognition."""
+    rekognition_face_id = models.CharField(max_length=255)
+    colecao = models.CharField(max_length=255, blank=True, default='')
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['colecao', 'rekognition_face_id'], name='face_para_remover_unica')]
+
+    def __str__(self):
+        return f"Face {self.rekognition_face_id} ({self.colecao or 'coleção global'})"
+
+# --- ENTREGA EM LOTE PARA JORNAIS PARCEIROS (ver galeria/distribuicao_ftp.py) ---
+class LoteEntrega(models.Model):
+    """Várias fotos para vários jornais numa tarefa só: uma sessão FTP por jornal."""
+    class Status(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Na fila'
+        ENVIANDO = 'ENVIANDO', 'Enviando'
+        AGUARDANDO = 'AGUARDANDO', 'Aguardando nova tentativa'
+        CONCLUIDO = 'CONCLUIDO', 'Concluído'
+        CONCLUIDO_COM_FALHAS = 'CONCLUIDO_COM_FALHAS', 'Concluído com falhas'
+
+    solicitante = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='lotes_entrega')
+    album = models.ForeignKey(Album, on_delete=models.SET_NULL, null=True, blank=True, related_name='lotes_entrega')
+    metadados = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=25, choices=Status.choices, default=Status.PENDENTE)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"Lote {self.id} ({self.get_status_display()})"
+
+
+class EntregaFTP(models.Model):
+    """
+    Um arquivo para um jornal: registro durável de cada entrega (ver galeria/entregas_ftp.py).
+    Falha volta a PENDENTE com 'proxima_tentativa_em' (espera exponencial) até esgotar as tentativas.
+    """
+    class Status(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Pendente'
+        ENVIANDO = 'ENVIANDO', 'Enviando'
+        ENVIADA = 'ENVIADA', 'Enviada'
+        FALHOU = 'FALHOU', 'Falhou'
+
+    lote = models.ForeignKey(LoteEntrega, on_delete=models.CASCADE, related_name='entregas')
+    # Foto do site OU arquivo temporário no S3 (upload só para FTP)
+    foto = models.ForeignKey(Foto, on_delete=models.CASCADE, null=True, blank=True, related_name='entregas_ftp')
+    chave_temporaria = models.CharField(max_length=500, blank=True, default='')
+    nome_arquivo = models.CharField(max_length=255, blank=True, default='')
+    parceiro = models.ForeignKey(JornalParceiro, on_delete=models.CASCADE, related_name='entregas_ftp')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDENTE, db_index=True)
+    tentativas = models.PositiveIntegerField(default=0)
+    bytes_enviados = models.PositiveBigIntegerField(null=True, blank=True)
+    duracao_ms = models.PositiveIntegerField(null=True, blank=True)
+    erro = models.TextField(blank=True, default='')
+    proxima_tentativa_em = models.DateTimeField(null=True, blank=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['lote', 'foto', 'parceiro'], name='entrega_ftp_unica')]
+
+    def __str__(self):
+        return f"{self.nome_arquivo or self.foto_id} -> {self.parceiro_id} ({self.status})"
+
+
+# --- UPLOAD DIRETO PARA O S3 (ver galeria/uploads_diretos.py) ---
+class SessaoUpload(models.Model):
+    """
+    O navegador manda os originais direto para o S3 (POST assinado; multipart nos vídeos)
+    e o backend só recebe o pedido da sessão e a confirmação, em JSON.
+    """
+    class Tipo(models.TextChoices):
+        FOTO = 'FOTO', 'Fotos'
+        VIDEO = 'VIDEO', 'Vídeos'
+
+    class Destino(models.TextChoices):
+        SITE = 'site', 'Site'
+        FTP = 'ftp', 'Apenas jornais (FTP)'
+        AMBOS = 'ambos', 'Site e jornais'
+
+    class Status(models.TextChoices):
+        ABERTA = 'ABERTA', 'Aguardando arquivos'
+        CONFIRMADA = 'CONFIRMADA', 'Confirmada'
+        CANCELADA = 'CANCELADA', 'Cancelada'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='sessoes_upload')
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, null=True, blank=True, related_name='sessoes_upload')
+    tipo = models.CharField(max_length=5, choices=Tipo.choices, default=Tipo.FOTO)
+    destino = models.CharField(max_length=5, choices=Destino.choices, default=Destino.SITE)
+    jornais = models.JSONField(default=list, blank=True)
+    metadados = models.JSONField(default=dict, blank=True)
+    preco = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    legenda = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ABERTA, db_index=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    expira_em = models.DateTimeField()
+    confirmada_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.get_tipo_display()}, {self.get_status_display()})"
+
+
+class ArquivoUpload(models.Model):
+    """Um arquivo da sessão: a chave reservada no bucket e, depois da confirmação, a Foto/Vídeo criado."""
+    class Status(models.TextChoices):
+        AGUARDANDO = 'AGUARDANDO', 'Aguardando upload'
+        CONFIRMADO = 'CONFIRMADO', 'Confirmado'
+
+    sessao = models.ForeignKey(SessaoUpload, on_delete=models.CASCADE, related_name='arquivos')
+    nome_original = models.CharField(max_length=255)
+    # Chave completa no bucket (com o 'media_private/' ou o 'tmp_ftp/')
+    chave = models.CharField(max_length=500)
+    content_type = models.CharField(max_length=100)
+    tamanho = models.PositiveBigIntegerField()
+    upload_id = models.CharField(max_length=255, blank=True, default='') # Multipart dos vídeos
+    checksums = models.JSONField(default=dict, blank=True) # SHA-256 (base64) declarado de cada parte do multipart
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.AGUARDANDO)
+    foto = models.ForeignKey(Foto, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    video = models.ForeignKey(Video, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.nome_original} ({self.status})"
+
+
 # --- NOVO MODELO: AVALIAÇÕES DA HOME PAGE ---
 class Avaliacao(models.Model):
     autor = models.CharField("Nome do Cliente", max_length=150)
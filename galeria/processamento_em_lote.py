@@ -0,0 +1,113 @@
+# galeria/processamento_em_lote.py
+
+import uuid
+from celery import group
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+
+from .models import Album, Foto
+
+# ====================================================================
+# UPLOAD EM LOTE (Um INSERT, poucas mensagens, um fechamento por lote)
+# ====================================================================
+# Uma foto por POST gerava um INSERT, um post_save e uma mensagem no Redis
+# por foto. Aqui o lote inteiro entra num bulk_create (que não dispara o
+# post_save) e o processamento vai em pedaços: um group do Celery com uma
+# mensagem a cada PROCESSAMENTO_PEDACO fotos.
+#
+# O fechamento do lote (contador do álbum e capa) roda UMA vez, quando o
+# último pedaço termina. Um chord faria isso, mas precisa de result backend
+# e o projeto roda com CELERY_IGNORE_RESULT: cada pedaço decrementa um
+# contador no cache e quem zera dispara o fechamento.
+
+PREFIXO_CACHE = 'processamento_lote'
+
+
+def _pedacos(ids, tamanho):
+    return [ids[inicio:inicio + tamanho] for inicio in range(0, len(ids), tamanho)]
+
+
+def enfileirar_fotos(album_id, fotos_ids):
+    """Agenda (depois do commit) o processamento das fotos em pedaços e o fechamento do lote."""
+    from .tasks import processar_fotos_em_lote_task
+
+    fotos_ids = sorted(fotos_ids)
+    if not fotos_ids:
+        return None
+
+    marcador = uuid.uuid4().hex
+    pedacos = _pedacos(fotos_ids, getattr(settings, 'PROCESSAMENTO_PEDACO', 25))
+    validade = getattr(settings, 'PROCESSAMENTO_LOTE_TTL', 60 * 60 * 24)
+
+    def disparar():
+        cache.set(f"{PREFIXO_CACHE}:{marcador}:pendentes", len(pedacos), validade)
+        cache.set(f"{PREFIXO_CACHE}:{marcador}:lote", (album_id, fotos_ids), validade)
+        # A indexação facial (fila 'faces') é agendada por cada foto ao fim do processamento
+        group([processar_fotos_em_lote_task.s(pedaco, marcador) for pedaco in pedacos]).apply_async()
+
+    transaction.on_commit(disparar)
+    return marcador
+
+
+def pedaco_concluido(marcador):
+    """
+    Chamado no fim de cada pedaço. Devolve (album_id, fotos_ids) para quem terminou por último, senão None.
+    """
+    chave = f"{PREFIXO_CACHE}:{marcador}:pendentes"
+    try:
+        restantes = cache.decr(chave)
+    except ValueError:
+        # Contador sumiu do cache (expirou ou foi despejado): fecha assim mesmo, o fechamento é idempotente
+        restantes = 0
+    if restantes > 0:
+        return None
+
+    lote = cache.get(f"{PREFIXO_CACHE}:{marcador}:lote")
+    cache.delete_many([chave, f"{PREFIXO_CACHE}:{marcador}:lote"])
+    return lote
+
+
+def fechar_lote(album_id, fotos_ids):
+    """Uma vez por lote: reconta as fotos do álbum e, se ele não tem capa, usa a primeira foto processada."""
+    album = Album.objects.filter(id=album_id).first()
+    if album is None:
+        return
+
+    album.total_fotos = Foto.objects.filter(album_id=album_id).count()
+    campos = ['total_fotos']
+    if not album.capa:
+        foto = (
+            Foto.objects.filter(id__in=fotos_ids, is_arquivado=False)
+            .exclude(miniatura_marca_dagua='').exclude(miniatura_marca_dagua__isnull=True)
+            .order_by('id').first()
+        )
+        if foto:
+            with foto.miniatura_marca_dagua.open('rb') as miniatura:
+                album.capa.save(f"capa_album_{album.id}_foto_{foto.id}.jpg", ContentFile(miniatura.read()), save=False)
+            campos.append('capa')
+    album.save(update_fields=campos)
+    print(f"📚 [LOTE] Álbum {album_id}: {album.total_fotos} fotos{' e capa nova' if 'capa' in campos else ''}.")
+
+
+def criar_fotos_em_lote(album, imagens=(), nomes=(), preco=None, legenda=''):
+    """
+    Um bulk_create para o lote: arquivos enviados (imagens) OU nomes já no storage (nomes, ex. 'fotos/x.jpg').
+    Devolve as fotos criadas; o processamento é agendado para depois do commit.
+    """
+    def nova(imagem):
+        foto = Foto(album=album, imagem=imagem, legenda=legenda or None)
+        # Dimensões lidas do cabeçalho no request (ImagemPeloCabecalhoField); chaves do bucket ficam para o worker
+        foto.largura, foto.altura = getattr(imagem, 'dimensoes', (None, None))
+        if preco is not None:
+            foto.preco = preco
+        return foto
+
+    with transaction.atomic():
+        # Os arquivos enviados sobem para o storage no pre_save do bulk_create
+        fotos = Foto.objects.bulk_create([nova(imagem) for imagem in list(imagens) or list(nomes)])
+        Album.objects.filter(id=album.id).update(total_fotos=F('total_fotos') + len(fotos))
+        enfileirar_fotos(album.id, [foto.id for foto in fotos])
+    return fotos
@@ -0,0 +1,124 @@
+# galeria/processamento_video.py
+
+import os
+import shutil
+import subprocess
+import tempfile
+import ffmpeg
+from django.conf import settings
+
+from .marca_dagua import caminho_overlay_video
+
+# ====================================================================
+# DERIVADOS DO VÍDEO NUMA PASSADA SÓ (Miniatura, preview e metadados)
+# ====================================================================
+# Antes eram duas tasks (miniatura e preview) e cada uma baixava o vídeo
+# inteiro do S3 para a memória, gravava num temporário e rodava o ffmpeg:
+# dois downloads de GBs e duas decodificações por upload. Agora o ffmpeg lê
+# o original direto de uma URL assinada, com o -ss ANTES do -i (busca na
+# entrada): só os trechos de bytes da janela do preview saem do bucket.
+# Uma invocação decodifica a janela uma vez e o split do filtro entrega os
+# quadros às duas saídas (o preview com a marca d'água e a miniatura).
+# O ffprobe antes dele só lê o cabeçalho do contêiner (duração, resolução,
+# codecs), que vai para Video.metadados.
+
+
+def entrada_do_ffmpeg(arquivo):
+    """Caminho local (storage em disco) ou URL assinada do S3: o ffmpeg busca por faixas de bytes."""
+    try:
+        return arquivo.path
+    except NotImplementedError:
+        validade = getattr(settings, 'VIDEO_URL_VALIDADE', 60 * 60)
+        return arquivo.storage.url(arquivo.name, expire=validade)
+
+
+def _numero(valor, tipo=float):
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fps(taxa):
+    numerador, _, denominador = (taxa or '').partition('/')
+    numerador, denominador = _numero(numerador), _numero(denominador or 1)
+    return round(numerador / denominador, 3) if numerador and denominador else None
+
+
+def ler_metadados(entrada):
+    """Resumo do ffprobe (só o cabeçalho do contêiner): o que o site precisa saber do original."""
+    sonda = ffmpeg.probe(entrada, cmd=shutil.which('ffprobe') or 'ffprobe')
+    formato = sonda.get('format', {})
+    video = next((s for s in sonda.get('streams', []) if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in sonda.get('streams', []) if s.get('codec_type') == 'audio'), {})
+    return {
+        'duracao': _numero(formato.get('duration')),
+        'formato': formato.get('format_name'),
+        'tamanho': _numero(formato.get('size'), int),
+        'bitrate': _numero(formato.get('bit_rate'), int),
+        'largura': video.get('width'),
+        'altura': video.get('height'),
+        'codec_video': video.get('codec_name'),
+        'fps': _fps(video.get('avg_frame_rate')),
+        'codec_audio': audio.get('codec_name'),
+    }
+
+
+def comando_derivados(entrada, inicio, duracao, miniatura=None, preview=None, segundo_miniatura=0, overlay=None):
+    """
+    Uma invocação do ffmpeg para as saídas pedidas (caminhos da miniatura e/ou do preview).
+    O -ss/-t na entrada limitam a leitura do original à janela do preview.
+    """
+    comando = [shutil.which('ffmpeg') or 'ffmpeg', '-y', '-v', 'error', '-ss', str(inicio), '-t', str(duracao), '-i', entrada]
+    filtros, saidas = [], []
+    fontes = ['[v_preview]', '[v_miniatura]'] if miniatura and preview else ['[0:v]', '[0:v]']
+    if miniatura and preview:
+        filtros.append('[0:v]split=2[v_preview][v_miniatura]')
+
+    if preview:
+        comando += ['-i', overlay]
+        # scale=-2:720 mantém a proporção; o "lençol" de marcas cobre o quadro e o que sobra fica de fora
+        filtros.append(f'{fontes[0]}scale=-2:720[bg];[bg][1:v]overlay=0:0[preview]')
+        saidas += ['-map', '[preview]', '-an', '-c:v', 'libx264', '-crf', '28', '-movflags', '+faststart', preview]
+    if miniatura:
+        filtros.append(f'{fontes[1]}trim=start={segundo_miniatura},setpts=PTS-STARTPTS[miniatura]')
+        saidas += ['-map', '[miniatura]', '-frames:v', '1', '-q:v', '3', miniatura]
+
+    return comando + ['-filter_complex', ';'.join(filtros)] + saidas
+
+
+def gerar_derivados(video, miniatura=True, preview=True):
+    """
+    {'metadados': dict, 'miniatura': bytes|None, 'preview': bytes|None} com uma leitura do original.
+    Erros do ffmpeg/ffprobe sobem para a task.
+    """
+    entrada = entrada_do_ffmpeg(video.arquivo_video)
+    metadados = ler_metadados(entrada)
+    resultado = {'metadados': metadados, 'miniatura': None, 'preview': None}
+    if not miniatura and not preview:
+        return resultado
+
+    inicio = getattr(settings, 'VIDEO_PREVIEW_INICIO', 0)
+    duracao = getattr(settings, 'VIDEO_PREVIEW_SEGUNDOS', 10)
+    # A miniatura sai de dentro da janela: 1 s depois do início (ou o meio, em vídeo curto)
+    restante = max(0.0, (metadados['duracao'] or duracao) - inicio)
+    segundo_miniatura = round(min(1.0, restante / 2, duracao / 2), 3)
+
+    pasta = tempfile.mkdtemp(prefix='video_')
+    try:
+        caminhos = {
+            'miniatura': os.path.join(pasta, 'miniatura.jpg') if miniatura else None,
+            'preview': os.path.join(pasta, 'preview.mp4') if preview else None,
+        }
+        comando = comando_derivados(
+            entrada, inicio, duracao, miniatura=caminhos['miniatura'], preview=caminhos['preview'],
+            segundo_miniatura=segundo_miniatura, overlay=caminho_overlay_video() if preview else None,
+        )
+        subprocess.run(comando, check=True, capture_output=True)
+        for nome, caminho in caminhos.items():
+            if caminho:
+                with open(caminho, 'rb') as f:
+                    resultado[nome] = f.read()
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return resultado
@@ -4,16 +4,18 @@ import boto3
 from botocore.exceptions import ClientError
 from django.conf import settings
 from rest_framework import serializers
-from .models import Album, Foto, Video, FaceIndexada, Avaliacao
-from contas.models import Usuario
+from .models import Album, Foto, Video, FaceIndexada, Avaliacao, LoteEntrega, EntregaFTP, SessaoUpload, ArquivoUpload
+from contas.models import Usuario, JornalParceiro
 
 # --- SERIALIZER DE FOTO (COM A LÓGICA CORRETA) ---
 class FotoSerializer(serializers.ModelSerializer):
     imagem_url = serializers.SerializerMethodField()
+    miniatura_url = serializers.SerializerMethodField()
+    social_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Foto
-        fields = ['id', 'legenda', 'preco', 'imagem_url', 'rotacao', 'is_arquivado'] # Adicionámos 'is_arquivado'
+        fields = ['id', 'legenda', 'preco', 'imagem_url', 'miniatura_url', 'social_url', 'rotacao', 'is_arquivado'] # Adicionámos 'is_arquivado'
 
     def get_imagem_url(self, obj):
         # Lógica defensiva:
@@ -27,6 +29,18 @@ class FotoSerializer(serializers.ModelSerializer):
         #    deve ser capaz de lidar com uma URL nula (ex: mostrar um placeholder).
         return None
 
+    def get_miniatura_url(self, obj):
+        # Versão leve para os quadradinhos da grade. Fotos antigas (sem a versão)
+        # caem para a miniatura de 600px.
+        if obj.miniatura_grade and obj.miniatura_grade.name:
+            return obj.miniatura_grade.url
+        return self.get_imagem_url(obj)
+
+    def get_social_url(self, obj):
+        if obj.imagem_social and obj.imagem_social.name:
+            return obj.imagem_social.url
+        return None
+
 # --- SERIALIZER DE VÍDEO (CORRIGIDO) ---
 class VideoSerializer(serializers.ModelSerializer):
     # A miniatura e o preview do vídeo são públicos
@@ -53,7 +67,7 @@ class VideoSerializer(serializers.ModelSerializer):
 class AlbumSerializer(serializers.ModelSerializer):
     fotografo_nome = serializers.SerializerMethodField()
     fotografo = serializers.StringRelatedField()
-    fotos_count = serializers.IntegerField(source='fotos.count', read_only=True)
+    fotos_count = serializers.IntegerField(source='total_fotos', read_only=True)
     capa_url = serializers.SerializerMethodField()
     
     class Meta:
@@ -105,20 +119,105 @@ class AlbumDetailSerializer(AlbumSerializer):
             if request.user == obj.fotografo or request.user.papel == Usuario.Papel.ADMIN:
                 is_owner_or_admin = True
 
-        # 4. Se NÃO for o dono, filtra as fotos arquivadas
+        # 4. Se NÃO for o dono, filtra as fotos arquivadas e as rejeitadas no processamento
         if not is_owner_or_admin:
-            queryset = queryset.filter(is_arquivado=False)
+            queryset = queryset.filter(is_arquivado=False).exclude(status_processamento=Foto.StatusProcessamento.REJEITADA)
         
         # 5. Retorna os dados
         return FotoSerializer(queryset, many=True, context=self.context).data
 
 # --- SERIALIZERS PARA UPLOAD E DASHBOARD (CORRETOS) ---
 # (Estes são usados pelo seu painel, não pelo público)
+class ImagemPeloCabecalhoField(serializers.FileField):
+    """
+    Só a assinatura e as dimensões do cabeçalho no request (sem Pillow).
+    A decodificação completa fica no worker (galeria/validacao_imagem.py).
+    """
+    default_error_messages = {'imagem_invalida': '{motivo}'}
+
+    def to_internal_value(self, data):
+        from .validacao_imagem import ImagemRejeitada, ler_cabecalho_imagem
+
+        arquivo = super().to_internal_value(data)
+        try:
+            _, largura, altura = ler_cabecalho_imagem(arquivo)
+        except ImagemRejeitada as e:
+            self.fail('imagem_invalida', motivo=str(e))
+        arquivo.dimensoes = (largura, altura)
+        return arquivo
+
+
 class FotoUploadSerializer(serializers.ModelSerializer):
+    imagem = ImagemPeloCabecalhoField()
+
     class Meta:
         model = Foto
         fields = ['album', 'imagem', 'legenda', 'preco']
 
+    def create(self, validated_data):
+        validated_data['largura'], validated_data['altura'] = validated_data['imagem'].dimensoes
+        return super().create(validated_data)
+
+class FotoLoteUploadSerializer(serializers.Serializer):
+    """Várias fotos de um álbum num POST só: arquivos em 'imagens' OU chaves já no bucket em 'chaves'."""
+    album = serializers.PrimaryKeyRelatedField(queryset=Album.objects.all())
+    imagens = serializers.ListField(child=ImagemPeloCabecalhoField(), required=False, allow_empty=False)
+    chaves = serializers.ListField(child=serializers.CharField(max_length=500), required=False, allow_empty=False)
+    preco = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True, default=None)
+    legenda = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+    def validate_album(self, album):
+        user = self.context['request'].user
+        if user.papel != 'ADMIN' and album.fotografo_id != user.id:
+            raise serializers.ValidationError("Álbum não encontrado.")
+        return album
+
+    def validate(self, data):
+        if ('imagens' in data) == ('chaves' in data):
+            raise serializers.ValidationError("Envie 'imagens' ou 'chaves' (apenas um dos dois).")
+        limite = getattr(settings, 'UPLOAD_MAX_ARQUIVOS', 1000)
+        if len(data.get('imagens') or data.get('chaves')) > limite:
+            raise serializers.ValidationError(f"No máximo {limite} fotos por lote.")
+
+        if 'chaves' in data:
+            # Chave do bucket ('media_private/fotos/...') ou nome no storage ('fotos/...')
+            campo = Foto._meta.get_field('imagem')
+            location, pasta = campo.storage.location, campo.upload_to.strip('/')
+            nomes = []
+            for chave in data['chaves']:
+                nome = chave[len(location) + 1:] if chave.startswith(f"{location}/") else chave
+                if not nome.startswith(f"{pasta}/") or '..' in nome.split('/'):
+                    raise serializers.ValidationError(f"Chave fora da pasta de fotos: {chave}")
+                nomes.append(nome)
+            if len(set(nomes)) != len(nomes):
+                raise serializers.ValidationError("Chaves repetidas no lote.")
+            usadas = list(Foto.objects.filter(imagem__in=nomes).values_list('imagem', flat=True)[:5])
+            if usadas:
+                raise serializers.ValidationError(f"Chaves que já são fotos: {', '.join(usadas)}")
+            # Só chaves reservadas pelo próprio usuário numa sessão de upload e que já chegaram ao bucket
+            from .uploads_diretos import arquivos_das_chaves
+
+            encontrados = arquivos_das_chaves(self.context['request'].user, nomes)
+            recusadas = [nome for nome in nomes if nome not in encontrados]
+            if recusadas:
+                raise serializers.ValidationError(f"Chaves que não são uploads seus ou ainda não chegaram ao bucket: {', '.join(recusadas[:5])}")
+            data['arquivos'] = [encontrados[nome] for nome in nomes]
+        return data
+
+    def create(self, validated_data):
+        from .processamento_em_lote import criar_fotos_em_lote
+        from .uploads_diretos import ArquivoJaConfirmado, confirmar_arquivos
+
+        if 'arquivos' in validated_data:
+            try:
+                return confirmar_arquivos(validated_data['album'], validated_data['arquivos'], preco=validated_data['preco'], legenda=validated_data['legenda'])
+            except ArquivoJaConfirmado:
+                raise serializers.ValidationError("Algumas chaves acabaram de ser confirmadas por outra requisição.")
+        return criar_fotos_em_lote(
+            validated_data['album'], imagens=validated_data['imagens'],
+            preco=validated_data['preco'], legenda=validated_data['legenda'],
+        )
+
 class VideoUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Video
@@ -156,10 +255,11 @@ class FotoDashboardSerializer(serializers.ModelSerializer):
         model = Foto
         fields = [
             'id', 'album', 'legenda', 'preco', 
-            'imagem', 'miniatura_marca_dagua',
-            'rotacao', 'is_arquivado'
+            'imagem', 'miniatura_marca_dagua', 'miniatura_grade', 'imagem_social',
+            'rotacao', 'is_arquivado', 'status_processamento', 'motivo_rejeicao', 'largura', 'altura'
         ]
-        read_only_fields = ['id', 'album', 'imagem', 'miniatura_marca_dagua']
+        read_only_fields = ['id', 'album', 'imagem', 'miniatura_marca_dagua', 'miniatura_grade', 'imagem_social',
+                            'status_processamento', 'motivo_rejeicao', 'largura', 'altura']
 
 class VideoDashboardSerializer(serializers.ModelSerializer):
     # --- CORREÇÃO 1: ADICIONANDO AS URLs ABSOLUTAS NO DASHBOARD ---
@@ -169,7 +269,8 @@ class VideoDashboardSerializer(serializers.ModelSerializer):
     class Meta:
         model = Video
         # Adicionamos 'miniatura_url' e 'arquivo_preview_url' aqui
-        fields = ['id', 'album', 'titulo', 'arquivo_video', 'arquivo_preview_url', 'miniatura_url', 'preco', 'data_upload']
+        fields = ['id', 'album', 'titulo', 'arquivo_video', 'arquivo_preview_url', 'miniatura_url', 'preco', 'data_upload', 'metadados']
+        read_only_fields = ['metadados']
         
     def get_miniatura_url(self, obj):
         if obj.miniatura and obj.miniatura.name:
@@ -181,6 +282,214 @@ class VideoDashboardSerializer(serializers.ModelSerializer):
             return obj.arquivo_preview.url
         return None
 
+# --- ENTREGA EM LOTE PARA JORNAIS (Painel) ---
+class LoteEntregaCreateSerializer(serializers.Serializer):
+    """Pedido de entrega: um álbum inteiro OU uma lista de fotos, para uma lista de jornais."""
+    album = serializers.IntegerField(required=False)
+    fotos = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    jornais = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    metadados = serializers.DictField(required=False, default=dict)
+
+    def validate(self, data):
+        user = self.context['request'].user
+        if ('album' in data) == ('fotos' in data):
+            raise serializers.ValidationError("Informe 'album' ou 'fotos' (apenas um dos dois).")
+
+        # Fotógrafo só entrega as próprias fotos, para os próprios jornais
+        fotos = Foto.objects.all()
+        jornais = JornalParceiro.objects.filter(id__in=data['jornais'], ativo=True)
+        if user.papel != 'ADMIN':
+            fotos = fotos.filter(album__fotografo=user)
+            jornais = jornais.filter(usuario=user)
+
+        if 'album' in data:
+            fotos = fotos.filter(album_id=data['album'], is_arquivado=False)
+        else:
+            fotos = fotos.filter(id__in=data['fotos'])
+        data['fotos'] = list(fotos.order_by('id'))
+        data['jornais'] = list(jornais)
+
+        if not data['fotos']:
+            raise serializers.ValidationError("Nenhuma foto encontrada para entregar.")
+        if not data['jornais']:
+            raise serializers.ValidationError("Nenhum jornal parceiro ativo encontrado.")
+        return data
+
+    def create(self, validated_data):
+        from .entregas_ftp import criar_lote
+
+        album = Album.objects.filter(id=validated_data['album']).first() if 'album' in validated_data else None
+        return criar_lote(
+            self.context['request'].user, validated_data['jornais'],
+            fotos=validated_data['fotos'], album=album, metadados=validated_data['metadados'],
+        )
+
+
+class LoteEntregaSerializer(serializers.ModelSerializer):
+    """Progresso do lote: totais, totais por jornal e (no detalhe) cada arquivo."""
+    progresso = serializers.SerializerMethodField()
+    jornais = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LoteEntrega
+        fields = ['id', 'album', 'status', 'criado_em', 'concluido_em', 'progresso', 'jornais']
+
+    def _contar(self, entregas):
+        contagem = {'total': len(entregas), 'enviadas': 0, 'falhas': 0, 'pendentes': 0}
+        chave = {EntregaFTP.Status.ENVIADA: 'enviadas', EntregaFTP.Status.FALHOU: 'falhas', EntregaFTP.Status.PENDENTE: 'pendentes', EntregaFTP.Status.ENVIANDO: 'pendentes'}
+        for entrega in entregas:
+            contagem[chave[entrega.status]] += 1
+        return contagem
+
+    def get_progresso(self, obj):
+        return self._contar(obj.entregas.all())
+
+    def get_jornais(self, obj):
+        por_jornal = {}
+        for entrega in obj.entregas.all():
+            por_jornal.setdefault(entrega.parceiro, []).append(entrega)
+        return [
+            {'id': parceiro.id, 'nome_jornal': parceiro.nome_jornal, **self._contar(entregas)}
+            for parceiro, entregas in por_jornal.items()
+        ]
+
+
+class LoteEntregaDetalheSerializer(LoteEntregaSerializer):
+    arquivos = serializers.SerializerMethodField()
+
+    class Meta(LoteEntregaSerializer.Meta):
+        fields = LoteEntregaSerializer.Meta.fields + ['arquivos']
+
+    def get_arquivos(self, obj):
+        return [
+            {
+                'foto': entrega.foto_id, 'nome_arquivo': entrega.nome_arquivo, 'jornal': entrega.parceiro_id,
+                'status': entrega.status, 'tentativas': entrega.tentativas, 'erro': entrega.erro, 'enviado_em': entrega.enviado_em,
+            }
+            for entrega in obj.entregas.all()
+        ]
+
+class EntregaFTPSerializer(serializers.ModelSerializer):
+    nome_jornal = serializers.CharField(source='parceiro.nome_jornal', read_only=True)
+
+    class Meta:
+        model = EntregaFTP
+        fields = [
+            'id', 'lote', 'foto', 'nome_arquivo', 'parceiro', 'nome_jornal', 'status', 'tentativas',
+            'bytes_enviados', 'duracao_ms', 'erro', 'proxima_tentativa_em', 'enviado_em', 'atualizado_em'
+        ]
+
+# --- UPLOAD DIRETO PARA O S3 (ver galeria/uploads_diretos.py) ---
+class ArquivoDeclaradoSerializer(serializers.Serializer):
+    nome = serializers.CharField(max_length=255)
+    tamanho = serializers.IntegerField(min_value=1)
+    content_type = serializers.CharField(max_length=100)
+
+
+class SessaoUploadCreateSerializer(serializers.Serializer):
+    """Abre a sessão: o navegador declara os arquivos e recebe onde mandar cada um."""
+    tipo = serializers.ChoiceField(choices=SessaoUpload.Tipo.choices, default=SessaoUpload.Tipo.FOTO)
+    destino = serializers.ChoiceField(choices=SessaoUpload.Destino.choices, default=SessaoUpload.Destino.SITE)
+    album = serializers.IntegerField(required=False)
+    jornais = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    metadados = serializers.DictField(required=False, default=dict)
+    preco = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True, default=None)
+    legenda = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    arquivos = ArquivoDeclaradoSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        user = self.context['request'].user
+        foto = data['tipo'] == SessaoUpload.Tipo.FOTO
+        if not foto and data['destino'] != SessaoUpload.Destino.SITE:
+            raise serializers.ValidationError("Vídeos só podem ir para o site.")
+
+        limite_arquivos = getattr(settings, 'UPLOAD_MAX_ARQUIVOS', 1000)
+        if len(data['arquivos']) > limite_arquivos:
+            raise serializers.ValidationError(f"No máximo {limite_arquivos} arquivos por sessão.")
+        limite_mb = getattr(settings, 'UPLOAD_FOTO_MAX_MB', 80) if foto else getattr(settings, 'UPLOAD_VIDEO_MAX_MB', 10 * 1024)
+        prefixo = 'image/' if foto else 'video/'
+        for arquivo in data['arquivos']:
+            if not arquivo['content_type'].startswith(prefixo):
+                raise serializers.ValidationError(f"'{arquivo['nome']}' não é {'uma imagem' if foto else 'um vídeo'}.")
+            if arquivo['tamanho'] > limite_mb * 1024 * 1024:
+                raise serializers.ValidationError(f"'{arquivo['nome']}' passa do limite de {limite_mb} MB.")
+
+        # Fotógrafo só manda para os próprios álbuns e os próprios jornais
+        albuns = Album.objects.all() if user.papel == 'ADMIN' else Album.objects.filter(fotografo=user)
+        if data['destino'] != SessaoUpload.Destino.FTP:
+            if 'album' not in data:
+                raise serializers.ValidationError("Informe o 'album'.")
+            data['album'] = albuns.filter(id=data['album']).first()
+            if data['album'] is None:
+                raise serializers.ValidationError("Álbum não encontrado.")
+        else:
+            data['album'] = albuns.filter(id=data['album']).first() if 'album' in data else None
+
+        if data['destino'] != SessaoUpload.Destino.SITE:
+            jornais = JornalParceiro.objects.filter(id__in=data['jornais'], ativo=True)
+            if user.papel != 'ADMIN':
+                jornais = jornais.filter(usuario=user)
+            data['jornais'] = list(jornais.values_list('id', flat=True))
+            if not data['jornais']:
+                raise serializers.ValidationError("Nenhum jornal parceiro ativo encontrado.")
+        else:
+            data['jornais'] = []
+        return data
+
+    def create(self, validated_data):
+        from .uploads_diretos import criar_sessao
+
+        return criar_sessao(self.context['request'].user, **validated_data)
+
+
+class ParteDeclaradaSerializer(serializers.Serializer):
+    numero = serializers.IntegerField(min_value=1)
+    sha256 = serializers.CharField(max_length=64)
+
+    def validate_sha256(self, value):
+        from .uploads_diretos import checksum_valido
+
+        if not checksum_valido(value):
+            raise serializers.ValidationError("Informe o SHA-256 da parte em base64.")
+        return value
+
+
+class PartesUploadSerializer(serializers.Serializer):
+    """Pede as URLs de algumas partes de um vídeo da sessão, cada uma com o seu checksum."""
+    arquivo = serializers.IntegerField()
+    partes = ParteDeclaradaSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        from .uploads_diretos import partes_do_video
+
+        sessao = self.context['sessao']
+        if sessao.status != SessaoUpload.Status.ABERTA:
+            raise serializers.ValidationError("Sessão fechada.")
+        arquivo = sessao.arquivos.filter(id=data['arquivo'], status=ArquivoUpload.Status.AGUARDANDO).exclude(upload_id='').first()
+        if arquivo is None:
+            raise serializers.ValidationError("Vídeo não encontrado nesta sessão (ou já confirmado).")
+        _, total = partes_do_video(arquivo)
+        if any(parte['numero'] > total for parte in data['partes']):
+            raise serializers.ValidationError(f"O vídeo tem {total} partes.")
+        data['arquivo'] = arquivo
+        return data
+
+
+class SessaoUploadSerializer(serializers.ModelSerializer):
+    total_arquivos = serializers.SerializerMethodField()
+    confirmados = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SessaoUpload
+        fields = ['id', 'tipo', 'destino', 'album', 'status', 'total_arquivos', 'confirmados', 'criado_em', 'expira_em', 'confirmada_em']
+
+    def get_total_arquivos(self, obj):
+        return len(obj.arquivos.all())
+
+    def get_confirmados(self, obj):
+        return sum(1 for arquivo in obj.arquivos.all() if arquivo.status == ArquivoUpload.Status.CONFIRMADO)
+
+
 class AvaliacaoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Avaliacao
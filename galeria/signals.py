@@ -1,12 +1,21 @@
 # galeria/signals.py
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.db import transaction
-from django.dispatch import receiver
+from django.db.models import F
+from django.dispatch import receiver, Signal
 
 # --- 1. Importações Corrigidas e Consolidadas ---
-from .models import Foto, Video
-from .tasks import processar_foto_task, gerar_miniatura_video_task, processar_preview_video
+from .models import Album, Foto, Video, FaceIndexada
+from .tasks import processar_foto_task, processar_video_task
+from .indexacao_faces import (
+    agendar_remocao_faces, agendar_remocao_colecao, enfileirar_remocao,
+    retirar_album_do_indice, devolver_album_ao_indice, remocao_em_lote_ativa,
+)
+
+# Disparado quando os preços de um álbum mudam em massa (queryset.update não gera post_save).
+# Argumentos: album_id, fotos (bool), videos (bool)
+precos_do_album_alterados = Signal()
 
 @receiver(post_save, sender=Foto)
 def processar_nova_foto_signal(sender, instance, created, **kwargs):
@@ -18,8 +27,18 @@ def processar_nova_foto_signal(sender, instance, created, **kwargs):
     # --- 2. Lógica de Verificação Melhorada ---
     if created and instance.imagem:
         print(f"--- Signal disparado para Foto ID: {instance.id}. Enviando para o Celery... ---")
+        # A indexação facial (fila 'faces') é agendada pela própria task, depois da versão 'rekognition'
         transaction.on_commit(lambda: processar_foto_task.delay(instance.id))
-        
+    if created:
+        Album.objects.filter(id=instance.album_id).update(total_fotos=F('total_fotos') + 1)
+
+
+@receiver(post_delete, sender=Foto)
+def foto_apagada_signal(sender, instance, **kwargs):
+    # O fim de cada lote de upload reconta do zero (galeria/processamento_em_lote.py)
+    Album.objects.filter(id=instance.album_id, total_fotos__gt=0).update(total_fotos=F('total_fotos') - 1)
+
+
 @receiver(post_save, sender=Video)
 def processar_novo_video_signal(sender, instance, created, **kwargs):
     """
@@ -28,8 +47,41 @@ def processar_novo_video_signal(sender, instance, created, **kwargs):
     if created and instance.arquivo_video:
         print(f"--- Signal disparado para Vídeo ID: {instance.id}. Enviando para o Celery... ---")
         
-        # 1. Gera a imagem estática (a thumbnail de capa)
-        transaction.on_commit(lambda: gerar_miniatura_video_task.delay(instance.id))
-        
-        # 2. Gera o vídeo de preview de 10s com a marca d'água
-        transaction.on_commit(lambda: processar_preview_video.delay(instance.id))
\ No newline at end of file
+        # Miniatura, preview de 10s com a marca d'água e metadados: uma task, uma leitura do original
+        transaction.on_commit(lambda: processar_video_task.delay(instance.id))
+
+
+# --- CICLO DE VIDA DO ÍNDICE FACIAL (galeria/indexacao_faces.py) ---
+
+@receiver(post_delete, sender=FaceIndexada)
+def face_apagada_signal(sender, instance, **kwargs):
+    """Face apagada do banco (inclusive em cascata da Foto): entra na fila de remoção do Rekognition."""
+    if remocao_em_lote_ativa():
+        return
+    if enfileirar_remocao([(instance.rekognition_face_id, instance.colecao)]):
+        transaction.on_commit(agendar_remocao_faces)
+
+
+@receiver(pre_save, sender=Album)
+def guardar_arquivamento_anterior(sender, instance, **kwargs):
+    instance._estava_arquivado = bool(
+        instance.pk and Album.objects.filter(pk=instance.pk, is_arquivado=True).exists()
+    )
+
+
+@receiver(post_save, sender=Album)
+def album_arquivado_signal(sender, instance, created, **kwargs):
+    estava_arquivado = getattr(instance, '_estava_arquivado', False)
+    if created or estava_arquivado == instance.is_arquivado:
+        return
+    if instance.is_arquivado:
+        retirar_album_do_indice(instance.id)
+    else:
+        devolver_album_ao_indice(instance.id)
+
+
+@receiver(post_delete, sender=Album)
+def album_apagado_signal(sender, instance, **kwargs):
+    """Álbum apagado: a coleção própria dele sai da AWS (as faces da global seguem pela fila, em cascata)."""
+    agendar_remocao_colecao(instance.id)
+
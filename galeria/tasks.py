@@ -1,23 +1,21 @@
 # galeria/tasks.py
-import ftplib
 import os
-import boto3
-import ffmpeg
-import tempfile
-import shutil
+import time
 import subprocess
 from io import BytesIO
-from PIL import Image
 
+from botocore.exceptions import ClientError
 from celery import shared_task
-from django.core.files.storage import default_storage
-from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-from .models import Foto, FaceIndexada, Video 
+from .models import Foto, Video 
+from .versoes import gerar_versoes, versoes_configuradas
+from .indexacao_faces import agendar_indexacao_faces
+from .validacao_imagem import ERROS_DE_IMAGEM, ImagemRejeitada, rejeitar_foto
 from contas.models import JornalParceiro
 
 # ====================================================================
-# TAREFA DE PROCESSAMENTO BÁSICO (Redimensionar, Rekognition, Marca d'água)
+# TAREFA DE PROCESSAMENTO BÁSICO (Versões e Marca d'água)
 # ====================================================================
 @shared_task
 def processar_foto_task(foto_id):
@@ -28,70 +26,54 @@ def processar_foto_task(foto_id):
 
         print(f"--- [CELERY] Iniciando processamento para Foto ID: {foto.id} ---")
 
-        with foto.imagem.open('rb') as image_file:
-            image_bytes = image_file.read()
-        
-        REKOGNITION_LIMIT = 5 * 1024 * 1024 # 5MB
-        
-        if len(image_bytes) > REKOGNITION_LIMIT:
-            img = Image.open(BytesIO(image_bytes))
-            img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
-            buffer_rekognition = BytesIO()
-            img.save(buffer_rekognition, format='JPEG', quality=95)
-            image_bytes_for_rekognition = buffer_rekognition.getvalue()
-        else:
-            image_bytes_for_rekognition = image_bytes
-
-        if not foto.faces_indexadas.exists():
-            rekognition_client = boto3.client('rekognition', region_name=settings.AWS_REKOGNITION_REGION_NAME)
-            response = rekognition_client.index_faces(
-                CollectionId=settings.AWS_REKOGNITION_COLLECTION_ID,
-                Image={'Bytes': image_bytes_for_rekognition},
-                ExternalImageId=str(foto.id),
-                DetectionAttributes=['DEFAULT']
-            )
-            novas_faces = []
-            for face_record in response.get('FaceRecords', []):
-                face_id = face_record['Face']['FaceId']
-                novas_faces.append(FaceIndexada(foto=foto, rekognition_face_id=face_id))
-            if novas_faces:
-                FaceIndexada.objects.bulk_create(novas_faces)
-
-        if not foto.miniatura_marca_dagua:
-            with Image.open(BytesIO(image_bytes)).convert("RGBA") as original_image:
-                size = (600, 600)
-                original_image.thumbnail(size)
-                img_width, img_height = original_image.size
-                watermark_path = os.path.join(settings.STATIC_ROOT, 'watermark.PNG')
-                
-                with Image.open(watermark_path).convert("RGBA") as watermark:
-                    PROPORCAO_MARCA = 0.20
-                    new_wm_width = int(img_width * PROPORCAO_MARCA)
-                    wm_ratio = new_wm_width / watermark.size[0]
-                    new_wm_height = int(wm_ratio * watermark.size[1])
-                    watermark = watermark.resize((new_wm_width, new_wm_height), Image.Resampling.LANCZOS)
-                    wm_width, wm_height = watermark.size
-                    
-                    OPACIDADE = 0.3
-                    alpha = watermark.getchannel('A')
-                    alpha = alpha.point(lambda i: i * OPACIDADE)
-                    watermark.putalpha(alpha)
-
-                    final_image = Image.new('RGBA', original_image.size, (0, 0, 0, 0))
-                    final_image.paste(original_image, (0, 0))
-                    
-                    PADDING_X = int(img_width * 0.1)
-                    PADDING_Y = int(img_height * 0.1)
-                    for y in range(0, img_height, wm_height + PADDING_Y):
-                        for x in range(0, img_width, wm_width + PADDING_X):
-                            final_image.paste(watermark, (x, y), mask=watermark)
-
-                    buffer = BytesIO()
-                    final_image.convert("RGB").save(buffer, format='JPEG', quality=90)
-                    buffer.seek(0)
-                    
-                    file_name = os.path.basename(foto.imagem.name)
-                    foto.miniatura_marca_dagua.save(file_name, ContentFile(buffer.read()), save=True)
+        # 1. Descobre só o que ainda falta gerar (reprocessar não refaz o que já existe)
+        versoes = versoes_configuradas()
+        pendentes = [
+            nome for nome, config in versoes.items()
+            if config.get('campo') and not getattr(foto, config['campo'])
+        ]
+
+        if not pendentes:
+            print(f"--- [CELERY] Foto ID: {foto.id} já possui todas as versões ---")
+            Foto.objects.filter(id=foto.id, status_processamento=Foto.StatusProcessamento.PENDENTE).update(status_processamento=Foto.StatusProcessamento.PROCESSADA)
+            agendar_indexacao_faces()
+            return
+
+        # 2. UMA única leitura e decodificação do original para todas as versões.
+        # O S3File só baixa no primeiro read(): o download fica FORA do try, para
+        # que um timeout do S3 (OSError no botocore) não rejeite uma foto boa.
+        # Com os bytes na memória, erro do Pillow é arquivo ruim (galeria/validacao_imagem.py).
+        # Original que não existe (nunca subiu ou foi apagado) também é rejeitado: senão fica PENDENTE para sempre
+        try:
+            with foto.imagem.open('rb') as image_file:
+                original = BytesIO(image_file.read())
+        except FileNotFoundError:
+            rejeitar_foto(foto, ImagemRejeitada("Original não encontrado no armazenamento."))
+            return
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+                raise
+            rejeitar_foto(foto, ImagemRejeitada("Original não encontrado no armazenamento."))
+            return
+        try:
+            geradas = gerar_versoes(original, pendentes)
+        except ERROS_DE_IMAGEM as e:
+            rejeitar_foto(foto, e)
+            return
+
+        # 3. Grava as versões nos seus campos e salva a foto uma vez só
+        file_name = os.path.basename(foto.imagem.name)
+        campos_alterados = ['status_processamento']
+        for nome, conteudo in geradas.items():
+            campo = versoes[nome]['campo']
+            getattr(foto, campo).save(file_name, ContentFile(conteudo), save=False)
+            campos_alterados.append(campo)
+
+        foto.status_processamento = Foto.StatusProcessamento.PROCESSADA
+        foto.save(update_fields=campos_alterados)
+
+        # A indexação facial (fila 'faces') lê a versão 'rekognition' gravada acima, não o original
+        agendar_indexacao_faces()
 
         print(f"--- [CELERY] Processamento completo para Foto ID: {foto.id} ---")
             
@@ -99,202 +81,151 @@ def processar_foto_task(foto_id):
         print(f"--- [ERRO CELERY] Erro ao processar foto task: {e} ---")
 
 
+# ====================================================================
+# PROCESSAMENTO DO UPLOAD EM LOTE (Pedaços de um group + fechamento único)
+# ====================================================================
 @shared_task
-def gerar_miniatura_video_task(video_id):
-    temp_video_path = None
-    temp_thumb_path = None
+def processar_fotos_em_lote_task(fotos_ids, marcador=None):
+    from .processamento_em_lote import pedaco_concluido
+
+    for foto_id in fotos_ids:
+        processar_foto_task(foto_id) # Roda aqui mesmo: uma mensagem por pedaço, não por foto
+
+    lote = pedaco_concluido(marcador) if marcador else None
+    if lote:
+        fechar_lote_fotos_task.delay(*lote)
+
+
+@shared_task
+def fechar_lote_fotos_task(album_id, fotos_ids):
+    from .processamento_em_lote import fechar_lote
+
+    fechar_lote(album_id, fotos_ids)
+
+
+# ====================================================================
+# TAREFA DE INDEXAÇÃO FACIAL (Fila 'faces', em lotes)
+# ====================================================================
+@shared_task
+def indexar_faces_pendentes_task():
+    from .indexacao_faces import CHAVE_AGENDAMENTO, reservar_lote, indexar_lote
+
+    # Libera o agendamento: fotos que chegarem daqui em diante agendam um novo lote
+    cache.delete(CHAVE_AGENDAMENTO)
+
+    fotos = reservar_lote()
+    if not fotos:
+        return
+
+    inicio = time.monotonic()
+    indexadas, falhas = indexar_lote(fotos)
+    print(f"--- [FACES] Lote de {len(fotos)} fotos: {len(indexadas)} indexadas, {len(falhas)} falhas em {time.monotonic() - inicio:.1f}s ---")
+
+    # Ainda tem fila? O próximo lote entra logo atrás deste
+    indexar_faces_pendentes_task.delay()
+
+
+@shared_task
+def remover_faces_task():
+    from .indexacao_faces import CHAVE_AGENDAMENTO_REMOCAO, remover_faces_enfileiradas
+
+    cache.delete(CHAVE_AGENDAMENTO_REMOCAO)
     try:
-        video = Video.objects.get(id=video_id)
-        if not video.arquivo_video or video.miniatura:
-            return
+        total = remover_faces_enfileiradas()
+        if total:
+            print(f"--- [FACES] {total} faces órfãs removidas do Rekognition ---")
+    except Exception as e:
+        # A fila continua no banco: a próxima remoção (ou o reconciliar_faces) termina o serviço
+        print(f"--- [ERRO FACES] Falha ao remover faces do Rekognition: {e} ---")
 
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_video_file, \
-             tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_thumb_file:
-            temp_video_path = temp_video_file.name
-            temp_thumb_path = temp_thumb_file.name
-        
-        with video.arquivo_video.open('rb') as s3_video_file:
-            with open(temp_video_path, 'wb') as local_video_file:
-                local_video_file.write(s3_video_file.read())
-
-        ffmpeg_cmd = shutil.which('ffmpeg') or 'ffmpeg'
-        (
-            ffmpeg
-            .input(temp_video_path, ss=1)
-            .output(temp_thumb_path, vframes=1)
-            .overwrite_output()
-            .run(cmd=ffmpeg_cmd, capture_stdout=True, capture_stderr=True)
-        )
-
-        with open(temp_thumb_path, 'rb') as thumb_f:
-            file_name = os.path.basename(video.arquivo_video.name).split('.')[0] + '.jpg'
-            video.miniatura.save(file_name, ContentFile(thumb_f.read()), save=True)
 
+@shared_task
+def apagar_colecao_album_task(album_id):
+    from .indexacao_faces import apagar_colecao_do_album
+
+    try:
+        apagar_colecao_do_album(album_id)
     except Exception as e:
-        print(f"--- [ERRO CELERY] Erro ao processar vídeo task: {e} ---")
-    finally:
-        if temp_video_path and os.path.exists(temp_video_path):
-            os.remove(temp_video_path)
-        if temp_thumb_path and os.path.exists(temp_thumb_path):
-            os.remove(temp_thumb_path)
+        # A coleção fica na AWS até o reconciliar_faces (álbum apagado) ou o próximo arquivamento
+        print(f"--- [ERRO FACES] Falha ao apagar a coleção do álbum {album_id}: {e} ---")
+
 
+# ====================================================================
+# TAREFA DE PROCESSAMENTO DO VÍDEO (galeria/processamento_video.py)
+# ====================================================================
 @shared_task
-def processar_preview_video(video_id):
-    caminho_original = None
-    caminho_preview_temp = None
-    caminho_wm_tiled = None
-    
+def processar_video_task(video_id):
+    from .processamento_video import gerar_derivados
+
     try:
         video = Video.objects.get(id=video_id)
-        
-        # 1. Cria arquivos temporários para baixar da AWS S3
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_original:
-            caminho_original = temp_original.name
-            with video.arquivo_video.open('rb') as s3_video_file:
-                temp_original.write(s3_video_file.read())
-
-        nome_arquivo = os.path.basename(video.arquivo_video.name)
-        nome_preview = f"preview_{nome_arquivo}"
-        caminho_preview_temp = os.path.join(settings.MEDIA_ROOT, 'temp', nome_preview)
-        os.makedirs(os.path.dirname(caminho_preview_temp), exist_ok=True)
-        
-        # =================================================================
-        # NOVA LÓGICA: Criar um "Lençol" gigante com a Marca d'Água (PIL)
-        # =================================================================
-        caminho_marca_dagua = os.path.join(settings.STATIC_ROOT, 'watermark.PNG')
-        caminho_wm_tiled = os.path.join(settings.MEDIA_ROOT, 'temp', f'wm_tiled_{video_id}.png')
-        
-        with Image.open(caminho_marca_dagua).convert("RGBA") as wm:
-            # Reduz a marca original (pode ajustar esse valor '180' se quiser maior/menor)
-            nova_largura = 120
-            ratio = nova_largura / wm.size[0]
-            nova_altura = int(wm.size[1] * ratio)
-            wm = wm.resize((nova_largura, nova_altura), Image.Resampling.LANCZOS)
-            
-            # Aplica opacidade de 50% (idêntico ao que você faz nas fotos)
-            alpha = wm.getchannel('A')
-            alpha = alpha.point(lambda i: i * 0.50)
-            wm.putalpha(alpha)
-            
-            # Cria um canvas gigante transparente de 2000x2000
-            canvas_size = 2000
-            canvas = Image.new('RGBA', (canvas_size, canvas_size), (0, 0, 0, 0))
-            
-            # Cola a marca d'água repetidas vezes nesse canvas formando a grade
-            padding_x = 40
-            padding_y = 60
+        if not video.arquivo_video:
+            return
 
-            for y in range(0, canvas_size, nova_altura + padding_y):
-                for x in range(0, canvas_size, nova_largura + padding_x):
-                    canvas.paste(wm, (x, y), mask=wm)
-            
-            canvas.save(caminho_wm_tiled, 'PNG')
-
-        # =================================================================
-        # COMANDO FFMPEG (Agora super simples e à prova de falhas)
-        # =================================================================
-        # scale=-2:720 -> Mantém a proporção exata, mas com mais resolução para evitar o zoom
-        # overlay -> Joga o canvas gigante no meio do vídeo. O que sobrar para fora, é ignorado.
-        filtro_ffmpeg = "[0:v]scale=-2:720[bg];[bg][1:v]overlay=0:0"
-
-        comando = [
-            'ffmpeg', '-y',
-            '-i', caminho_original,
-            '-i', caminho_wm_tiled, # Usa o lençol gigante que criamos acima
-            '-t', '10',
-            '-filter_complex', filtro_ffmpeg,
-            '-an',
-            '-c:v', 'libx264',
-            '-crf', '28',
-            caminho_preview_temp
-        ]
+        # Só o que ainda falta (reprocessar não refaz o que já existe)
+        miniatura, preview = not video.miniatura, not video.arquivo_preview
+        if not (miniatura or preview or not video.metadados):
+            print(f"--- [CELERY] Vídeo ID: {video.id} já possui miniatura, preview e metadados ---")
+            return
 
-        subprocess.run(comando, check=True)
+        print(f"--- [CELERY] Iniciando processamento para Vídeo ID: {video.id} ---")
+        derivados = gerar_derivados(video, miniatura=miniatura, preview=preview)
+
+        nome = os.path.splitext(os.path.basename(video.arquivo_video.name))[0]
+        video.metadados = derivados['metadados']
+        campos_alterados = ['metadados']
+        if derivados['miniatura']:
+            video.miniatura.save(f"{nome}.jpg", ContentFile(derivados['miniatura']), save=False)
+            campos_alterados.append('miniatura')
+        if derivados['preview']:
+            video.arquivo_preview.save(f"preview_{nome}.mp4", ContentFile(derivados['preview']), save=False)
+            campos_alterados.append('arquivo_preview')
+        video.save(update_fields=campos_alterados)
+
+        print(f"--- [CELERY] Processamento completo para Vídeo ID: {video.id} ---")
+
+    except subprocess.CalledProcessError as e:
+        erro = (e.stderr or b'').decode(errors='replace').strip()[-500:]
+        print(f"--- [ERRO CELERY] ffmpeg falhou no Vídeo ID {video_id}: {erro} ---")
+    except Exception as e:
+        print(f"--- [ERRO CELERY] Erro ao processar vídeo task: {e} ---")
 
-        # 3. Salva no banco de dados
-        with open(caminho_preview_temp, 'rb') as f:
-            video.arquivo_preview.save(nome_preview, ContentFile(f.read()), save=True)
 
-        return f"Preview do vídeo {video_id} gerado com sucesso!"
+# As duas tasks antigas viraram uma: continuam aqui para as mensagens que ainda estiverem na fila
+@shared_task
+def gerar_miniatura_video_task(video_id):
+    processar_video_task(video_id)
 
-    except Exception as e:
-        print(f"Erro ao processar vídeo {video_id}: {e}")
-        return False
-        
-    finally:
-        # 4. Limpeza rigorosa para manter o seu servidor Hetzner rodando leve
-        if caminho_original and os.path.exists(caminho_original):
-            os.remove(caminho_original)
-        if caminho_preview_temp and os.path.exists(caminho_preview_temp):
-            os.remove(caminho_preview_temp)
-        if caminho_wm_tiled and os.path.exists(caminho_wm_tiled):
-            os.remove(caminho_wm_tiled)
+
+@shared_task
+def processar_preview_video(video_id):
+    processar_video_task(video_id)
 
 # ====================================================================
 # TAREFA: FTP PARA FOTOS SALVAS NO SITE (Envio Direto / Sem Alteração)
 # ====================================================================
+# Vira um lote de uma foto: cada jornal ganha uma EntregaFTP com novas
+# tentativas (galeria/entregas_ftp.py). O upload já cria o lote direto;
+# esta task continua aqui para as mensagens antigas que estiverem na fila.
 @shared_task
 def distribuir_foto_para_ftps(foto_id, jornais_ids=None, metadados=None):
+    from .entregas_ftp import criar_lote
+
     try:
         foto = Foto.objects.select_related('album').get(id=foto_id)
-        
-        if jornais_ids:
-            parceiros = JornalParceiro.objects.filter(id__in=jornais_ids, ativo=True)
-        else:
-            parceiros = JornalParceiro.objects.filter(ativo=True)
-
-        if not parceiros.exists():
-            return "Nenhum jornal parceiro ativo encontrado."
-
-        with foto.imagem.open('rb') as f:
-            img_data = f.read()
-
-        nome_arquivo = os.path.basename(foto.imagem.name)
-        resultados = []
-
-        for parceiro in parceiros:
-            try:
-                ftp = ftplib.FTP()
-                if ':' in parceiro.ftp_host:
-                    host, porta = parceiro.ftp_host.split(':')
-                    ftp.connect(host, int(porta))
-                else:
-                    ftp.connect(parceiro.ftp_host, 21)
-                    
-                ftp.login(user=parceiro.ftp_user, passwd=parceiro.ftp_password)
-                
-                # 🚀 INÍCIO DA LÓGICA DE PASTA INTELIGENTE
-                pasta_alvo = parceiro.ftp_pasta.strip()
-                if not pasta_alvo or pasta_alvo == '/':
-                    pasta_alvo = 'Acesso_Imagens' # Nome da pasta se o parceiro não definir nenhuma
-
-                try:
-                    ftp.cwd(pasta_alvo) # Tenta entrar na pasta
-                except ftplib.error_perm:
-                    # Se não existe, tenta criar
-                    try:
-                        ftp.mkd(pasta_alvo)
-                        ftp.cwd(pasta_alvo)
-                    except ftplib.error_perm:
-                        # FALLBACK SEGURANÇA: Se não tiver permissão para criar, usa a raiz
-                        try:
-                            ftp.cwd('/')
-                        except:
-                            pass # Fica no diretório padrão de login
-                # 🚀 FIM DA LÓGICA DE PASTA INTELIGENTE
-
-                ftp.storbinary(f'STOR {nome_arquivo}', BytesIO(img_data))
-                ftp.quit()
-                resultados.append(f"Enviado Puro para: {parceiro.nome_jornal}")
-            except Exception as e:
-                resultados.append(f"Falha ao enviar para {parceiro.nome_jornal}: {str(e)}")
-
-        return resultados
-
     except Foto.DoesNotExist:
         return f"Erro: Foto {foto_id} não encontrada."
-    except Exception as e:
-        return f"Erro crítico na distribuição: {str(e)}"
+
+    if jornais_ids:
+        parceiros = JornalParceiro.objects.filter(id__in=jornais_ids, ativo=True)
+    else:
+        parceiros = JornalParceiro.objects.filter(ativo=True)
+
+    if not parceiros.exists():
+        return "Nenhum jornal parceiro ativo encontrado."
+
+    lote = criar_lote(None, parceiros, fotos=[foto], album=foto.album, metadados=metadados)
+    return entregar_lote_ftp_task(lote.id)
 
 
 # ====================================================================
@@ -302,63 +233,40 @@ def distribuir_foto_para_ftps(foto_id, jornais_ids=None, metadados=None):
 # ====================================================================
 @shared_task
 def distribuir_foto_temporaria_ftp(temp_s3_key, jornais_ids, metadados=None):
-    try:
-        s3_client = boto3.client(
-            's3', 
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID, 
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY, 
-            region_name=settings.AWS_S3_REGION_NAME
-        )
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+    from .entregas_ftp import criar_lote
 
-        s3_response = s3_client.get_object(Bucket=bucket_name, Key=temp_s3_key)
-        img_data = s3_response['Body'].read()
+    parceiros = JornalParceiro.objects.filter(id__in=jornais_ids, ativo=True)
+    if not parceiros.exists():
+        return "Nenhum jornal parceiro ativo encontrado."
 
-        parceiros = JornalParceiro.objects.filter(id__in=jornais_ids, ativo=True)
-        nome_arquivo = temp_s3_key.split('/')[-1]
-        if '_' in nome_arquivo:
-            nome_arquivo = nome_arquivo.split('_', 1)[1]
-
-        resultados = []
-
-        for parceiro in parceiros:
-            try:
-                ftp = ftplib.FTP()
-                if ':' in parceiro.ftp_host:
-                    host, porta = parceiro.ftp_host.split(':')
-                    ftp.connect(host, int(porta))
-                else:
-                    ftp.connect(parceiro.ftp_host, 21)
-                    
-                ftp.login(user=parceiro.ftp_user, passwd=parceiro.ftp_password)
-                
-                # 🚀 INÍCIO DA LÓGICA DE PASTA INTELIGENTE (Cópia idêntica)
-                pasta_alvo = parceiro.ftp_pasta.strip()
-                if not pasta_alvo or pasta_alvo == '/':
-                    pasta_alvo = 'Acesso_Imagens'
-
-                try:
-                    ftp.cwd(pasta_alvo)
-                except ftplib.error_perm:
-                    try:
-                        ftp.mkd(pasta_alvo)
-                        ftp.cwd(pasta_alvo)
-                    except ftplib.error_perm:
-                        try:
-                            ftp.cwd('/')
-                        except:
-                            pass
-                # 🚀 FIM DA LÓGICA DE PASTA INTELIGENTE
-
-                ftp.storbinary(f'STOR {nome_arquivo}', BytesIO(img_data))
-                ftp.quit()
-                resultados.append(f"Enviado Temp Puro para: {parceiro.nome_jornal}")
-            except Exception as e:
-                resultados.append(f"Falha Temp para {parceiro.nome_jornal}: {str(e)}")
-
-        s3_client.delete_object(Bucket=bucket_name, Key=temp_s3_key)
-
-        return resultados
+    nome_arquivo = temp_s3_key.split('/')[-1]
+    if '_' in nome_arquivo:
+        nome_arquivo = nome_arquivo.split('_', 1)[1]
 
-    except Exception as e:
-        return f"Erro crítico na distribuição temporária: {str(e)}"
\ No newline at end of file
+    lote = criar_lote(None, parceiros, chave_temporaria=temp_s3_key, nome_arquivo=nome_arquivo, metadados=metadados)
+    return entregar_lote_ftp_task(lote.id)
+
+
+# ====================================================================
+# TAREFA: ENTREGA EM LOTE (Álbum ou lista de fotos, uma sessão por jornal)
+# ====================================================================
+@shared_task
+def entregar_lote_ftp_task(lote_id):
+    from .models import LoteEntrega
+    from .entregas_ftp import reservar_entregas, processar_entregas, atualizar_lote
+
+    # Só as entregas que já podem sair; mensagem duplicada do Celery não acha nada para reservar
+    entregas = reservar_entregas(lote_id)
+    if not entregas:
+        return f"Lote {lote_id}: nada para enviar agora."
+
+    LoteEntrega.objects.filter(id=lote_id).update(status=LoteEntrega.Status.ENVIANDO)
+    inicio = time.monotonic()
+    enviadas, falhas = processar_entregas(entregas)
+    print(f"--- [FTP] Lote {lote_id}: {enviadas} envios, {falhas} falhas em {time.monotonic() - inicio:.1f}s ---")
+
+    espera = atualizar_lote(lote_id)
+    if espera is not None:
+        # Falhas voltam sozinhas depois da espera exponencial (ou quando o disjuntor fechar)
+        entregar_lote_ftp_task.apply_async((lote_id,), countdown=int(espera) + 1)
+    return f"Lote {lote_id}: {enviadas} enviados, {falhas} falhas."
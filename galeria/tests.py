@@ -6,10 +6,42 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from django.test import override_settings
-from contas.models import Usuario
-from .models import Album, Foto
+from django.core.cache import cache
+from django.utils import timezone
+from contas.models import JornalParceiro, Usuario
+from config import aws
+from .busca_facial import BackendLocal, BackendRekognition, backend_busca_facial, buscar_selfie, hash_perceptual, incrementar_versao_colecao
+from .models import FaceIndexada, FaceParaRemover, LoteEntrega, EntregaFTP, SessaoUpload, ArquivoUpload
+from .indexacao_faces import BaldeDeTokens, apagar_colecao_do_album, balde_do_processo, com_backoff, reservar_lote, indexar_lote, imagem_para_indexar, remover_faces_enfileiradas, reconciliar_colecao
+from .models import Album, Foto, Video
+from .processamento_em_lote import enfileirar_fotos, fechar_lote
+from .processamento_video import entrada_do_ffmpeg
+from .uploads_diretos import cancelar_sessao, criar_sessao, limpar_sessoes_expiradas, partes_assinadas
+from .tasks import processar_video_task
+from .validacao_imagem import ImagemRejeitada, ler_cabecalho_imagem
+from .serializers import FotoUploadSerializer
+from .versoes import gerar_versoes, versoes_configuradas
+from . import distribuicao_ftp, entregas_ftp, marca_dagua
+from . import metadados as metadados_iptc
+from .marca_dagua import aplicar_marca_dagua, limpar_cache
+from .management.commands.benchmark_marca_dagua import marca_dagua_antiga
+import base64
+import ftplib
+import hashlib
+import importlib.util
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
 from io import BytesIO
-from PIL import Image
+from unittest.mock import MagicMock, PropertyMock, patch
+from PIL import Image, ImageChops, IptcImagePlugin, JpegImagePlugin
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 def create_dummy_image():
@@ -138,3 +170,1437 @@ class GaleriaAPITestCase(APITestCase):
         self.assertEqual(response.data['fotografo'], self.fotografo1.id)
         # Verifica se o álbum agora existe no banco de dados.
         self.assertTrue(Album.objects.filter(titulo='Meu Novo Álbum').exists())
+
+
+class VersoesFotoTestCase(TestCase):
+    """
+    Testes do motor de versões (galeria/versoes.py).
+    """
+
+    def criar_jpeg(self, tamanho=(4000, 3000)):
+        f = BytesIO()
+        Image.new('RGB', tamanho, (120, 80, 40)).save(f, 'jpeg')
+        f.seek(0)
+        return f
+
+    def test_gera_todas_as_versoes_em_uma_passada(self):
+        """Garante que cada versão sai no tamanho configurado."""
+        versoes = gerar_versoes(self.criar_jpeg())
+
+        self.assertEqual(set(versoes.keys()), set(versoes_configuradas().keys()))
+        tamanhos = {nome: Image.open(BytesIO(conteudo)).size for nome, conteudo in versoes.items()}
+        self.assertEqual(tamanhos['grade'], (300, 225))
+        self.assertEqual(tamanhos['lightbox'], (600, 450))
+        self.assertEqual(tamanhos['social'], (1200, 630))
+        self.assertEqual(tamanhos['rekognition'], (1440, 1080))
+
+    def test_decodifica_jpeg_em_escala_reduzida(self):
+        """Garante que o modo 'draft' é usado quando só precisamos das versões pequenas."""
+        jpeg = JpegImagePlugin.JpegImageFile
+        with patch.object(jpeg, 'draft', autospec=True, side_effect=jpeg.draft) as draft:
+            versoes = gerar_versoes(self.criar_jpeg(), ['grade'])
+
+        draft.assert_called_once()
+        self.assertEqual(draft.call_args[0][2], (300, 225))
+        self.assertEqual(list(versoes.keys()), ['grade'])
+
+
+class MarcaDaguaTestCase(TestCase):
+    """
+    Testes do compositor de marca d'água em cache (galeria/marca_dagua.py).
+    """
+
+    def setUp(self):
+        limpar_cache()
+
+    def test_resultado_igual_ao_laco_antigo(self):
+        """Garante que o alpha_composite gera a mesma imagem que o laço de paste antigo."""
+        imagem = Image.new('RGBA', (600, 400), (90, 120, 150, 255))
+
+        antiga = marca_dagua_antiga(imagem)
+        nova = aplicar_marca_dagua(imagem)
+
+        diferenca = ImageChops.difference(antiga, nova).getextrema()
+        self.assertTrue(all(maximo <= 1 for _, maximo in diferenca))
+
+    def test_overlay_montado_uma_vez_por_tamanho(self):
+        """Garante que o PNG da marca só é processado na primeira chamada de cada tamanho."""
+        with patch('galeria.marca_dagua._montar_overlay', wraps=marca_dagua._montar_overlay) as montar, \
+             patch('galeria.marca_dagua._pasta_cache_disco', return_value=tempfile.mkdtemp()):
+            for _ in range(3):
+                aplicar_marca_dagua(Image.new('RGB', (600, 400)))
+            aplicar_marca_dagua(Image.new('RGB', (400, 600)))
+
+        self.assertEqual(montar.call_count, 2)
+
+    @override_settings(MARCA_DAGUA_CACHE_MB=1)
+    def test_cache_em_memoria_limitado_em_bytes(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        with patch('galeria.marca_dagua._pasta_cache_disco', return_value=pasta):
+            for largura in (300, 310, 320, 330): # ~360 KB cada em RGBA: só duas cabem em 1 MB
+                aplicar_marca_dagua(Image.new('RGB', (largura, 300)))
+            aplicar_marca_dagua(Image.new('RGB', (1000, 1000))) # ~4 MB: maior que o limite, fica só no disco
+
+        self.assertEqual([chave[0] for chave in marca_dagua._cache_memoria], [320, 330])
+        self.assertLessEqual(marca_dagua._bytes_em_memoria, 1024 * 1024)
+
+    @override_settings(MARCA_DAGUA_CACHE_DISCO_MAX=2)
+    def test_cache_em_disco_apaga_as_grades_menos_usadas(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        with patch('galeria.marca_dagua._pasta_cache_disco', return_value=pasta):
+            for largura in (100, 200, 300):
+                aplicar_marca_dagua(Image.new('RGB', (largura, 100)))
+                time.sleep(0.01) # mtimes distintos
+            limpar_cache()
+            video = marca_dagua.caminho_overlay_video()
+
+        grades = sorted(os.listdir(pasta))
+        self.assertEqual(len(grades), 2)
+        self.assertIn(os.path.basename(video), grades)
+        self.assertTrue(os.path.exists(video))
+
+
+@override_settings(AWS_S3_REGION_NAME='us-east-1', AWS_REKOGNITION_REGION_NAME='us-east-1', AWS_ACCESS_KEY_ID='teste', AWS_SECRET_ACCESS_KEY='teste')
+class ClientesAwsTestCase(TestCase):
+    """
+    Testes do registro de clientes boto3 compartilhados (config/aws.py).
+    """
+
+    def setUp(self):
+        aws.limpar_clientes()
+
+    def tearDown(self):
+        aws.limpar_clientes()
+
+    def test_cliente_reaproveitado_no_mesmo_processo(self):
+        self.assertIs(aws.cliente_s3(), aws.cliente_s3())
+        self.assertIsNot(aws.cliente_s3(), aws.cliente_rekognition())
+
+        config = aws.cliente_s3().meta.config
+        self.assertEqual(config.signature_version, 's3v4')
+        self.assertEqual(config.retries['mode'], 'adaptive')
+        self.assertTrue(config.tcp_keepalive)
+
+        # No Rekognition o backoff é só do com_backoff: o botocore não multiplica as tentativas
+        retries = aws.cliente_rekognition().meta.config.retries
+        self.assertEqual((retries['mode'], retries['total_max_attempts']), ('standard', 2))
+
+    def test_processo_filho_cria_cliente_proprio(self):
+        """Depois de um fork (PID diferente) o cliente do pai nunca é reaproveitado."""
+        do_pai = aws.cliente_s3()
+        with patch('config.aws.os.getpid', return_value=-1):
+            do_filho = aws.cliente_s3()
+        self.assertIsNot(do_pai, do_filho)
+        self.assertIs(aws.cliente_s3(), do_pai)
+
+
+def extrator_de_teste(imagem_bytes):
+    """Extrator fake do backend local: a 'imagem' é o próprio vetor ('1,0,0'), faces separadas por ';'."""
+    texto = imagem_bytes.decode()
+    return [[float(valor) for valor in face.split(',')] for face in texto.split(';') if face]
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "NumPy não instalado (backend local de busca facial)")
+@override_settings(BUSCA_FACIAL_BACKEND='local', BUSCA_FACIAL_EXTRATOR='galeria.tests.extrator_de_teste', BUSCA_FACIAL_LIMIAR_LOCAL=90)
+class BuscaFacialLocalTestCase(APITestCase):
+    """
+    Testes do backend local de busca facial (galeria/busca_facial.py).
+    """
+
+    def setUp(self):
+        BackendLocal._indices.clear()
+        fotografo = Usuario.objects.create(email='facial@example.com', nome_completo='Fotógrafo Facial', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Corrida', data_evento='2025-01-01', fotografo=fotografo)
+        self.outro_album = Album.objects.create(titulo='Maratona', data_evento='2025-01-01', fotografo=fotografo)
+
+        backend = backend_busca_facial()
+        self.foto_atleta = self._indexar(backend, self.album, b'1,0,0;0,0,1')
+        self.foto_outro = self._indexar(backend, self.album, b'0,1,0')
+        self.foto_atleta_maratona = self._indexar(backend, self.outro_album, b'1,0.1,0')
+
+    def _indexar(self, backend, album, vetores):
+        foto = Foto.objects.create(album=album, imagem=f'fotos/facial_{album.id}.jpg')
+        FaceIndexada.objects.bulk_create(backend.indexar(foto, vetores))
+        return foto
+
+    def test_busca_partida_por_album_e_global(self):
+        backend = backend_busca_facial()
+        self.assertEqual([foto_id for foto_id, _ in backend.buscar(b'1,0,0', album_id=self.album.id)], [self.foto_atleta.id])
+
+        resultados = backend.buscar(b'1,0,0')
+        self.assertEqual([foto_id for foto_id, _ in resultados], [self.foto_atleta.id, self.foto_atleta_maratona.id])
+        self.assertAlmostEqual(resultados[0][1], 100.0, places=3)
+
+        self.assertEqual(backend.buscar(b''), [])
+
+    def test_indice_remontado_quando_faces_mudam(self):
+        backend = backend_busca_facial()
+        self.assertEqual(len(backend.buscar(b'0,1,0', album_id=self.album.id)), 1)
+
+        nova = self._indexar(backend, self.album, b'0,1,0.05')
+        self.assertEqual({foto_id for foto_id, _ in backend.buscar(b'0,1,0', album_id=self.album.id)}, {self.foto_outro.id, nova.id})
+
+    @override_settings(BUSCA_FACIAL_INDICES_MAX=2, BUSCA_FACIAL_INDICES_MAX_FACES=3)
+    def test_indices_em_memoria_sao_lru_limitado(self):
+        backend = backend_busca_facial()
+        backend.buscar(b'1,0,0', album_id=self.album.id) # 3 faces
+        backend.buscar(b'1,0,0', album_id=self.outro_album.id) # 1 face: passa do limite de faces
+        self.assertEqual(list(BackendLocal._indices), [self.outro_album.id])
+
+        backend.buscar(b'1,0,0') # Global (4 faces): fica sozinho mesmo acima do limite
+        self.assertEqual(list(BackendLocal._indices), [None])
+
+    def test_expansao_traz_fotos_da_pessoa_so_dentro_do_album(self):
+        """A face parecida com a melhor encontrada entra pela expansão, mesmo abaixo do limiar da selfie."""
+        backend = backend_busca_facial()
+        perfil = self._indexar(backend, self.album, b'1,0.3,0')
+        de_lado = self._indexar(backend, self.album, b'1,0.7,0') # 82% da selfie, 95% do perfil
+
+        no_album = [foto_id for foto_id, _ in backend.buscar(b'1,0,0', album_id=self.album.id)]
+        self.assertEqual(no_album, [self.foto_atleta.id, perfil.id, de_lado.id])
+
+        self.assertNotIn(de_lado.id, [foto_id for foto_id, _ in backend.buscar(b'1,0,0')])
+
+    def test_view_usa_backend_configurado(self):
+        url = reverse('busca-facial')
+        imagem = SimpleUploadedFile('selfie.jpg', b'1,0,0', content_type='image/jpeg')
+        response = self.client.post(url, {'imagem_referencia': imagem, 'album_id': self.album.id}, format='multipart', secure=True)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([foto['id'] for foto in response.data], [self.foto_atleta.id])
+
+
+class _BackendContador:
+    """Backend fake de coleção única: conta as chamadas e sempre acha as mesmas fotos."""
+    nome = 'contador'
+
+    def __init__(self, resultados):
+        self.resultados = resultados
+        self.chamadas = 0
+
+    def particao(self, album_id):
+        return None
+
+    def buscar(self, imagem_bytes, album_id=None):
+        self.chamadas += 1
+        return list(self.resultados)
+
+
+class CacheBuscaFacialTestCase(TestCase):
+    """
+    Testes do cache de resultados da busca facial pelo hash perceptual da selfie.
+    """
+
+    def setUp(self):
+        cache.clear()
+        fotografo = Usuario.objects.create(email='selfie@example.com', nome_completo='Fotógrafo Selfie', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Prova 1', data_evento='2025-01-01', fotografo=fotografo)
+        outro_album = Album.objects.create(titulo='Prova 2', data_evento='2025-01-01', fotografo=fotografo)
+        self.foto = Foto.objects.create(album=self.album, imagem='fotos/selfie_1.jpg')
+        self.foto_outro_album = Foto.objects.create(album=outro_album, imagem='fotos/selfie_2.jpg')
+        self.backend = _BackendContador([(self.foto_outro_album.id, 99.5), (self.foto.id, 97.0)])
+
+    def _selfie(self, qualidade=90, cor=(200, 40, 40)):
+        imagem = Image.new('RGB', (400, 300), cor)
+        imagem.paste((20, 20, 160), (150, 80, 260, 220))
+        buffer = BytesIO()
+        imagem.save(buffer, 'JPEG', quality=qualidade)
+        return buffer.getvalue()
+
+    def test_hash_estavel_a_recompressao(self):
+        self.assertEqual(hash_perceptual(self._selfie(95)), hash_perceptual(self._selfie(60)))
+        self.assertNotEqual(hash_perceptual(self._selfie()), hash_perceptual(self._espelhada()))
+        self.assertIsNone(hash_perceptual(b'nao e imagem'))
+
+    def _espelhada(self):
+        imagem = Image.new('RGB', (400, 300), (200, 40, 40))
+        imagem.paste((20, 20, 160), (20, 80, 130, 220))
+        buffer = BytesIO()
+        imagem.save(buffer, 'JPEG', quality=90)
+        return buffer.getvalue()
+
+    def test_busca_por_album_filtra_resultado_global_guardado(self):
+        with patch('galeria.busca_facial.backend_busca_facial', return_value=self.backend):
+            self.assertEqual([f for f, _ in buscar_selfie(self._selfie(95))], [self.foto_outro_album.id, self.foto.id])
+            self.assertEqual(buscar_selfie(self._selfie(70), album_id=self.album.id), [(self.foto.id, 97.0)])
+            self.assertEqual(self.backend.chamadas, 1)
+
+            # Faces novas na coleção: a próxima busca vai de novo ao backend
+            incrementar_versao_colecao()
+            buscar_selfie(self._selfie(95), album_id=self.album.id)
+            self.assertEqual(self.backend.chamadas, 2)
+
+    def test_view_paginada_por_cursor_com_similaridade(self):
+        url = reverse('busca-facial')
+        terceira = Foto.objects.create(album=self.album, imagem='fotos/selfie_3.jpg')
+        self.backend.resultados.append((terceira.id, 96.0))
+
+        with patch('galeria.busca_facial.backend_busca_facial', return_value=self.backend):
+            selfie = SimpleUploadedFile('selfie.jpg', self._selfie(), content_type='image/jpeg')
+            primeira = self.client.post(url, {'imagem_referencia': selfie, 'limite': 2}, format='multipart', secure=True)
+            self.assertEqual(primeira.status_code, status.HTTP_200_OK)
+            self.assertEqual([(f['id'], f['similaridade']) for f in primeira.data['resultados']], [(self.foto_outro_album.id, 99.5), (self.foto.id, 97.0)])
+
+            segunda = self.client.post(url, {'cursor': primeira.data['proximo_cursor'], 'limite': 2}, format='multipart', secure=True)
+            self.assertEqual([f['id'] for f in segunda.data['resultados']], [terceira.id])
+            self.assertIsNone(segunda.data['proximo_cursor'])
+            self.assertEqual(self.backend.chamadas, 1)
+
+        invalido = self.client.post(url, {'cursor': 'xyz'}, format='multipart', secure=True)
+        self.assertEqual(invalido.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(AWS_REKOGNITION_COLLECTION_ID='site', BUSCA_FACIAL_COLECAO_POR_ALBUM=True, BUSCA_FACIAL_EXPANSAO_MAX=1)
+class ColecaoPorAlbumRekognitionTestCase(TestCase):
+    """
+    Testes das coleções por álbum do backend Rekognition (cliente da AWS simulado).
+    """
+
+    def setUp(self):
+        BackendRekognition._colecoes_criadas.clear()
+        cache.clear()
+        fotografo = Usuario.objects.create(email='colecao@example.com', nome_completo='Fotógrafo Coleção', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Final', data_evento='2025-01-01', fotografo=fotografo)
+        self.foto = Foto.objects.create(album=self.album, imagem='fotos/colecao_1.jpg')
+        self.foto_expandida = Foto.objects.create(album=self.album, imagem='fotos/colecao_2.jpg')
+
+        self.rekognition = MagicMock()
+        self.rekognition.exceptions.ResourceAlreadyExistsException = type('JaExiste', (Exception,), {})
+
+    def test_indexa_na_colecao_global_e_na_do_album(self):
+        self.rekognition.index_faces.side_effect = [
+            {'FaceRecords': [{'Face': {'FaceId': 'global-1'}}]},
+            {'FaceRecords': [{'Face': {'FaceId': 'album-1'}}]},
+        ]
+        with patch('galeria.busca_facial.cliente_rekognition', return_value=self.rekognition):
+            faces = BackendRekognition().indexar(self.foto, b'jpeg')
+
+        self.assertEqual([(f.rekognition_face_id, f.colecao) for f in faces], [('global-1', ''), ('album-1', f'site-album-{self.album.id}')])
+        self.rekognition.create_collection.assert_called_once_with(CollectionId=f'site-album-{self.album.id}')
+
+    def test_busca_no_album_usa_colecao_propria_e_expansao(self):
+        colecao = f'site-album-{self.album.id}'
+        FaceIndexada.objects.create(foto=self.foto, rekognition_face_id='album-1', colecao=colecao)
+        FaceIndexada.objects.create(foto=self.foto_expandida, rekognition_face_id='album-2', colecao=colecao)
+        self.rekognition.search_faces_by_image.return_value = {'FaceMatches': [{'Face': {'FaceId': 'album-1'}, 'Similarity': 99.0}]}
+        self.rekognition.search_faces.return_value = {'FaceMatches': [{'Face': {'FaceId': 'album-2'}, 'Similarity': 98.0}]}
+
+        with patch('galeria.busca_facial.cliente_rekognition', return_value=self.rekognition):
+            resultados = BackendRekognition().buscar(b'selfie', album_id=self.album.id)
+
+        self.assertEqual([foto_id for foto_id, _ in resultados], [self.foto.id, self.foto_expandida.id])
+        self.assertEqual(self.rekognition.search_faces_by_image.call_args.kwargs['CollectionId'], colecao)
+        self.rekognition.search_faces.assert_called_once()
+
+    def test_particao_consulta_o_banco_so_uma_vez(self):
+        backend = BackendRekognition()
+        with self.assertNumQueries(1):
+            self.assertIsNone(backend.particao(self.album.id)) # Álbum indexado antes da coleção própria
+            self.assertIsNone(backend.particao(self.album.id))
+
+        self.rekognition.index_faces.return_value = {'FaceRecords': [{'Face': {'FaceId': 'face-1'}}]}
+        with patch('galeria.busca_facial.cliente_rekognition', return_value=self.rekognition):
+            backend.indexar(self.foto, b'jpeg')
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.particao(self.album.id), self.album.id)
+
+    def test_arquivar_ou_apagar_o_album_apaga_a_colecao(self):
+        colecao = f'site-album-{self.album.id}'
+        FaceIndexada.objects.create(foto=self.foto, rekognition_face_id='global-1')
+        FaceIndexada.objects.create(foto=self.foto, rekognition_face_id='album-1', colecao=colecao)
+        BackendRekognition._colecoes_criadas.add(colecao)
+        cache.set(f'busca_facial:colecao_album:{self.album.id}', True, None)
+
+        with patch('galeria.tasks.apagar_colecao_album_task.delay') as tarefa, patch('galeria.indexacao_faces.agendar_remocao_faces'), \
+             self.captureOnCommitCallbacks(execute=True):
+            self.album.is_arquivado = True
+            self.album.save()
+        tarefa.assert_called_once_with(self.album.id)
+        # A face da coleção do álbum não vai face a face: a coleção inteira é apagada
+        self.assertEqual(list(FaceParaRemover.objects.values_list('colecao', 'rekognition_face_id')), [('', 'global-1')])
+
+        FaceParaRemover.objects.create(rekognition_face_id='album-antiga', colecao=colecao)
+        self.rekognition.exceptions.ResourceNotFoundException = type('NaoExiste', (Exception,), {})
+        apagar_colecao_do_album(self.album.id, rekognition=self.rekognition, balde=BaldeDeTokens(taxa=0))
+
+        self.rekognition.delete_collection.assert_called_once_with(CollectionId=colecao)
+        self.assertFalse(FaceParaRemover.objects.filter(colecao=colecao).exists())
+        self.assertNotIn(colecao, BackendRekognition._colecoes_criadas)
+        self.assertIsNone(BackendRekognition().particao(self.album.id))
+
+        with patch('galeria.tasks.apagar_colecao_album_task.delay') as tarefa, patch('galeria.signals.agendar_remocao_faces'), \
+             self.captureOnCommitCallbacks(execute=True):
+            album_id = self.album.id
+            self.album.delete()
+        tarefa.assert_called_once_with(album_id)
+
+
+class _ErroThrottling(Exception):
+    response = {'Error': {'Code': 'ThrottlingException'}}
+
+
+class _BackendIndexacao:
+    """Backend fake: a foto 'ruim' sempre falha e a 'lenta' leva um throttling antes de funcionar."""
+
+    def __init__(self, ruim_id, lenta_id):
+        self.ruim_id = ruim_id
+        self.lenta_id = lenta_id
+        self.tentativas = {}
+
+    def indexar(self, foto, imagem_bytes, chamar):
+        def index_faces():
+            self.tentativas[foto.id] = self.tentativas.get(foto.id, 0) + 1
+            if foto.id == self.ruim_id:
+                raise ValueError("imagem corrompida")
+            if foto.id == self.lenta_id and self.tentativas[foto.id] == 1:
+                raise _ErroThrottling()
+            return [FaceIndexada(foto=foto, rekognition_face_id=f"face-{foto.id}")]
+        return chamar(index_faces)
+
+
+@override_settings(FACES_BACKOFF_BASE=0, FACES_LOTE=3)
+class IndexacaoFacesEmLoteTestCase(TestCase):
+    """
+    Testes da fila de indexação facial em lotes (galeria/indexacao_faces.py).
+    """
+
+    def setUp(self):
+        fotografo = Usuario.objects.create(email='lote@example.com', nome_completo='Fotógrafo Lote', papel=Usuario.Papel.FOTOGRAFO)
+        album = Album.objects.create(titulo='Maratona', data_evento='2025-01-01', fotografo=fotografo)
+        self.fotos = [Foto.objects.create(album=album, imagem=f'fotos/lote_{i}.jpg') for i in range(5)]
+        Foto.objects.update(status_processamento=Foto.StatusProcessamento.PROCESSADA)
+        Foto.objects.filter(id=self.fotos[3].id).update(status_faces=Foto.StatusFaces.INDEXADA)
+        # Ainda sem as versões: a indexação espera o processar_foto_task
+        Foto.objects.filter(id=self.fotos[4].id).update(status_processamento=Foto.StatusProcessamento.PENDENTE)
+
+    def test_balde_de_tokens_segura_a_taxa(self):
+        balde = BaldeDeTokens(taxa=50, capacidade=1)
+        inicio = time.monotonic()
+        for _ in range(6):
+            balde.adquirir()
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.09)
+
+    def test_backoff_so_repete_throttling(self):
+        tentativas = []
+
+        def chamada():
+            tentativas.append(1)
+            if len(tentativas) < 3:
+                raise _ErroThrottling()
+            return 'ok'
+
+        self.assertEqual(com_backoff(chamada), 'ok')
+        self.assertEqual(len(tentativas), 3)
+        with self.assertRaises(ValueError):
+            com_backoff(lambda: (_ for _ in ()).throw(ValueError("outro erro")))
+
+    def test_lote_reservado_indexado_em_paralelo(self):
+        lote = reservar_lote()
+        self.assertEqual([foto.id for foto in lote], [foto.id for foto in self.fotos[:3]])
+        self.assertEqual(Foto.objects.filter(status_faces=Foto.StatusFaces.PROCESSANDO).count(), 3)
+        self.assertEqual(reservar_lote(), []) # Nada pendente sobrou para outro worker
+
+        backend = _BackendIndexacao(ruim_id=self.fotos[0].id, lenta_id=self.fotos[1].id)
+        with patch('galeria.indexacao_faces.imagem_para_indexar', return_value=b'jpeg'):
+            indexadas, falhas = indexar_lote(lote, backend=backend, balde=BaldeDeTokens(taxa=0))
+
+        self.assertEqual(sorted(indexadas), [self.fotos[1].id, self.fotos[2].id])
+        self.assertEqual(falhas, [self.fotos[0].id])
+        self.assertEqual(backend.tentativas[self.fotos[1].id], 2)
+        self.assertEqual(set(FaceIndexada.objects.values_list('foto_id', flat=True)), {self.fotos[1].id, self.fotos[2].id})
+        self.assertEqual(Foto.objects.get(id=self.fotos[0].id).status_faces, Foto.StatusFaces.FALHOU)
+
+    def test_foto_apagada_ou_album_arquivado_no_meio_do_lote(self):
+        lote = reservar_lote()
+        # Enquanto o lote estava no Rekognition: uma foto foi apagada e o álbum da outra, arquivado
+        Foto.objects.filter(id=self.fotos[1].id).delete()
+        Foto.objects.filter(id=self.fotos[2].id).update(status_faces=Foto.StatusFaces.REMOVIDA)
+
+        backend = _BackendIndexacao(ruim_id=None, lenta_id=None)
+        with patch('galeria.indexacao_faces.imagem_para_indexar', return_value=b'jpeg'):
+            indexadas, falhas = indexar_lote(lote, backend=backend, balde=BaldeDeTokens(taxa=0))
+
+        self.assertEqual((indexadas, falhas), ([self.fotos[0].id], []))
+        self.assertEqual(list(FaceIndexada.objects.values_list('foto_id', flat=True)), [self.fotos[0].id])
+        self.assertEqual(Foto.objects.get(id=self.fotos[2].id).status_faces, Foto.StatusFaces.REMOVIDA)
+        self.assertEqual(
+            set(FaceParaRemover.objects.values_list('rekognition_face_id', flat=True)),
+            {f'face-{self.fotos[1].id}', f'face-{self.fotos[2].id}'},
+        )
+
+    @override_settings(AWS_REKOGNITION_COLLECTION_ID='site', BUSCA_FACIAL_COLECAO_POR_ALBUM=True)
+    def test_throttling_na_colecao_do_album_nao_reindexa_na_global(self):
+        rekognition = MagicMock()
+        rekognition.exceptions.ResourceAlreadyExistsException = type('JaExiste', (Exception,), {})
+
+        throttling = [_ErroThrottling()] # Só a primeira chamada na coleção do álbum
+
+        def index_faces(CollectionId, **kwargs):
+            if CollectionId != 'site' and throttling:
+                raise throttling.pop()
+            return {'FaceRecords': [{'Face': {'FaceId': f'{CollectionId}-1'}}]}
+        rekognition.index_faces.side_effect = index_faces
+
+        lote = reservar_lote(tamanho=1)
+        with patch('galeria.busca_facial.cliente_rekognition', return_value=rekognition), \
+             patch('galeria.indexacao_faces.imagem_para_indexar', return_value=b'jpeg'):
+            indexadas, _ = indexar_lote(lote, backend=BackendRekognition(), balde=BaldeDeTokens(taxa=0))
+
+        colecoes = [c.kwargs['CollectionId'] for c in rekognition.index_faces.call_args_list]
+        self.assertEqual(colecoes, ['site', f'site-album-{lote[0].album_id}', f'site-album-{lote[0].album_id}'])
+        self.assertEqual(indexadas, [lote[0].id])
+        self.assertEqual(FaceIndexada.objects.filter(foto=lote[0]).count(), 2)
+
+    def test_balde_e_do_processo(self):
+        self.assertIs(balde_do_processo(), balde_do_processo())
+
+    def test_indexacao_le_a_versao_rekognition_e_nao_o_original(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        armazenamento = FileSystemStorage(location=pasta)
+        original = BytesIO()
+        Image.new('RGB', (2400, 1600), (30, 90, 150)).save(original, 'JPEG')
+
+        with patch.object(Foto._meta.get_field('imagem'), 'storage', armazenamento), \
+             patch.object(Foto._meta.get_field('imagem_rekognition'), 'storage', armazenamento):
+            # Processada antes da versão existir: gera do original uma vez e grava
+            antiga = Foto.objects.get(id=self.fotos[0].id)
+            antiga.imagem.name = armazenamento.save('fotos/antiga.jpg', original)
+            reduzida = imagem_para_indexar(antiga)
+            self.assertEqual(Image.open(BytesIO(reduzida)).size, (1620, 1080))
+            self.assertEqual(Foto.objects.get(id=antiga.id).imagem_rekognition.name, antiga.imagem_rekognition.name)
+
+            # Com a versão gravada, o original nem é aberto
+            foto = Foto.objects.get(id=antiga.id)
+            with patch.object(armazenamento, 'open', wraps=armazenamento.open) as abrir:
+                self.assertEqual(imagem_para_indexar(foto), reduzida)
+            self.assertEqual([c.args[0] for c in abrir.call_args_list], [foto.imagem_rekognition.name])
+
+
+@override_settings(AWS_REKOGNITION_COLLECTION_ID='site')
+class ColetaDeLixoFacesTestCase(TestCase):
+    """
+    Testes do ciclo de vida do índice facial: fila de remoção, arquivamento e reconciliação.
+    """
+
+    def setUp(self):
+        fotografo = Usuario.objects.create(email='lixo@example.com', nome_completo='Fotógrafo Lixo', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Torneio', data_evento='2025-01-01', fotografo=fotografo)
+        self.foto1 = Foto.objects.create(album=self.album, imagem='fotos/lixo_1.jpg')
+        self.foto2 = Foto.objects.create(album=self.album, imagem='fotos/lixo_2.jpg')
+        FaceIndexada.objects.create(foto=self.foto1, rekognition_face_id='a')
+        FaceIndexada.objects.create(foto=self.foto1, rekognition_face_id='a-album', colecao='site-album-1')
+        FaceIndexada.objects.create(foto=self.foto2, rekognition_face_id='b')
+        FaceIndexada.objects.create(foto=self.foto2, rekognition_face_id='local-123')
+
+        self.rekognition = MagicMock()
+        self.rekognition.exceptions.ResourceNotFoundException = type('NaoExiste', (Exception,), {})
+
+    def _fila(self):
+        return set(FaceParaRemover.objects.values_list('colecao', 'rekognition_face_id'))
+
+    def test_foto_apagada_enfileira_faces_da_aws(self):
+        self.foto1.delete()
+        self.assertEqual(self._fila(), {('', 'a'), ('site-album-1', 'a-album')})
+
+        self.foto2.delete() # A face do backend local não existe na AWS
+        self.assertNotIn(('', 'local-123'), self._fila())
+
+    def test_remocao_em_lotes_por_colecao(self):
+        Foto.objects.filter(album=self.album).delete()
+        with patch('galeria.indexacao_faces.MAX_FACES_POR_REMOCAO', 1):
+            total = remover_faces_enfileiradas(self.rekognition, balde=BaldeDeTokens(taxa=0))
+
+        self.assertEqual(total, 3)
+        chamadas = [(c.kwargs['CollectionId'], tuple(c.kwargs['FaceIds'])) for c in self.rekognition.delete_faces.call_args_list]
+        self.assertEqual(sorted(chamadas), [('site', ('a',)), ('site', ('b',)), ('site-album-1', ('a-album',))])
+        self.assertFalse(FaceParaRemover.objects.exists())
+
+    def test_arquivar_album_tira_faces_do_indice(self):
+        self.album.is_arquivado = True
+        self.album.save()
+
+        self.assertFalse(FaceIndexada.objects.filter(foto__album=self.album).exists())
+        self.assertEqual(self._fila(), {('', 'a'), ('', 'b')}) # A coleção do álbum sai inteira (apagar_colecao_do_album)
+        self.assertEqual(set(Foto.objects.values_list('status_faces', flat=True)), {Foto.StatusFaces.REMOVIDA})
+
+        self.album.is_arquivado = False
+        self.album.save()
+        self.assertEqual(set(Foto.objects.values_list('status_faces', flat=True)), {Foto.StatusFaces.PENDENTE})
+
+    def test_reconciliacao_remove_orfas_e_reindexa_perdidas(self):
+        Foto.objects.update(status_faces=Foto.StatusFaces.INDEXADA)
+        self.rekognition.list_faces.return_value = {'Faces': [
+            {'FaceId': 'a', 'ExternalImageId': str(self.foto1.id)},
+            {'FaceId': 'x', 'ExternalImageId': '999'},
+        ]}
+
+        orfas, perdidas = reconciliar_colecao(self.rekognition, '', aplicar=True)
+
+        self.assertEqual((orfas, perdidas), (['x'], ['b']))
+        self.assertEqual(self._fila(), {('', 'x'), ('', 'b')})
+        self.assertEqual(Foto.objects.get(id=self.foto2.id).status_faces, Foto.StatusFaces.PENDENTE)
+        self.assertEqual(Foto.objects.get(id=self.foto1.id).status_faces, Foto.StatusFaces.INDEXADA)
+
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyftpdlib'), "pyftpdlib não instalado (servidor FTP de teste)")
+class DistribuicaoFTPTestCase(TestCase):
+    def setUp(self):
+        from servidor_ftp import criar_servidor, ligar_em_segundo_plano
+        self.pasta = tempfile.mkdtemp()
+        self.servidor, self.usuarios = criar_servidor(('127.0.0.1', 0), pasta_base=self.pasta, parceiros=3, threaded=True, log=False)
+        self.desligar_servidor = ligar_em_segundo_plano(self.servidor)
+        porta = self.servidor.address[1]
+        self.parceiros = [
+            JornalParceiro(nome_jornal=usuario, ftp_host=f'127.0.0.1:{porta}', ftp_user=usuario, ftp_password='senha123', ftp_pasta='/')
+            for usuario, _ in self.usuarios
+        ]
+        distribuicao_ftp.pool.limpar()
+
+    def tearDown(self):
+        distribuicao_ftp.pool.limpar()
+        self.desligar_servidor()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def _distribuir(self, parceiros, nome_arquivo, dados):
+        """Um arquivo para vários jornais pelo motor de lote: [(parceiro, erro ou None)] na ordem dos parceiros."""
+        envios = [(parceiro, [(nome_arquivo, nome_arquivo)]) for parceiro in parceiros]
+        erros = {aviso.parceiro.nome_jornal: aviso.erro for aviso in distribuicao_ftp.entregar_em_lote(envios, lambda chave: BytesIO(dados))}
+        return [(parceiro, erros[parceiro.nome_jornal]) for parceiro in parceiros]
+
+    def test_envia_para_todos_criando_a_pasta(self):
+        resultados = self._distribuir(self.parceiros, 'foto.jpg', b'jpeg')
+
+        self.assertEqual([erro for _, erro in resultados], [None, None, None])
+        self.assertEqual([p.nome_jornal for p, _ in resultados], [p.nome_jornal for p in self.parceiros])
+        for _, pasta in self.usuarios:
+            with open(os.path.join(pasta, distribuicao_ftp.PASTA_PADRAO, 'foto.jpg'), 'rb') as f:
+                self.assertEqual(f.read(), b'jpeg')
+
+    def test_segunda_foto_reaproveita_conexao_logada(self):
+        parceiro = self.parceiros[0]
+        with patch.object(ftplib.FTP, 'login', autospec=True, side_effect=ftplib.FTP.login) as login, \
+                patch.object(ftplib.FTP, 'cwd', autospec=True, side_effect=ftplib.FTP.cwd) as cwd:
+            self._distribuir([parceiro], 'a.jpg', b'a')
+            self._distribuir([parceiro], 'b.jpg', b'b')
+
+        self.assertEqual(login.call_count, 1)
+        self.assertEqual(cwd.call_count, 2) # Só a primeira foto: o cwd falha, mkd e cwd de novo
+        self.assertTrue(os.path.exists(os.path.join(self.usuarios[0][1], distribuicao_ftp.PASTA_PADRAO, 'b.jpg')))
+
+    def test_conexao_derrubada_tenta_de_novo_com_conexao_nova(self):
+        parceiro = self.parceiros[0]
+        self._distribuir([parceiro], 'a.jpg', b'a')
+        # Simula o servidor derrubando a sessão ociosa
+        for fila in distribuicao_ftp.pool._ociosas.values():
+            for conexao in fila:
+                conexao.ftp.sock.close()
+
+        [(_, erro)] = self._distribuir([parceiro], 'b.jpg', b'b')
+
+        self.assertIsNone(erro)
+        self.assertTrue(os.path.exists(os.path.join(self.usuarios[0][1], distribuicao_ftp.PASTA_PADRAO, 'b.jpg')))
+
+    def test_pasta_trocada_nao_reaproveita_sessao_de_outra_pasta(self):
+        parceiro = self.parceiros[0]
+        parceiro.ftp_pasta = 'Esportes'
+        self._distribuir([parceiro], 'a.jpg', b'a')
+        parceiro.ftp_pasta = 'Capa'
+        self._distribuir([parceiro], 'b.jpg', b'b')
+
+        self.assertTrue(os.path.exists(os.path.join(self.usuarios[0][1], 'Capa', 'b.jpg')))
+        self.assertFalse(os.path.exists(os.path.join(self.usuarios[0][1], 'Esportes', 'Capa')))
+
+    def test_login_recusado_fecha_o_socket(self):
+        self.parceiros[0].ftp_password = 'errada'
+        with patch.object(ftplib.FTP, 'close', autospec=True, side_effect=ftplib.FTP.close) as fechar:
+            with self.assertRaises(ftplib.error_perm):
+                distribuicao_ftp.ConexaoFTP(self.parceiros[0])
+        fechar.assert_called_once()
+
+    def test_falha_de_um_jornal_nao_derruba_os_outros(self):
+        self.parceiros[1].ftp_password = 'errada'
+
+        resultados = self._distribuir(self.parceiros, 'foto.jpg', b'jpeg')
+
+        self.assertIsNone(resultados[0][1])
+        self.assertIsInstance(resultados[1][1], ftplib.error_perm)
+        self.assertIsNone(resultados[2][1])
+
+    def test_lote_usa_uma_sessao_por_jornal_e_le_cada_foto_uma_vez(self):
+        self.parceiros[1].ftp_password = 'errada'
+        lidas = []
+
+        def abrir(chave):
+            lidas.append(chave)
+            return BytesIO(f'foto {chave}'.encode())
+
+        envios = [(parceiro, [(i, f'{i}.jpg') for i in range(5)]) for parceiro in self.parceiros]
+        temporarios = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temporarios, ignore_errors=True)
+        with patch.object(ftplib.FTP, 'login', autospec=True, side_effect=ftplib.FTP.login) as login, \
+                self.settings(FTP_PASTA_TEMPORARIA=temporarios):
+            avisos = list(distribuicao_ftp.entregar_em_lote(envios, abrir))
+
+        self.assertEqual(len(avisos), 15)
+        self.assertEqual(login.call_count, 3) # Uma sessão por jornal (a do jornal 2 falha no login)
+        self.assertEqual(sorted(lidas), list(range(5)))
+        self.assertEqual(os.listdir(temporarios), []) # Cada temporário some quando o último jornal termina
+        self.assertEqual({aviso.tamanho for aviso in avisos if aviso.erro is None}, {len(b'foto 0')})
+        falhas = [(aviso.parceiro.nome_jornal, aviso.chave) for aviso in avisos if aviso.erro is not None]
+        self.assertEqual(sorted(falhas), [(self.parceiros[1].nome_jornal, i) for i in range(5)])
+        with open(os.path.join(self.usuarios[2][1], distribuicao_ftp.PASTA_PADRAO, '4.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'foto 4')
+
+    def test_task_de_lote_registra_o_progresso(self):
+        from .tasks import entregar_lote_ftp_task
+        fotografo = Usuario.objects.create(email='lote@teste.com', nome_completo='Lote', papel=Usuario.Papel.FOTOGRAFO)
+        album = Album.objects.create(titulo='Jogo', data_evento='2025-01-01', fotografo=fotografo)
+        fotos = [Foto.objects.create(album=album, imagem=f'fotos/lance{i}.jpg') for i in range(3)]
+        for parceiro in self.parceiros[:2]:
+            parceiro.usuario = fotografo
+            parceiro.save()
+        lote = LoteEntrega.objects.create(solicitante=fotografo, album=album)
+        EntregaFTP.objects.bulk_create([EntregaFTP(lote=lote, foto=foto, parceiro=p) for p in self.parceiros[:2] for foto in fotos])
+
+        s3 = MagicMock()
+        s3.get_object.side_effect = lambda Bucket, Key: {'Body': BytesIO(Key.encode())}
+        with patch('galeria.entregas_ftp.cliente_s3', return_value=s3):
+            entregar_lote_ftp_task(lote.id)
+            # Mensagem duplicada do Celery não reenvia
+            self.assertIn('nada para enviar', entregar_lote_ftp_task(lote.id))
+
+        lote.refresh_from_db()
+        self.assertEqual(lote.status, LoteEntrega.Status.CONCLUIDO)
+        self.assertIsNotNone(lote.concluido_em)
+        self.assertEqual(lote.entregas.filter(status=EntregaFTP.Status.ENVIADA).count(), 6)
+        self.assertEqual(lote.entregas.get(foto=fotos[0], parceiro=self.parceiros[0]).bytes_enviados, len(b'media_private/fotos/lance0.jpg'))
+        with open(os.path.join(self.usuarios[1][1], distribuicao_ftp.PASTA_PADRAO, 'lance2.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'media_private/fotos/lance2.jpg')
+
+    def test_arquivo_grande_nao_fica_inteiro_na_memoria(self):
+        import tracemalloc
+
+        class StreamDoS3:
+            """Gera 8 MB em blocos, como o Body do get_object."""
+            def __init__(self):
+                self.restante = 8 * 1024 * 1024
+            def read(self, tamanho=-1):
+                tamanho = self.restante if tamanho is None or tamanho < 0 else min(tamanho, self.restante)
+                self.restante -= tamanho
+                return b'x' * tamanho
+            def close(self):
+                pass
+
+        for parceiros in (self.parceiros[:1], self.parceiros):
+            envios = [(parceiro, [('grande', 'grande.tif')]) for parceiro in parceiros]
+            tracemalloc.start()
+            avisos = list(distribuicao_ftp.entregar_em_lote(envios, lambda chave: StreamDoS3()))
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.assertEqual({(aviso.erro, aviso.tamanho) for aviso in avisos}, {(None, 8 * 1024 * 1024)})
+            self.assertLess(pico, 4 * 1024 * 1024)
+        self.assertEqual(os.path.getsize(os.path.join(self.usuarios[2][1], distribuicao_ftp.PASTA_PADRAO, 'grande.tif')), 8 * 1024 * 1024)
+
+
+class LoteEntregaAPITestCase(APITestCase):
+    def setUp(self):
+        self.fotografo = Usuario.objects.create(email='f@teste.com', nome_completo='F', papel=Usuario.Papel.FOTOGRAFO)
+        self.outro = Usuario.objects.create(email='o@teste.com', nome_completo='O', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Final', data_evento='2025-01-01', fotografo=self.fotografo)
+        self.fotos = [Foto.objects.create(album=self.album, imagem=f'fotos/{i}.jpg') for i in range(3)]
+        Foto.objects.filter(id=self.fotos[2].id).update(is_arquivado=True)
+        self.jornal = JornalParceiro.objects.create(usuario=self.fotografo, nome_jornal='Diário', ftp_host='ftp.x', ftp_user='u', ftp_password='p')
+        self.jornal_alheio = JornalParceiro.objects.create(usuario=self.outro, nome_jornal='Alheio', ftp_host='ftp.y', ftp_user='u', ftp_password='p')
+        self.client.force_authenticate(self.fotografo)
+        self.url = reverse('dashboard-entrega-list')
+
+    def test_cria_lote_do_album_com_progresso(self):
+        with patch('galeria.tasks.entregar_lote_ftp_task') as task, self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(self.url, {'album': self.album.id, 'jornais': [self.jornal.id, self.jornal_alheio.id]}, format='json', secure=True)
+
+        self.assertEqual(resposta.status_code, status.HTTP_202_ACCEPTED)
+        task.apply_async.assert_called_once_with((resposta.data['id'],), countdown=0)
+        # Foto arquivada e jornal de outro fotógrafo ficam de fora
+        self.assertEqual(resposta.data['progresso'], {'total': 2, 'enviadas': 0, 'falhas': 0, 'pendentes': 2})
+        self.assertEqual([j['id'] for j in resposta.data['jornais']], [self.jornal.id])
+        self.assertEqual(len(resposta.data['arquivos']), 2)
+
+        detalhe = self.client.get(reverse('dashboard-entrega-detail', args=[resposta.data['id']]), secure=True)
+        self.assertEqual(detalhe.data['status'], 'PENDENTE')
+
+    def test_rejeita_fotos_de_outro_fotografo(self):
+        self.client.force_authenticate(self.outro)
+        resposta = self.client.post(self.url, {'fotos': [self.fotos[0].id], 'jornais': [self.jornal_alheio.id]}, format='json', secure=True)
+
+        self.assertEqual(resposta.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_exige_album_ou_fotos(self):
+        resposta = self.client.post(self.url, {'album': self.album.id, 'fotos': [self.fotos[0].id], 'jornais': [self.jornal.id]}, format='json', secure=True)
+
+        self.assertEqual(resposta.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(FTP_ENTREGA_TENTATIVAS=3, FTP_DISJUNTOR_FALHAS=4, FTP_TIMEOUT=2)
+class EntregasFTPTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.fotografo = Usuario.objects.create(email='e@teste.com', nome_completo='E', papel=Usuario.Papel.FOTOGRAFO)
+        album = Album.objects.create(titulo='Clássico', data_evento='2025-01-01', fotografo=self.fotografo)
+        self.fotos = [Foto.objects.create(album=album, imagem=f'fotos/c{i}.jpg') for i in range(2)]
+        # Porta 1: conexão recusada na hora, o jornal está "fora do ar"
+        self.fora = JornalParceiro.objects.create(usuario=self.fotografo, nome_jornal='Fora', ftp_host='127.0.0.1:1', ftp_user='u', ftp_password='p')
+        self.lote = entregas_ftp.criar_lote(self.fotografo, [self.fora], fotos=self.fotos)
+
+    def _rodar(self):
+        from .tasks import entregar_lote_ftp_task
+        with patch('galeria.tasks.entregar_lote_ftp_task.apply_async') as reagendar:
+            entregar_lote_ftp_task(self.lote.id)
+        return reagendar
+
+    def _vencer_esperas(self):
+        EntregaFTP.objects.filter(lote=self.lote).update(proxima_tentativa_em=timezone.now())
+
+    def test_falha_volta_para_a_fila_com_espera_e_depois_desiste(self):
+        reagendar = self._rodar()
+
+        entrega = EntregaFTP.objects.filter(lote=self.lote).first()
+        self.assertEqual((entrega.status, entrega.tentativas), (EntregaFTP.Status.PENDENTE, 1))
+        self.assertGreater(entrega.proxima_tentativa_em, timezone.now())
+        self.assertIn('refused', entrega.erro.lower())
+        self.assertEqual(reagendar.call_args.args, ((self.lote.id,),))
+        self.assertGreater(reagendar.call_args.kwargs['countdown'], 1)
+        self.assertEqual(LoteEntrega.objects.get(id=self.lote.id).status, LoteEntrega.Status.AGUARDANDO)
+
+        # Antes da hora nada sai
+        self.assertFalse(entregas_ftp.reservar_entregas(self.lote.id))
+
+        for _ in range(2):
+            entregas_ftp.fechar_disjuntor(self.fora.id)
+            self._vencer_esperas()
+            reagendar = self._rodar()
+
+        self.assertFalse(reagendar.called)
+        self.assertEqual(set(EntregaFTP.objects.filter(lote=self.lote).values_list('status', 'tentativas')), {(EntregaFTP.Status.FALHOU, 3)})
+        self.assertEqual(LoteEntrega.objects.get(id=self.lote.id).status, LoteEntrega.Status.CONCLUIDO_COM_FALHAS)
+
+    def test_disjuntor_adia_sem_gastar_tentativa(self):
+        self._rodar() # 2 falhas
+        self._vencer_esperas()
+        self._rodar() # 4 falhas: abre
+
+        self.assertIsNotNone(entregas_ftp.disjuntor_aberto_ate(self.fora.id))
+        self._vencer_esperas()
+        with patch.object(entregas_ftp, 'entregar_em_lote') as enviar:
+            self._rodar()
+
+        self.assertFalse(enviar.call_args.args[0])
+        entrega = EntregaFTP.objects.filter(lote=self.lote).first()
+        self.assertEqual((entrega.status, entrega.tentativas), (EntregaFTP.Status.PENDENTE, 2))
+        self.assertGreater(entrega.proxima_tentativa_em, timezone.now() + timedelta(seconds=200))
+
+    def test_painel_lista_e_reenfileira_as_falhas(self):
+        EntregaFTP.objects.filter(lote=self.lote).update(status=EntregaFTP.Status.FALHOU, tentativas=3, erro='530 Login incorrect')
+        LoteEntrega.objects.filter(id=self.lote.id).update(status=LoteEntrega.Status.CONCLUIDO_COM_FALHAS)
+        for _ in range(4):
+            entregas_ftp.registrar_falha(self.fora.id)
+        self.client.force_authenticate(self.fotografo)
+
+        lista = self.client.get(reverse('dashboard-entrega-ftp-list'), {'status': 'FALHOU'}, secure=True)
+        self.assertEqual(len(lista.data), 2)
+        self.assertEqual(lista.data[0]['nome_jornal'], 'Fora')
+
+        jornais = self.client.get(reverse('dashboard-entrega-ftp-jornais'), secure=True)
+        self.assertEqual((jornais.data[0]['falhas'], jornais.data[0]['pendentes']), (2, 0))
+        self.assertIsNotNone(jornais.data[0]['disjuntor_aberto_ate'])
+
+        with patch('galeria.tasks.entregar_lote_ftp_task') as task, self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('dashboard-entrega-ftp-reenfileirar'), {'parceiro': self.fora.id}, format='json', secure=True)
+
+        self.assertEqual(resposta.data['reenfileiradas'], 2)
+        task.apply_async.assert_called_once_with((self.lote.id,), countdown=0)
+        self.assertEqual(set(EntregaFTP.objects.filter(lote=self.lote).values_list('status', 'tentativas')), {(EntregaFTP.Status.PENDENTE, 0)})
+        self.assertIsNone(entregas_ftp.disjuntor_aberto_ate(self.fora.id))
+
+    @override_settings(FTP_RESERVA_MINUTOS=30)
+    def test_entrega_presa_em_enviando_volta_para_a_fila(self):
+        # Worker morreu no meio do lote: uma entrega presa há uma hora, a outra saindo agora
+        presa, saindo = EntregaFTP.objects.filter(lote=self.lote).order_by('id')
+        EntregaFTP.objects.filter(id=presa.id).update(status=EntregaFTP.Status.ENVIANDO, atualizado_em=timezone.now() - timedelta(hours=1))
+        EntregaFTP.objects.filter(id=saindo.id).update(status=EntregaFTP.Status.ENVIANDO, atualizado_em=timezone.now())
+
+        with patch('galeria.tasks.entregar_lote_ftp_task') as task, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(entregas_ftp.retomar_entregas_abandonadas(), 1)
+        task.apply_async.assert_called_once_with((self.lote.id,), countdown=0)
+
+        self.client.force_authenticate(self.fotografo)
+        with patch('galeria.tasks.entregar_lote_ftp_task'), self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('dashboard-entrega-ftp-reenfileirar'), {'parceiro': self.fora.id}, format='json', secure=True)
+
+        self.assertEqual(resposta.data['reenfileiradas'], 1)
+        self.assertEqual(EntregaFTP.objects.get(id=presa.id).status, EntregaFTP.Status.PENDENTE)
+        self.assertEqual(EntregaFTP.objects.get(id=saindo.id).status, EntregaFTP.Status.ENVIANDO)
+
+    def test_outro_fotografo_nao_ve_as_entregas(self):
+        outro = Usuario.objects.create(email='x@teste.com', nome_completo='X', papel=Usuario.Papel.FOTOGRAFO)
+        self.client.force_authenticate(outro)
+
+        resposta = self.client.post(reverse('dashboard-entrega-ftp-reenfileirar'), {'parceiro': self.fora.id}, format='json', secure=True)
+
+        self.assertEqual(resposta.data['reenfileiradas'], 0)
+
+
+class MetadadosIptcTestCase(TestCase):
+    """
+    Testes do carimbo IPTC/XMP por segmentos (galeria/metadados.py).
+    """
+    METADADOS = {'titulo': 'Final do Estadual', 'legenda': 'Gol da vitória', 'creditos': 'João Fotógrafo', 'data': '16/03/2025'}
+
+    def setUp(self):
+        cache.clear()
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), (200, 30, 30)).save(buffer, 'JPEG', exif=Image.Exif().tobytes())
+        self.original = buffer.getvalue()
+
+    def _carimbar(self, dados, metadados=None):
+        arquivo, _, _ = metadados_iptc.carimbar(BytesIO(dados), metadados or self.METADADOS)
+        return arquivo.read()
+
+    def test_carimbo_nao_mexe_nos_dados_comprimidos(self):
+        carimbado = self._carimbar(self.original)
+
+        inicio_scan = self.original.index(b'\xff\xda')
+        self.assertTrue(carimbado.endswith(self.original[inicio_scan:]))
+        with Image.open(BytesIO(carimbado)) as imagem:
+            iptc = IptcImagePlugin.getiptcinfo(imagem)
+            self.assertIn('Final do Estadual', imagem.info['xmp'].decode('utf-8'))
+            self.assertIn('exif', imagem.info)
+        self.assertEqual(iptc[(2, 5)], 'Final do Estadual'.encode('utf-8'))
+        self.assertEqual(iptc[(2, 120)], 'Gol da vitória'.encode('utf-8'))
+        self.assertEqual(iptc[(2, 80)], 'João Fotógrafo'.encode('utf-8'))
+        self.assertEqual(iptc[(2, 55)], b'20250316')
+
+    def test_recarimbar_substitui_em_vez_de_duplicar(self):
+        primeiro = self._carimbar(self.original, {'titulo': 'Antigo'})
+        segundo = self._carimbar(primeiro)
+
+        segmentos, _ = metadados_iptc.ler_cabecalho(BytesIO(segundo))
+        self.assertEqual([codigo for codigo, _ in segmentos].count(0xED), 1)
+        self.assertEqual(sum(1 for codigo, s in segmentos if codigo == 0xE1 and metadados_iptc.ASSINATURA_XMP in s), 1)
+        self.assertNotIn(b'Antigo', segundo)
+
+    def test_arquivo_que_nao_e_jpeg_passa_intacto(self):
+        png = BytesIO()
+        Image.new('RGB', (8, 8)).save(png, 'PNG')
+
+        self.assertEqual(self._carimbar(png.getvalue()), png.getvalue())
+
+    def test_cabecalho_em_cache_pede_so_o_resto_a_origem(self):
+        pedidos = []
+
+        def abrir(inicio):
+            pedidos.append(inicio)
+            return BytesIO(self.original[inicio:])
+
+        primeiro = metadados_iptc.abrir_carimbado('fotos/x.jpg', self.METADADOS, abrir).read()
+        segundo = metadados_iptc.abrir_carimbado('fotos/x.jpg', self.METADADOS, abrir).read()
+
+        self.assertEqual(primeiro, segundo)
+        self.assertEqual(pedidos, [0, self.original.index(b'\xff\xda') + 2])
+
+    def test_legenda_gigante_e_cortada_tambem_no_xmp(self):
+        carimbado = self._carimbar(self.original, {'legenda': 'á' * 100_000})
+
+        with Image.open(BytesIO(carimbado)) as imagem:
+            xmp = imagem.info['xmp'].decode('utf-8')
+        self.assertIn('á' * 1000, xmp)
+        self.assertNotIn('á' * 1001, xmp)
+
+    def test_mantem_o_que_o_fotografo_ja_tinha_gravado(self):
+        iim = (
+            metadados_iptc._dataset(0, b'\x00\x04') + metadados_iptc._dataset(5, b'Titulo velho')
+            + metadados_iptc._dataset(25, b'futebol') + metadados_iptc._dataset(116, '© Agência'.encode('latin-1'))
+        )
+        irb = metadados_iptc._recurso_8bim(0x0404, iim) + metadados_iptc._recurso_8bim(0x0409, b'miniatura')
+        app13 = metadados_iptc.ASSINATURA_PHOTOSHOP + irb
+        xmp = metadados_iptc.ASSINATURA_XMP + (
+            '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+            '<rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            '<dc:title><rdf:Alt><rdf:li xml:lang="x-default">Titulo velho</rdf:li></rdf:Alt></dc:title>'
+            '<dc:rights><rdf:Alt><rdf:li xml:lang="x-default">Todos os direitos</rdf:li></rdf:Alt></dc:rights>'
+            '</rdf:Description></rdf:RDF></x:xmpmeta>'
+        ).encode('utf-8')
+        original = (
+            self.original[:2]
+            + b'\xff\xe1' + struct.pack('>H', len(xmp) + 2) + xmp
+            + b'\xff\xed' + struct.pack('>H', len(app13) + 2) + app13
+            + self.original[2:]
+        )
+
+        carimbado = self._carimbar(original)
+
+        with Image.open(BytesIO(carimbado)) as imagem:
+            iptc = IptcImagePlugin.getiptcinfo(imagem)
+            xmp = imagem.info['xmp'].decode('utf-8')
+        self.assertEqual(iptc[(2, 5)], b'Final do Estadual')
+        self.assertEqual(iptc[(2, 25)], b'futebol')
+        self.assertEqual(iptc[(2, 116)], '© Agência'.encode('utf-8'))
+        self.assertIn(b'8BIM\x04\x09', carimbado)
+        self.assertIn('Todos os direitos', xmp)
+        self.assertIn('Final do Estadual', xmp)
+        self.assertNotIn(b'Titulo velho', carimbado)
+
+
+@override_settings(AWS_STORAGE_BUCKET_NAME='bucket', UPLOAD_PARTE_MB=16)
+class SessaoUploadAPITestCase(APITestCase):
+    def setUp(self):
+        self.fotografo = Usuario.objects.create(email='u@teste.com', nome_completo='U', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Regional', data_evento='2025-01-01', fotografo=self.fotografo)
+        self.client.force_authenticate(self.fotografo)
+        self.url = reverse('dashboard-upload-list')
+
+        self.s3 = MagicMock()
+        self.s3.generate_presigned_post.side_effect = lambda Bucket, Key, **kw: {'url': 'https://bucket.s3', 'fields': {'key': Key}}
+        self.s3.create_multipart_upload.return_value = {'UploadId': 'up-1'}
+        self.s3.generate_presigned_url.return_value = 'https://bucket.s3/parte'
+        self.no_bucket, self.partes = [], []
+        paginadores = {'list_objects_v2': MagicMock(), 'list_parts': MagicMock()}
+        paginadores['list_objects_v2'].paginate.side_effect = lambda **kw: [{'Contents': list(self.no_bucket)}]
+        paginadores['list_parts'].paginate.side_effect = lambda **kw: [{'Parts': list(self.partes)}]
+        self.s3.get_paginator.side_effect = paginadores.get
+        patcher = patch('galeria.uploads_diretos.cliente_s3', return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _confirmar(self, sessao_id):
+        with patch('galeria.processamento_em_lote.group') as grupo, patch('galeria.tasks.processar_video_task') as videos, \
+             patch('galeria.tasks.entregar_lote_ftp_task'), self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('dashboard-upload-confirmar', args=[sessao_id]), secure=True)
+        return resposta, grupo, videos
+
+    def test_fotos_vao_direto_ao_bucket_e_a_confirmacao_cria_em_lote(self):
+        arquivos = [{'nome': f'IMG_{i}.jpg', 'tamanho': 15_000_000, 'content_type': 'image/jpeg'} for i in range(3)]
+        resposta = self.client.post(self.url, {'album': self.album.id, 'preco': '12.50', 'arquivos': arquivos}, format='json', secure=True)
+
+        self.assertEqual(resposta.status_code, status.HTTP_201_CREATED)
+        chaves = [upload['post']['fields']['key'] for upload in resposta.data['uploads']]
+        self.assertTrue(all(chave.startswith(f"media_private/fotos/{resposta.data['id'].replace('-', '')}/") for chave in chaves))
+
+        # Só duas chegaram: a confirmação cria as duas e devolve a que falta
+        self.no_bucket = [{'Key': chave, 'Size': 14_000_000} for chave in chaves[:2]]
+        confirmacao, grupo, _ = self._confirmar(resposta.data['id'])
+
+        self.assertEqual(len(confirmacao.data['fotos']), 2)
+        self.assertEqual(confirmacao.data['faltando'], ['IMG_2.jpg'])
+        self.assertEqual([assinatura.args[0] for assinatura in grupo.call_args.args[0]], [sorted(confirmacao.data['fotos'])])
+        foto = Foto.objects.get(id=confirmacao.data['fotos'][0])
+        self.assertEqual((foto.imagem.name, foto.preco), (chaves[0][len('media_private/'):], Decimal('12.50')))
+
+        self.no_bucket = [{'Key': chave, 'Size': 14_000_000} for chave in chaves]
+        confirmacao, _, _ = self._confirmar(resposta.data['id'])
+
+        self.assertEqual((len(confirmacao.data['fotos']), confirmacao.data['faltando']), (1, []))
+        self.assertEqual(Foto.objects.filter(album=self.album).count(), 3)
+        self.assertEqual(SessaoUpload.objects.get(id=resposta.data['id']).status, SessaoUpload.Status.CONFIRMADA)
+
+    def test_video_multipart_so_fecha_com_todas_as_partes(self):
+        arquivos = [{'nome': 'final.mp4', 'tamanho': 40 * 1024 * 1024, 'content_type': 'video/mp4'}]
+        resposta = self.client.post(self.url, {'album': self.album.id, 'tipo': 'VIDEO', 'arquivos': arquivos}, format='json', secure=True)
+
+        upload = resposta.data['uploads'][0]
+        self.assertEqual((upload['tamanho_parte'], upload['total_partes']), (16 * 1024 * 1024, 3))
+        self.assertEqual(self.s3.create_multipart_upload.call_args.kwargs['ChecksumAlgorithm'], 'SHA256')
+        chave = self.s3.create_multipart_upload.call_args.kwargs['Key']
+
+        # Cada parte pede a sua URL com o SHA-256: ele entra na assinatura e volta como cabeçalho do PUT
+        shas = {numero: base64.b64encode(hashlib.sha256(bytes([numero])).digest()).decode() for numero in (1, 2, 3)}
+        url_partes = reverse('dashboard-upload-partes', args=[resposta.data['id']])
+        pedido = self.client.post(url_partes, {'arquivo': upload['id'], 'partes': [{'numero': n, 'sha256': sha} for n, sha in shas.items()]}, format='json', secure=True)
+        self.assertEqual(len(pedido.data['partes']), 3)
+        self.assertEqual(pedido.data['partes'][1]['cabecalhos']['x-amz-checksum-sha256'], shas[2])
+        self.assertEqual(self.s3.generate_presigned_url.call_args.kwargs['Params']['ChecksumSHA256'], shas[3])
+
+        invalidos = [{'numero': 4, 'sha256': shas[1]}], [{'numero': 1, 'sha256': 'nao-e-base64'}]
+        for partes in invalidos:
+            recusado = self.client.post(url_partes, {'arquivo': upload['id'], 'partes': partes}, format='json', secure=True)
+            self.assertEqual(recusado.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # A parte 2 chegou com outro checksum (não é a declarada): conta como faltando
+        self.partes = [
+            {'PartNumber': 1, 'ETag': '"a"', 'Size': 16 * 1024 * 1024, 'ChecksumSHA256': shas[1]},
+            {'PartNumber': 2, 'ETag': '"b"', 'Size': 16 * 1024 * 1024, 'ChecksumSHA256': shas[1]},
+        ]
+        situacao = self.client.get(reverse('dashboard-upload-situacao', args=[resposta.data['id']]), secure=True).data['arquivos'][0]
+        self.assertEqual((situacao['partes_faltando'], situacao['bytes_recebidos']), ([2, 3], 16 * 1024 * 1024))
+
+        confirmacao, _, _ = self._confirmar(resposta.data['id'])
+        self.assertEqual(confirmacao.data['faltando'], ['final.mp4'])
+        self.assertFalse(self.s3.complete_multipart_upload.called)
+
+        self.partes[1]['ChecksumSHA256'] = shas[2]
+        self.partes.append({'PartNumber': 3, 'ETag': '"c"', 'Size': 8 * 1024 * 1024, 'ChecksumSHA256': shas[3]})
+        self.no_bucket = [{'Key': chave, 'Size': 40 * 1024 * 1024}]
+        confirmacao, _, videos = self._confirmar(resposta.data['id'])
+
+        partes = self.s3.complete_multipart_upload.call_args.kwargs['MultipartUpload']['Parts']
+        self.assertEqual([(parte['PartNumber'], parte['ChecksumSHA256']) for parte in partes], list(shas.items()))
+        video = Video.objects.get(id=confirmacao.data['videos'][0])
+        self.assertEqual(video.titulo, 'final')
+        videos.delay.assert_called_once_with(video.id)
+
+    def test_pedidos_de_partes_em_paralelo_nao_perdem_checksums(self):
+        arquivos = [{'nome': 'jogo.mp4', 'tamanho': 40 * 1024 * 1024, 'content_type': 'video/mp4'}]
+        resposta = self.client.post(self.url, {'album': self.album.id, 'tipo': 'VIDEO', 'arquivos': arquivos}, format='json', secure=True)
+        sha = base64.b64encode(hashlib.sha256(b'x').digest()).decode()
+
+        # Dois pedidos que leram a linha antes de qualquer um gravar
+        primeiro, segundo = ArquivoUpload.objects.get(sessao_id=resposta.data['id']), ArquivoUpload.objects.get(sessao_id=resposta.data['id'])
+        partes_assinadas(primeiro, [{'numero': 1, 'sha256': sha}])
+        partes_assinadas(segundo, [{'numero': 2, 'sha256': sha}])
+
+        self.assertEqual(ArquivoUpload.objects.get(id=primeiro.id).checksums, {'1': sha, '2': sha})
+
+    def test_cancelamento_no_meio_da_confirmacao_nao_cria_fotos(self):
+        arquivos = [{'nome': 'a.jpg', 'tamanho': 1000, 'content_type': 'image/jpeg'}]
+        resposta = self.client.post(self.url, {'album': self.album.id, 'arquivos': arquivos}, format='json', secure=True)
+        sessao_id = resposta.data['id']
+        self.no_bucket = [{'Key': resposta.data['uploads'][0]['post']['fields']['key'], 'Size': 1000}]
+
+        # O DELETE chega enquanto a confirmação lista o prefixo no S3 (fora da trava)
+        listar = self.s3.get_paginator('list_objects_v2').paginate.side_effect
+        def listar_e_cancelar(**kw):
+            self.client.delete(reverse('dashboard-upload-detail', args=[sessao_id]), secure=True)
+            return listar(**kw)
+        self.s3.get_paginator('list_objects_v2').paginate.side_effect = listar_e_cancelar
+
+        confirmacao, _, _ = self._confirmar(sessao_id)
+
+        self.assertEqual(confirmacao.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Foto.objects.exists())
+        self.assertEqual(SessaoUpload.objects.get(id=sessao_id).status, SessaoUpload.Status.CANCELADA)
+        self.s3.delete_objects.assert_called_once()
+
+    def test_cancelar_sessao_confirmada_nao_apaga_nada(self):
+        arquivos = [{'nome': 'a.jpg', 'tamanho': 1000, 'content_type': 'image/jpeg'}]
+        resposta = self.client.post(self.url, {'album': self.album.id, 'arquivos': arquivos}, format='json', secure=True)
+        self.no_bucket = [{'Key': resposta.data['uploads'][0]['post']['fields']['key'], 'Size': 1000}]
+        self._confirmar(resposta.data['id'])
+
+        sessao = SessaoUpload.objects.get(id=resposta.data['id'])
+        SessaoUpload.objects.filter(id=sessao.id).update(expira_em=timezone.now() - timedelta(hours=1))
+
+        self.assertFalse(cancelar_sessao(sessao))
+        self.assertEqual(limpar_sessoes_expiradas(), 0)
+        self.assertFalse(self.s3.delete_objects.called)
+        self.assertEqual(SessaoUpload.objects.get(id=sessao.id).status, SessaoUpload.Status.CONFIRMADA)
+
+    def test_so_ftp_vira_lote_com_os_temporarios(self):
+        jornal = JornalParceiro.objects.create(usuario=self.fotografo, nome_jornal='Diário', ftp_host='ftp.x', ftp_user='u', ftp_password='p')
+        arquivos = [{'nome': 'capa.jpg', 'tamanho': 1000, 'content_type': 'image/jpeg'}]
+        resposta = self.client.post(self.url, {'destino': 'ftp', 'jornais': [jornal.id], 'arquivos': arquivos}, format='json', secure=True)
+        chave = resposta.data['uploads'][0]['post']['fields']['key']
+        self.assertTrue(chave.startswith('tmp_ftp/'))
+
+        self.no_bucket = [{'Key': chave, 'Size': 1000}]
+        confirmacao, _, _ = self._confirmar(resposta.data['id'])
+
+        entrega = EntregaFTP.objects.get(lote_id=confirmacao.data['lote'])
+        self.assertEqual((entrega.chave_temporaria, entrega.nome_arquivo, entrega.parceiro_id), (chave, 'capa.jpg', jornal.id))
+        self.assertFalse(Foto.objects.exists())
+
+    def test_rejeita_album_alheio_e_arquivo_que_nao_e_imagem(self):
+        outro = Usuario.objects.create(email='v@teste.com', nome_completo='V', papel=Usuario.Papel.FOTOGRAFO)
+        album_alheio = Album.objects.create(titulo='Outro', data_evento='2025-01-01', fotografo=outro)
+        imagem = [{'nome': 'a.jpg', 'tamanho': 10, 'content_type': 'image/jpeg'}]
+
+        alheio = self.client.post(self.url, {'album': album_alheio.id, 'arquivos': imagem}, format='json', secure=True)
+        pdf = self.client.post(self.url, {'album': self.album.id, 'arquivos': [{'nome': 'a.pdf', 'tamanho': 10, 'content_type': 'application/pdf'}]}, format='json', secure=True)
+
+        self.assertEqual((alheio.status_code, pdf.status_code), (status.HTTP_400_BAD_REQUEST, status.HTTP_400_BAD_REQUEST))
+        self.assertFalse(SessaoUpload.objects.exists())
+
+
+@override_settings(PROCESSAMENTO_PEDACO=25)
+class UploadEmLoteTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.fotografo = Usuario.objects.create(email='l@teste.com', nome_completo='L', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Copa', data_evento='2025-01-01', fotografo=self.fotografo)
+        self.client.force_authenticate(self.fotografo)
+        self.url = reverse('foto-upload-lote')
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+
+        self.no_bucket = []
+        s3 = MagicMock()
+        s3.get_paginator.return_value.paginate.side_effect = lambda **kw: [{'Contents': [{'Key': chave, 'Size': 1000} for chave in self.no_bucket]}]
+        patcher = patch('galeria.uploads_diretos.cliente_s3', return_value=s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _postar(self, dados, formato='json'):
+        with patch('galeria.processamento_em_lote.group') as grupo, patch('galeria.signals.processar_foto_task') as por_foto, \
+             self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(self.url, dados, format=formato, secure=True)
+        return resposta, grupo, por_foto
+
+    def _reservar(self, quantidade, usuario=None, no_bucket=True):
+        arquivos = [{'nome': f'{i:03d}.jpg', 'tamanho': 1000, 'content_type': 'image/jpeg'} for i in range(quantidade)]
+        sessao = criar_sessao(usuario or self.fotografo, SessaoUpload.Tipo.FOTO, arquivos, album=self.album)
+        chaves = [arquivo.chave for arquivo in sessao.arquivos.all()]
+        if no_bucket:
+            self.no_bucket += chaves
+        return chaves
+
+    def test_chaves_viram_fotos_num_insert_e_poucas_mensagens(self):
+        chaves = self._reservar(60)
+        resposta, grupo, por_foto = self._postar({'album': self.album.id, 'chaves': chaves, 'preco': '8.00'})
+
+        self.assertEqual(resposta.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(resposta.data['fotos']), 60)
+        assinaturas = grupo.call_args.args[0]
+        self.assertEqual([len(assinatura.args[0]) for assinatura in assinaturas], [25, 25, 10])
+        self.assertEqual(len({assinatura.args[1] for assinatura in assinaturas}), 1)
+        self.assertFalse(por_foto.delay.called)
+        self.assertEqual(Album.objects.get(id=self.album.id).total_fotos, 60)
+        self.assertEqual(Foto.objects.get(id=resposta.data['fotos'][0]).imagem.name, chaves[0][len('media_private/'):])
+        self.assertFalse(ArquivoUpload.objects.filter(status=ArquivoUpload.Status.AGUARDANDO).exists())
+
+    def test_rejeita_chave_de_outro_usuario_ou_que_nao_chegou_ao_bucket(self):
+        outro = Usuario.objects.create(email='n@teste.com', nome_completo='N', papel=Usuario.Papel.FOTOGRAFO)
+        alheia = self._reservar(1, usuario=outro)
+        nao_subiu = self._reservar(1, no_bucket=False)
+        inventada = ['media_private/fotos/qualquer/x.jpg']
+
+        respostas = [self._postar({'album': self.album.id, 'chaves': chaves})[0] for chaves in (alheia, nao_subiu, inventada)]
+
+        self.assertEqual({resposta.status_code for resposta in respostas}, {status.HTTP_400_BAD_REQUEST})
+        self.assertFalse(Foto.objects.exists())
+        self.assertEqual(Album.objects.get(id=self.album.id).total_fotos, 0)
+
+    @patch('galeria.tasks.rejeitar_foto')
+    def test_original_que_sumiu_do_bucket_e_rejeitado(self, rejeitar):
+        from .tasks import processar_foto_task
+
+        foto = Foto.objects.create(album=self.album, imagem='fotos/sumiu.jpg')
+        with patch.object(Foto._meta.get_field('imagem'), 'storage', FileSystemStorage(location=self.pasta)):
+            processar_foto_task(foto.id)
+
+        rejeitar.assert_called_once()
+
+    def test_arquivos_sobem_no_mesmo_lote(self):
+        imagens = [create_dummy_image(), create_dummy_image()]
+        with patch.object(Foto._meta.get_field('imagem'), 'storage', FileSystemStorage(location=self.pasta)):
+            resposta, grupo, _ = self._postar({'album': self.album.id, 'imagens': imagens}, formato='multipart')
+
+        self.assertEqual(resposta.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(os.listdir(os.path.join(self.pasta, 'fotos'))), 2)
+        self.assertEqual(len(grupo.call_args.args[0]), 1)
+
+    def test_rejeita_chave_fora_da_pasta_e_album_alheio(self):
+        outro = Usuario.objects.create(email='m@teste.com', nome_completo='M', papel=Usuario.Papel.FOTOGRAFO)
+        Foto.objects.create(album=self.album, imagem='fotos/ja.jpg')
+
+        fora = self._postar({'album': self.album.id, 'chaves': ['media/miniaturas/x.jpg']})[0]
+        repetida = self._postar({'album': self.album.id, 'chaves': ['fotos/ja.jpg']})[0]
+        self.client.force_authenticate(outro)
+        alheio = self._postar({'album': self.album.id, 'chaves': ['fotos/y.jpg']})[0]
+
+        self.assertEqual({fora.status_code, repetida.status_code, alheio.status_code}, {status.HTTP_400_BAD_REQUEST})
+        self.assertEqual(Foto.objects.count(), 1)
+
+    def test_fechamento_roda_uma_vez_quando_o_ultimo_pedaco_termina(self):
+        from .tasks import processar_fotos_em_lote_task
+
+        fotos = [Foto.objects.create(album=self.album, imagem=f'fotos/p{i}.jpg') for i in range(60)]
+        with patch('galeria.processamento_em_lote.group') as grupo, self.captureOnCommitCallbacks(execute=True):
+            enfileirar_fotos(self.album.id, [foto.id for foto in fotos])
+
+        with patch('galeria.tasks.processar_foto_task') as processar, patch('galeria.tasks.fechar_lote_fotos_task') as fechar:
+            for assinatura in grupo.call_args.args[0]:
+                self.assertFalse(fechar.delay.called)
+                processar_fotos_em_lote_task(*assinatura.args)
+
+        self.assertEqual(processar.call_count, 60)
+        fechar.delay.assert_called_once_with(self.album.id, [foto.id for foto in fotos])
+
+    def test_fechamento_reconta_e_escolhe_a_capa(self):
+        fotos = [Foto.objects.create(album=self.album, imagem=f'fotos/c{i}.jpg') for i in range(3)]
+        Album.objects.filter(id=self.album.id).update(total_fotos=0)
+        armazenamento = FileSystemStorage(location=self.pasta)
+        armazenamento.save('miniaturas/c1.jpg', create_dummy_image())
+        Foto.objects.filter(id=fotos[1].id).update(miniatura_marca_dagua='miniaturas/c1.jpg')
+
+        with patch.object(Foto._meta.get_field('miniatura_marca_dagua'), 'storage', armazenamento), \
+             patch.object(Album._meta.get_field('capa'), 'storage', armazenamento):
+            fechar_lote(self.album.id, [foto.id for foto in fotos])
+
+        album = Album.objects.get(id=self.album.id)
+        self.assertEqual(album.total_fotos, 3)
+        self.assertEqual(album.capa.name, f'album_capas/capa_album_{album.id}_foto_{fotos[1].id}.jpg')
+
+
+class ValidacaoImagemTestCase(TestCase):
+    """
+    Testes da validação em dois tempos (galeria/validacao_imagem.py): cabeçalho no request, pixels no worker.
+    """
+
+    def setUp(self):
+        self.fotografo = Usuario.objects.create(email='val@teste.com', nome_completo='Val', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Sub-17', data_evento='2025-01-01', fotografo=self.fotografo)
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        armazenamento = FileSystemStorage(location=self.pasta)
+        for campo in ('imagem', 'miniatura_marca_dagua', 'miniatura_grade', 'imagem_social', 'imagem_rekognition'):
+            patcher = patch.object(Foto._meta.get_field(campo), 'storage', armazenamento)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.armazenamento = armazenamento
+        patcher = patch('galeria.tasks.agendar_indexacao_faces')
+        self.agendar_indexacao = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _arquivo(self, formato, tamanho=(640, 480), **opcoes):
+        f = BytesIO()
+        Image.new('RGB', tamanho, (30, 90, 150)).save(f, formato, **opcoes)
+        f.seek(0)
+        return f
+
+    def test_dimensoes_saem_do_cabecalho(self):
+        casos = [
+            ('JPEG', self._arquivo('JPEG', exif=Image.Exif().tobytes())),
+            ('JPEG', self._arquivo('JPEG', progressive=True)),
+            ('PNG', self._arquivo('PNG')),
+            ('WEBP', self._arquivo('WEBP')),
+            ('WEBP', self._arquivo('WEBP', lossless=True)),
+        ]
+        for formato, arquivo in casos:
+            self.assertEqual(ler_cabecalho_imagem(arquivo), (formato, 640, 480))
+            self.assertEqual(arquivo.tell(), 0)
+
+        with self.assertRaises(ImagemRejeitada):
+            ler_cabecalho_imagem(BytesIO(b'%PDF-1.7 nada de foto aqui'))
+
+    def test_upload_nao_abre_a_imagem_no_pillow(self):
+        arquivo = SimpleUploadedFile('a.jpg', self._arquivo('JPEG', (800, 600)).read(), content_type='image/jpeg')
+        requisicao = MagicMock(user=self.fotografo)
+        serializer = FotoUploadSerializer(data={'album': self.album.id, 'imagem': arquivo, 'preco': '10.00'}, context={'request': requisicao})
+
+        with patch('PIL.Image.open', side_effect=AssertionError("Pillow no request")):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            foto = serializer.save()
+
+        self.assertEqual((foto.largura, foto.altura, foto.status_processamento), (800, 600, Foto.StatusProcessamento.PENDENTE))
+
+    def test_worker_processa_e_rejeita(self):
+        from .tasks import processar_foto_task
+
+        boa = Foto.objects.create(album=self.album, imagem=self.armazenamento.save('fotos/boa.jpg', self._arquivo('JPEG')))
+        jpeg = self._arquivo('JPEG', (1200, 900)).getvalue()
+        cortada = Foto.objects.create(album=self.album, imagem=self.armazenamento.save('fotos/cortada.jpg', BytesIO(jpeg[:len(jpeg) // 3])))
+        with override_settings(FOTO_MAX_PIXELS=2_000_000):
+            grande = Foto.objects.create(album=self.album, imagem=self.armazenamento.save('fotos/grande.jpg', self._arquivo('JPEG', (2000, 1500))))
+
+            for foto in (boa, cortada, grande):
+                processar_foto_task(foto.id)
+
+        boa.refresh_from_db(); cortada.refresh_from_db(); grande.refresh_from_db()
+        self.assertEqual(boa.status_processamento, Foto.StatusProcessamento.PROCESSADA)
+        self.assertTrue(boa.miniatura_grade)
+        self.assertTrue(boa.imagem_rekognition) # A indexação facial lê esta versão, não o original
+        self.assertEqual(self.agendar_indexacao.call_count, 1) # Só a foto processada libera a indexação
+        self.assertEqual((cortada.status_processamento, cortada.status_faces), (Foto.StatusProcessamento.REJEITADA, Foto.StatusFaces.FALHOU))
+        self.assertIn('truncated', cortada.motivo_rejeicao)
+        self.assertEqual(grande.status_processamento, Foto.StatusProcessamento.REJEITADA)
+        self.assertIn('megapixels', grande.motivo_rejeicao)
+        self.assertFalse(grande.miniatura_grade)
+
+    def test_falha_de_rede_no_download_nao_rejeita_a_foto(self):
+        from .tasks import processar_foto_task
+
+        foto = Foto.objects.create(album=self.album, imagem=self.armazenamento.save('fotos/boa.jpg', self._arquivo('JPEG')))
+        # O botocore levanta ReadTimeoutError (um OSError) no read() do S3File
+        original = MagicMock(read=MagicMock(side_effect=OSError("Read timeout on endpoint URL")))
+        with patch.object(self.armazenamento, 'open', return_value=original):
+            processar_foto_task(foto.id)
+
+        foto.refresh_from_db()
+        self.assertEqual((foto.status_processamento, foto.motivo_rejeicao), (Foto.StatusProcessamento.PENDENTE, ''))
+
+
+class ProcessamentoVideoTestCase(TestCase):
+    def setUp(self):
+        self.fotografo = Usuario.objects.create(email='v@teste.com', nome_completo='V', papel=Usuario.Papel.FOTOGRAFO)
+        self.album = Album.objects.create(titulo='Final', data_evento='2025-01-01', fotografo=self.fotografo)
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        storage = FileSystemStorage(location=self.pasta)
+        for campo in ('arquivo_video', 'miniatura', 'arquivo_preview'):
+            patcher = patch.object(Video._meta.get_field(campo), 'storage', storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sonda = {
+            'format': {'duration': '95.5', 'format_name': 'mov,mp4', 'size': '1000', 'bit_rate': '8000000'},
+            'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 1920, 'height': 1080, 'avg_frame_rate': '30000/1001'}],
+        }
+
+    def _ffmpeg_falso(self, comando, **kwargs):
+        # Grava as saídas pedidas (os caminhos que terminam em .jpg/.mp4)
+        for caminho in comando:
+            if caminho.endswith(('.jpg', '.mp4')):
+                with open(caminho, 'wb') as f:
+                    f.write(b'derivado')
+
+    def _processar(self, video):
+        with patch('galeria.processamento_video.ffmpeg.probe', return_value=self.sonda), \
+             patch('galeria.processamento_video.caminho_overlay_video', return_value='/tmp/lencol.png'), \
+             patch('galeria.processamento_video.subprocess.run', side_effect=self._ffmpeg_falso) as run:
+            processar_video_task(video.id)
+        return run
+
+    def test_upload_dispara_uma_task_e_uma_invocacao_gera_tudo(self):
+        with patch('galeria.signals.processar_video_task') as task, self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.create(album=self.album, arquivo_video=ContentFile(b'mp4', name='jogo.mp4'))
+        task.delay.assert_called_once_with(video.id)
+
+        run = self._processar(video)
+
+        self.assertEqual(run.call_count, 1)
+        comando = run.call_args.args[0]
+        # Busca na entrada: -ss/-t antes do -i, que lê o original direto do storage
+        self.assertLess(comando.index('-ss'), comando.index('-i'))
+        self.assertEqual(comando[comando.index('-t') + 1], '10')
+        self.assertEqual(comando[comando.index('-i') + 1], video.arquivo_video.path)
+        self.assertIn('split=2', comando[comando.index('-filter_complex') + 1])
+
+        video.refresh_from_db()
+        self.assertEqual((video.metadados['duracao'], video.metadados['largura'], video.metadados['fps']), (95.5, 1920, 29.97))
+        self.assertTrue(video.miniatura.name.endswith('.jpg'))
+        self.assertTrue(video.arquivo_preview.name.endswith('.mp4'))
+
+        # Reprocessar não baixa nem decodifica de novo
+        self.assertFalse(self._processar(video).called)
+
+    def test_so_a_miniatura_faltando_nao_refaz_o_preview(self):
+        with patch('galeria.signals.processar_video_task'):
+            video = Video.objects.create(album=self.album, arquivo_video=ContentFile(b'mp4', name='curto.mp4'), arquivo_preview='videos_previews/p.mp4')
+        self.sonda['format']['duration'] = '0.8'
+
+        comando = self._processar(video).call_args.args[0]
+
+        self.assertEqual(comando.count('-i'), 1)
+        self.assertFalse(any(parte.endswith('.mp4') for parte in comando[comando.index('-filter_complex'):]))
+        self.assertIn('trim=start=0.4', comando[comando.index('-filter_complex') + 1])
+
+    def test_original_no_s3_vira_url_assinada(self):
+        arquivo = MagicMock()
+        type(arquivo).path = PropertyMock(side_effect=NotImplementedError)
+        arquivo.storage.url.return_value = 'https://bucket.s3/videos/jogo.mp4?X-Amz-Signature=x'
+
+        with override_settings(VIDEO_URL_VALIDADE=600):
+            self.assertEqual(entrada_do_ffmpeg(arquivo), arquivo.storage.url.return_value)
+        arquivo.storage.url.assert_called_once_with(arquivo.name, expire=600)
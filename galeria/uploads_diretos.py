@@ -0,0 +1,455 @@
+# galeria/uploads_diretos.py
+
+import base64
+import binascii
+import math
+import os
+from datetime import timedelta
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from config.aws import cliente_s3
+from contas.models import JornalParceiro
+from .models import SessaoUpload, ArquivoUpload, Foto, Video
+from .processamento_em_lote import criar_fotos_em_lote
+from .entregas_ftp import criar_lote, agendar_lote
+
+# ====================================================================
+# UPLOAD DIRETO PARA O S3 (O gunicorn só vê JSON)
+# ====================================================================
+# Antes cada original (15 MB a foto, GBs o vídeo) atravessava o gunicorn
+# como multipart e o django-storages subia tudo de novo para o S3: o worker
+# web ficava preso a transferência inteira. Agora:
+#   1. POST da sessão: o backend reserva uma chave por arquivo e devolve um
+#      POST assinado (fotos) ou o tamanho das partes do multipart (vídeos);
+#   2. o navegador manda os bytes direto para o bucket. Nos vídeos, pede as
+#      URLs das partes com o SHA-256 de cada uma (POST partes/): o S3 recusa
+#      parte corrompida, e uma conexão que cai só perde a parte em curso;
+#      GET status/ diz o que já chegou para retomar de onde parou;
+#   3. POST de confirmação: o backend lista o prefixo da sessão no S3 (uma
+#      chamada a cada 1.000 arquivos), cria as Fotos/Vídeos com bulk_create
+#      e enfileira o processamento.
+# A confirmação pode ser repetida: só cria o que chegou e ainda não virou
+# Foto/Vídeo, e devolve o que falta.
+
+MB = 1024 * 1024
+LIMITE_PARTES_S3 = 10000
+
+
+class SessaoCancelada(Exception):
+    """A sessão foi cancelada (ou expirou) enquanto a confirmação falava com o S3."""
+
+
+class ArquivoJaConfirmado(Exception):
+    """Outra requisição confirmou algum dos arquivos entre a validação e a criação."""
+
+
+def _bucket():
+    return settings.AWS_STORAGE_BUCKET_NAME
+
+
+def _local_do_campo(modelo, campo):
+    """(location do storage, pasta do upload_to) do campo de arquivo: ex. ('media_private', 'fotos')."""
+    field = modelo._meta.get_field(campo)
+    return field.storage.location, field.upload_to.strip('/')
+
+
+def prefixo_da_sessao(sessao):
+    """Todos os arquivos da sessão ficam debaixo de um prefixo só: a confirmação lista um lugar."""
+    if sessao.destino == SessaoUpload.Destino.FTP:
+        return f"tmp_ftp/{sessao.id.hex}/"
+    location, pasta = _local_do_campo(Foto, 'imagem') if sessao.tipo == SessaoUpload.Tipo.FOTO else _local_do_campo(Video, 'arquivo_video')
+    return f"{location}/{pasta}/{sessao.id.hex}/"
+
+
+def nome_no_storage(chave, modelo, campo):
+    """Chave do bucket -> nome gravado no FileField (sem o location do storage)."""
+    location, _ = _local_do_campo(modelo, campo)
+    return chave[len(location) + 1:] if chave.startswith(f"{location}/") else chave
+
+
+def tamanho_da_parte(tamanho):
+    """Partes de UPLOAD_PARTE_MB, crescendo se o vídeo passaria do limite de partes do S3."""
+    parte = getattr(settings, 'UPLOAD_PARTE_MB', 16) * MB
+    return max(parte, math.ceil(tamanho / LIMITE_PARTES_S3))
+
+
+def _validade():
+    return int(timedelta(hours=getattr(settings, 'UPLOAD_SESSAO_HORAS', 24)).total_seconds())
+
+
+# --- SESSÃO ---
+
+def criar_sessao(usuario, tipo, arquivos, destino=SessaoUpload.Destino.SITE, album=None, jornais=(), metadados=None, preco=None, legenda=''):
+    """
+    Reserva uma chave por arquivo ({'nome', 'tamanho', 'content_type'}) e, nos vídeos, já abre o multipart.
+    """
+    sessao = SessaoUpload.objects.create(
+        usuario=usuario, album=album, tipo=tipo, destino=destino, jornais=list(jornais),
+        metadados=metadados or {}, preco=preco, legenda=legenda or '',
+        expira_em=timezone.now() + timedelta(seconds=_validade()),
+    )
+    prefixo = prefixo_da_sessao(sessao)
+    registros = []
+    for indice, arquivo in enumerate(arquivos):
+        nome = get_valid_filename(os.path.basename(arquivo['nome']))[-100:] or 'arquivo'
+        registro = ArquivoUpload(
+            sessao=sessao, nome_original=arquivo['nome'], chave=f"{prefixo}{indice:04d}_{nome}",
+            content_type=arquivo['content_type'], tamanho=arquivo['tamanho'],
+        )
+        if tipo == SessaoUpload.Tipo.VIDEO:
+            resposta = cliente_s3().create_multipart_upload(Bucket=_bucket(), Key=registro.chave, ContentType=registro.content_type, ChecksumAlgorithm='SHA256')
+            registro.upload_id = resposta['UploadId']
+        registros.append(registro)
+    ArquivoUpload.objects.bulk_create(registros)
+    return sessao
+
+
+def post_assinado(arquivo):
+    """Formulário do POST direto ao S3 para uma foto: chave, tipo e tamanho máximo travados na política."""
+    limite = getattr(settings, 'UPLOAD_FOTO_MAX_MB', 80) * MB
+    return cliente_s3().generate_presigned_post(
+        Bucket=_bucket(), Key=arquivo.chave,
+        Fields={'Content-Type': arquivo.content_type},
+        Conditions=[{'Content-Type': arquivo.content_type}, ['content-length-range', 1, limite]],
+        ExpiresIn=_validade(),
+    )
+
+
+def partes_do_video(arquivo):
+    """(tamanho de cada parte, total de partes) do multipart de um vídeo."""
+    parte = tamanho_da_parte(arquivo.tamanho)
+    return parte, max(1, math.ceil(arquivo.tamanho / parte))
+
+
+def _tamanho_esperado(arquivo, numero):
+    parte, total = partes_do_video(arquivo)
+    return parte if numero < total else arquivo.tamanho - parte * (total - 1)
+
+
+def checksum_valido(valor):
+    """SHA-256 em base64 (o formato do cabeçalho x-amz-checksum-sha256)."""
+    try:
+        return len(base64.b64decode(valor, validate=True)) == 32
+    except (binascii.Error, ValueError, TypeError):
+        return False
+
+
+def partes_assinadas(arquivo, partes):
+    """
+    URLs de PUT das partes pedidas ([{'numero', 'sha256'}]). O checksum entra na assinatura:
+    o S3 recusa a parte se os bytes não baterem com o SHA-256 declarado.
+    """
+    # Os clientes pedem partes em paralelo: a trava na linha evita que um pedido apague os checksums do outro
+    with transaction.atomic():
+        travado = ArquivoUpload.objects.select_for_update().get(id=arquivo.id)
+        travado.checksums.update({str(parte['numero']): parte['sha256'] for parte in partes})
+        travado.save(update_fields=['checksums'])
+    arquivo.checksums = travado.checksums
+
+    cliente = cliente_s3()
+    assinadas = []
+    for parte in partes:
+        assinadas.append({
+            'numero': parte['numero'],
+            'url': cliente.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': _bucket(), 'Key': arquivo.chave, 'UploadId': arquivo.upload_id, 'PartNumber': parte['numero'],
+                    'ChecksumAlgorithm': 'SHA256', 'ChecksumSHA256': parte['sha256'],
+                },
+                ExpiresIn=_validade(),
+            ),
+            # Assinados junto com a URL: o PUT precisa mandar exatamente estes cabeçalhos
+            'cabecalhos': {'x-amz-checksum-sha256': parte['sha256'], 'x-amz-sdk-checksum-algorithm': 'SHA256'},
+        })
+    return assinadas
+
+
+def instrucoes_de_upload(sessao):
+    """O que o navegador precisa para mandar cada arquivo ainda não confirmado."""
+    instrucoes = []
+    for arquivo in sessao.arquivos.filter(status=ArquivoUpload.Status.AGUARDANDO):
+        item = {'id': arquivo.id, 'nome': arquivo.nome_original}
+        if arquivo.upload_id:
+            # As URLs das partes saem sob demanda (POST partes/), com o checksum de cada uma
+            item['tamanho_parte'], item['total_partes'] = partes_do_video(arquivo)
+        else:
+            item['post'] = post_assinado(arquivo)
+        instrucoes.append(item)
+    return instrucoes
+
+
+# --- SITUAÇÃO E CONFIRMAÇÃO ---
+
+def _sem_upload(erro):
+    return erro.response.get('Error', {}).get('Code') == 'NoSuchUpload'
+
+
+def partes_recebidas(arquivo):
+    """
+    {numero: parte do list_parts} das partes que servem: tamanho certo e o checksum declarado.
+    None se o multipart não existe mais (já concluído ou abortado).
+    """
+    parte, total = partes_do_video(arquivo)
+    cliente = cliente_s3()
+    validas = {}
+    try:
+        for pagina in cliente.get_paginator('list_parts').paginate(Bucket=_bucket(), Key=arquivo.chave, UploadId=arquivo.upload_id):
+            for recebida in pagina.get('Parts', []):
+                numero = recebida['PartNumber']
+                if numero > total or recebida['Size'] != _tamanho_esperado(arquivo, numero):
+                    continue
+                if recebida.get('ChecksumSHA256') != arquivo.checksums.get(str(numero)):
+                    continue
+                validas[numero] = recebida
+    except ClientError as e:
+        if not _sem_upload(e):
+            raise
+        return None
+    return validas
+
+
+def situacao_do_arquivo(arquivo, no_bucket=None):
+    """Para retomar o upload: o que já chegou e o que falta mandar."""
+    situacao = {'id': arquivo.id, 'nome': arquivo.nome_original, 'status': arquivo.status, 'tamanho': arquivo.tamanho}
+    if arquivo.status != ArquivoUpload.Status.AGUARDANDO:
+        return situacao
+    if not arquivo.upload_id:
+        situacao['recebido'] = arquivo.chave in (no_bucket or {})
+        return situacao
+
+    parte, total = partes_do_video(arquivo)
+    recebidas = partes_recebidas(arquivo)
+    if recebidas is None:
+        # Multipart já fechado: só falta a confirmação
+        recebidas = {numero: {'Size': _tamanho_esperado(arquivo, numero)} for numero in range(1, total + 1)}
+    situacao.update({
+        'tamanho_parte': parte, 'total_partes': total,
+        'bytes_recebidos': sum(recebida['Size'] for recebida in recebidas.values()),
+        'partes_recebidas': sorted(recebidas),
+        'partes_faltando': [numero for numero in range(1, total + 1) if numero not in recebidas],
+    })
+    return situacao
+
+
+def situacao_da_sessao(sessao):
+    arquivos = list(sessao.arquivos.all())
+    fotos_aguardando = any(a.status == ArquivoUpload.Status.AGUARDANDO and not a.upload_id for a in arquivos)
+    no_bucket = arquivos_no_bucket(prefixo_da_sessao(sessao)) if fotos_aguardando else {}
+    return [situacao_do_arquivo(arquivo, no_bucket) for arquivo in arquivos]
+
+
+def _concluir_multipart(arquivo):
+    """Fecha o multipart se todas as partes chegaram íntegras. False se falta alguma."""
+    _, total = partes_do_video(arquivo)
+    recebidas = partes_recebidas(arquivo)
+    if recebidas is None:
+        # Já concluído numa confirmação anterior que caiu antes do commit: a listagem do prefixo decide
+        return True
+    if len(recebidas) < total:
+        return False
+    partes = [
+        {'PartNumber': numero, 'ETag': recebidas[numero]['ETag'], 'ChecksumSHA256': recebidas[numero]['ChecksumSHA256']}
+        for numero in range(1, total + 1)
+    ]
+    try:
+        cliente_s3().complete_multipart_upload(Bucket=_bucket(), Key=arquivo.chave, UploadId=arquivo.upload_id, MultipartUpload={'Parts': partes})
+    except ClientError as e:
+        # Outra confirmação fechou o mesmo multipart ao mesmo tempo
+        if not _sem_upload(e):
+            raise
+    return True
+
+
+def arquivos_no_bucket(prefixo):
+    """{chave: tamanho} de tudo que está no prefixo (uma chamada a cada 1.000 objetos)."""
+    encontrados = {}
+    for pagina in cliente_s3().get_paginator('list_objects_v2').paginate(Bucket=_bucket(), Prefix=prefixo):
+        for objeto in pagina.get('Contents', []):
+            encontrados[objeto['Key']] = objeto['Size']
+    return encontrados
+
+
+def enfileirar_videos(videos):
+    """O que o post_save (galeria/signals.py) faria por vídeo; o bulk_create não dispara sinais."""
+    from .tasks import processar_video_task
+
+    videos_ids = [video.id for video in videos]
+
+    def disparar():
+        for video_id in videos_ids:
+            processar_video_task.delay(video_id)
+
+    transaction.on_commit(disparar)
+
+
+def _novo_video(sessao, arquivo):
+    titulo = os.path.splitext(os.path.basename(arquivo.nome_original))[0] or "Vídeo sem título"
+    video = Video(album=sessao.album, arquivo_video=nome_no_storage(arquivo.chave, Video, 'arquivo_video'), titulo=titulo)
+    if sessao.preco is not None:
+        video.preco = sessao.preco
+    return video
+
+
+def confirmar_sessao(sessao_id):
+    """
+    Cria as Fotos/Vídeos (ou o lote FTP) do que já está no bucket.
+    Devolve {'fotos': [ids], 'videos': [ids], 'lote': id|None, 'faltando': [nomes]}.
+    SessaoCancelada se a sessão foi cancelada no meio.
+    """
+    # 1. As chamadas ao S3 (list_parts, complete, listagem do prefixo) ficam fora da transação:
+    # segundos de rede não seguram a trava da sessão nem uma conexão do banco aberta
+    sessao = SessaoUpload.objects.get(id=sessao_id)
+    if sessao.status == SessaoUpload.Status.CANCELADA:
+        raise SessaoCancelada()
+    aguardando = list(sessao.arquivos.filter(status=ArquivoUpload.Status.AGUARDANDO))
+    sem_partes = {arquivo.id for arquivo in aguardando if arquivo.upload_id and not _concluir_multipart(arquivo)}
+    no_bucket = arquivos_no_bucket(prefixo_da_sessao(sessao)) if len(sem_partes) < len(aguardando) else {}
+
+    with transaction.atomic():
+        # 2. Lock da sessão: duas confirmações ao mesmo tempo não criam a mesma foto duas vezes,
+        # e um cancelamento que passou na frente não deixa criar Foto de arquivo já apagado
+        sessao = SessaoUpload.objects.select_for_update().get(id=sessao_id)
+        if sessao.status == SessaoUpload.Status.CANCELADA:
+            raise SessaoCancelada()
+        aguardando = list(sessao.arquivos.filter(status=ArquivoUpload.Status.AGUARDANDO))
+        chegaram = [arquivo for arquivo in aguardando if arquivo.id not in sem_partes and arquivo.chave in no_bucket]
+        for arquivo in chegaram:
+            arquivo.tamanho = no_bucket[arquivo.chave]
+            arquivo.status = ArquivoUpload.Status.CONFIRMADO
+
+        fotos, videos, lote = [], [], None
+        if sessao.destino != SessaoUpload.Destino.FTP:
+            if sessao.tipo == SessaoUpload.Tipo.FOTO:
+                fotos = criar_fotos_em_lote(
+                    sessao.album, nomes=[nome_no_storage(arquivo.chave, Foto, 'imagem') for arquivo in chegaram],
+                    preco=sessao.preco, legenda=sessao.legenda,
+                ) if chegaram else []
+                for arquivo, foto in zip(chegaram, fotos):
+                    arquivo.foto = foto
+            else:
+                videos = Video.objects.bulk_create([_novo_video(sessao, arquivo) for arquivo in chegaram])
+                for arquivo, video in zip(chegaram, videos):
+                    arquivo.video = video
+                enfileirar_videos(videos)
+
+        if sessao.destino != SessaoUpload.Destino.SITE and chegaram and sessao.jornais:
+            parceiros = JornalParceiro.objects.filter(id__in=sessao.jornais, ativo=True)
+            if sessao.destino == SessaoUpload.Destino.FTP:
+                lote = criar_lote(sessao.usuario, parceiros, album=sessao.album, metadados=sessao.metadados,
+                                  temporarios=[(arquivo.chave, os.path.basename(arquivo.nome_original)) for arquivo in chegaram])
+            else:
+                lote = criar_lote(sessao.usuario, parceiros, fotos=fotos, album=sessao.album, metadados=sessao.metadados)
+            agendar_lote(lote.id)
+
+        ArquivoUpload.objects.bulk_update(chegaram, ['tamanho', 'status', 'foto', 'video'])
+        faltando = [arquivo.nome_original for arquivo in aguardando if arquivo.status == ArquivoUpload.Status.AGUARDANDO]
+        if not faltando:
+            sessao.status = SessaoUpload.Status.CONFIRMADA
+            sessao.confirmada_em = timezone.now()
+            sessao.save(update_fields=['status', 'confirmada_em'])
+
+    print(f"📦 [UPLOAD] Sessão {sessao.id}: {len(chegaram)} confirmados, {len(faltando)} faltando.")
+    return {
+        'fotos': [foto.id for foto in fotos], 'videos': [video.id for video in videos],
+        'lote': lote.id if lote else None, 'faltando': faltando,
+    }
+
+
+# --- CHAVES JÁ NO BUCKET (POST do upload em lote) ---
+
+def arquivos_das_chaves(usuario, nomes):
+    """
+    {nome no storage: ArquivoUpload} dos nomes ('fotos/<sessão>/...') que o usuário reservou numa sessão
+    de fotos do site ainda aberta e que já estão no bucket (uma listagem por sessão). O que é de outra
+    pessoa, de sessão FTP/vídeo ou nunca subiu fica de fora: não vira Foto fantasma.
+    """
+    location, _ = _local_do_campo(Foto, 'imagem')
+    arquivos = list(
+        ArquivoUpload.objects.select_related('sessao')
+        .filter(
+            chave__in=[f"{location}/{nome}" for nome in nomes], status=ArquivoUpload.Status.AGUARDANDO, upload_id='',
+            sessao__usuario=usuario, sessao__tipo=SessaoUpload.Tipo.FOTO, sessao__status=SessaoUpload.Status.ABERTA,
+        )
+        .exclude(sessao__destino=SessaoUpload.Destino.FTP)
+    )
+    no_bucket = {}
+    for sessao in {arquivo.sessao_id: arquivo.sessao for arquivo in arquivos}.values():
+        no_bucket.update(arquivos_no_bucket(prefixo_da_sessao(sessao)))
+
+    encontrados = {}
+    for arquivo in arquivos:
+        if arquivo.chave in no_bucket:
+            arquivo.tamanho = no_bucket[arquivo.chave]
+            encontrados[nome_no_storage(arquivo.chave, Foto, 'imagem')] = arquivo
+    return encontrados
+
+
+def confirmar_arquivos(album, arquivos, preco=None, legenda=''):
+    """
+    Cria as Fotos dos ArquivoUpload já verificados (arquivos_das_chaves) e os marca como confirmados,
+    com a mesma trava de confirmar_sessao: a foto não sai duas vezes se a sessão for confirmada junto.
+    """
+    with transaction.atomic():
+        list(SessaoUpload.objects.select_for_update().filter(id__in={arquivo.sessao_id for arquivo in arquivos}))
+        ainda_aguardando = set(
+            ArquivoUpload.objects.filter(id__in=[arquivo.id for arquivo in arquivos], status=ArquivoUpload.Status.AGUARDANDO)
+            .values_list('id', flat=True)
+        )
+        if len(ainda_aguardando) != len(arquivos):
+            raise ArquivoJaConfirmado()
+
+        fotos = criar_fotos_em_lote(album, nomes=[nome_no_storage(arquivo.chave, Foto, 'imagem') for arquivo in arquivos], preco=preco, legenda=legenda)
+        for arquivo, foto in zip(arquivos, fotos):
+            arquivo.foto = foto
+            arquivo.status = ArquivoUpload.Status.CONFIRMADO
+        ArquivoUpload.objects.bulk_update(arquivos, ['tamanho', 'status', 'foto'])
+    return fotos
+
+
+# --- CANCELAMENTO E LIMPEZA ---
+
+def cancelar_sessao(sessao):
+    """
+    Aborta os multiparts e apaga do bucket o que chegou mas não foi confirmado.
+    False se a sessão já não estava aberta (confirmada ou cancelada por outra requisição).
+    """
+    # Mesma trava da confirmação: ou ela termina antes (e o que virou Foto não é apagado),
+    # ou vê a sessão CANCELADA e não cria nada. O S3 fica para depois do commit.
+    with transaction.atomic():
+        sessao = SessaoUpload.objects.select_for_update().get(id=sessao.id)
+        if sessao.status != SessaoUpload.Status.ABERTA:
+            return False
+        aguardando = list(sessao.arquivos.filter(status=ArquivoUpload.Status.AGUARDANDO))
+        sessao.status = SessaoUpload.Status.CANCELADA
+        sessao.save(update_fields=['status'])
+
+    cliente = cliente_s3()
+    for arquivo in aguardando:
+        if arquivo.upload_id:
+            try:
+                cliente.abort_multipart_upload(Bucket=_bucket(), Key=arquivo.chave, UploadId=arquivo.upload_id)
+            except ClientError as e:
+                if not _sem_upload(e):
+                    raise
+
+    chaves = [arquivo.chave for arquivo in aguardando]
+    for inicio in range(0, len(chaves), 1000):
+        cliente.delete_objects(Bucket=_bucket(), Delete={'Objects': [{'Key': chave} for chave in chaves[inicio:inicio + 1000]], 'Quiet': True})
+    return True
+
+
+def limpar_sessoes_expiradas():
+    """Cancela as sessões abertas vencidas (multipart abandonado no S3 é cobrado por GB). Devolve quantas."""
+    vencidas = SessaoUpload.objects.filter(status=SessaoUpload.Status.ABERTA, expira_em__lt=timezone.now())
+    total = 0
+    for sessao in vencidas:
+        try:
+            total += cancelar_sessao(sessao)
+        except Exception as e:
+            print(f"⚠️ [UPLOAD] Não foi possível cancelar a sessão {sessao.id}: {e}")
+    return total
@@ -7,6 +7,7 @@ from .views import (
     AlbumDetailView, 
     BuscaFacialView,
     FotoUploadView,
+    FotoLoteUploadView,
     VideoUploadDashboardView,
     AlbumViewSet,
     FotoViewSet,
@@ -14,6 +15,9 @@ from .views import (
     album_share_preview,
     StatusFilaProcessamentoView,
     AvaliacaoViewSet,
+    LoteEntregaViewSet,
+    EntregaFTPViewSet,
+    SessaoUploadViewSet,
     avaliacoes_destaques
 )
 
@@ -22,6 +26,9 @@ dashboard_router = DefaultRouter()
 dashboard_router.register(r'albuns', AlbumViewSet, basename='dashboard-album')
 dashboard_router.register(r'fotos', FotoViewSet, basename='dashboard-foto')
 dashboard_router.register(r'videos', VideoViewSet, basename='dashboard-video')
+dashboard_router.register(r'entregas', LoteEntregaViewSet, basename='dashboard-entrega')
+dashboard_router.register(r'entregas-ftp', EntregaFTPViewSet, basename='dashboard-entrega-ftp')
+dashboard_router.register(r'uploads', SessaoUploadViewSet, basename='dashboard-upload')
 # --- REGISTRO DA ROTA DO ADMIN PARA AVALIAÇÕES ---
 dashboard_router.register(r'avaliacoes', AvaliacaoViewSet, basename='dashboard-avaliacao')
 
@@ -39,6 +46,7 @@ urlpatterns = [
     
     # URLs do Painel (para fotógrafos/admins)
     path('fotos/upload/', FotoUploadView.as_view(), name='foto-upload'),
+    path('fotos/upload/lote/', FotoLoteUploadView.as_view(), name='foto-upload-lote'),
     path('dashboard/videos/upload/', VideoUploadDashboardView.as_view(), name='video-upload'),
     path('dashboard/status-fila/', StatusFilaProcessamentoView.as_view(), name='status-fila'),
     
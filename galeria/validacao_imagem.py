@@ -0,0 +1,142 @@
+# galeria/validacao_imagem.py
+
+import struct
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+
+from .metadados import MARCADORES_SEM_TAMANHO
+
+# ====================================================================
+# VALIDAÇÃO DA FOTO EM DOIS TEMPOS (Cabeçalho no request, pixels no worker)
+# ====================================================================
+# O ImageField do DRF abre e verifica cada upload no Pillow dentro do
+# request, e o worker depois decodifica os mesmos bytes de novo. Agora o
+# request só confere a assinatura do arquivo e lê largura/altura do
+# cabeçalho (alguns KB, sem Pillow). A decodificação completa, o limite de
+# pixels (bomba de descompressão) e a verificação ficam no processamento do
+# Celery, que já decodifica a foto para gerar as versões: foto que não passa
+# vai para REJEITADA com o motivo.
+
+FORMATOS_ACEITOS = ('JPEG', 'PNG', 'WEBP')
+
+# SOF0..SOF15, menos DHT (C4), JPG (C8) e DAC (CC)
+MARCADORES_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Cabeçalho que passa disso (Exif gigante, arquivo forjado) não é lido até o fim
+LIMITE_CABECALHO = 1024 * 1024
+
+
+class ImagemRejeitada(ValueError):
+    """O conteúdo do arquivo não é uma foto que o site aceita (o motivo vai para a Foto)."""
+
+
+# Erros do Pillow ao decodificar bytes já baixados: todos querem dizer "arquivo ruim"
+ERROS_DE_IMAGEM = (ImagemRejeitada, UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError, EOFError)
+
+
+def formato_pela_assinatura(inicio):
+    """JPEG/PNG/WEBP pelos primeiros bytes, ou None."""
+    if inicio[:3] == b'\xff\xd8\xff':
+        return 'JPEG'
+    if inicio[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'PNG'
+    if inicio[:4] == b'RIFF' and inicio[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def _dimensoes_jpeg(arquivo):
+    arquivo.seek(2)
+    lidos = 2
+    while lidos < LIMITE_CABECALHO:
+        marcador = arquivo.read(2)
+        lidos += 2
+        while marcador[:1] == b'\xff' and marcador[1:] == b'\xff':
+            marcador = b'\xff' + arquivo.read(1)
+            lidos += 1
+        if len(marcador) < 2 or marcador[0] != 0xFF:
+            return None
+        codigo = marcador[1]
+        if codigo in MARCADORES_SEM_TAMANHO:
+            continue
+        if codigo in (0xD9, 0xDA): # Fim da imagem ou início dos dados sem ter passado por um SOF
+            return None
+        tamanho = arquivo.read(2)
+        if len(tamanho) < 2:
+            return None
+        tamanho = struct.unpack('>H', tamanho)[0]
+        if codigo in MARCADORES_SOF:
+            quadro = arquivo.read(5)
+            if len(quadro) < 5:
+                return None
+            altura, largura = struct.unpack('>HH', quadro[1:5])
+            return largura, altura
+        arquivo.seek(tamanho - 2, 1)
+        lidos += tamanho
+    return None
+
+
+def _dimensoes_png(cabecalho):
+    if cabecalho[12:16] != b'IHDR' or len(cabecalho) < 24:
+        return None
+    return struct.unpack('>II', cabecalho[16:24])
+
+
+def _dimensoes_webp(cabecalho):
+    bloco = cabecalho[12:16]
+    if bloco == b'VP8 ' and len(cabecalho) >= 30 and cabecalho[23:26] == b'\x9d\x01\x2a':
+        largura, altura = struct.unpack('<HH', cabecalho[26:30])
+        return largura & 0x3FFF, altura & 0x3FFF
+    if bloco == b'VP8L' and len(cabecalho) >= 25 and cabecalho[20] == 0x2F:
+        b = cabecalho[21:25]
+        return 1 + (b[0] | (b[1] & 0x3F) << 8), 1 + (b[1] >> 6 | b[2] << 2 | (b[3] & 0x0F) << 10)
+    if bloco == b'VP8X' and len(cabecalho) >= 30:
+        return 1 + int.from_bytes(cabecalho[24:27], 'little'), 1 + int.from_bytes(cabecalho[27:30], 'little')
+    return None
+
+
+def ler_cabecalho_imagem(arquivo):
+    """
+    (formato, largura, altura) lendo só o cabeçalho; ImagemRejeitada se não for JPEG/PNG/WEBP legível.
+    O arquivo volta para o início.
+    """
+    arquivo.seek(0)
+    try:
+        cabecalho = arquivo.read(32)
+        formato = formato_pela_assinatura(cabecalho)
+        if formato is None:
+            raise ImagemRejeitada("Formato não suportado (envie JPEG, PNG ou WEBP).")
+        if formato == 'JPEG':
+            dimensoes = _dimensoes_jpeg(arquivo)
+        elif formato == 'PNG':
+            dimensoes = _dimensoes_png(cabecalho)
+        else:
+            dimensoes = _dimensoes_webp(cabecalho)
+    finally:
+        arquivo.seek(0)
+
+    if not dimensoes or not all(dimensoes):
+        raise ImagemRejeitada(f"Cabeçalho {formato} ilegível.")
+    return formato, dimensoes[0], dimensoes[1]
+
+
+def conferir_original(imagem):
+    """No worker, com o original já aberto no Pillow (só cabeçalho lido): formato e limite de pixels."""
+    if imagem.format not in FORMATOS_ACEITOS:
+        raise ImagemRejeitada(f"Formato {imagem.format} não suportado.")
+    largura, altura = imagem.size
+    limite = getattr(settings, 'FOTO_MAX_PIXELS', 120_000_000)
+    if largura * altura > limite:
+        raise ImagemRejeitada(f"{largura}x{altura} passa do limite de {limite // 1_000_000} megapixels.")
+
+
+def rejeitar_foto(foto, erro):
+    """A foto some do site e da fila de faces; o fotógrafo vê o motivo no painel."""
+    from .models import Foto
+
+    motivo = str(erro) or erro.__class__.__name__
+    Foto.objects.filter(id=foto.id).update(
+        status_processamento=Foto.StatusProcessamento.REJEITADA, motivo_rejeicao=motivo[:255],
+        status_faces=Foto.StatusFaces.FALHOU,
+    )
+    print(f"🚫 [CELERY] Foto ID {foto.id} rejeitada: {motivo}")
@@ -0,0 +1,115 @@
+# galeria/versoes.py
+
+from io import BytesIO
+from PIL import Image
+from django.conf import settings
+from .marca_dagua import aplicar_marca_dagua
+from .validacao_imagem import conferir_original
+
+# ====================================================================
+# MOTOR DE VERSÕES DA FOTO (Uma única decodificação, várias saídas)
+# ====================================================================
+# A tabela de versões fica só em settings.FOTO_VERSOES (tamanho, modo,
+# qualidade, marca_dagua, campo). Este módulo apenas lê essa tabela.
+
+# Nome da versão que a indexação facial lê (galeria/indexacao_faces.py)
+VERSAO_REKOGNITION = 'rekognition'
+
+
+def versoes_configuradas():
+    return settings.FOTO_VERSOES
+
+
+def _tamanho_final(tamanho_original, config):
+    """Calcula o tamanho que a versão terá a partir do tamanho do original."""
+    largura, altura = tamanho_original
+    max_largura, max_altura = config['tamanho']
+
+    if config['modo'] == 'cortar':
+        return (max_largura, max_altura)
+
+    escala = min(max_largura / largura, max_altura / altura, 1.0)
+    return (max(1, round(largura * escala)), max(1, round(altura * escala)))
+
+
+def _tamanho_minimo_decodificacao(tamanho_original, config):
+    """Menor tamanho que o original decodificado precisa ter para gerar a versão sem perder qualidade."""
+    largura, altura = tamanho_original
+    if config['modo'] == 'cortar':
+        max_largura, max_altura = config['tamanho']
+        escala = min(max(max_largura / largura, max_altura / altura), 1.0)
+        return (round(largura * escala), round(altura * escala))
+    return _tamanho_final(tamanho_original, config)
+
+
+def _redimensionar(imagem, config):
+    tamanho = _tamanho_final(imagem.size, config)
+
+    if config['modo'] == 'cortar':
+        # Recorta o centro da imagem na proporção do cartão antes de reduzir
+        largura, altura = imagem.size
+        proporcao_alvo = tamanho[0] / tamanho[1]
+        if largura / altura > proporcao_alvo:
+            nova_largura = round(altura * proporcao_alvo)
+            esquerda = (largura - nova_largura) // 2
+            caixa = (esquerda, 0, esquerda + nova_largura, altura)
+        else:
+            nova_altura = round(largura / proporcao_alvo)
+            topo = (altura - nova_altura) // 2
+            caixa = (0, topo, largura, topo + nova_altura)
+        return imagem.resize(tamanho, Image.Resampling.LANCZOS, box=caixa, reducing_gap=3.0)
+
+    if tamanho == imagem.size:
+        return imagem.copy()
+    return imagem.resize(tamanho, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def gerar_versoes(arquivo, nomes=None):
+    """
+    Decodifica o original UMA única vez e devolve {nome_da_versao: bytes JPEG}.
+    Arquivo que não é foto válida levanta um dos ERROS_DE_IMAGEM (galeria/validacao_imagem.py).
+
+    Para JPEGs usamos o modo 'draft' do Pillow: o decodificador já entrega a
+    imagem reduzida (1/2, 1/4, 1/8) no menor tamanho que ainda atende a maior
+    versão pedida, o que corta boa parte do custo de CPU e memória.
+    """
+    versoes = versoes_configuradas()
+    if nomes is None:
+        nomes = list(versoes.keys())
+    nomes = [nome for nome in nomes if nome in versoes]
+    if not nomes:
+        return {}
+
+    with Image.open(arquivo) as original:
+        # Formato e limite de pixels antes de decodificar (galeria/validacao_imagem.py)
+        conferir_original(original)
+        tamanho_original = original.size
+
+        # O maior tamanho necessário entre todas as versões pedidas
+        largura_min, altura_min = 1, 1
+        for nome in nomes:
+            largura, altura = _tamanho_minimo_decodificacao(tamanho_original, versoes[nome])
+            largura_min = max(largura_min, largura)
+            altura_min = max(altura_min, altura)
+
+        if original.format == 'JPEG':
+            original.draft('RGB', (largura_min, altura_min))
+
+        original.load()
+        base = original.convert('RGB') if original.mode != 'RGB' else original.copy()
+
+    # Maiores primeiro: o 'base' é liberado pelo coletor assim que a última versão termina
+    nomes.sort(key=lambda n: versoes[n]['tamanho'][0] * versoes[n]['tamanho'][1], reverse=True)
+
+    resultado = {}
+    for nome in nomes:
+        config = versoes[nome]
+        imagem = _redimensionar(base, config)
+        if config.get('marca_dagua'):
+            imagem = aplicar_marca_dagua(imagem)
+
+        buffer = BytesIO()
+        imagem.save(buffer, format='JPEG', quality=config.get('qualidade', 90))
+        resultado[nome] = buffer.getvalue()
+
+    return resultado
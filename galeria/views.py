@@ -1,9 +1,8 @@
-import boto3
 import uuid
-from django.db.models import Q
+from django.db.models import Count, Max, Prefetch, Q
 from django.core.files.base import ContentFile
 from django.conf import settings
-from rest_framework import generics, viewsets, status
+from rest_framework import generics, mixins, viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -15,25 +14,37 @@ from PIL import Image, ImageOps
 from io import BytesIO
 
 # Importa as tasks
-from .tasks import distribuir_foto_para_ftps, distribuir_foto_temporaria_ftp, processar_preview_video
+from .entregas_ftp import agendar_lote, criar_lote, reenfileirar, abandonadas, disjuntor_aberto_ate
+from .signals import precos_do_album_alterados
+from .uploads_diretos import instrucoes_de_upload, partes_assinadas, situacao_da_sessao, confirmar_sessao, cancelar_sessao, SessaoCancelada
+from .busca_facial import buscar_selfie, paginar_resultados
 
 # Importa os modelos e serializers
-from .models import Album, Foto, Video, FaceIndexada, Avaliacao
+from .models import Album, Foto, Video, Avaliacao, LoteEntrega, EntregaFTP, SessaoUpload
 from .serializers import (
     AlbumSerializer, 
     AlbumDetailSerializer, 
     FotoSerializer,
     FotoUploadSerializer,
+    FotoLoteUploadSerializer,
     VideoUploadSerializer,
     AlbumDashboardSerializer,
     FotoDashboardSerializer,
     VideoDashboardSerializer,
-    AvaliacaoSerializer
+    AvaliacaoSerializer,
+    LoteEntregaCreateSerializer,
+    LoteEntregaSerializer,
+    LoteEntregaDetalheSerializer,
+    EntregaFTPSerializer,
+    SessaoUploadCreateSerializer,
+    SessaoUploadSerializer,
+    PartesUploadSerializer
 )
 
 # Permissões do app contas
 from contas.permissions import IsFotografoOrAdmin, IsAdminUser
-from contas.models import Usuario
+from config.aws import cliente_s3
+from contas.models import Usuario, JornalParceiro
 
 # =========================================================
 # --- VIEWS PÚBLICAS (PARA OS CLIENTES) ---
@@ -83,61 +94,71 @@ class StatusFilaProcessamentoView(APIView):
         return Response({'fotos_na_fila': fotos_na_fila})
 
 class BuscaFacialView(APIView):
+    """
+    Busca as fotos de uma pessoa pela selfie. Cada foto vem com a 'similaridade' (0-100).
+    Com 'limite' a resposta é paginada: {"resultados": [...], "proximo_cursor": "..."};
+    as páginas seguintes só precisam do 'cursor' (a selfie não é reenviada).
+    """
     permission_classes = [AllowAny]
     
     def post(self, request, *args, **kwargs):
         imagem_referencia = request.FILES.get('imagem_referencia')
         album_id = request.data.get('album_id')
+        cursor = request.data.get('cursor')
+        limite = request.data.get('limite')
         
-        if not imagem_referencia: 
+        if not imagem_referencia and not cursor: 
             return Response({"error": "Nenhuma imagem."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # 1. LER E COMPACTAR A IMAGEM UMA SÓ VEZ
-            image_bytes = imagem_referencia.read()
-            if len(image_bytes) > 5 * 1024 * 1024:
-                img = Image.open(BytesIO(image_bytes))
-                img = ImageOps.exif_transpose(img)
-                img.thumbnail((1080, 1080), Image.Resampling.LANCZOS)
-                buffer = BytesIO()
-                img.convert("RGB").save(buffer, format='JPEG', quality=85)
-                image_bytes = buffer.getvalue() # Salva a imagem processada
-
-            # 2. CHAMADA AO REKOGNITION (Usando os bytes processados)
-            rekognition_client = boto3.client('rekognition', region_name=settings.AWS_REKOGNITION_REGION_NAME)
-            response = rekognition_client.search_faces_by_image(
-                CollectionId=settings.AWS_REKOGNITION_COLLECTION_ID,
-                Image={'Bytes': image_bytes}, # <--- CORREÇÃO AQUI
-                MaxFaces=5, FaceMatchThreshold=95
-            )
-            
-            face_matches = response.get('FaceMatches', [])
-            if not face_matches: 
-                return Response([], status=status.HTTP_200_OK)
+            limite = min(max(int(limite), 1), 200) if limite else None
+        except (TypeError, ValueError):
+            return Response({"error": "Limite inválido."}, status=status.HTTP_400_BAD_REQUEST)
 
-            # 3. PEGA OS IDS RETORNADOS E BUSCA NO BANCO
-            matched_face_ids = [match['Face']['FaceId'] for match in face_matches]
-            fotos_encontradas_ids = FaceIndexada.objects.filter(rekognition_face_id__in=matched_face_ids).values_list('foto_id', flat=True).distinct()
-            
-            # 4. AQUI APLICAMOS O FILTRO DE ÁLBUM!
-            if album_id:
-                # Se enviou album_id, filtra apenas as fotos desse álbum
-                fotos = Foto.objects.filter(
-                    id__in=fotos_encontradas_ids, 
-                    album_id=album_id, # <--- FILTRA AQUI
-                    is_arquivado=False
-                )
-            else:
-                # Se não enviou (Busca Global), filtra no site todo (álbuns públicos e não arquivados)
-                fotos = Foto.objects.filter(
-                    id__in=fotos_encontradas_ids, 
-                    is_arquivado=False, 
-                    album__is_arquivado=False, 
-                    album__is_publico=True
-                )
-            
-            serializer = FotoSerializer(fotos, many=True, context={'request': request})
-            return Response(serializer.data)
+        try:
+            resultados = None
+            if not cursor:
+                # 1. LER E COMPACTAR A IMAGEM UMA SÓ VEZ
+                image_bytes = imagem_referencia.read()
+                if len(image_bytes) > 5 * 1024 * 1024:
+                    img = Image.open(BytesIO(image_bytes))
+                    img = ImageOps.exif_transpose(img)
+                    img.thumbnail((1080, 1080), Image.Resampling.LANCZOS)
+                    buffer = BytesIO()
+                    img.convert("RGB").save(buffer, format='JPEG', quality=85)
+                    image_bytes = buffer.getvalue() # Salva a imagem processada
+
+                # 2. BUSCA NO ÍNDICE DO ÁLBUM (ou global), com cache pelo hash perceptual da selfie
+                resultados = buscar_selfie(image_bytes, album_id=album_id)
+
+                # 3. SÓ FICAM AS FOTOS VISÍVEIS (antes de paginar, para as páginas virem cheias)
+                fotos_visiveis = Foto.objects.filter(id__in=[foto_id for foto_id, _ in resultados], is_arquivado=False, album__is_arquivado=False)
+                if album_id:
+                    fotos_visiveis = fotos_visiveis.filter(album_id=album_id)
+                else:
+                    # Busca Global: só álbuns públicos
+                    fotos_visiveis = fotos_visiveis.filter(album__is_publico=True)
+                visiveis = set(fotos_visiveis.values_list('id', flat=True))
+                resultados = [(foto_id, similaridade) for foto_id, similaridade in resultados if foto_id in visiveis]
+
+            # 4. PÁGINA PEDIDA (ou tudo, no formato antigo de lista)
+            proximo_cursor = None
+            if limite or cursor:
+                try:
+                    resultados, proximo_cursor = paginar_resultados(resultados, cursor=cursor, limite=limite or 30)
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 5. SERIALIZA NA ORDEM DA SIMILARIDADE
+            similaridade_por_foto = dict(resultados)
+            fotos = sorted(Foto.objects.filter(id__in=similaridade_por_foto.keys()), key=lambda foto: -similaridade_por_foto[foto.id])
+            dados = FotoSerializer(fotos, many=True, context={'request': request}).data
+            for foto in dados:
+                foto['similaridade'] = round(similaridade_por_foto[foto['id']], 2)
+
+            if limite or cursor:
+                return Response({"resultados": dados, "proximo_cursor": proximo_cursor})
+            return Response(dados)
             
         except Exception as e:
             print(f"Erro na busca facial: {e}")
@@ -178,8 +199,10 @@ class FotoUploadView(APIView):
                 # Se for "ambos", dispara o FTP usando a foto salva
                 if destino == 'ambos' and jornais_ids:
                     print(f"--- Disparando FTP (Ambos) para {jornais_ids} com metadados ---")
-                    # ⚠️ ATENÇÃO: Passamos os 'metadados' como terceiro argumento para o celery
-                    distribuir_foto_para_ftps.delay(foto.id, jornais_ids, metadados)
+                    # Lote de uma foto: cada jornal vira uma EntregaFTP com novas tentativas
+                    parceiros = JornalParceiro.objects.filter(id__in=jornais_ids, ativo=True)
+                    lote = criar_lote(request.user, parceiros, fotos=[foto], album=foto.album, metadados=metadados)
+                    agendar_lote(lote.id)
                     
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -191,13 +214,7 @@ class FotoUploadView(APIView):
 
             try:
                 # Upload direto para uma pasta temporária na AWS S3
-                s3_client = boto3.client(
-                    's3', 
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID, 
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY, 
-                    region_name=settings.AWS_S3_REGION_NAME,
-                    config=boto3.session.Config(signature_version='s3v4')
-                )
+                s3_client = cliente_s3()
                 
                 temp_key = f"tmp_ftp/{uuid.uuid4().hex}_{imagem_file.name}"
                 s3_client.upload_fileobj(imagem_file, settings.AWS_STORAGE_BUCKET_NAME, temp_key)
@@ -205,7 +222,9 @@ class FotoUploadView(APIView):
                 print(f"--- Disparando FTP Temporário para {jornais_ids} com metadados ---")
                 
                 # 🚀 AGORA SIM! Enviamos a ordem real para o Celery fazer o trabalho em segundo plano:
-                distribuir_foto_temporaria_ftp.delay(temp_key, jornais_ids, metadados)
+                parceiros = JornalParceiro.objects.filter(id__in=jornais_ids, ativo=True)
+                lote = criar_lote(request.user, parceiros, chave_temporaria=temp_key, nome_arquivo=imagem_file.name, metadados=metadados)
+                agendar_lote(lote.id)
 
                 return Response({'status': 'Foto enviada direto para os jornais com sucesso!'}, status=status.HTTP_200_OK)
                 
@@ -213,6 +232,168 @@ class FotoUploadView(APIView):
                 print(f"Erro no upload temporário FTP: {e}")
                 return Response({'error': 'Erro ao processar arquivo FTP.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class FotoLoteUploadView(APIView):
+    """
+    Lote de fotos de um álbum: multipart com vários 'imagens' ou JSON com 'chaves' já enviadas ao bucket.
+    Um bulk_create e o processamento em pedaços (galeria/processamento_em_lote.py).
+    """
+    permission_classes = [IsAuthenticated, IsFotografoOrAdmin]
+
+    def post(self, request, *args, **kwargs):
+        serializer = FotoLoteUploadSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        fotos = serializer.save()
+        return Response({'album': serializer.validated_data['album'].id, 'fotos': [foto.id for foto in fotos]}, status=status.HTTP_201_CREATED)
+
+# =========================================================================================
+
+class LoteEntregaViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Entrega em lote para os jornais: POST {"album": 1} ou {"fotos": [..]} com {"jornais": [..]}.
+    O GET do lote mostra o progresso arquivo a arquivo enquanto o Celery envia.
+    """
+    permission_classes = [IsAuthenticated, IsFotografoOrAdmin]
+
+    def get_queryset(self):
+        entregas = EntregaFTP.objects.select_related('parceiro').order_by('parceiro_id', 'foto_id')
+        lotes = LoteEntrega.objects.prefetch_related(Prefetch('entregas', queryset=entregas))
+        if self.request.user.papel == 'ADMIN': return lotes
+        return lotes.filter(solicitante=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'create': return LoteEntregaCreateSerializer
+        if self.action == 'retrieve': return LoteEntregaDetalheSerializer
+        return LoteEntregaSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lote = serializer.save()
+        agendar_lote(lote.id)
+        lote = self.get_queryset().get(id=lote.id)
+        return Response(LoteEntregaDetalheSerializer(lote).data, status=status.HTTP_202_ACCEPTED)
+
+
+class EntregaFTPViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Registro das entregas FTP. Por padrão lista o que ainda não chegou (pendentes, enviando e falhas);
+    filtros: ?status=FALHOU,PENDENTE e ?parceiro=<id>.
+    """
+    serializer_class = EntregaFTPSerializer
+    permission_classes = [IsAuthenticated, IsFotografoOrAdmin]
+
+    def get_queryset(self):
+        entregas = EntregaFTP.objects.select_related('parceiro').order_by('-atualizado_em')
+        if self.request.user.papel != 'ADMIN':
+            entregas = entregas.filter(lote__solicitante=self.request.user)
+        if self.action != 'list':
+            return entregas
+
+        status_param = self.request.query_params.get('status')
+        situacoes = status_param.split(',') if status_param else [EntregaFTP.Status.PENDENTE, EntregaFTP.Status.ENVIANDO, EntregaFTP.Status.FALHOU]
+        entregas = entregas.filter(status__in=situacoes)
+        if self.request.query_params.get('parceiro'):
+            entregas = entregas.filter(parceiro_id=self.request.query_params['parceiro'])
+        return entregas
+
+    @action(detail=False, methods=['post'])
+    def reenfileirar(self, request):
+        """
+        Volta para a fila as entregas escolhidas ({"ids": [..]}) ou todas as falhas de um jornal ({"parceiro": id}).
+        Entregas presas em ENVIANDO além da reserva (worker morto) também voltam.
+        """
+        entregas = self.get_queryset().exclude(status=EntregaFTP.Status.ENVIADA)
+        if request.data.get('ids'):
+            entregas = entregas.filter(id__in=request.data['ids'])
+        elif request.data.get('parceiro'):
+            entregas = entregas.filter(Q(status=EntregaFTP.Status.FALHOU) | abandonadas(), parceiro_id=request.data['parceiro'])
+        else:
+            return Response({'error': "Informe 'ids' ou 'parceiro'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'reenfileiradas': reenfileirar(entregas)})
+
+    @action(detail=False, methods=['get'])
+    def jornais(self, request):
+        """Situação de cada jornal: fila, falhas, última entrega e o disjuntor."""
+        contagem = {
+            linha['parceiro_id']: linha
+            for linha in self.get_queryset().order_by().values('parceiro_id').annotate(
+                pendentes=Count('id', filter=Q(status__in=[EntregaFTP.Status.PENDENTE, EntregaFTP.Status.ENVIANDO])),
+                falhas=Count('id', filter=Q(status=EntregaFTP.Status.FALHOU)),
+                enviadas=Count('id', filter=Q(status=EntregaFTP.Status.ENVIADA)),
+                ultima_entrega=Max('enviado_em'),
+            )
+        }
+        parceiros = JornalParceiro.objects.filter(id__in=contagem.keys()).order_by('nome_jornal')
+        return Response([
+            {
+                'id': parceiro.id, 'nome_jornal': parceiro.nome_jornal, 'ativo': parceiro.ativo,
+                'pendentes': contagem[parceiro.id]['pendentes'], 'falhas': contagem[parceiro.id]['falhas'],
+                'enviadas': contagem[parceiro.id]['enviadas'], 'ultima_entrega': contagem[parceiro.id]['ultima_entrega'],
+                'disjuntor_aberto_ate': disjuntor_aberto_ate(parceiro.id),
+            }
+            for parceiro in parceiros
+        ])
+
+# =========================================================================================
+# 🚀 UPLOAD DIRETO PARA O S3 (O navegador manda os bytes; aqui só passa JSON)
+# =========================================================================================
+
+class SessaoUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    POST: declara os arquivos ({"album", "tipo", "destino", "arquivos": [{"nome", "tamanho", "content_type"}]})
+    e recebe o POST assinado de cada foto (ou o tamanho das partes de cada vídeo).
+    POST {id}/partes/: {"arquivo", "partes": [{"numero", "sha256"}]} -> URLs de PUT das partes do vídeo.
+    GET {id}/status/: o que já chegou e o que falta (para retomar). POST {id}/confirmar/: cria as
+    Fotos/Vídeos do que chegou ao bucket. DELETE: cancela e limpa o bucket.
+    """
+    permission_classes = [IsAuthenticated, IsFotografoOrAdmin]
+
+    def get_queryset(self):
+        sessoes = SessaoUpload.objects.prefetch_related('arquivos')
+        if self.request.user.papel == 'ADMIN': return sessoes
+        return sessoes.filter(usuario=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'create': return SessaoUploadCreateSerializer
+        return SessaoUploadSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sessao = self.get_queryset().get(id=serializer.save().id)
+        return Response({**SessaoUploadSerializer(sessao).data, 'uploads': instrucoes_de_upload(sessao)}, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Reabrir a sessão (página recarregada) devolve assinaturas novas para o que falta
+        sessao = self.get_object()
+        uploads = instrucoes_de_upload(sessao) if sessao.status == SessaoUpload.Status.ABERTA else []
+        return Response({**SessaoUploadSerializer(sessao).data, 'uploads': uploads})
+
+    def perform_destroy(self, instance):
+        cancelar_sessao(instance) # Só cancela se ainda estiver aberta (checado sob a trava)
+
+    @action(detail=True, methods=['post'])
+    def partes(self, request, pk=None):
+        sessao = self.get_object()
+        serializer = PartesUploadSerializer(data=request.data, context={'sessao': sessao})
+        serializer.is_valid(raise_exception=True)
+        return Response({'partes': partes_assinadas(serializer.validated_data['arquivo'], serializer.validated_data['partes'])})
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def situacao(self, request, pk=None):
+        sessao = self.get_object()
+        arquivos = situacao_da_sessao(sessao) if sessao.status == SessaoUpload.Status.ABERTA else []
+        return Response({**SessaoUploadSerializer(sessao).data, 'arquivos': arquivos})
+
+    @action(detail=True, methods=['post'])
+    def confirmar(self, request, pk=None):
+        sessao = self.get_object()
+        try:
+            return Response(confirmar_sessao(sessao.id))
+        except SessaoCancelada:
+            return Response({'error': 'Sessão cancelada.'}, status=status.HTTP_400_BAD_REQUEST)
+
 # =========================================================================================
 
 class VideoUploadDashboardView(generics.CreateAPIView):
@@ -265,6 +446,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
              return Response({'error': 'Preço inválido.'}, status=status.HTTP_400_BAD_REQUEST)
         
         count = album.fotos.all().update(preco=new_price)
+        precos_do_album_alterados.send(sender=Album, album_id=album.id, fotos=True, videos=False)
         return Response({'status': f'{count} fotos atualizadas com sucesso para R$ {new_price:.2f}'})
 
     @action(detail=True, methods=['post'])
@@ -279,6 +461,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
              return Response({'error': 'Preço inválido.'}, status=status.HTTP_400_BAD_REQUEST)
 
         count = album.videos.all().update(preco=new_price)
+        precos_do_album_alterados.send(sender=Album, album_id=album.id, fotos=False, videos=True)
         return Response({'status': f'{count} vídeos atualizados com sucesso para R$ {new_price:.2f}'})
     
     @action(detail=True, methods=['post'])
@@ -327,12 +510,7 @@ class FotoViewSet(viewsets.ModelViewSet):
     def baixar_original(self, request, pk=None):
         foto = self.get_object() 
         
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME
-        )
+        s3_client = cliente_s3()
         
         # 1. Pega o nome como está no banco de dados (ex: 'fotos/imagem.jpg')
         caminho_banco = foto.imagem.name
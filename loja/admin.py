@@ -1,10 +1,12 @@
 # loja/admin.py
 
-import csv
-from django.http import HttpResponse
+from django import forms
 from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
 from django.db.models import Sum
-from .models import Pedido, ItemPedido, FotoComprada, Cupom
+from .models import Pedido, ItemPedido, FotoComprada, Cupom, PacoteDownload, SaldoFotografo
+from .financeiro import valores_do_item
+from .exportacao import exportar_pagamentos
 from django.utils import timezone
 from rangefilter.filters import DateRangeFilter # <-- IMPORT NOVO PARA O CALENDÁRIO
 
@@ -29,52 +31,52 @@ class FotografoFilter(admin.SimpleListFilter):
             return queryset.filter(foto__album__fotografo__id=self.value())
         return queryset
 
-# --- 2. AÇÃO MÁGICA ATUALIZADA: EXPORTAR PARA EXCEL (CSV) ---
+# --- 2. AÇÃO MÁGICA ATUALIZADA: EXPORTAR PARA EXCEL (CSV / XLSX em streaming) ---
+def _filtros_da_lista(request):
+    """Os filtros da lista de vendas (calendário, fotógrafo, status, busca) no formato do filtrar_vendas."""
+    filtros = {}
+    campo_data = forms.DateField() # Lê a data no formato do calendário (dd/mm/aaaa)
+    for parametro, chave in (('pedido__criado_em__range__gte', 'data_inicio'), ('pedido__criado_em__range__lte', 'data_fim')):
+        if request.GET.get(parametro):
+            try:
+                filtros[chave] = campo_data.clean(request.GET[parametro]).isoformat()
+            except ValidationError:
+                pass # O calendário também ignora data inválida
+    for parametro, chave in (('fotografo_id', 'fotografo_id'), ('pedido__status__exact', 'status'), ('q', 'q')):
+        if request.GET.get(parametro):
+            filtros[chave] = request.GET[parametro]
+    return filtros
+
+
+def _exportar(modeladmin, request, queryset, formato):
+    if request.POST.get('select_across') == '1':
+        # "Selecionar todos": vão só os filtros da lista e a consulta é refeita onde rodar (request ou Celery)
+        selecao = {'filtros': _filtros_da_lista(request)}
+    else:
+        selecao = {'ids': list(queryset.values_list('id', flat=True))} # No máximo uma página marcada à mão
+    response = exportar_pagamentos(request.user, formato=formato, nome_base='relatorio_pagamento_fotografos', **selecao)
+    if response is None:
+        modeladmin.message_user(
+            request,
+            f"📨 São muitas vendas! O relatório está sendo gerado em segundo plano e o link chegará em {request.user.email}.",
+            messages.INFO
+        )
+    return response
+
 @admin.action(description='Imprimir Relatório de Pagamento (Excel)')
 def exportar_pagamento_csv(modeladmin, request, queryset):
-    response = HttpResponse(content_type='text/csv; charset=utf-8-sig') 
-    response['Content-Disposition'] = 'attachment; filename="relatorio_pagamento_fotografos.csv"'
-    
-    writer = csv.writer(response, delimiter=';')
-    writer.writerow(['ID Pedido', 'Data da Venda', 'Status', 'Fotógrafo', 'ID da Foto', 'Valor da Venda (R$)', 'Comissão a Pagar (R$)'])
-    
-    total_geral_comissao = 0.0 
-    
-    for item in queryset:
-        try:
-            nome_fotografo = item.foto.album.fotografo.nome_completo or item.foto.album.fotografo.email
-        except AttributeError:
-            nome_fotografo = "Desconhecido"
+    return _exportar(modeladmin, request, queryset, 'csv')
 
-        # 🪄 USAMOS A MATEMÁTICA PROPORCIONAL PARA O EXCEL TAMBÉM
-        valor_venda_real = modeladmin.get_valor_real_item(item)
-        comissao = valor_venda_real * 0.95 
-        
-        total_geral_comissao += comissao 
-
-        data_local = timezone.localtime(item.pedido.criado_em)
-
-        writer.writerow([
-            item.pedido.id,
-            data_local.strftime("%d/%m/%Y %H:%M"),
-            item.pedido.status,
-            nome_fotografo,
-            item.foto.id,
-            str(f"{valor_venda_real:.2f}").replace('.', ','),
-            str(f"{comissao:.2f}").replace('.', ',')
-        ])
-        
-    writer.writerow([]) 
-    writer.writerow(['', '', '', '', '', 'TOTAL A PAGAR:', str(f"{total_geral_comissao:.2f}").replace('.', ',')])
-        
-    return response
+@admin.action(description='Imprimir Relatório de Pagamento (Planilha XLSX)')
+def exportar_pagamento_xlsx(modeladmin, request, queryset):
+    return _exportar(modeladmin, request, queryset, 'xlsx')
 
 # --------------------------------------------------
 
 class ItemPedidoInline(admin.TabularInline):
     model = ItemPedido
     extra = 0
-    readonly_fields = ('foto', 'video', 'preco') # <--- MÁGICA FEITA AQUI
+    readonly_fields = ('foto', 'video', 'preco', 'pago_ao_fotografo') # <--- MÁGICA FEITA AQUI (repasse só pela baixa, que debita o saldo)
     can_delete = False
 
     def has_add_permission(self, request, obj=None):
@@ -101,9 +103,10 @@ class ItemPedidoAdmin(admin.ModelAdmin):
         'get_metodo_pagamento', 'get_status_pedido', 'valor_venda', 'valor_fotografo'
     )
     raw_id_fields = ('pedido', 'foto')
+    readonly_fields = ('pago_ao_fotografo',) # O repasse é marcado pela baixa (loja/financeiro.py), que debita o saldo
     list_filter = (('pedido__criado_em', DateRangeFilter), FotografoFilter, 'pedido__status')
     search_fields = ('foto__album__fotografo__email', 'pedido__id')
-    actions = [exportar_pagamento_csv]
+    actions = [exportar_pagamento_csv, exportar_pagamento_xlsx]
 
     # 🚀 1. OTIMIZAÇÕES EXTRAS DE VELOCIDADE
     list_per_page = 30 
@@ -144,8 +147,9 @@ class ItemPedidoAdmin(admin.ModelAdmin):
                 queryset_filtrado = response.context_data['cl'].queryset
                 
                 if queryset_filtrado.count() < 1000:
-                    total_real_vendas = sum(self.get_valor_real_item(item) for item in queryset_filtrado)
-                    total_pagar = total_real_vendas * 0.95
+                    valores = [valores_do_item(item) for item in queryset_filtrado]
+                    total_real_vendas = sum(valor for valor, _ in valores)
+                    total_pagar = sum(comissao for _, comissao in valores)
                     
                     if total_real_vendas > 0:
                         messages.success(request, f"💰 RESUMO DO FILTRO: Vendas Líquidas (R$ {total_real_vendas:.2f}) | TOTAL A PAGAR: R$ {total_pagar:.2f}")
@@ -154,18 +158,9 @@ class ItemPedidoAdmin(admin.ModelAdmin):
                     
         return response
 
-    # --- 🧮 CORAÇÃO DA MATEMÁTICA PROPORCIONAL ---
+    # --- 🧮 CORAÇÃO DA MATEMÁTICA PROPORCIONAL (gravada no item quando o pedido é pago) ---
     def get_valor_real_item(self, obj):
-        if not obj.preco or not obj.pedido.valor_total:
-            return 0.0
-        
-        subtotal_cheio = sum(item.preco for item in obj.pedido.itens.all())
-        
-        if subtotal_cheio > 0:
-            fator_desconto = float(obj.pedido.valor_total) / float(subtotal_cheio)
-            return float(obj.preco) * fator_desconto
-        
-        return float(obj.preco)
+        return valores_do_item(obj)[0]
 
     # --- CAMPOS DA TELA ---
     def valor_venda(self, obj):
@@ -174,8 +169,7 @@ class ItemPedidoAdmin(admin.ModelAdmin):
     valor_venda.short_description = 'Valor Pago (c/ Desconto)'
 
     def valor_fotografo(self, obj):
-        valor_real = self.get_valor_real_item(obj)
-        valor_receber = valor_real * 0.95
+        valor_receber = valores_do_item(obj)[1]
         return f"R$ {valor_receber:.2f}"
     valor_fotografo.short_description = 'Comissão (Un.)'
 
@@ -216,4 +210,18 @@ class FotoCompradaAdmin(admin.ModelAdmin):
 class CupomAdmin(admin.ModelAdmin):
     list_display = ('codigo', 'fotografo', 'desconto_percentual', 'ativo', 'data_validade')
     list_filter = ('ativo', 'fotografo')
-    search_fields = ('codigo',)
\ No newline at end of file
+    search_fields = ('codigo',)
+@admin.register(PacoteDownload)
+class PacoteDownloadAdmin(admin.ModelAdmin):
+    list_display = ('chave', 'solicitado_por', 'status', 'tamanho_bytes', 'data_expiracao', 'criado_em')
+    list_filter = ('status',)
+    search_fields = ('chave', 'solicitado_por__email')
+    raw_id_fields = ('solicitado_por',)
+
+@admin.register(SaldoFotografo)
+class SaldoFotografoAdmin(admin.ModelAdmin):
+    list_display = ('fotografo', 'saldo_pendente', 'atualizado_em')
+    search_fields = ('fotografo__email', 'fotografo__nome_completo')
+    # O saldo só muda pelo livro-caixa (pagamentos e repasses) ou pelo comando de recálculo
+    readonly_fields = ('fotografo', 'saldo_pendente', 'atualizado_em')
+
@@ -5,3 +5,7 @@ from django.apps import AppConfig
 class LojaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'loja'
+
+    def ready(self):
+        # Importa os signals para que eles sejam registados
+        import loja.signals
@@ -0,0 +1,204 @@
+# loja/exportacao.py
+
+import csv
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .financeiro import vendas_com_valores, filtrar_vendas, CAMPOS_RELATORIO_VENDAS
+from .pacotes import BufferPassagem
+
+# ====================================================================
+# MOTOR DE EXPORTAÇÃO (CSV / XLSX em streaming, memória constante)
+# ====================================================================
+# As linhas saem do banco por um cursor (.iterator) e vão direto para o
+# cliente, sem montar o arquivo inteiro na memória. Acima de
+# EXPORTACAO_LIMITE_LINHAS o relatório é gerado pelo Celery e o link chega por e-mail.
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+CABECALHO_PAGAMENTOS = ['ID Pedido', 'Data da Venda', 'Status', 'Fotógrafo', 'ID da Foto', 'Valor da Venda (R$)', 'Comissão a Pagar (R$)']
+
+
+def _limite_linhas():
+    return getattr(settings, 'EXPORTACAO_LIMITE_LINHAS', 50000)
+
+
+def _tamanho_lote():
+    return getattr(settings, 'EXPORTACAO_CHUNK', 2000)
+
+
+# --- 1. A CONSULTA DO RELATÓRIO DE PAGAMENTOS ---
+
+def consulta_pagamentos(filtros=None, ids=None):
+    """Filtros da tela (REST ou lista do admin) ou IDs escolhidos no admin; sempre a mesma consulta anotada."""
+    from .models import ItemPedido
+
+    base = ItemPedido.objects.all()
+    if ids is not None:
+        base = base.filter(id__in=ids)
+    vendas = vendas_com_valores(base)
+    if filtros:
+        vendas = filtrar_vendas(vendas, filtros)
+    return vendas.order_by('-pedido__criado_em', '-id').values(*CAMPOS_RELATORIO_VENDAS)
+
+
+def linhas_pagamentos(vendas):
+    """Gera as linhas do relatório (valores crus: Decimal continua Decimal) e o total no fim."""
+    total_geral = Decimal('0')
+    for venda in vendas.iterator(chunk_size=_tamanho_lote()):
+        total_geral += venda['valor_comissao']
+        yield [
+            venda['pedido_id'],
+            timezone.localtime(venda['pedido__criado_em']).strftime("%d/%m/%Y %H:%M"),
+            venda['pedido__status'],
+            venda['foto__album__fotografo__nome_completo'] or venda['foto__album__fotografo__email'] or "Desconhecido",
+            venda['foto_id'],
+            venda['valor_venda'],
+            venda['valor_comissao'],
+        ]
+    yield []
+    yield ['', '', '', '', '', 'TOTAL A PAGAR:', total_geral]
+
+
+# --- 2. CSV ---
+
+class _Eco:
+    """Pseudo-arquivo: o csv.writer 'escreve' e a linha volta pronta para o streaming."""
+
+    def write(self, valor):
+        return valor
+
+
+def _celula_csv(valor):
+    if isinstance(valor, Decimal):
+        return f"{valor:.2f}".replace('.', ',') # Excel em português
+    return valor
+
+
+def gerar_csv(cabecalho, linhas):
+    writer = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff' # BOM: o Excel abre os acentos corretamente
+    yield writer.writerow(cabecalho)
+    for linha in linhas:
+        yield writer.writerow([_celula_csv(valor) for valor in linha])
+
+
+# --- 3. XLSX (planilha mínima, escrita direto no ZIP) ---
+
+_CARACTERES_INVALIDOS_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_ARQUIVOS_FIXOS_XLSX = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Relatorio" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celula_xlsx(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t>{texto}</t></is></c>'
+
+
+def _linha_xlsx(linha):
+    return '<row>' + ''.join(_celula_xlsx(valor) for valor in linha) + '</row>'
+
+
+def gerar_xlsx(cabecalho, linhas):
+    destino = BufferPassagem()
+    zip_file = zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED)
+
+    for nome, conteudo in _ARQUIVOS_FIXOS_XLSX.items():
+        zip_file.writestr(nome, conteudo)
+
+    with zip_file.open('xl/worksheets/sheet1.xml', 'w') as planilha:
+        planilha.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        planilha.write(_linha_xlsx(cabecalho).encode())
+
+        lote = []
+        for linha in linhas:
+            lote.append(_linha_xlsx(linha))
+            if len(lote) >= 500:
+                planilha.write(''.join(lote).encode())
+                lote.clear()
+                dados = destino.esvaziar()
+                if dados:
+                    yield dados
+        planilha.write(''.join(lote).encode())
+        planilha.write(b'</sheetData></worksheet>')
+
+    zip_file.close()
+    yield destino.esvaziar()
+
+
+def gerar_arquivo(formato, cabecalho, linhas):
+    if formato == 'xlsx':
+        return gerar_xlsx(cabecalho, linhas)
+    return gerar_csv(cabecalho, linhas)
+
+
+# --- 4. RESPOSTA HTTP EM STREAMING ---
+
+def resposta_streaming(formato, nome_base, cabecalho, linhas):
+    formato = formato if formato in FORMATOS else 'csv'
+    response = StreamingHttpResponse(gerar_arquivo(formato, cabecalho, linhas), content_type=FORMATOS[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nome_base}.{formato}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def exportar_pagamentos(usuario, formato='csv', filtros=None, ids=None, nome_base='relatorio_pagamentos_site'):
+    """
+    Devolve a resposta em streaming ou, se o relatório for grande demais,
+    agenda o Celery e devolve None (o link chega por e-mail ao usuário).
+    """
+    formato = formato if formato in FORMATOS else 'csv'
+    vendas = consulta_pagamentos(filtros=filtros, ids=ids)
+
+    # Só precisamos saber se passa do limite, não o total exato
+    limite = _limite_linhas()
+    if limite and vendas[limite:limite + 1].exists():
+        from .tasks import exportar_pagamentos_task
+        exportar_pagamentos_task.delay(usuario.id, formato, filtros=filtros, ids=ids, nome_base=nome_base)
+        return None
+
+    return resposta_streaming(formato, nome_base, CABECALHO_PAGAMENTOS, linhas_pagamentos(vendas))
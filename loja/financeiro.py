@@ -0,0 +1,272 @@
+# loja/financeiro.py
+
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Round
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+# ====================================================================
+# LIVRO-CAIXA DOS FOTÓGRAFOS (Calculado uma vez, lido sempre)
+# ====================================================================
+# A matemática proporcional de descontos roda UMA vez por pedido, quando ele
+# vira PAGO: cada ItemPedido guarda seu valor líquido e a comissão, e o
+# SaldoFotografo é creditado na mesma transação. Repasses debitam o saldo.
+# Qualquer outra mudança que mexe no que está pendente (estorno do pedido,
+# item apagado, edição do item) passa por acompanhar_saldos: o saldo anda
+# pela diferença do antes e depois, na mesma transação.
+
+COMISSAO_FOTOGRAFO = Decimal('0.95')
+CENTAVOS = Decimal('0.01')
+
+
+def _arredondar(valor):
+    return valor.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def calcular_valores_itens(pedido, itens):
+    """Rateia o desconto do pedido entre os itens: devolve {item_id: (valor_liquido, comissao)}."""
+    subtotal_cheio = sum((item.preco for item in itens if item.preco), Decimal('0'))
+    valores = {}
+    for item in itens:
+        valor_liquido = Decimal('0')
+        if item.preco and pedido.valor_total:
+            if subtotal_cheio > 0:
+                valor_liquido = _arredondar(item.preco * pedido.valor_total / subtotal_cheio)
+            else:
+                valor_liquido = item.preco
+        valores[item.id] = (valor_liquido, _arredondar(valor_liquido * COMISSAO_FOTOGRAFO))
+    return valores
+
+
+def _movimentar_saldos(valores_por_fotografo):
+    from .models import SaldoFotografo
+
+    for fotografo_id, valor in valores_por_fotografo.items():
+        if not fotografo_id or not valor:
+            continue
+        SaldoFotografo.objects.get_or_create(fotografo_id=fotografo_id)
+        # F() faz a soma dentro do banco: dois webhooks ao mesmo tempo não se atropelam
+        SaldoFotografo.objects.filter(fotografo_id=fotografo_id).update(saldo_pendente=F('saldo_pendente') + valor)
+
+
+def _pendentes_por_fotografo(itens):
+    """{fotografo_id: comissão} que os itens somam hoje no saldo (FOTOS de pedido PAGO ainda não repassadas)."""
+    from .models import Pedido
+
+    pendentes = itens.filter(pedido__status=Pedido.StatusPedido.PAGO, pago_ao_fotografo=False, foto__isnull=False)
+    return {linha['foto__album__fotografo_id']: linha['total'] or Decimal('0') for linha in _comissoes_por_fotografo(pendentes)}
+
+
+@contextmanager
+def acompanhar_saldos(itens):
+    """
+    Credita/debita os fotógrafos pela diferença do que 'itens' (queryset) soma no saldo antes e
+    depois do bloco. Rodar dentro de uma transação, com o pedido travado.
+    """
+    antes = _pendentes_por_fotografo(itens)
+    yield
+    depois = _pendentes_por_fotografo(itens)
+    _movimentar_saldos({
+        fotografo_id: depois.get(fotografo_id, Decimal('0')) - antes.get(fotografo_id, Decimal('0'))
+        for fotografo_id in antes.keys() | depois.keys()
+    })
+
+
+def registrar_pedido_pago(pedido):
+    """
+    Grava valor_liquido/comissao nos itens do pedido que ainda não têm. O crédito no saldo
+    é feito por acompanhar_saldos, em volta do save do pedido (loja/models.py).
+    """
+    from .models import ItemPedido
+
+    itens = list(ItemPedido.objects.filter(pedido=pedido))
+    if not any(item.valor_liquido is None for item in itens):
+        return
+
+    valores = calcular_valores_itens(pedido, itens)
+    novos = []
+    for item in itens:
+        if item.valor_liquido is None:
+            item.valor_liquido, item.comissao = valores[item.id]
+            novos.append(item)
+    ItemPedido.objects.bulk_update(novos, ['valor_liquido', 'comissao'])
+
+
+def debitar_item_apagado(item):
+    """Item apagado (sozinho ou com o pedido): sai do saldo o que ele somava."""
+    from .models import ItemPedido
+
+    debitos = _pendentes_por_fotografo(ItemPedido.objects.filter(pk=item.pk))
+    _movimentar_saldos({fotografo_id: -valor for fotografo_id, valor in debitos.items()})
+
+
+def baixar_itens_pagos(itens_pendentes):
+    """
+    Marca os itens como repassados ao fotógrafo e debita o saldo de cada um.
+    Devolve (quantidade_de_itens, total_em_comissoes).
+    """
+    from .models import ItemPedido
+
+    with transaction.atomic():
+        ids = list(itens_pendentes.select_for_update(of=('self',)).filter(pago_ao_fotografo=False).values_list('id', flat=True))
+        if not ids:
+            return 0, Decimal('0')
+
+        linhas = _comissoes_por_fotografo(ItemPedido.objects.filter(id__in=ids))
+        debitos = {linha['foto__album__fotografo_id']: -(linha['total'] or Decimal('0')) for linha in linhas}
+
+        quantidade = ItemPedido.objects.filter(id__in=ids).update(pago_ao_fotografo=True)
+        _movimentar_saldos(debitos)
+
+    return quantidade, -sum(debitos.values(), Decimal('0'))
+
+
+def _comissoes_por_fotografo(itens):
+    """
+    [{'foto__album__fotografo_id', 'total'}] somando a comissão gravada ou, em item de pedido pago
+    antes do livro-caixa que ainda não passou pelo backfill, a calculada na hora (vendas_com_valores).
+    """
+    return vendas_com_valores(itens).order_by().values('foto__album__fotografo_id').annotate(total=Sum('valor_comissao'))
+
+
+def saldo_do_fotografo(fotografo_id):
+    """Consulta direta (índice único) no saldo corrente do fotógrafo."""
+    from .models import SaldoFotografo
+
+    saldo = SaldoFotografo.objects.filter(fotografo_id=fotografo_id).values_list('saldo_pendente', flat=True).first()
+    return saldo or Decimal('0')
+
+
+def saldos_dos_fotografos(fotografo_ids):
+    """Vários saldos numa única consulta: {fotografo_id: saldo}."""
+    from .models import SaldoFotografo
+
+    return dict(SaldoFotografo.objects.filter(fotografo_id__in=set(fotografo_ids)).values_list('fotografo_id', 'saldo_pendente'))
+
+
+def recalcular_saldo(fotografo_id):
+    """Refaz o saldo a partir dos itens (usado pelo backfill e por conferências)."""
+    from .models import Pedido, ItemPedido, SaldoFotografo
+
+    itens = ItemPedido.objects.filter(
+        foto__album__fotografo_id=fotografo_id,
+        pedido__status=Pedido.StatusPedido.PAGO,
+        pago_ao_fotografo=False
+    )
+    total = sum((linha['total'] or Decimal('0') for linha in _comissoes_por_fotografo(itens)), Decimal('0'))
+
+    SaldoFotografo.objects.update_or_create(fotografo_id=fotografo_id, defaults={'saldo_pendente': total})
+    return total
+
+
+def valores_do_item(item):
+    """(valor_liquido, comissao) do item: o gravado ou, para pedidos ainda não pagos, o calculado na hora."""
+    if item.valor_liquido is not None:
+        return item.valor_liquido, item.comissao
+    return calcular_valores_itens(item.pedido, list(item.pedido.itens.all()))[item.id]
+
+
+# ====================================================================
+# RELATÓRIOS DE VENDAS (Toda a matemática dentro do banco)
+# ====================================================================
+# Uma única consulta anotada: o subtotal do pedido vem de um Subquery e o
+# valor líquido/comissão são calculados em SQL com Decimal. Itens já pagos
+# usam os valores gravados pelo livro-caixa (valor_liquido/comissao).
+
+CAMPOS_RELATORIO_VENDAS = (
+    'id', 'pedido_id', 'pedido__criado_em', 'pedido__status', 'pedido__metodo_pagamento',
+    'pago_ao_fotografo', 'foto_id', 'foto__album__fotografo__nome_completo',
+    'foto__album__fotografo__email', 'valor_venda', 'valor_comissao',
+)
+
+
+def vendas_com_valores(queryset=None):
+    from .models import ItemPedido
+
+    if queryset is None:
+        queryset = ItemPedido.objects.all()
+
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    subtotal_pedido = Subquery(
+        ItemPedido.objects.filter(pedido=OuterRef('pedido')).order_by().values('pedido').annotate(total=Sum('preco')).values('total'),
+        output_field=decimal
+    )
+    valor_rateado = Case(
+        When(Q(preco__isnull=True) | Q(pedido__valor_total__isnull=True) | Q(pedido__valor_total=0), then=Value(Decimal('0'))),
+        When(subtotal__gt=0, then=Round(ExpressionWrapper(F('preco') * F('pedido__valor_total') / F('subtotal'), output_field=decimal), 2)),
+        default=F('preco'),
+        output_field=decimal
+    )
+    return queryset.annotate(subtotal=subtotal_pedido).annotate(
+        valor_venda=Coalesce('valor_liquido', valor_rateado, output_field=decimal),
+    ).annotate(
+        valor_comissao=Coalesce('comissao', Round(ExpressionWrapper(F('valor_venda') * COMISSAO_FOTOGRAFO, output_field=decimal), 2), output_field=decimal),
+    )
+
+
+def filtrar_vendas(queryset, params):
+    """Os mesmos filtros da tela de vendas do admin, do JSON e do CSV."""
+    data_inicio = params.get('data_inicio')
+    data_fim = params.get('data_fim')
+    fotografo_id = params.get('fotografo_id')
+    status = params.get('status')
+    search = params.get('search')
+    busca_admin = params.get('q')
+
+    if data_inicio:
+        queryset = queryset.filter(pedido__criado_em__date__gte=parse_date(data_inicio))
+    if data_fim:
+        queryset = queryset.filter(pedido__criado_em__date__lte=parse_date(data_fim))
+    if fotografo_id:
+        queryset = queryset.filter(foto__album__fotografo__id=fotografo_id)
+    if status:
+        queryset = queryset.filter(pedido__status=status)
+    if search:
+        queryset = queryset.filter(pedido__id__icontains=search)
+    if busca_admin:
+        # Como a busca da lista do admin (search_fields): cada termo no e-mail do fotógrafo ou no nº do pedido
+        for termo in busca_admin.split():
+            queryset = queryset.filter(Q(foto__album__fotografo__email__icontains=termo) | Q(pedido__id__icontains=termo))
+    return queryset
+
+
+def totais_pendentes(vendas):
+    """Soma (vendas, comissões) das vendas PAGAS ainda não repassadas, numa única agregação."""
+    from .models import Pedido
+
+    pendente = Q(pedido__status=Pedido.StatusPedido.PAGO, pago_ao_fotografo=False)
+    totais = vendas.aggregate(
+        total_vendas=Sum('valor_venda', filter=pendente),
+        total_pagar=Sum('valor_comissao', filter=pendente),
+    )
+    return totais['total_vendas'] or Decimal('0'), totais['total_pagar'] or Decimal('0')
+
+
+# --- Paginação por cursor (keyset): (data do pedido, id), do mais novo para o mais antigo ---
+
+def codificar_cursor(criado_em, item_id):
+    return urlsafe_base64_encode(f"{criado_em.isoformat()}|{item_id}".encode())
+
+
+def paginar_por_cursor(vendas, cursor, limite):
+    """Devolve (linhas, proximo_cursor). Cursor inválido é tratado como primeira página."""
+    vendas = vendas.order_by('-pedido__criado_em', '-id')
+    if cursor:
+        try:
+            data_texto, item_id = urlsafe_base64_decode(cursor).decode().split('|')
+            criado_em = parse_datetime(data_texto)
+            vendas = vendas.filter(
+                Q(pedido__criado_em__lt=criado_em) | Q(pedido__criado_em=criado_em, id__lt=int(item_id))
+            )
+        except (ValueError, TypeError):
+            pass
+
+    linhas = list(vendas[:limite + 1])
+    if len(linhas) <= limite:
+        return linhas, None
+    linhas = linhas[:limite]
+    ultima = linhas[-1]
+    return linhas, codificar_cursor(ultima['pedido__criado_em'], ultima['id'])
@@ -0,0 +1,12 @@
+# loja/management/commands/limpar_pacotes_expirados.py
+from django.core.management.base import BaseCommand
+
+from loja.pacotes import limpar_pacotes_expirados
+
+
+class Command(BaseCommand):
+    help = "Apaga do S3 os pacotes ZIP já vencidos (rodar pelo cron/agendador)."
+
+    def handle(self, *args, **options):
+        total = limpar_pacotes_expirados()
+        self.stdout.write(self.style.SUCCESS(f"{total} pacotes vencidos apagados do bucket."))
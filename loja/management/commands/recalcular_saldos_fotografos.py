@@ -0,0 +1,49 @@
+# loja/management/commands/recalcular_saldos_fotografos.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from contas.models import Usuario
+from loja.financeiro import calcular_valores_itens, recalcular_saldo
+from loja.models import Pedido, ItemPedido
+
+
+class Command(BaseCommand):
+    help = "Preenche valor_liquido/comissao dos pedidos PAGOS antigos e refaz o SaldoFotografo de todos os fotógrafos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refazer-valores', action='store_true', help="Recalcula também os itens que já têm valor gravado.")
+        parser.add_argument('--lote', type=int, default=500, help="Quantos pedidos processar por transação.")
+
+    def handle(self, *args, **options):
+        pedidos = Pedido.objects.filter(status=Pedido.StatusPedido.PAGO)
+        if not options['refazer_valores']:
+            pedidos = pedidos.filter(itens__valor_liquido__isnull=True).distinct()
+
+        pedido_ids = list(pedidos.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f"🧮 {len(pedido_ids)} pedido(s) para calcular...")
+
+        # 1. Grava valor líquido e comissão, em lotes
+        itens_atualizados = 0
+        for inicio in range(0, len(pedido_ids), options['lote']):
+            lote = pedido_ids[inicio:inicio + options['lote']]
+            with transaction.atomic():
+                atualizar = []
+                for pedido in Pedido.objects.filter(id__in=lote).prefetch_related(Prefetch('itens', queryset=ItemPedido.objects.order_by('id'))):
+                    itens = list(pedido.itens.all())
+                    valores = calcular_valores_itens(pedido, itens)
+                    for item in itens:
+                        if item.valor_liquido is None or options['refazer_valores']:
+                            item.valor_liquido, item.comissao = valores[item.id]
+                            atualizar.append(item)
+                ItemPedido.objects.bulk_update(atualizar, ['valor_liquido', 'comissao'])
+                itens_atualizados += len(atualizar)
+
+        # 2. Refaz o saldo de cada fotógrafo a partir dos itens
+        fotografos = Usuario.objects.filter(papel=Usuario.Papel.FOTOGRAFO).values_list('id', flat=True)
+        for fotografo_id in fotografos:
+            recalcular_saldo(fotografo_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {itens_atualizados} item(ns) atualizado(s) e {len(fotografos)} saldo(s) recalculado(s)."
+        ))
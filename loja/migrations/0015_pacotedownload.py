@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:32
+
+import config.storages
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja', '0014_solicitacaosaque_comprovante'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PacoteDownload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(help_text='sha256 dos IDs das fotos (ordenados).', max_length=64, unique=True)),
+                ('foto_ids', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('PRONTO', 'Pronto'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('arquivo', models.FileField(blank=True, null=True, storage=config.storages.PrivateMediaStorage(), upload_to='pacotes/')),
+                ('tamanho_bytes', models.BigIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('data_expiracao', models.DateTimeField(help_text='Acompanha a data_expiracao das compras.')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pacotes_download', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
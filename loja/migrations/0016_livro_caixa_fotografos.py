@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja', '0015_pacotedownload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itempedido',
+            name='comissao',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Parte do fotógrafo sobre o valor líquido.', max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='itempedido',
+            name='valor_liquido',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Preço com o desconto do pedido rateado.', max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='SaldoFotografo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saldo_pendente', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('fotografo', models.OneToOneField(limit_choices_to={'papel': 'FOTOGRAFO'}, on_delete=django.db.models.deletion.CASCADE, related_name='saldo', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
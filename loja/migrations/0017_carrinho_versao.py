@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja', '0016_livro_caixa_fotografos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrinho',
+            name='versao',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Preenche o livro-caixa dos pedidos pagos antes da 0016 (antes feito à mão pelo recalcular_saldos_fotografos)
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations
+from django.db.models import Sum
+
+# Congelados aqui (não importa loja.financeiro): a migração não muda de sentido se o código mudar
+COMISSAO_FOTOGRAFO = Decimal('0.95')
+CENTAVOS = Decimal('0.01')
+
+
+def _valores(pedido, itens):
+    """{item_id: (valor_liquido, comissao)}: desconto do pedido rateado pelo preço de cada item."""
+    subtotal = sum((item.preco for item in itens if item.preco), Decimal('0'))
+    valores = {}
+    for item in itens:
+        valor_liquido = Decimal('0')
+        if item.preco and pedido.valor_total:
+            valor_liquido = (item.preco * pedido.valor_total / subtotal).quantize(CENTAVOS, rounding=ROUND_HALF_UP) if subtotal > 0 else item.preco
+        valores[item.id] = (valor_liquido, (valor_liquido * COMISSAO_FOTOGRAFO).quantize(CENTAVOS, rounding=ROUND_HALF_UP))
+    return valores
+
+
+def preencher(apps, schema_editor):
+    Pedido = apps.get_model('loja', 'Pedido')
+    ItemPedido = apps.get_model('loja', 'ItemPedido')
+    SaldoFotografo = apps.get_model('loja', 'SaldoFotografo')
+
+    # 1. valor_liquido/comissao dos itens de pedidos PAGOS que ainda estão em branco
+    pedido_ids = list(
+        Pedido.objects.filter(status='PAGO', itens__valor_liquido__isnull=True).distinct().order_by('id').values_list('id', flat=True)
+    )
+    for inicio in range(0, len(pedido_ids), 500):
+        atualizar = []
+        for pedido in Pedido.objects.filter(id__in=pedido_ids[inicio:inicio + 500]):
+            itens = list(ItemPedido.objects.filter(pedido=pedido).order_by('id'))
+            valores = _valores(pedido, itens)
+            for item in itens:
+                if item.valor_liquido is None:
+                    item.valor_liquido, item.comissao = valores[item.id]
+                    atualizar.append(item)
+        ItemPedido.objects.bulk_update(atualizar, ['valor_liquido', 'comissao'])
+
+    # 2. Saldo de cada fotógrafo refeito a partir dos itens pagos e ainda não repassados
+    linhas = (
+        ItemPedido.objects.filter(pedido__status='PAGO', pago_ao_fotografo=False, foto__album__fotografo__isnull=False)
+        .values('foto__album__fotografo_id').annotate(total=Sum('comissao'))
+    )
+    for linha in linhas:
+        SaldoFotografo.objects.update_or_create(
+            fotografo_id=linha['foto__album__fotografo_id'], defaults={'saldo_pendente': linha['total'] or Decimal('0')}
+        )
+    SaldoFotografo.objects.exclude(fotografo_id__in=[linha['foto__album__fotografo_id'] for linha in linhas]).update(saldo_pendente=Decimal('0'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja', '0017_carrinho_versao'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,18 @@
 # loja/models.py
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from datetime import timedelta
 from contas.models import Usuario
 from galeria.models import Foto, Video
+from config.storages import PrivateMediaStorage
 
 class Carrinho(models.Model):
     cliente = models.OneToOneField(Usuario, on_delete=models.CASCADE, related_name='carrinho')
     criado_em = models.DateTimeField(auto_now_add=True)
     cupom = models.ForeignKey('Cupom', on_delete=models.SET_NULL, null=True, blank=True)
+    # Sobe a cada mudança que mexe no preço (loja/signals.py): é a chave do cache de preços
+    versao = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Carrinho de {self.cliente.email}"
@@ -52,31 +55,43 @@ class Pedido(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        # 1. Primeiro, salvamos o pedido normalmente para garantir que o "PAGO" foi gravado
-        super().save(*args, **kwargs)
+        from .financeiro import acompanhar_saldos, registrar_pedido_pago
+
+        with transaction.atomic():
+            if self.pk:
+                # Trava o pedido: dois webhooks do mesmo pagamento entram em fila aqui
+                Pedido.objects.select_for_update().filter(pk=self.pk).first()
+
+            # O saldo dos fotógrafos anda pela diferença: virou PAGO credita, saiu de PAGO (estorno) debita
+            with acompanhar_saldos(ItemPedido.objects.filter(pedido_id=self.pk)):
+                # 1. Primeiro, salvamos o pedido normalmente para garantir que o "PAGO" foi gravado
+                super().save(*args, **kwargs)
+
+                # 2. Em seguida, verificamos: O status agora é PAGO?
+                # (⚠️ Importante: Verifique se no seu modelo a sigla é 'PAGO' em maiúsculo, ou 'pago', etc)
+                if self.status == 'PAGO':
+
+                    # Importamos aqui dentro para evitar erros de "Importação Circular" do Django
+                    from .models import FotoComprada
+
+                    # 3. Pegamos todos os itens (fotos) que estão dentro deste pedido
+                    # Se você usar um 'related_name' no ItemPedido, mude para self.itens.all()
+                    # O padrão do Django é usar nome_do_modelo_set
+                    itens_do_pedido = self.itens.all()
+
+                    # 4. Para cada foto no carrinho, criamos o acesso do cliente
+                    for item in itens_do_pedido:
+
+                        # Usamos o get_or_create em vez de .create() por segurança!
+                        # Se você salvar o pedido "PAGO" duas vezes no admin sem querer,
+                        # ele não vai duplicar a foto na área do cliente.
+                        FotoComprada.objects.get_or_create(
+                            cliente=self.cliente,
+                            foto=item.foto
+                        )
 
-        # 2. Em seguida, verificamos: O status agora é PAGO?
-        # (⚠️ Importante: Verifique se no seu modelo a sigla é 'PAGO' em maiúsculo, ou 'pago', etc)
-        if self.status == 'PAGO':
-            
-            # Importamos aqui dentro para evitar erros de "Importação Circular" do Django
-            from .models import FotoComprada 
-
-            # 3. Pegamos todos os itens (fotos) que estão dentro deste pedido
-            # Se você usar um 'related_name' no ItemPedido, mude para self.itens.all()
-            # O padrão do Django é usar nome_do_modelo_set
-            itens_do_pedido = self.itens.all() 
-            
-            # 4. Para cada foto no carrinho, criamos o acesso do cliente
-            for item in itens_do_pedido:
-                
-                # Usamos o get_or_create em vez de .create() por segurança! 
-                # Se você salvar o pedido "PAGO" duas vezes no admin sem querer, 
-                # ele não vai duplicar a foto na área do cliente.
-                FotoComprada.objects.get_or_create(
-                    cliente=self.cliente,
-                    foto=item.foto
-                )
+                    # 5. Grava o valor líquido/comissão de cada item
+                    registrar_pedido_pago(self)
 
     def __str__(self):
         if self.cliente:
@@ -89,6 +104,18 @@ class ItemPedido(models.Model):
     video = models.ForeignKey(Video, on_delete=models.PROTECT, null=True, blank=True) # <-- Adicionado
     preco = models.DecimalField(max_digits=10, decimal_places=2)
     pago_ao_fotografo = models.BooleanField(default=False)
+    # Gravados UMA vez quando o pedido vira PAGO (loja/financeiro.py)
+    valor_liquido = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Preço com o desconto do pedido rateado.")
+    comissao = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Parte do fotógrafo sobre o valor líquido.")
+
+    def save(self, *args, **kwargs):
+        from .financeiro import acompanhar_saldos
+
+        # Item novo num pedido pago, comissão ou repasse editados: o saldo anda pela diferença
+        with transaction.atomic():
+            Pedido.objects.select_for_update().filter(pk=self.pedido_id).first()
+            with acompanhar_saldos(ItemPedido.objects.filter(pedido_id=self.pedido_id)):
+                super().save(*args, **kwargs)
 
 class FotoComprada(models.Model):
     cliente = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='fotos_compradas')
@@ -202,4 +229,48 @@ class SolicitacaoSaque(models.Model):
     atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Saque #{self.id} | {self.fotografo.nome_completo} | R$ {self.valor} | {self.status}"
\ No newline at end of file
+        return f"Saque #{self.id} | {self.fotografo.nome_completo} | R$ {self.valor} | {self.status}"
+
+class PacoteDownload(models.Model):
+    """
+    ZIP pré-montado pelo Celery para um conjunto de fotos compradas.
+    A 'chave' é o sha256 dos IDs ordenados: o mesmo conjunto reaproveita o mesmo arquivo.
+    """
+    class StatusPacote(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Pendente'
+        PROCESSANDO = 'PROCESSANDO', 'Processando'
+        PRONTO = 'PRONTO', 'Pronto'
+        FALHOU = 'FALHOU', 'Falhou'
+
+    chave = models.CharField(max_length=64, unique=True, help_text="sha256 dos IDs das fotos (ordenados).")
+    foto_ids = models.JSONField(default=list)
+    solicitado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='pacotes_download')
+    status = models.CharField(max_length=20, choices=StatusPacote.choices, default=StatusPacote.PENDENTE)
+    arquivo = models.FileField(upload_to='pacotes/', blank=True, null=True, storage=PrivateMediaStorage())
+    tamanho_bytes = models.BigIntegerField(default=0)
+    erro = models.TextField(blank=True, null=True)
+    data_expiracao = models.DateTimeField(help_text="Acompanha a data_expiracao das compras.")
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Pacote {self.chave[:12]} ({len(self.foto_ids)} fotos) - {self.status}"
+
+    @property
+    def is_valido(self):
+        return self.status == self.StatusPacote.PRONTO and timezone.now() < self.data_expiracao
+
+class SaldoFotografo(models.Model):
+    """Saldo corrente de cada fotógrafo (comissões PAGAS ainda não repassadas)."""
+    fotografo = models.OneToOneField(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name='saldo',
+        limit_choices_to={'papel': Usuario.Papel.FOTOGRAFO}
+    )
+    saldo_pendente = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Saldo de {self.fotografo.email}: R$ {self.saldo_pendente}"
+
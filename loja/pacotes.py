@@ -0,0 +1,221 @@
+# loja/pacotes.py
+
+import hashlib
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+
+# ====================================================================
+# PACOTE ZIP EM STREAMING (Memória constante, qualquer tamanho de pedido)
+# ====================================================================
+# O ZIP é escrito entrada a entrada num "buffer de passagem": cada pedaço que
+# chega do S3 já sai para o cliente. Os GETs dos próximos arquivos são abertos
+# em paralelo numa janela pequena e limitada (ZIP_DOWNLOAD_PREFETCH).
+
+TAMANHO_BLOCO = 64 * 1024
+
+# O S3 exige partes de no mínimo 5MB (exceto a última)
+TAMANHO_PARTE_MULTIPART = 8 * 1024 * 1024
+
+# JPEG, PNG e vídeos já são comprimidos: deflate só gastaria CPU
+EXTENSOES_SEM_COMPRESSAO = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.gif', '.mp4', '.mov', '.zip'}
+
+
+class BufferPassagem:
+    """Destino 'só escrita' do zipfile: guarda os bytes até o gerador entregá-los."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def chave_s3_do_arquivo(campo_arquivo):
+    """Chave completa no bucket (ex: 'media_private/fotos/imagem.jpg')."""
+    return f"{campo_arquivo.storage.location}/{campo_arquivo.name}"
+
+
+def nome_no_zip_da_foto(foto):
+    return f"acesso_imagens_foto_{foto.id}_{os.path.basename(foto.imagem.name)}"
+
+
+def _tipo_compressao(nome):
+    extensao = os.path.splitext(nome)[1].lower()
+    return zipfile.ZIP_STORED if extensao in EXTENSOES_SEM_COMPRESSAO else zipfile.ZIP_DEFLATED
+
+
+def gerar_zip_streaming(arquivos, s3_client, bucket_name, prefetch=None):
+    """
+    Gera os bytes de um ZIP a partir de uma lista de (nome_no_zip, chave_s3).
+    Arquivos que falharem no S3 são pulados (e avisados no terminal).
+    """
+    janela = prefetch or getattr(settings, 'ZIP_DOWNLOAD_PREFETCH', 4)
+    destino = BufferPassagem()
+    pendentes = deque()
+    iterador = iter(arquivos)
+    agora = timezone.localtime().timetuple()[:6]
+
+    executor = ThreadPoolExecutor(max_workers=janela)
+
+    def agendar_proximo():
+        for nome, chave in iterador:
+            pendentes.append((nome, chave, executor.submit(s3_client.get_object, Bucket=bucket_name, Key=chave)))
+            return
+
+    try:
+        for _ in range(janela):
+            agendar_proximo()
+
+        zip_file = zipfile.ZipFile(destino, 'w', allowZip64=True)
+
+        while pendentes:
+            nome, chave, futuro = pendentes.popleft()
+            agendar_proximo() # Mantém a janela cheia enquanto este arquivo é transmitido
+
+            try:
+                s3_response = futuro.result()
+            except Exception as e:
+                print(f"⚠️ ERRO S3 - O arquivo {chave} falhou ou sumiu do bucket: {e}")
+                continue
+
+            info = zipfile.ZipInfo(nome, date_time=agora)
+            info.compress_type = _tipo_compressao(nome)
+            # Tamanho previsto (o zipfile corrige no fim); evita ZIP64 desnecessário
+            info.file_size = s3_response.get('ContentLength', 0)
+
+            corpo = s3_response['Body']
+            try:
+                with zip_file.open(info, 'w') as entrada:
+                    for bloco in corpo.iter_chunks(TAMANHO_BLOCO):
+                        entrada.write(bloco)
+                        dados = destino.esvaziar()
+                        if dados:
+                            yield dados
+            finally:
+                corpo.close()
+
+            dados = destino.esvaziar()
+            if dados:
+                yield dados
+
+        zip_file.close() # Escreve o diretório central
+        yield destino.esvaziar()
+
+    finally:
+        # Cliente desistiu no meio? Fecha as conexões que ficaram abertas na janela
+        for _, _, futuro in pendentes:
+            if futuro.cancel():
+                continue
+            try:
+                futuro.result()['Body'].close()
+            except Exception:
+                pass
+        executor.shutdown(wait=False)
+
+
+# ====================================================================
+# PACOTES PRÉ-MONTADOS (Celery + Multipart Upload no S3 privado)
+# ====================================================================
+
+def chave_do_pacote(foto_ids):
+    """Endereço do pacote pelo conteúdo: mesmo conjunto de fotos = mesma chave."""
+    ids_ordenados = sorted({int(foto_id) for foto_id in foto_ids})
+    return hashlib.sha256(','.join(map(str, ids_ordenados)).encode()).hexdigest()
+
+
+def enviar_zip_multipart(arquivos, s3_client, bucket_name, chave_destino):
+    """
+    Monta o ZIP em streaming e sobe direto para o S3 em partes de 8MB.
+    Nunca guarda mais que uma parte na memória. Devolve o tamanho final em bytes.
+    """
+    envio = s3_client.create_multipart_upload(Bucket=bucket_name, Key=chave_destino, ContentType='application/zip')
+    upload_id = envio['UploadId']
+    partes = []
+    buffer = bytearray()
+    total = 0
+
+    def enviar_parte(dados):
+        numero = len(partes) + 1
+        resposta = s3_client.upload_part(
+            Bucket=bucket_name, Key=chave_destino, UploadId=upload_id,
+            PartNumber=numero, Body=bytes(dados)
+        )
+        partes.append({'PartNumber': numero, 'ETag': resposta['ETag']})
+
+    try:
+        for dados in gerar_zip_streaming(arquivos, s3_client, bucket_name):
+            buffer.extend(dados)
+            total += len(dados)
+            if len(buffer) >= TAMANHO_PARTE_MULTIPART:
+                enviar_parte(buffer)
+                buffer.clear()
+
+        if buffer or not partes:
+            enviar_parte(buffer)
+
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=chave_destino, UploadId=upload_id,
+            MultipartUpload={'Parts': partes}
+        )
+    except Exception:
+        # Sem isso as partes órfãs ficam cobrando armazenamento no bucket
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=chave_destino, UploadId=upload_id)
+        raise
+
+    return total
+
+
+# ====================================================================
+# PACOTES TRAVADOS E VENCIDOS
+# ====================================================================
+# Worker morto no meio (ou mensagem perdida) deixava o pacote PENDENTE/
+# PROCESSANDO para sempre, e o ZIP vencido ficava no bucket até alguém
+# pedir o mesmo conjunto de novo.
+
+def pacote_travado(pacote):
+    """PENDENTE/PROCESSANDO sem andar há mais de PACOTE_ZIP_TIMEOUT_MINUTOS."""
+    limite = timedelta(minutes=getattr(settings, 'PACOTE_ZIP_TIMEOUT_MINUTOS', 30))
+    em_andamento = (pacote.StatusPacote.PENDENTE, pacote.StatusPacote.PROCESSANDO)
+    return pacote.status in em_andamento and pacote.atualizado_em < timezone.now() - limite
+
+
+def apagar_arquivo_do_pacote(pacote):
+    """Tira o ZIP do bucket (o registro fica: o mesmo conjunto pode ser remontado)."""
+    if pacote.arquivo:
+        pacote.arquivo.delete(save=False)
+        pacote.tamanho_bytes = 0
+
+
+def limpar_pacotes_expirados():
+    """Apaga do S3 os ZIPs PRONTOS já vencidos. Devolve quantos."""
+    from .models import PacoteDownload
+
+    agora = timezone.now()
+    vencidos = PacoteDownload.objects.filter(status=PacoteDownload.StatusPacote.PRONTO, data_expiracao__lt=agora).exclude(arquivo='').exclude(arquivo__isnull=True)
+    total = 0
+    for pacote in vencidos.iterator():
+        # Reserva antes de apagar: um pedido que remonta o pacote agora tira ele de PRONTO/vencido
+        reservado = PacoteDownload.objects.filter(
+            id=pacote.id, status=PacoteDownload.StatusPacote.PRONTO, data_expiracao__lt=agora
+        ).update(arquivo='', tamanho_bytes=0)
+        if reservado:
+            try:
+                pacote.arquivo.storage.delete(pacote.arquivo.name)
+                total += 1
+            except Exception as e:
+                print(f"⚠️ [PACOTE] Não foi possível apagar {pacote.arquivo.name}: {e}")
+    return total
@@ -0,0 +1,207 @@
+# loja/precificacao.py
+
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Prefetch, Q, prefetch_related_objects
+from django.utils import timezone
+
+# ====================================================================
+# MOTOR DE PREÇOS DO CARRINHO (Número fixo de consultas, cálculo único)
+# ====================================================================
+# O carrinho é carregado com tudo o que o preço precisa (itens, fotos,
+# vídeos, álbuns e cupom) e as propostas aceitas chegam numa única consulta.
+# O resultado fica guardado na própria instância do carrinho: o serializer,
+# o checkout e o cupom leem o mesmo cálculo, sem refazer nada.
+# Entre requisições o resultado vive no cache (Redis), com a chave amarrada à
+# 'versao' do carrinho: qualquer mudança de preço sobe a versão (loja/signals.py).
+
+STATUS_PROPOSTA_ACEITA = ['ACEITA', 'CONTRAPROPOSTA_ACEITA']
+
+
+class PrecoCarrinho:
+    """Resumo do preço: subtotal, desconto e total, com o detalhe por álbum."""
+
+    def __init__(self, subtotal, desconto, descontos_por_album, desconto_cupom):
+        self.subtotal = subtotal
+        self.desconto = desconto
+        self.total = subtotal - desconto
+        self.descontos_por_album = descontos_por_album
+        self.desconto_cupom = desconto_cupom
+
+    def para_cache(self):
+        return {
+            'subtotal': self.subtotal,
+            'desconto': self.desconto,
+            'descontos_por_album': self.descontos_por_album,
+            'desconto_cupom': self.desconto_cupom,
+        }
+
+
+def _consulta_itens():
+    from .models import ItemCarrinho
+
+    return ItemCarrinho.objects.select_related('foto__album', 'video__album').order_by('id')
+
+
+def carregar_carrinho(cliente):
+    """Busca (ou cria) o carrinho do cliente já com tudo o que o preço e o serializer usam."""
+    from .models import Carrinho
+
+    carrinho, _ = Carrinho.objects.select_related('cupom').prefetch_related(
+        Prefetch('itens', queryset=_consulta_itens())
+    ).get_or_create(cliente=cliente)
+    return carrinho
+
+
+def _chave_cache(carrinho):
+    """
+    Versão + cupom + dia: o cupom escolhido já muda a chave sozinho e a virada
+    do dia cobre cupons que vencem pela data_validade.
+    """
+    if not carrinho.pk:
+        return None
+    return f"carrinho_preco:{carrinho.pk}:v{carrinho.versao}:c{carrinho.cupom_id or 0}:{timezone.localdate().isoformat()}"
+
+
+def invalidar_carrinhos(filtro):
+    """Sobe a versão (dentro do banco, sem corrida) dos carrinhos que casam com o filtro Q."""
+    from .models import Carrinho
+
+    ids = Carrinho.objects.filter(filtro).values('id')
+    return Carrinho.objects.filter(id__in=ids).update(versao=F('versao') + 1)
+
+
+def invalidar_carrinhos_do_album(album_id, fotos=True, videos=True):
+    filtro = Q()
+    if fotos:
+        filtro |= Q(itens__foto__album_id=album_id)
+    if videos:
+        filtro |= Q(itens__video__album_id=album_id)
+    return invalidar_carrinhos(filtro)
+
+
+def _garantir_itens_carregados(carrinho):
+    if 'itens' not in getattr(carrinho, '_prefetched_objects_cache', {}):
+        prefetch_related_objects([carrinho], Prefetch('itens', queryset=_consulta_itens()))
+
+
+def _propostas_aceitas(cliente_id, album_ids):
+    """A proposta aceita mais recente de cada álbum, numa única consulta."""
+    from .models import PropostaCompra
+
+    if not album_ids:
+        return {}
+    propostas = {}
+    for proposta in PropostaCompra.objects.filter(
+        cliente_id=cliente_id, album_id__in=album_ids, status__in=STATUS_PROPOSTA_ACEITA
+    ).order_by('-id'):
+        propostas.setdefault(proposta.album_id, proposta)
+    return propostas
+
+
+def _melhor_desconto_progressivo(album, quantidade):
+    melhor_desconto_pct = Decimal('0.00')
+    if album.qtd_desconto_1 > 0 and quantidade >= album.qtd_desconto_1:
+        melhor_desconto_pct = max(melhor_desconto_pct, album.pct_desconto_1)
+    if album.qtd_desconto_2 > 0 and quantidade >= album.qtd_desconto_2:
+        melhor_desconto_pct = max(melhor_desconto_pct, album.pct_desconto_2)
+    if album.qtd_desconto_3 > 0 and quantidade >= album.qtd_desconto_3:
+        melhor_desconto_pct = max(melhor_desconto_pct, album.pct_desconto_3)
+    return melhor_desconto_pct
+
+
+def _desconto_proposta(proposta, dados):
+    """Desconto da proposta aceita, se o carrinho cumprir a quantidade combinada de fotos e vídeos."""
+    if not proposta:
+        return Decimal('0.00')
+
+    if dados['qtd_fotos'] < proposta.quantidade_fotos or dados['qtd_videos'] < proposta.quantidade_videos:
+        return Decimal('0.00')
+
+    qtd_total_exigida = proposta.quantidade_fotos + proposta.quantidade_videos
+    preco_medio = dados['valor_soma'] / Decimal(dados['qtd_fotos'] + dados['qtd_videos'])
+    valor_normal_dos_itens_negociados = preco_medio * Decimal(qtd_total_exigida)
+
+    # Se foi uma contra-proposta, usa o valor dela. Se não, usa o valor original do cliente.
+    valor_acordado = proposta.valor_contraproposta if proposta.status == 'CONTRAPROPOSTA_ACEITA' else proposta.valor_oferecido
+
+    if valor_normal_dos_itens_negociados > valor_acordado:
+        return valor_normal_dos_itens_negociados - valor_acordado
+    return Decimal('0.00')
+
+
+def calcular_precos(carrinho):
+    """
+    Calcula (uma vez) subtotal, descontos progressivos/propostas por álbum e cupom.
+    O resultado fica guardado no carrinho enquanto o cupom não mudar.
+    """
+    memo = getattr(carrinho, '_precificacao', None)
+    if memo is not None and memo[0] == carrinho.cupom_id:
+        return memo[1]
+
+    chave = _chave_cache(carrinho)
+    if chave:
+        guardado = cache.get(chave)
+        if guardado is not None:
+            resultado = PrecoCarrinho(**guardado)
+            carrinho._precificacao = (carrinho.cupom_id, resultado)
+            return resultado
+
+    _garantir_itens_carregados(carrinho)
+    itens = list(carrinho.itens.all())
+
+    # 1. Agrupa as mídias (Fotos ou Vídeos) por álbum
+    subtotal = Decimal('0.00')
+    por_album = {}
+    for item in itens:
+        media = item.foto or item.video
+        if not media:
+            continue
+        subtotal += media.preco
+
+        dados = por_album.setdefault(media.album_id, {
+            'album': media.album, 'qtd_fotos': 0, 'qtd_videos': 0, 'valor_soma': Decimal('0.00')
+        })
+        dados['qtd_fotos' if item.foto else 'qtd_videos'] += 1
+        dados['valor_soma'] += media.preco
+
+    # 2. Por álbum vale o MAIOR entre o desconto da proposta aceita e o progressivo
+    propostas = _propostas_aceitas(carrinho.cliente_id, list(por_album.keys()))
+    descontos_por_album = {}
+    for album_id, dados in por_album.items():
+        album = dados['album']
+        desconto_proposta = _desconto_proposta(propostas.get(album_id), dados)
+
+        pct = _melhor_desconto_progressivo(album, dados['qtd_fotos'] + dados['qtd_videos'])
+        desconto_progressivo = dados['valor_soma'] * (pct / Decimal('100.0')) if pct > 0 else Decimal('0.00')
+
+        descontos_por_album[album_id] = max(desconto_proposta, desconto_progressivo)
+
+    # 3. Cupom do fotógrafo (se existir e for válido) sobre as mídias dele
+    desconto_cupom = Decimal('0.00')
+    cupom = carrinho.cupom
+    if cupom and cupom.is_valido():
+        percentual_cupom = cupom.desconto_percentual / Decimal('100.0')
+        for item in itens:
+            media = item.foto or item.video
+            if media and media.album.fotografo_id == cupom.fotografo_id:
+                desconto_cupom += media.preco * percentual_cupom
+
+    desconto = round(sum(descontos_por_album.values(), Decimal('0.00')) + desconto_cupom, 2)
+    resultado = PrecoCarrinho(round(subtotal, 2), desconto, descontos_por_album, desconto_cupom)
+
+    carrinho._precificacao = (carrinho.cupom_id, resultado)
+    if chave:
+        cache.set(chave, resultado.para_cache(), getattr(settings, 'CARRINHO_CACHE_TTL', 3600))
+    return resultado
+
+
+def cupom_vale_para_carrinho(carrinho, cupom):
+    """O cupom só vale se o carrinho tiver alguma mídia do fotógrafo dono dele."""
+    _garantir_itens_carregados(carrinho)
+    for item in carrinho.itens.all():
+        media = item.foto or item.video
+        if media and media.album.fotografo_id == cupom.fotografo_id:
+            return True
+    return False
@@ -0,0 +1,69 @@
+# loja/signals.py
+
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from galeria.models import Album, Foto, Video
+from galeria.signals import precos_do_album_alterados
+from .financeiro import debitar_item_apagado
+from .models import ItemCarrinho, ItemPedido, Cupom, PropostaCompra
+from .precificacao import invalidar_carrinhos, invalidar_carrinhos_do_album
+
+# ====================================================================
+# INVALIDAÇÃO DO CACHE DE PREÇOS DO CARRINHO
+# ====================================================================
+# Tudo o que pode mudar o preço de um carrinho sobe a 'versao' dele.
+# A troca de cupom no próprio carrinho já muda a chave do cache (cupom_id).
+
+@receiver(post_save, sender=ItemCarrinho)
+@receiver(post_delete, sender=ItemCarrinho)
+def item_carrinho_alterado(sender, instance, **kwargs):
+    invalidar_carrinhos(Q(id=instance.carrinho_id))
+
+
+@receiver(post_save, sender=Cupom)
+def cupom_alterado(sender, instance, created, **kwargs):
+    # Percentual, validade ou 'ativo' mudaram: todos os carrinhos com este cupom
+    if not created:
+        invalidar_carrinhos(Q(cupom_id=instance.id))
+
+
+@receiver(post_save, sender=PropostaCompra)
+@receiver(post_delete, sender=PropostaCompra)
+def proposta_alterada(sender, instance, **kwargs):
+    # Aceita, recusada, contra-proposta aceita...: o carrinho do cliente recalcula
+    invalidar_carrinhos(Q(cliente_id=instance.cliente_id))
+
+
+@receiver(post_save, sender=Foto)
+@receiver(post_save, sender=Video)
+def midia_alterada(sender, instance, created, update_fields=None, **kwargs):
+    # O processamento (miniaturas, preview) salva com update_fields e não mexe no preço
+    if created or (update_fields is not None and 'preco' not in update_fields):
+        return
+    campo = 'itens__foto' if sender is Foto else 'itens__video'
+    invalidar_carrinhos(Q(**{campo: instance.id}))
+
+
+@receiver(post_save, sender=Album)
+def album_alterado(sender, instance, created, **kwargs):
+    # Faixas de desconto progressivo (qtd/pct) moram no álbum
+    if not created:
+        invalidar_carrinhos_do_album(instance.id)
+
+
+@receiver(precos_do_album_alterados)
+def precos_do_album_alterados_em_massa(sender, album_id, fotos=True, videos=True, **kwargs):
+    invalidar_carrinhos_do_album(album_id, fotos=fotos, videos=videos)
+
+
+# ====================================================================
+# SALDO DOS FOTÓGRAFOS (loja/financeiro.py)
+# ====================================================================
+# pre_delete também roda item a item quando o Pedido inteiro é apagado
+# (o CASCADE manda os sinais dos itens antes de apagar qualquer linha).
+
+@receiver(pre_delete, sender=ItemPedido)
+def item_pedido_apagado(sender, instance, **kwargs):
+    debitar_item_apagado(instance)
@@ -0,0 +1,106 @@
+# loja/tasks.py
+import tempfile
+import uuid
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+from config.aws import cliente_s3
+from config.storages import PrivateMediaStorage
+from contas.models import Usuario
+from galeria.models import Foto
+from .models import PacoteDownload
+from .pacotes import chave_s3_do_arquivo, nome_no_zip_da_foto, enviar_zip_multipart
+
+# ====================================================================
+# TAREFA DE MONTAGEM DO PACOTE ZIP (Fora do ciclo da requisição)
+# ====================================================================
+@shared_task
+def gerar_pacote_zip_task(pacote_id):
+    # 1. "Reserva" o pacote: se outro worker já pegou, não faz nada
+    reservado = PacoteDownload.objects.filter(
+        id=pacote_id, status=PacoteDownload.StatusPacote.PENDENTE
+    ).update(status=PacoteDownload.StatusPacote.PROCESSANDO, erro=None)
+    if not reservado:
+        return
+
+    pacote = PacoteDownload.objects.get(id=pacote_id)
+    print(f"--- [CELERY] Montando pacote ZIP {pacote.chave[:12]} com {len(pacote.foto_ids)} fotos ---")
+
+    try:
+        fotos = Foto.objects.filter(id__in=pacote.foto_ids).exclude(imagem='').only('id', 'imagem').order_by('id')
+        arquivos = [(nome_no_zip_da_foto(foto), chave_s3_do_arquivo(foto.imagem)) for foto in fotos]
+        if not arquivos:
+            raise ValueError("Nenhuma imagem encontrada para o pacote.")
+
+        s3_client = cliente_s3()
+
+        nome_relativo = f"pacotes/{pacote.chave}.zip"
+        chave_destino = f"{pacote.arquivo.storage.location}/{nome_relativo}"
+        tamanho = enviar_zip_multipart(arquivos, s3_client, settings.AWS_STORAGE_BUCKET_NAME, chave_destino)
+
+        pacote.arquivo.name = nome_relativo
+        pacote.tamanho_bytes = tamanho
+        pacote.status = PacoteDownload.StatusPacote.PRONTO
+        pacote.save(update_fields=['arquivo', 'tamanho_bytes', 'status', 'atualizado_em'])
+        print(f"✅ [CELERY] Pacote {pacote.chave[:12]} pronto ({tamanho} bytes).")
+
+    except Exception as e:
+        print(f"❌ [CELERY] Erro ao montar o pacote {pacote.chave[:12]}: {e}")
+        pacote.status = PacoteDownload.StatusPacote.FALHOU
+        pacote.erro = str(e)
+        pacote.save(update_fields=['status', 'erro', 'atualizado_em'])
+
+
+
+# ====================================================================
+# EXPORTAÇÃO GRANDE DE RELATÓRIOS (Arquivo no S3 + link por e-mail)
+# ====================================================================
+@shared_task
+def exportar_pagamentos_task(usuario_id, formato, filtros=None, ids=None, nome_base='relatorio_pagamentos_site'):
+    from .exportacao import consulta_pagamentos, linhas_pagamentos, gerar_arquivo, CABECALHO_PAGAMENTOS
+
+    usuario = Usuario.objects.get(id=usuario_id)
+    print(f"--- [CELERY] Exportando relatório ({formato}) para {usuario.email} ---")
+
+    nome_arquivo = f"{nome_base}_{timezone.now().strftime('%Y%m%d%H%M')}_{uuid.uuid4().hex[:8]}.{formato}"
+    chave_destino = f"{PrivateMediaStorage().location}/exportacoes/{nome_arquivo}"
+
+    try:
+        vendas = consulta_pagamentos(filtros=filtros, ids=ids)
+
+        # O arquivo vai para o disco do worker em streaming e sobe de uma vez (multipart automático do boto3)
+        with tempfile.NamedTemporaryFile(suffix=f".{formato}") as temporario:
+            for pedaco in gerar_arquivo(formato, CABECALHO_PAGAMENTOS, linhas_pagamentos(vendas)):
+                temporario.write(pedaco.encode('utf-8') if isinstance(pedaco, str) else pedaco)
+            temporario.flush()
+
+            s3_client = cliente_s3()
+            s3_client.upload_file(temporario.name, settings.AWS_STORAGE_BUCKET_NAME, chave_destino)
+
+        validade = getattr(settings, 'EXPORTACAO_LINK_VALIDADE', 3 * 24 * 3600)
+        link = s3_client.generate_presigned_url('get_object', Params={
+            'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+            'Key': chave_destino,
+            'ResponseContentDisposition': f'attachment; filename="{nome_arquivo}"'
+        }, ExpiresIn=validade)
+
+        mensagem_html = f"""
+        <p>Olá, {usuario.nome_completo or usuario.email}!</p>
+        <p>O relatório que você pediu ficou pronto:</p>
+        <p><a href="{link}">Baixar {nome_arquivo}</a></p>
+        <p>O link expira em {validade // 3600} horas.</p>
+        """
+        send_mail(
+            subject="Acesso Imagens - Seu relatório está pronto",
+            message=f"Seu relatório está pronto: {link}",
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[usuario.email],
+            html_message=mensagem_html,
+            fail_silently=False,
+        )
+        print(f"✅ [CELERY] Relatório {nome_arquivo} enviado para {usuario.email}.")
+
+    except Exception as e:
+        print(f"❌ [CELERY] Erro ao exportar relatório para {usuario.email}: {e}")
+        raise
@@ -2,19 +2,33 @@ from django.test import TestCase
 
 # loja/tests.py
 
-from unittest.mock import patch
-from io import BytesIO
+import importlib
+import os
+import zipfile
+from unittest.mock import MagicMock, patch
+from decimal import Decimal
+from io import BytesIO, StringIO
+from botocore.response import StreamingBody
 from PIL import Image
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
 from django.test import override_settings
 from django.utils import timezone
 from datetime import timedelta
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
 from contas.models import Usuario
 from galeria.models import Album, Foto
-from .models import Carrinho, ItemCarrinho, Pedido, FotoComprada
+from galeria.signals import precos_do_album_alterados
+from .models import Carrinho, ItemCarrinho, Pedido, ItemPedido, FotoComprada, Cupom, PropostaCompra, PacoteDownload
+from .precificacao import carregar_carrinho, calcular_precos
+from .serializers import CarrinhoSerializer
+from .financeiro import saldo_do_fotografo, baixar_itens_pagos, recalcular_saldo
+from .exportacao import consulta_pagamentos
+from .pacotes import gerar_zip_streaming, enviar_zip_multipart, chave_do_pacote, pacote_travado, limpar_pacotes_expirados
 
 def create_dummy_image():
     """Cria um arquivo de imagem JPEG de 1x1 pixel em memória."""
@@ -152,7 +166,7 @@ class LojaAPITestCase(APITestCase):
         self.client.force_authenticate(user=self.cliente1)
 
         # 'patch' substitui a função 'generate_presigned_url' por uma que retorna um valor fixo
-        with patch('boto3.client') as mock_s3_client:
+        with patch('loja.views.cliente_s3') as mock_s3_client:
             mock_s3_client.return_value.generate_presigned_url.return_value = "http://mocked.s3.url/download"
             response = self.client.get(url)
 
@@ -166,3 +180,339 @@ class LojaAPITestCase(APITestCase):
 
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class _S3Falso:
+    """Imita o get_object do boto3 devolvendo StreamingBody de verdade."""
+
+    def __init__(self, arquivos):
+        self.arquivos = arquivos
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.arquivos:
+            raise KeyError(Key)
+        dados = self.arquivos[Key]
+        return {'Body': StreamingBody(BytesIO(dados), len(dados)), 'ContentLength': len(dados)}
+
+    # --- Multipart: guarda as partes na memória ---
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        self.partes = {}
+        self.abortado = False
+        return {'UploadId': 'envio-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.partes[PartNumber] = Body
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numeros = [parte['PartNumber'] for parte in MultipartUpload['Parts']]
+        self.arquivos[Key] = b''.join(self.partes[n] for n in numeros)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.abortado = True
+
+
+class PacoteZipStreamingTestCase(TestCase):
+
+    def test_zip_em_streaming_e_valido_e_pula_arquivos_sumidos(self):
+        foto = BytesIO()
+        Image.new('RGB', (50, 50), 'red').save(foto, 'JPEG')
+        arquivos_s3 = {
+            'media_private/fotos/a.jpg': foto.getvalue(),
+            'media_private/fotos/b.txt': b'texto ' * 1000,
+        }
+        lista = [
+            ('a.jpg', 'media_private/fotos/a.jpg'),
+            ('sumiu.jpg', 'media_private/fotos/sumiu.jpg'),
+            ('b.txt', 'media_private/fotos/b.txt'),
+        ]
+
+        partes = list(gerar_zip_streaming(lista, _S3Falso(arquivos_s3), 'bucket', prefetch=2))
+        self.assertGreater(len(partes), 1) # Entregue aos pedaços, não de uma vez
+
+        with zipfile.ZipFile(BytesIO(b''.join(partes))) as zip_file:
+            self.assertEqual(zip_file.namelist(), ['a.jpg', 'b.txt'])
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.getinfo('a.jpg').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zip_file.getinfo('b.txt').compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(zip_file.read('a.jpg'), arquivos_s3['media_private/fotos/a.jpg'])
+
+    @patch('loja.pacotes.TAMANHO_PARTE_MULTIPART', 100 * 1024)
+    def test_pacote_sobe_em_partes_e_chave_ignora_ordem(self):
+        self.assertEqual(chave_do_pacote([3, 1, 2, 2]), chave_do_pacote(['1', '2', '3']))
+
+        arquivos_s3 = {f'media_private/fotos/{i}.bin': os.urandom(150 * 1024) for i in range(3)}
+        s3 = _S3Falso(arquivos_s3)
+        lista = [(f'{i}.bin', f'media_private/fotos/{i}.bin') for i in range(3)]
+
+        tamanho = enviar_zip_multipart(lista, s3, 'bucket', 'media_private/pacotes/x.zip')
+
+        self.assertGreater(len(s3.partes), 1)
+        self.assertFalse(s3.abortado)
+        with zipfile.ZipFile(BytesIO(s3.arquivos['media_private/pacotes/x.zip'])) as zip_file:
+            self.assertEqual(len(zip_file.namelist()), 3)
+            self.assertIsNone(zip_file.testzip())
+        self.assertEqual(tamanho, len(s3.arquivos['media_private/pacotes/x.zip']))
+
+    def test_pacote_travado_e_zip_vencido(self):
+        agora = timezone.now()
+        travado = PacoteDownload.objects.create(chave='a' * 64, foto_ids=[1], status=PacoteDownload.StatusPacote.PROCESSANDO, data_expiracao=agora + timedelta(days=1))
+        vencido = PacoteDownload.objects.create(chave='b' * 64, foto_ids=[2], status=PacoteDownload.StatusPacote.PRONTO, arquivo='pacotes/b.zip', data_expiracao=agora - timedelta(days=1))
+        valido = PacoteDownload.objects.create(chave='c' * 64, foto_ids=[3], status=PacoteDownload.StatusPacote.PRONTO, arquivo='pacotes/c.zip', data_expiracao=agora + timedelta(days=1))
+        self.assertFalse(pacote_travado(travado))
+        PacoteDownload.objects.filter(id=travado.id).update(atualizado_em=agora - timedelta(hours=1))
+
+        storage = MagicMock()
+        with patch.object(PacoteDownload._meta.get_field('arquivo'), 'storage', storage):
+            apagados = limpar_pacotes_expirados()
+
+        self.assertTrue(pacote_travado(PacoteDownload.objects.get(id=travado.id)))
+        self.assertEqual(apagados, 1)
+        storage.delete.assert_called_once_with('pacotes/b.zip')
+        self.assertFalse(PacoteDownload.objects.get(id=vencido.id).arquivo)
+        self.assertEqual(PacoteDownload.objects.get(id=valido.id).arquivo.name, 'pacotes/c.zip')
+
+
+
+class LivroCaixaFotografoTestCase(TestCase):
+
+    def setUp(self):
+        self.fotografo = Usuario.objects.create(email='caixa_fotografo@example.com', nome_completo='Fotógrafo Caixa', papel=Usuario.Papel.FOTOGRAFO)
+        self.cliente = Usuario.objects.create(email='caixa_cliente@example.com', nome_completo='Cliente Caixa', papel=Usuario.Papel.CLIENTE)
+        album = Album.objects.create(titulo='Álbum Caixa', data_evento=timezone.now().date(), fotografo=self.fotografo)
+        self.foto1 = Foto.objects.create(album=album, imagem='fotos/caixa1.jpg', preco=Decimal('10.00'))
+        self.foto2 = Foto.objects.create(album=album, imagem='fotos/caixa2.jpg', preco=Decimal('30.00'))
+
+        # Pedido de R$ 40 em fotos pago com cupom de 50% (R$ 20)
+        self.pedido = Pedido.objects.create(cliente=self.cliente, valor_total=Decimal('20.00'))
+        ItemPedido.objects.create(pedido=self.pedido, foto=self.foto1, preco=Decimal('10.00'))
+        ItemPedido.objects.create(pedido=self.pedido, foto=self.foto2, preco=Decimal('30.00'))
+
+    def test_pagamento_grava_valores_e_credita_saldo_uma_vez(self):
+        self.pedido.status = Pedido.StatusPedido.PAGO
+        self.pedido.save()
+        self.pedido.save() # Webhook repetido não pode creditar duas vezes
+
+        valores = dict(ItemPedido.objects.values_list('foto_id', 'comissao'))
+        self.assertEqual(valores[self.foto1.id], Decimal('4.75'))
+        self.assertEqual(valores[self.foto2.id], Decimal('14.25'))
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('19.00'))
+
+        # Repasse: marca os itens e zera o saldo
+        quantidade, total = baixar_itens_pagos(ItemPedido.objects.filter(pedido=self.pedido))
+        self.assertEqual((quantidade, total), (2, Decimal('19.00')))
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('0.00'))
+
+    def test_backfill_refaz_pedidos_antigos(self):
+        # Pedido pago "antes" do livro-caixa: status gravado direto, sem passar pelo save()
+        Pedido.objects.filter(id=self.pedido.id).update(status=Pedido.StatusPedido.PAGO)
+
+        call_command('recalcular_saldos_fotografos', stdout=StringIO())
+
+        self.assertFalse(ItemPedido.objects.filter(valor_liquido__isnull=True).exists())
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('19.00'))
+
+    def test_relatorio_admin_calcula_no_banco_e_pagina_por_cursor(self):
+        admin = Usuario.objects.create(email='caixa_admin@example.com', nome_completo='Admin Caixa', papel=Usuario.Papel.ADMIN)
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        url = reverse('admin-vendas-json')
+
+        # Pedido ainda PENDENTE: o desconto rateado é calculado em SQL (não há valor gravado)
+        with self.assertNumQueries(3):
+            pagina1 = client.get(url, {'limite': 1}, secure=True).data
+        self.assertEqual(len(pagina1['resultados']), 1)
+        self.assertIsNotNone(pagina1['proximo_cursor'])
+
+        pagina2 = client.get(url, {'limite': 1, 'cursor': pagina1['proximo_cursor']}, secure=True).data
+        self.assertIsNone(pagina2['proximo_cursor'])
+
+        valores = {linha['foto_id']: linha['valor_venda'] for linha in pagina1['resultados'] + pagina2['resultados']}
+        self.assertEqual(valores, {self.foto1.id: 5.0, self.foto2.id: 15.0})
+        self.assertEqual(pagina1['resumo']['total_pagar'], 0) # Nada PAGO ainda
+
+        self.pedido.status = Pedido.StatusPedido.PAGO
+        self.pedido.save()
+        self.assertEqual(client.get(url, secure=True).data['resumo']['total_pagar'], 19.0)
+
+        csv_resposta = b''.join(client.get(reverse('exportar-pagamentos'), secure=True).streaming_content).decode('utf-8-sig')
+        self.assertIn('TOTAL A PAGAR:;19,00', csv_resposta)
+
+        xlsx_resposta = client.get(reverse('exportar-pagamentos'), {'formato': 'xlsx'}, secure=True)
+        with zipfile.ZipFile(BytesIO(b''.join(xlsx_resposta.streaming_content))) as planilha:
+            self.assertIn('<v>19.00</v>', planilha.read('xl/worksheets/sheet1.xml').decode())
+
+    def test_estorno_edicao_e_exclusao_movem_o_saldo(self):
+        self.pedido.status = Pedido.StatusPedido.PAGO
+        self.pedido.save()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('19.00'))
+
+        # Estorno no admin e pagamento de novo
+        self.pedido.status = Pedido.StatusPedido.FALHOU
+        self.pedido.save()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('0'))
+        self.pedido.status = Pedido.StatusPedido.PAGO
+        self.pedido.save()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('19.00'))
+
+        # Repasse marcado no item
+        item = ItemPedido.objects.get(foto=self.foto1)
+        item.pago_ao_fotografo = True
+        item.save()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('14.25'))
+
+        # Item apagado e depois o pedido inteiro
+        ItemPedido.objects.get(foto=self.foto2).delete()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('0'))
+        outro = Pedido.objects.create(cliente=self.cliente, valor_total=Decimal('10.00'))
+        ItemPedido.objects.create(pedido=outro, foto=self.foto1, preco=Decimal('10.00'))
+        outro.status = Pedido.StatusPedido.PAGO
+        outro.save()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('9.50'))
+        outro.delete()
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('0'))
+
+    def test_itens_pagos_antes_do_livro_caixa(self):
+        # Pedido pago antes da 0016: status gravado sem signal, itens sem valor_liquido/comissao
+        Pedido.objects.filter(id=self.pedido.id).update(status=Pedido.StatusPedido.PAGO)
+
+        self.assertEqual(recalcular_saldo(self.fotografo.id), Decimal('19.00'))
+        self.assertEqual(baixar_itens_pagos(ItemPedido.objects.filter(id=ItemPedido.objects.get(foto=self.foto2).id)), (1, Decimal('14.25')))
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('4.75'))
+
+        # A migração de dados grava os valores e refaz o saldo
+        from django.apps import apps
+        importlib.import_module('loja.migrations.0018_preencher_livro_caixa').preencher(apps, None)
+        self.assertEqual(ItemPedido.objects.get(foto=self.foto1).comissao, Decimal('4.75'))
+        self.assertEqual(saldo_do_fotografo(self.fotografo.id), Decimal('4.75'))
+
+    @override_settings(EXPORTACAO_LIMITE_LINHAS=1)
+    def test_exportacao_grande_vai_para_o_celery(self):
+        admin = Usuario.objects.create(email='caixa_admin@example.com', nome_completo='Admin Caixa', papel=Usuario.Papel.ADMIN)
+        client = APIClient()
+        client.force_authenticate(user=admin)
+
+        with patch('loja.tasks.exportar_pagamentos_task.delay') as tarefa:
+            resposta = client.get(reverse('exportar-pagamentos'), {'formato': 'xlsx'}, secure=True)
+
+        self.assertEqual(resposta.status_code, status.HTTP_202_ACCEPTED)
+        tarefa.assert_called_once_with(admin.id, 'xlsx', filtros={}, ids=None, nome_base='relatorio_pagamentos_site')
+
+    @override_settings(EXPORTACAO_LIMITE_LINHAS=1)
+    def test_exportar_todos_no_admin_manda_os_filtros_e_nao_os_ids(self):
+        outro = Usuario.objects.create(email='caixa_outro@example.com', nome_completo='Outro', papel=Usuario.Papel.FOTOGRAFO)
+        album = Album.objects.create(titulo='Outro álbum', data_evento=timezone.now().date(), fotografo=outro)
+        ItemPedido.objects.create(pedido=self.pedido, foto=Foto.objects.create(album=album, imagem='fotos/caixa3.jpg'), preco=Decimal('5.00'))
+        superusuario = Usuario.objects.create(email='caixa_super@example.com', nome_completo='Super', is_staff=True, is_superuser=True)
+        self.client.force_login(superusuario)
+
+        hoje = timezone.localdate()
+        querystring = (
+            f"fotografo_id={self.fotografo.id}&pedido__status__exact={Pedido.StatusPedido.PENDENTE}&q=caixa"
+            f"&pedido__criado_em__range__gte={hoje:%d/%m/%Y}&pedido__criado_em__range__lte={hoje:%d/%m/%Y}"
+        )
+        with patch('loja.tasks.exportar_pagamentos_task.delay') as tarefa:
+            self.client.post(
+                f"{reverse('admin:loja_itempedido_changelist')}?{querystring}",
+                {'action': 'exportar_pagamento_xlsx', 'select_across': '1', 'index': 0, '_selected_action': [ItemPedido.objects.first().id]},
+                secure=True,
+            )
+
+        filtros = tarefa.call_args.kwargs['filtros']
+        self.assertEqual(filtros, {
+            'data_inicio': hoje.isoformat(), 'data_fim': hoje.isoformat(),
+            'fotografo_id': str(self.fotografo.id), 'status': Pedido.StatusPedido.PENDENTE, 'q': 'caixa',
+        })
+        self.assertIsNone(tarefa.call_args.kwargs['ids'])
+        # O worker refaz a mesma lista filtrada só com o ORM
+        vendas = consulta_pagamentos(filtros=filtros)
+        self.assertEqual({venda['foto_id'] for venda in vendas}, {self.foto1.id, self.foto2.id})
+
+
+class PrecificacaoCarrinhoTestCase(TestCase):
+
+    def setUp(self):
+        self.fotografo = Usuario.objects.create(email='preco_fotografo@example.com', nome_completo='Fotógrafo Preço', papel=Usuario.Papel.FOTOGRAFO)
+        self.cliente = Usuario.objects.create(email='preco_cliente@example.com', nome_completo='Cliente Preço', papel=Usuario.Papel.CLIENTE)
+        self.album_progressivo = Album.objects.create(
+            titulo='Progressivo', data_evento=timezone.now().date(), fotografo=self.fotografo,
+            qtd_desconto_1=3, pct_desconto_1=Decimal('10.00')
+        )
+        self.album_proposta = Album.objects.create(titulo='Proposta', data_evento=timezone.now().date(), fotografo=self.fotografo)
+        PropostaCompra.objects.create(
+            cliente=self.cliente, album=self.album_proposta, quantidade_fotos=2,
+            valor_oferecido=Decimal('15.00'), status='ACEITA'
+        )
+        self.carrinho = Carrinho.objects.create(cliente=self.cliente)
+        cache.clear()
+
+    def _adicionar(self, album, quantidade):
+        for i in range(quantidade):
+            foto = Foto.objects.create(album=album, imagem=f'fotos/preco_{album.id}_{i}.jpg', preco=Decimal('10.00'))
+            ItemCarrinho.objects.create(carrinho=self.carrinho, foto=foto)
+
+    def test_descontos_de_album_proposta_e_cupom(self):
+        self._adicionar(self.album_progressivo, 3) # R$ 30 com 10% = R$ 3
+        self._adicionar(self.album_proposta, 2)    # R$ 20 por R$ 15 = R$ 5
+        self.carrinho.cupom = Cupom.objects.create(codigo='PRECO5', desconto_percentual=Decimal('5.00'), fotografo=self.fotografo)
+        self.carrinho.save()
+
+        precos = calcular_precos(carregar_carrinho(self.cliente))
+        self.assertEqual(precos.subtotal, Decimal('50.00'))
+        self.assertEqual(precos.desconto, Decimal('10.50')) # 3 + 5 + 5% de 50
+        self.assertEqual(precos.total, Decimal('39.50'))
+
+    def test_numero_de_consultas_nao_cresce_com_o_carrinho(self):
+        # carrinho+cupom, itens+mídias+álbuns, propostas
+        self._adicionar(self.album_progressivo, 2)
+        with self.assertNumQueries(3):
+            CarrinhoSerializer(carregar_carrinho(self.cliente)).data
+
+        self._adicionar(self.album_progressivo, 20)
+        self._adicionar(self.album_proposta, 20)
+        with self.assertNumQueries(3):
+            dados = CarrinhoSerializer(carregar_carrinho(self.cliente)).data
+        self.assertEqual(len(dados['itens']), 42)
+
+    def test_cache_de_precos_e_invalidado_por_versao(self):
+        self._adicionar(self.album_progressivo, 2)
+        self.assertEqual(calcular_precos(carregar_carrinho(self.cliente)).total, Decimal('20.00'))
+
+        # Segunda visita: o preço vem do cache (sem a consulta de propostas)
+        with self.assertNumQueries(2):
+            self.assertEqual(CarrinhoSerializer(carregar_carrinho(self.cliente)).data['total'], Decimal('20.00'))
+
+        # Terceira foto ativa o desconto progressivo de 10%
+        self._adicionar(self.album_progressivo, 1)
+        self.assertEqual(calcular_precos(carregar_carrinho(self.cliente)).total, Decimal('27.00'))
+
+        # Preço alterado em massa (queryset.update, sem post_save) também invalida
+        Foto.objects.filter(album=self.album_progressivo).update(preco=Decimal('20.00'))
+        precos_do_album_alterados.send(sender=Album, album_id=self.album_progressivo.id, fotos=True, videos=False)
+        self.assertEqual(calcular_precos(carregar_carrinho(self.cliente)).total, Decimal('54.00'))
+
+        # Proposta aceita para o álbum
+        PropostaCompra.objects.create(
+            cliente=self.cliente, album=self.album_progressivo, quantidade_fotos=3,
+            valor_oferecido=Decimal('40.00'), status='ACEITA'
+        )
+        self.assertEqual(calcular_precos(carregar_carrinho(self.cliente)).total, Decimal('40.00'))
+
+    def test_aplicar_cupom_nao_desfaz_versao_subida_no_meio(self):
+        self._adicionar(self.album_progressivo, 1)
+        Cupom.objects.create(codigo='VERSAO5', desconto_percentual=Decimal('5.00'), fotografo=self.fotografo)
+        versao = Carrinho.objects.get(id=self.carrinho.id).versao
+        client = APIClient()
+        client.force_authenticate(user=self.cliente)
+
+        # Um preço muda (signal sobe a versão) entre a leitura do carrinho e o save do cupom
+        def subir_versao(carrinho, cupom):
+            Carrinho.objects.filter(id=carrinho.id).update(versao=F('versao') + 1)
+            return True
+        with patch('loja.views.cupom_vale_para_carrinho', side_effect=subir_versao):
+            resposta = client.post(reverse('aplicar-cupom'), {'codigo': 'VERSAO5'}, secure=True)
+
+        self.assertEqual(resposta.status_code, status.HTTP_200_OK)
+        carrinho = Carrinho.objects.get(id=self.carrinho.id)
+        self.assertEqual((carrinho.versao, carrinho.cupom.codigo), (versao + 1, 'VERSAO5'))
+
@@ -22,6 +22,7 @@ from .views import (
     FotografoVendasJSONView, 
     FotografoHistoricoPagamentosView,
     BulkDownloadFotosZipView,
+    PacoteDownloadZipView,
     BulkEnviarFotosEmailView,
     CriarPropostaView, 
     FotografoPropostasView, 
@@ -55,6 +56,8 @@ urlpatterns = [
     path('download-foto/<int:foto_id>/', DownloadFotoView.as_view(), name='download-foto'),
     path('download-foto/<int:foto_id>/enviar-email/', EnviarFotoEmailView.as_view(), name='enviar_foto_email'),
     path('download-fotos-zip/', BulkDownloadFotosZipView.as_view(), name='bulk-download-zip'),
+    path('download-fotos-zip/pacote/', PacoteDownloadZipView.as_view(), name='pacote-zip'),
+    path('download-fotos-zip/pacote/<str:chave>/', PacoteDownloadZipView.as_view(), name='pacote-zip-status'),
     path('enviar-fotos-email/', BulkEnviarFotosEmailView.as_view(), name='bulk-enviar-email'),
 
     path('dashboard/propostas/', FotografoPropostasView.as_view(), name='listar-propostas'),
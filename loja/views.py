@@ -1,16 +1,12 @@
 # loja/views.py
 
 # 1. Bibliotecas Padrão do Python
-import csv
-import io
 import json
 import os
-import zipfile
 from datetime import timedelta
 from decimal import Decimal
 
 # 2. Bibliotecas de Terceiros
-import boto3
 import mercadopago
 from botocore.exceptions import ClientError
 
@@ -19,7 +15,7 @@ from django.conf import settings
 from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import Sum, Count, Q, F, Prefetch
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.dateparse import parse_date
@@ -37,7 +33,16 @@ from rest_framework.views import APIView
 from contas.models import Usuario
 from contas.permissions import IsCliente, IsFotografoOrAdmin, IsAdminUser
 from galeria.models import Foto, Video
-from .models import Carrinho, ItemCarrinho, Pedido, ItemPedido, Cupom, FotoComprada, HistoricoPagamentoFotografo, PropostaCompra, SolicitacaoSaque
+from config.aws import cliente_s3
+from .models import Carrinho, ItemCarrinho, Pedido, ItemPedido, Cupom, FotoComprada, HistoricoPagamentoFotografo, PropostaCompra, SolicitacaoSaque, PacoteDownload
+from .pacotes import gerar_zip_streaming, chave_s3_do_arquivo, nome_no_zip_da_foto, chave_do_pacote, pacote_travado, apagar_arquivo_do_pacote
+from .tasks import gerar_pacote_zip_task
+from .precificacao import carregar_carrinho, calcular_precos, cupom_vale_para_carrinho
+from .exportacao import exportar_pagamentos
+from .financeiro import (
+    saldo_do_fotografo, saldos_dos_fotografos, baixar_itens_pagos, valores_do_item,
+    vendas_com_valores, filtrar_vendas, totais_pendentes, paginar_por_cursor, CAMPOS_RELATORIO_VENDAS
+)
 from .serializers import CarrinhoSerializer, PedidoSerializer, VendaFotografoSerializer, CupomSerializer, PropostaCompraSerializer, SolicitacaoSaqueSerializer
 
 # --- VIEWS DO FLUXO DE COMPRA DO CLIENTE ---
@@ -46,7 +51,7 @@ class CarrinhoView(APIView):
     permission_classes = [IsAuthenticated, IsCliente]
 
     def get(self, request):
-        carrinho, _ = Carrinho.objects.get_or_create(cliente=request.user)
+        carrinho = carregar_carrinho(request.user)
         serializer = CarrinhoSerializer(carrinho, context={'request': request})
         return Response(serializer.data)
     
@@ -82,7 +87,7 @@ class CarrinhoView(APIView):
         item_id = request.data.get('item_id')
         item = get_object_or_404(ItemCarrinho, pk=item_id, carrinho__cliente=request.user)
         item.delete()
-        carrinho = Carrinho.objects.get(cliente=request.user)
+        carrinho = carregar_carrinho(request.user)
         serializer = CarrinhoSerializer(carrinho, context={'request': request})
         return Response(serializer.data)
 
@@ -91,10 +96,10 @@ class AplicarCupomView(APIView):
 
     def post(self, request):
         codigo = request.data.get('codigo')
-        carrinho = Carrinho.objects.get(cliente=request.user)
+        carrinho = carregar_carrinho(request.user)
         if not codigo:
             carrinho.cupom = None
-            carrinho.save()
+            carrinho.save(update_fields=['cupom'])
             serializer = CarrinhoSerializer(carrinho, context={'request': request})
             return Response(serializer.data)
         try:
@@ -104,13 +109,14 @@ class AplicarCupomView(APIView):
         if not cupom.is_valido():
             return Response({"error": "Este cupom não é mais válido."}, status=status.HTTP_400_BAD_REQUEST)
         
-        tem_foto_valida = any(item.foto.album.fotografo == cupom.fotografo for item in carrinho.itens.all())
+        tem_foto_valida = cupom_vale_para_carrinho(carrinho, cupom)
         
         if not tem_foto_valida:
             return Response({"error": "Este cupom não é válido para nenhuma das fotos no seu carrinho."}, status=status.HTTP_400_BAD_REQUEST)
         
         carrinho.cupom = cupom
-        carrinho.save()
+        # Só o cupom: um save completo devolveria a 'versao' lida agora, desfazendo um aumento concorrente
+        carrinho.save(update_fields=['cupom'])
         serializer = CarrinhoSerializer(carrinho, context={'request': request})
         return Response(serializer.data)
 
@@ -119,12 +125,12 @@ class MercadoPagoCheckoutView(APIView):
     
     def post(self, request):
         try:
-            carrinho = Carrinho.objects.get(cliente=request.user)
-            if not carrinho.itens.exists():
+            carrinho = carregar_carrinho(request.user)
+            if not carrinho.itens.all():
                 return Response({"error": "Seu carrinho está vazio."}, status=status.HTTP_400_BAD_REQUEST)
             
-            serializer_carrinho = CarrinhoSerializer(carrinho, context={'request': request})
-            total = float(serializer_carrinho.data.get('total'))
+            # O mesmo cálculo que o cliente viu no carrinho (sem passar pelo serializer)
+            total = calcular_precos(carrinho).total
 
             if total <= 0:
                 return Response({"error": "O valor total do pedido deve ser positivo."}, status=status.HTTP_400_BAD_REQUEST)
@@ -132,7 +138,7 @@ class MercadoPagoCheckoutView(APIView):
             # 1. Cria o Pedido (MANTENHA ESTA PARTE IGUAL)
             pedido = Pedido.objects.create(
                 cliente=request.user,
-                valor_total=Decimal(total)
+                valor_total=total
             )
             
             itens_do_pedido = []
@@ -352,7 +358,7 @@ class DownloadFotoView(APIView):
             storage_location = foto.imagem.storage.location
             full_key = f"{storage_location}/{relative_path}"
             
-            s3_client = boto3.client('s3', aws_access_key_id=settings.AWS_ACCESS_KEY_ID, aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY, region_name=settings.AWS_S3_REGION_NAME, config=boto3.session.Config(signature_version='s3v4'))
+            s3_client = cliente_s3()
             file_name = os.path.basename(full_key)
             params = {'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': full_key, 'ResponseContentDisposition': f'attachment; filename="{file_name}"'}
             download_url = s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=300)
@@ -437,45 +443,23 @@ class BulkDownloadFotosZipView(APIView):
             return Response({"error": "Nenhuma das fotos solicitadas é válida ou pertence a você."}, status=status.HTTP_403_FORBIDDEN)
 
         # 2. Busca as fotos reais, de forma única
-        fotos_para_baixar = Foto.objects.filter(id__in=fotos_compradas_ids)
+        fotos_para_baixar = Foto.objects.filter(id__in=fotos_compradas_ids).exclude(imagem='').only('id', 'imagem')
+        arquivos = [(nome_no_zip_da_foto(foto), chave_s3_do_arquivo(foto.imagem)) for foto in fotos_para_baixar]
+
+        if not arquivos:
+            return Response({"error": "Nenhuma imagem foi encontrada no servidor AWS."}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            s3_client = boto3.client(
-                's3', 
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID, 
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY, 
-                region_name=settings.AWS_S3_REGION_NAME, 
-                config=boto3.session.Config(signature_version='s3v4')
-            )
+            s3_client = cliente_s3()
             bucket_name = settings.AWS_STORAGE_BUCKET_NAME
 
-            zip_buffer = io.BytesIO()
-            fotos_adicionadas = 0 # Contador para sabermos se deu tudo certo
-
-            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                for foto in fotos_para_baixar:
-                    relative_path = foto.imagem.name
-                    storage_location = foto.imagem.storage.location
-                    full_key = f"{storage_location}/{relative_path}"
-                    
-                    file_name = f"acesso_imagens_foto_{foto.id}_{os.path.basename(full_key)}"
-
-                    try:
-                        s3_response = s3_client.get_object(Bucket=bucket_name, Key=full_key)
-                        foto_content = s3_response['Body'].read()
-                        zip_file.writestr(file_name, foto_content)
-                        fotos_adicionadas += 1
-                    except Exception as e:
-                        # MÁGICA 2: Agora ele te avisa no terminal se a foto sumiu do S3!
-                        print(f"⚠️ ERRO S3 - A foto {foto.id} falhou ou sumiu do bucket: {e}")
-                        continue
-
-            if fotos_adicionadas == 0:
-                return Response({"error": "Nenhuma imagem foi encontrada no servidor AWS."}, status=status.HTTP_404_NOT_FOUND)
-
-            zip_buffer.seek(0)
-            response = HttpResponse(zip_buffer, content_type='application/zip')
+            # 3. O ZIP vai sendo montado e enviado ao mesmo tempo (memória constante)
+            response = StreamingHttpResponse(
+                gerar_zip_streaming(arquivos, s3_client, bucket_name),
+                content_type='application/zip'
+            )
             response['Content-Disposition'] = f'attachment; filename="acesso_imagens_pacote_{timezone.now().strftime("%Y%m%d%H%M")}.zip"'
+            response['X-Accel-Buffering'] = 'no' # Nginx não segura o arquivo inteiro antes de repassar
             
             return response
 
@@ -484,6 +468,98 @@ class BulkDownloadFotosZipView(APIView):
             return Response({"error": "Erro no servidor ao gerar o pacote ZIP."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class PacoteDownloadZipView(APIView):
+    """
+    Pacote ZIP montado em segundo plano pelo Celery.
+    POST: pede o pacote (202 enquanto monta, 200 com o link quando pronto).
+    GET <chave>: consulta o andamento / pega o link.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def _compras_validas(self, user, foto_ids):
+        return FotoComprada.objects.filter(
+            cliente=user, foto_id__in=foto_ids, data_expiracao__gte=timezone.now()
+        )
+
+    def _resposta(self, pacote, user):
+        dados = {"chave": pacote.chave, "status": pacote.status, "total_fotos": len(pacote.foto_ids)}
+        if pacote.is_valido:
+            # O link nunca vive mais que o acesso do próprio cliente às fotos
+            validade_cliente = self._compras_validas(user, pacote.foto_ids).order_by('data_expiracao').values_list('data_expiracao', flat=True).first()
+            segundos = int((validade_cliente - timezone.now()).total_seconds()) if validade_cliente else 0
+            expira_em = max(60, min(3600, segundos))
+            s3_client = cliente_s3()
+            params = {
+                'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+                'Key': chave_s3_do_arquivo(pacote.arquivo),
+                'ResponseContentDisposition': f'attachment; filename="acesso_imagens_pacote_{pacote.chave[:12]}.zip"'
+            }
+            dados["download_url"] = s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expira_em)
+            dados["tamanho_bytes"] = pacote.tamanho_bytes
+            return Response(dados, status=status.HTTP_200_OK)
+        if pacote.status == PacoteDownload.StatusPacote.FALHOU:
+            dados["error"] = "Não foi possível montar o pacote. Tente novamente."
+        return Response(dados, status=status.HTTP_202_ACCEPTED)
+
+    def post(self, request):
+        foto_ids = request.data.get('foto_ids', [])
+        if not foto_ids:
+            return Response({"error": "Nenhuma foto selecionada."}, status=status.HTTP_400_BAD_REQUEST)
+
+        compras = self._compras_validas(request.user, foto_ids).exclude(foto__isnull=True)
+        ids_validos = sorted(set(compras.values_list('foto_id', flat=True)))
+        if not ids_validos:
+            return Response({"error": "Nenhuma das fotos solicitadas é válida ou pertence a você."}, status=status.HTTP_403_FORBIDDEN)
+
+        # O pacote vale enquanto a compra mais antiga do conjunto ainda for válida
+        expiracao = compras.order_by('data_expiracao').values_list('data_expiracao', flat=True).first()
+        chave = chave_do_pacote(ids_validos)
+
+        with transaction.atomic():
+            pacote, criado = PacoteDownload.objects.select_for_update().get_or_create(
+                chave=chave,
+                defaults={'foto_ids': ids_validos, 'solicitado_por': request.user, 'data_expiracao': expiracao}
+            )
+            # Pacote vencido, que falhou ou travado (worker morreu): remonta no mesmo endereço
+            vencido = pacote.status == PacoteDownload.StatusPacote.PRONTO and not pacote.is_valido
+            refazer = not criado and (
+                pacote.status == PacoteDownload.StatusPacote.FALHOU or vencido or pacote_travado(pacote)
+            )
+            if refazer:
+                if vencido:
+                    apagar_arquivo_do_pacote(pacote)
+                pacote.status = PacoteDownload.StatusPacote.PENDENTE
+                pacote.solicitado_por = request.user
+                pacote.data_expiracao = expiracao
+                pacote.erro = None
+                pacote.save()
+            elif pacote.data_expiracao < expiracao:
+                # Outro cliente com compra mais recente: o arquivo pode viver mais
+                pacote.data_expiracao = expiracao
+                pacote.save(update_fields=['data_expiracao', 'atualizado_em'])
+
+            if criado or refazer:
+                transaction.on_commit(lambda: gerar_pacote_zip_task.delay(pacote.id))
+
+        try:
+            return self._resposta(pacote, request.user)
+        except Exception as e:
+            print(f"ERRO ao gerar URL do pacote: {e}")
+            return Response({"error": "Erro ao gerar link de download."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def get(self, request, chave):
+        pacote = get_object_or_404(PacoteDownload, chave=chave)
+        # Só quem ainda tem acesso a TODAS as fotos do pacote pode baixá-lo
+        if self._compras_validas(request.user, pacote.foto_ids).values('foto_id').distinct().count() != len(pacote.foto_ids):
+            return Response({"error": "Permissão negada ou acesso expirado."}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            return self._resposta(pacote, request.user)
+        except Exception as e:
+            print(f"ERRO ao gerar URL do pacote: {e}")
+            return Response({"error": "Erro ao gerar link de download."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class BulkEnviarFotosEmailView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -506,13 +582,7 @@ class BulkEnviarFotosEmailView(APIView):
         fotos_para_enviar = Foto.objects.select_related('album').filter(id__in=fotos_compradas_ids)
 
         try:
-            s3_client = boto3.client(
-                's3', 
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID, 
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY, 
-                region_name=settings.AWS_S3_REGION_NAME, 
-                config=boto3.session.Config(signature_version='s3v4')
-            )
+            s3_client = cliente_s3()
             bucket_name = settings.AWS_STORAGE_BUCKET_NAME
 
             links_html = ""
@@ -671,69 +741,24 @@ class AdminStatsView(APIView):
         
         return Response(data)
     
+def _nome_fotografo(venda):
+    return venda['foto__album__fotografo__nome_completo'] or venda['foto__album__fotografo__email'] or "Desconhecido"
+
+
 class ExportarPagamentosCSVView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        # 1. Pega TODOS os filtros que o React vai enviar
-        data_inicio = request.GET.get('data_inicio')
-        data_fim = request.GET.get('data_fim')
-        fotografo_id = request.GET.get('fotografo_id')
-        status = request.GET.get('status')
-        search = request.GET.get('search')
-
-        # 2. CORREÇÃO: Busca TODOS os itens do pedido (igual à tela)
-        vendas = ItemPedido.objects.all().order_by('-pedido__criado_em')
-
-        # 3. Aplica os filtros exatamente como na tela
-        if data_inicio:
-            vendas = vendas.filter(pedido__criado_em__date__gte=parse_date(data_inicio))
-        if data_fim:
-            vendas = vendas.filter(pedido__criado_em__date__lte=parse_date(data_fim))
-        if fotografo_id:
-            vendas = vendas.filter(foto__album__fotografo__id=fotografo_id)
-        if status:
-            vendas = vendas.filter(pedido__status=status) # Se não escolher status, traz todos (incluindo PENDENTE)
-        if search:
-            vendas = vendas.filter(pedido__id__icontains=search)
-
-        # 4. Prepara o arquivo Excel (CSV)
-        response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
-        response['Content-Disposition'] = 'attachment; filename="relatorio_pagamentos_site.csv"'
-        writer = csv.writer(response, delimiter=';')
-        
-        # Cabeçalho
-        writer.writerow(['ID Pedido', 'Data da Venda', 'Status', 'Fotógrafo', 'ID da Foto', 'Valor da Venda (R$)', 'Comissão a Pagar (R$)'])
-        
-        total_geral = 0.0
-
-        # Preenche as linhas
-        for item in vendas:
-            try:
-                nome_fotografo = item.foto.album.fotografo.nome_completo or item.foto.album.fotografo.email
-            except AttributeError:
-                nome_fotografo = "Desconhecido"
-
-            valor = float(item.preco) if item.preco else 0.0
-            comissao = valor * 0.95 # A taxa do fotógrafo
-            total_geral += comissao
-
-            data_local = timezone.localtime(item.pedido.criado_em)
-
-            writer.writerow([
-                item.pedido.id,
-                data_local.strftime("%d/%m/%Y %H:%M"),
-                item.pedido.status,
-                nome_fotografo,
-                item.foto.id,
-                str(f"{valor:.2f}").replace('.', ','),
-                str(f"{comissao:.2f}").replace('.', ',')
-            ])
-
-        # Linha do Total Final
-        writer.writerow([])
-        writer.writerow(['', '', '', '', '', 'TOTAL A PAGAR:', str(f"{total_geral:.2f}").replace('.', ',')])
+        # Mesmos filtros da tela; ?formato=xlsx gera planilha do Excel em vez de CSV
+        filtros = {chave: valor for chave, valor in request.GET.dict().items() if chave != 'formato'}
+        formato = request.GET.get('formato', 'csv')
 
+        response = exportar_pagamentos(request.user, formato=formato, filtros=filtros)
+        if response is None:
+            return Response({
+                "mensagem": "O relatório é grande e está sendo gerado em segundo plano. O link de download chegará no seu e-mail.",
+                "email_destino": request.user.email
+            }, status=status.HTTP_202_ACCEPTED)
         return response
 
 class AdminVendasJSONView(APIView):
@@ -762,83 +787,44 @@ class AdminVendasJSONView(APIView):
 
         # --- SE PASSOU PELO IF ACIMA, É PORQUE ALGUÉM CLICOU EM "PESQUISAR" ---
 
-        # 2. Pega os filtros da URL
-        data_inicio = request.GET.get('data_inicio')
-        data_fim = request.GET.get('data_fim')
-        fotografo_id = request.GET.get('fotografo_id')
-        status = request.GET.get('status')
-        search = request.GET.get('search')
-
-        # 3. Busca os itens COM OTIMIZAÇÃO EXTREMA
-        # Traz o pedido, as fotos, os álbuns e os fotógrafos de uma vez só!
-        vendas = ItemPedido.objects.select_related(
-            'pedido', 'foto', 'foto__album', 'foto__album__fotografo'
-        ).prefetch_related(
-            'pedido__itens' # Traz os outros itens do carrinho para podermos calcular o desconto
-        ).all().order_by('-pedido__criado_em')
+        # 2 + 3 + 4. Filtros da URL e valores (subtotal, desconto, comissão) calculados DENTRO do banco
+        vendas = filtrar_vendas(vendas_com_valores(), request.GET)
 
-        # 4. Aplica os filtros
-        if data_inicio:
-            vendas = vendas.filter(pedido__criado_em__date__gte=parse_date(data_inicio))
-        if data_fim:
-            vendas = vendas.filter(pedido__criado_em__date__lte=parse_date(data_fim))
-        if fotografo_id:
-            vendas = vendas.filter(foto__album__fotografo__id=fotografo_id)
-        if status:
-            vendas = vendas.filter(pedido__status=status)
-        if search:
-            vendas = vendas.filter(pedido__id__icontains=search)
-
-        # 5. Monta a tabela e faz a Matemática Proporcional (A Mesma do admin.py!)
-        dados_tabela = []
-        total_vendas_pendentes_reais = 0.0
-
-        for item in vendas:
-            # Pega o nome do fotógrafo com segurança
-            try:
-                nome_fotografo = item.foto.album.fotografo.nome_completo or item.foto.album.fotografo.email
-            except AttributeError:
-                nome_fotografo = "Desconhecido"
-            
-            # --- 🧮 MATEMÁTICA PROPORCIONAL DE DESCONTOS (O CORAÇÃO DO SEU CAIXA) ---
-            valor_real_item = 0.0
-            if item.preco and item.pedido.valor_total:
-                subtotal_cheio = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                if subtotal_cheio > 0:
-                    fator_desconto = float(item.pedido.valor_total) / float(subtotal_cheio)
-                    valor_real_item = float(item.preco) * fator_desconto
-                else:
-                    valor_real_item = float(item.preco)
-            
-            comissao = valor_real_item * 0.95
-
-            # Só somamos para pagar ao fotógrafo se a venda estiver PAGA e AINDA NÃO PAGA ao fotógrafo
-            if item.pedido.status == Pedido.StatusPedido.PAGO and not item.pago_ao_fotografo:
-                total_vendas_pendentes_reais += valor_real_item
-
-            data_local = timezone.localtime(item.pedido.criado_em)
-            
-            dados_tabela.append({
-                "id": item.id,
-                "pedido_id": item.pedido.id,
-                "fotografo": nome_fotografo,
-                "foto_id": item.foto.id,
-                "data": data_local.strftime("%d/%m/%Y %H:%M"),
-                "forma_pgto": getattr(item.pedido, 'metodo_pagamento', 'MERCADO_PAGO'),
-                "status": item.pedido.status,
-                "pago_ao_fotografo": item.pago_ao_fotografo,
-                "valor_venda": valor_real_item,  # 🎯 Agora o React mostra o valor descontado!
-                "comissao": comissao             # 🎯 E a comissão é 95% do valor descontado!
-            })
+        # 5. O resumo é uma única agregação SQL sobre o filtro inteiro (ignora a paginação)
+        total_vendas, total_pagar = totais_pendentes(vendas)
 
-        total_pagar_pendente = total_vendas_pendentes_reais * 0.95
+        # 6. Paginação por cursor (opcional): ?limite=100&cursor=<proximo_cursor da página anterior>
+        linhas = vendas.values(*CAMPOS_RELATORIO_VENDAS)
+        proximo_cursor = None
+        try:
+            limite = int(request.GET.get('limite', 0))
+        except ValueError:
+            limite = 0
+        if limite > 0:
+            linhas, proximo_cursor = paginar_por_cursor(linhas, request.GET.get('cursor'), min(limite, 1000))
+        else:
+            linhas = linhas.order_by('-pedido__criado_em', '-id')
+
+        dados_tabela = [{
+            "id": venda['id'],
+            "pedido_id": venda['pedido_id'],
+            "fotografo": _nome_fotografo(venda),
+            "foto_id": venda['foto_id'],
+            "data": timezone.localtime(venda['pedido__criado_em']).strftime("%d/%m/%Y %H:%M"),
+            "forma_pgto": venda['pedido__metodo_pagamento'] or 'MERCADO_PAGO',
+            "status": venda['pedido__status'],
+            "pago_ao_fotografo": venda['pago_ao_fotografo'],
+            "valor_venda": float(venda['valor_venda']),  # 🎯 O valor já descontado
+            "comissao": float(venda['valor_comissao'])   # 🎯 E a comissão é 95% do valor descontado!
+        } for venda in linhas]
 
         return Response({
             "resumo": {
-                "total_vendas": total_vendas_pendentes_reais,
-                "total_pagar": total_pagar_pendente
+                "total_vendas": float(total_vendas),
+                "total_pagar": float(total_pagar)
             },
             "resultados": dados_tabela,
+            "proximo_cursor": proximo_cursor,
             "fotografos": lista_fotografos
         })
 
@@ -876,8 +862,8 @@ class RegistrarPagamentoFotografoView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # 2. Atualiza os itens (Mágica do Zerar)
-            total_atualizado = itens_pendentes.update(pago_ao_fotografo=True)
+            # 2. Atualiza os itens (Mágica do Zerar) e debita o livro-caixa
+            total_atualizado, _ = baixar_itens_pagos(itens_pendentes)
 
             # 3. Cria o Recibo
             fotografo = Usuario.objects.get(id=fotografo_id)
@@ -994,9 +980,7 @@ class FotografoVendasJSONView(APIView):
         status_repasse = request.GET.get('status_repasse')
 
         vendas = ItemPedido.objects.select_related(
-            'pedido'
-        ).prefetch_related(
-            'pedido__itens'
+            'pedido', 'pedido__cliente', 'foto', 'foto__album'
         ).filter(
             foto__album__fotografo=fotografo,
             pedido__status=Pedido.StatusPedido.PAGO
@@ -1017,23 +1001,8 @@ class FotografoVendasJSONView(APIView):
         if not (data_inicio or data_fim or status_repasse):
             vendas = vendas[:30]
 
-        # 3. Calcula o SALDO PENDENTE REAL (O resumo no topo ignora o limite de 30, ele calcula tudo!)
-        itens_pendentes_geral = ItemPedido.objects.select_related('pedido').prefetch_related('pedido__itens').filter(
-            foto__album__fotografo=fotografo,
-            pedido__status=Pedido.StatusPedido.PAGO,
-            pago_ao_fotografo=False
-        )
-        
-        saldo_pendente_real = 0.0
-        for item in itens_pendentes_geral:
-            valor_real_aux = 0.0
-            if item.preco and item.pedido.valor_total:
-                subtotal = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                if subtotal > 0:
-                    valor_real_aux = float(item.preco) * (float(item.pedido.valor_total) / float(subtotal))
-                else:
-                    valor_real_aux = float(item.preco)
-            saldo_pendente_real += valor_real_aux * 0.95
+        # 3. SALDO PENDENTE REAL: lido direto do livro-caixa (uma consulta só, sem recalcular nada)
+        saldo_pendente_real = float(saldo_do_fotografo(fotografo.id))
 
         total_ja_recebido_db = HistoricoPagamentoFotografo.objects.filter(
             fotografo=fotografo
@@ -1054,16 +1023,7 @@ class FotografoVendasJSONView(APIView):
             elif hasattr(item.pedido, 'cliente_email') and item.pedido.cliente_email:
                 nome_cliente = item.pedido.cliente_email
             
-            valor_real_item = 0.0
-            if item.preco and item.pedido.valor_total:
-                subtotal_cheio = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                if subtotal_cheio > 0:
-                    fator_desconto = float(item.pedido.valor_total) / float(subtotal_cheio)
-                    valor_real_item = float(item.preco) * fator_desconto
-                else:
-                    valor_real_item = float(item.preco)
-            
-            comissao = valor_real_item * 0.95
+            valor_liquido, comissao = valores_do_item(item)
 
             foto_url = ""
             if item.foto and item.foto.imagem:
@@ -1081,8 +1041,8 @@ class FotografoVendasJSONView(APIView):
                 "cliente": nome_cliente,
                 "data": data_local.strftime("%d/%m/%Y %H:%M"),
                 "pago_ao_fotografo": item.pago_ao_fotografo,
-                "valor_venda": valor_real_item,  
-                "comissao": comissao,
+                "valor_venda": float(valor_liquido),  
+                "comissao": float(comissao),
                 "foto_url": foto_url,
                 "album_nome": album_nome             
             })
@@ -1212,29 +1172,13 @@ class FotografoSolicitacaoSaqueView(APIView):
         saques = SolicitacaoSaque.objects.filter(fotografo=request.user).order_by('-criado_em')
         
         # 🔥 MÁGICA 1: O Fotógrafo vê o valor a subir em tempo real na tela dele!
+        # (O saldo vem pronto do livro-caixa: uma consulta, não importa quantas vendas existam)
+        saldo_atualizado = saldo_do_fotografo(request.user.id)
         for saque in saques:
-            if saque.status == 'PENDENTE':
-                itens_pendentes = ItemPedido.objects.select_related('pedido').prefetch_related('pedido__itens').filter(
-                    foto__album__fotografo=request.user,
-                    pedido__status=Pedido.StatusPedido.PAGO,
-                    pago_ao_fotografo=False
-                )
-                
-                saldo_atualizado = 0.0
-                for item in itens_pendentes:
-                    valor_real_aux = 0.0
-                    if item.preco and item.pedido.valor_total:
-                        subtotal = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                        if subtotal > 0:
-                            valor_real_aux = float(item.preco) * (float(item.pedido.valor_total) / float(subtotal))
-                        else:
-                            valor_real_aux = float(item.preco)
-                    saldo_atualizado += valor_real_aux * 0.95
-                
-                # Se o saldo cresceu, atualizamos o "papelzinho" da solicitação
-                if float(saque.valor) != saldo_atualizado and saldo_atualizado > 0:
-                    saque.valor = saldo_atualizado
-                    saque.save()
+            # Se o saldo cresceu, atualizamos o "papelzinho" da solicitação
+            if saque.status == 'PENDENTE' and saque.valor != saldo_atualizado and saldo_atualizado > 0:
+                saque.valor = saldo_atualizado
+                saque.save(update_fields=['valor', 'atualizado_em'])
 
         serializer = SolicitacaoSaqueSerializer(saques, many=True)
         return Response(serializer.data)
@@ -1249,23 +1193,8 @@ class FotografoSolicitacaoSaqueView(APIView):
         if not chave_pix:
             return Response({"error": "A Chave PIX é obrigatória."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 2. Calcula o Saldo Real Disponível DIRETAMENTE NO SERVIDOR
-        itens_pendentes = ItemPedido.objects.select_related('pedido').prefetch_related('pedido__itens').filter(
-            foto__album__fotografo=request.user,
-            pedido__status=Pedido.StatusPedido.PAGO,
-            pago_ao_fotografo=False
-        )
-        
-        saldo_disponivel = 0.0
-        for item in itens_pendentes:
-            valor_real_aux = 0.0
-            if item.preco and item.pedido.valor_total:
-                subtotal = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                if subtotal > 0:
-                    valor_real_aux = float(item.preco) * (float(item.pedido.valor_total) / float(subtotal))
-                else:
-                    valor_real_aux = float(item.preco)
-            saldo_disponivel += valor_real_aux * 0.95
+        # 2. Pega o Saldo Real Disponível DIRETAMENTE DO LIVRO-CAIXA DO SERVIDOR
+        saldo_disponivel = saldo_do_fotografo(request.user.id)
 
         # 3. Trava: Impede o saque se o saldo for zero
         if saldo_disponivel <= 0:
@@ -1310,28 +1239,15 @@ class AdminSolicitacaoSaqueView(APIView):
             saques = saques.filter(status=status_param)
 
         # 🔥 MÁGICA 2: O Admin também vê o valor finalizado e atualizado na tabela de pendentes
+        # (Todos os saldos envolvidos chegam numa única consulta)
+        saques = list(saques)
+        saldos = saldos_dos_fotografos(saque.fotografo_id for saque in saques if saque.status == 'PENDENTE')
         for saque in saques:
             if saque.status == 'PENDENTE':
-                itens_pendentes = ItemPedido.objects.select_related('pedido').prefetch_related('pedido__itens').filter(
-                    foto__album__fotografo=saque.fotografo,
-                    pedido__status=Pedido.StatusPedido.PAGO,
-                    pago_ao_fotografo=False
-                )
-                
-                saldo_atualizado = 0.0
-                for item in itens_pendentes:
-                    valor_real_aux = 0.0
-                    if item.preco and item.pedido.valor_total:
-                        subtotal = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                        if subtotal > 0:
-                            valor_real_aux = float(item.preco) * (float(item.pedido.valor_total) / float(subtotal))
-                        else:
-                            valor_real_aux = float(item.preco)
-                    saldo_atualizado += valor_real_aux * 0.95
-                
-                if float(saque.valor) != saldo_atualizado and saldo_atualizado > 0:
+                saldo_atualizado = saldos.get(saque.fotografo_id, Decimal('0'))
+                if saque.valor != saldo_atualizado and saldo_atualizado > 0:
                     saque.valor = saldo_atualizado
-                    saque.save()
+                    saque.save(update_fields=['valor', 'atualizado_em'])
         
         serializer = SolicitacaoSaqueSerializer(saques, many=True)
         return Response(serializer.data)
@@ -1357,24 +1273,13 @@ class AdminSolicitacaoSaqueView(APIView):
             return Response({"status": "A solicitação foi recusada e o saldo regressou para o fotógrafo."})
         
         elif acao == 'aprovar':
-            itens_pendentes = ItemPedido.objects.select_related('pedido').prefetch_related('pedido__itens').filter(
+            # 1. As vendas deste fotógrafo que ainda não foram repassadas
+            itens_pendentes = ItemPedido.objects.filter(
                 foto__album__fotografo=saque.fotografo,
                 pedido__status=Pedido.StatusPedido.PAGO,
                 pago_ao_fotografo=False
             )
 
-            # 1. Calcula o saldo cravado no milissegundo em que o admin clicou no botão verde
-            saldo_final = 0.0
-            for item in itens_pendentes:
-                valor_real_aux = 0.0
-                if item.preco and item.pedido.valor_total:
-                    subtotal = sum(i.preco for i in item.pedido.itens.all() if i.preco)
-                    if subtotal > 0:
-                        valor_real_aux = float(item.preco) * (float(item.pedido.valor_total) / float(subtotal))
-                    else:
-                        valor_real_aux = float(item.preco)
-                saldo_final += valor_real_aux * 0.95
-
             # 2. 🔥 MÁGICA 3: APURA AS DATAS DO PERÍODO EXATO
             from django.db.models import Min, Max
             from django.utils import timezone
@@ -1383,8 +1288,9 @@ class AdminSolicitacaoSaqueView(APIView):
             data_inicio = datas['min_data'].date() if datas['min_data'] else timezone.now().date()
             data_fim = datas['max_data'].date() if datas['max_data'] else timezone.now().date()
 
-            # 3. Marca os itens como pagos
-            total_vendas_atualizadas = itens_pendentes.update(pago_ao_fotografo=True)
+            # 3. Marca os itens como pagos e debita o livro-caixa
+            # (o valor é a soma exata das comissões gravadas, cravado no clique do botão verde)
+            total_vendas_atualizadas, saldo_final = baixar_itens_pagos(itens_pendentes)
 
             # 4. Gera o Recibo Oficial com as Datas e o Valor Atualizado!
             HistoricoPagamentoFotografo.objects.create(
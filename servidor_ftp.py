@@ -1,32 +1,100 @@
+import logging
 import os
+import threading
+import time
 from pyftpdlib.authorizers import DummyAuthorizer
 from pyftpdlib.handlers import FTPHandler
-from pyftpdlib.servers import FTPServer
-
-# 1. Cria uma pasta no seu computador para simular a redação do Jornal
-pasta_destino = os.path.join(os.getcwd(), "Jornal_Recebimentos")
-os.makedirs(pasta_destino, exist_ok=True)
-
-# 2. Cria as credenciais de acesso
-authorizer = DummyAuthorizer()
-# (Username, Password, Pasta de destino, Permissões totais)
-authorizer.add_user("editor_jornal", "senha123", pasta_destino, perm="elradfmwMT")
-
-# 3. Configura o "motor" do FTP
-handler = FTPHandler
-handler.authorizer = authorizer
-
-# 4. Liga o servidor na porta 2121 (Usamos 2121 em vez de 21 para não exigir permissões de Administrador do Windows)
-endereco = ("127.0.0.1", 2121)
-server = FTPServer(endereco, handler)
-
-print("="*60)
-print("📡 Servidor FTP do 'Jornal Parceiro' Online!")
-print(f"🌐 Host: 127.0.0.1:2121")
-print(f"👤 Usuário: editor_jornal")
-print(f"🔑 Senha: senha123")
-print(f"📁 As fotos vão aparecer na pasta: {pasta_destino}")
-print("="*60)
-
-# Fica a ouvir infinitamente
-server.serve_forever()
\ No newline at end of file
+from pyftpdlib.ioloop import IOLoop
+from pyftpdlib.servers import FTPServer, ThreadedFTPServer
+
+
+_lock_cwd = threading.Lock()
+
+
+def criar_servidor(endereco=("127.0.0.1", 2121), pasta_base=None, parceiros=1, latencia_ms=0, threaded=False, log=True):
+    """
+    Monta o servidor que simula os jornais parceiros.
+    Com parceiros > 1 cada jornal ganha o seu usuário (editor_jornal1, editor_jornal2...) e a sua pasta.
+    latencia_ms atrasa cada comando, imitando um FTP do outro lado da internet.
+    log=False cala o log de cada comando (benchmark e testes).
+    """
+    if not log:
+        # Com um handler próprio o pyftpdlib não reconfigura o log ao ligar o loop
+        logger = logging.getLogger("pyftpdlib")
+        if not logger.handlers:
+            logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.WARNING)
+
+    pasta_base = pasta_base or os.path.join(os.getcwd(), "Jornal_Recebimentos")
+
+    # 1. Cria as pastas no seu computador para simular a redação de cada Jornal
+    # 2. Cria as credenciais de acesso
+    authorizer = DummyAuthorizer()
+    usuarios = []
+    for i in range(1, parceiros + 1):
+        usuario = "editor_jornal" if parceiros == 1 else f"editor_jornal{i}"
+        pasta = pasta_base if parceiros == 1 else os.path.join(pasta_base, usuario)
+        os.makedirs(pasta, exist_ok=True)
+        # (Username, Password, Pasta de destino, Permissões totais)
+        authorizer.add_user(usuario, "senha123", pasta, perm="elradfmwMT")
+        usuarios.append((usuario, pasta))
+
+    # 3. Configura o "motor" do FTP (uma classe nova para não mexer no FTPHandler global)
+    atraso = latencia_ms / 1000
+
+    class HandlerJornal(FTPHandler):
+        def pre_process_command(self, line, cmd, arg):
+            if atraso:
+                time.sleep(atraso)
+            return super().pre_process_command(line, cmd, arg)
+
+        def ftp_CWD(self, path):
+            # O pyftpdlib troca o diretório do PROCESSO e depois volta: com threads, um CWD por vez
+            with _lock_cwd:
+                return super().ftp_CWD(path)
+
+    HandlerJornal.authorizer = authorizer
+
+    # ThreadedFTPServer: um comando lento (latência simulada) não trava os outros jornais
+    classe = ThreadedFTPServer if threaded or atraso else FTPServer
+    # IOLoop próprio: vários servidores no mesmo processo (benchmark, testes) não dividem o loop global
+    return classe(endereco, HandlerJornal, ioloop=IOLoop()), usuarios
+
+
+def ligar_em_segundo_plano(server):
+    """Roda o servidor numa thread e devolve a função que o desliga (de dentro da própria thread)."""
+    parar = threading.Event()
+
+    def rodar():
+        while not parar.is_set():
+            server.serve_forever(timeout=0.05, blocking=False, handle_exit=False)
+        server.close_all()
+
+    thread = threading.Thread(target=rodar, daemon=True)
+    thread.start()
+
+    def desligar():
+        parar.set()
+        thread.join()
+
+    return desligar
+
+
+if __name__ == "__main__":
+    # 4. Liga o servidor na porta 2121 (Usamos 2121 em vez de 21 para não exigir permissões de Administrador do Windows)
+    server, usuarios = criar_servidor(
+        parceiros=int(os.getenv("FTP_PARCEIROS", "1")),
+        latencia_ms=int(os.getenv("FTP_LATENCIA_MS", "0")),
+    )
+
+    print("="*60)
+    print("📡 Servidor FTP do 'Jornal Parceiro' Online!")
+    print(f"🌐 Host: 127.0.0.1:2121")
+    for usuario, pasta in usuarios:
+        print(f"👤 Usuário: {usuario}")
+        print(f"🔑 Senha: senha123")
+        print(f"📁 As fotos vão aparecer na pasta: {pasta}")
+    print("="*60)
+
+    # Fica a ouvir infinitamente
+    server.serve_forever()